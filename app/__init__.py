@@ -97,6 +97,7 @@ def create_app() -> Flask:
     # Google Cloud Storage configuration
     app.config["GCS_BUCKET_NAME"] = ENV.get("GCS_BUCKET_NAME")
     app.config["GCS_PROCESSED_BUCKET_NAME"] = ENV.get("GCS_PROCESSED_BUCKET_NAME")
+    app.config["STORAGE_BACKEND"] = ENV.get("STORAGE_BACKEND")
     
     # Google Cloud Tasks configuration
     app.config["CLOUD_TASKS_QUEUE_ID"] = ENV.get("CLOUD_TASKS_QUEUE_ID")
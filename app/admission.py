@@ -0,0 +1,193 @@
+"""
+Upload-time admission control for mdraft.
+
+This module decides, before any worker time or Document AI spend is
+committed, whether a conversion request should run as requested, be
+downgraded to the free markitdown engine, or be rejected because the
+user is over their plan cap.  The decision combines a fast page estimate
+with the plan and usage counters already cached in Redis, and costs a
+single pipelined Redis round trip.
+"""
+from __future__ import annotations
+
+import logging
+import os
+from typing import Any, Dict, Optional
+
+from flask import session
+from flask_login import current_user
+
+from .api_usage import PLAN_PAGE_CAPS, _get_redis_client, _usage_key
+
+logger = logging.getLogger(__name__)
+
+ADMIT = "admit"
+DOWNGRADE = "downgrade"
+REJECT = "reject"
+
+# Engine used when a request has to be downgraded; it has no per-page cost
+DOWNGRADE_ENGINE = "markitdown"
+
+# Engines without a per-page cost, which are never downgraded
+FREE_ENGINES = {DOWNGRADE_ENGINE, "passthrough"}
+
+# Defaults used when Redis is unavailable or has no data for the user
+DEFAULT_PLAN = "F&F"
+DEFAULT_CAP_PAGES = 300
+
+
+def get_admission_mode() -> str:
+    """Get the admission control mode from environment variable.
+
+    Returns:
+        One of 'off', 'downgrade' or 'enforce' (default: 'enforce').
+        'downgrade' never rejects; users over their cap are moved to the
+        free engine instead.
+    """
+    mode = os.getenv("ADMISSION_CONTROL", "enforce").strip().lower()
+    return mode if mode in ("off", "downgrade", "enforce") else "enforce"
+
+
+def resolve_user_id() -> Optional[int]:
+    """Resolve the user making the current request.
+
+    Uses Flask-Login first and falls back to the session, mirroring the
+    lookup done by the usage API.
+
+    Returns:
+        The user ID, or None for anonymous requests
+    """
+    try:
+        if current_user.is_authenticated:
+            return current_user.id
+    except Exception:
+        pass
+    try:
+        return session.get("user_id")
+    except Exception:
+        return None
+
+
+def get_usage_snapshot(user_id: int) -> Dict[str, Any]:
+    """Read a user's plan, cap and monthly usage in one Redis round trip.
+
+    Args:
+        user_id: The user ID to look up
+
+    Returns:
+        Dictionary with plan, cap_pages and used_pages
+    """
+    snapshot: Dict[str, Any] = {
+        "plan": DEFAULT_PLAN,
+        "cap_pages": DEFAULT_CAP_PAGES,
+        "used_pages": 0,
+    }
+
+    redis_client = _get_redis_client()
+    if not redis_client:
+        return snapshot
+
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.hgetall(f"userplan:{user_id}")
+        pipe.get(_usage_key(user_id))
+        plan_fields, used_pages = pipe.execute()
+    except Exception as e:
+        logger.warning(f"Admission usage lookup failed for user {user_id}: {e}")
+        return snapshot
+
+    plan_fields = plan_fields or {}
+    plan = plan_fields.get(b"plan")
+    if plan is not None:
+        snapshot["plan"] = plan.decode()
+
+    cap_pages = plan_fields.get(b"cap_pages")
+    try:
+        if cap_pages is not None:
+            snapshot["cap_pages"] = int(cap_pages)
+        else:
+            snapshot["cap_pages"] = PLAN_PAGE_CAPS.get(snapshot["plan"], DEFAULT_CAP_PAGES)
+    except ValueError:
+        snapshot["cap_pages"] = PLAN_PAGE_CAPS.get(snapshot["plan"], DEFAULT_CAP_PAGES)
+
+    try:
+        if used_pages is not None:
+            snapshot["used_pages"] = int(used_pages)
+    except ValueError:
+        pass
+
+    return snapshot
+
+
+def check_admission(user_id: Optional[int], pages: int, engine: str) -> Dict[str, Any]:
+    """Decide whether a conversion may run before it is enqueued.
+
+    Policy:
+    - users already at or over their cap are rejected ('enforce' mode) or
+      downgraded to the free engine ('downgrade' mode);
+    - requests that would take a user over their cap on a metered engine
+      (Document AI) are downgraded to the free engine;
+    - everything else is admitted unchanged.
+
+    Args:
+        user_id: The requesting user, or None for anonymous requests
+        pages: Estimated number of pages in the document
+        engine: Engine the conversion would use if admitted unchanged
+
+    Returns:
+        Dictionary with decision ('admit', 'downgrade' or 'reject'), the
+        engine to use, the page estimate and the usage snapshot consulted
+    """
+    decision: Dict[str, Any] = {
+        "decision": ADMIT,
+        "engine": engine,
+        "pages": pages,
+    }
+
+    mode = get_admission_mode()
+    if mode == "off" or user_id is None:
+        return decision
+
+    usage = get_usage_snapshot(user_id)
+    decision.update(usage)
+    used_pages = usage["used_pages"]
+    cap_pages = usage["cap_pages"]
+
+    if used_pages >= cap_pages:
+        if mode == "enforce":
+            decision["decision"] = REJECT
+            decision["engine"] = None
+            decision["reason"] = "quota_exceeded"
+        else:
+            decision["decision"] = DOWNGRADE
+            decision["engine"] = engine if engine in FREE_ENGINES else DOWNGRADE_ENGINE
+            decision["reason"] = "quota_exceeded"
+    elif used_pages + pages > cap_pages and engine not in FREE_ENGINES:
+        decision["decision"] = DOWNGRADE
+        decision["engine"] = DOWNGRADE_ENGINE
+        decision["reason"] = "quota_would_be_exceeded"
+
+    if decision["decision"] != ADMIT:
+        logger.info(
+            f"Admission {decision['decision']} for user {user_id}: "
+            f"{used_pages}+{pages} of {cap_pages} pages on {engine}"
+        )
+
+    return decision
+
+
+def rejection_payload(decision: Dict[str, Any]) -> Dict[str, Any]:
+    """Build the JSON body returned when a request is rejected.
+
+    Args:
+        decision: Result of check_admission()
+
+    Returns:
+        Dictionary suitable for jsonify()
+    """
+    return {
+        "error": decision.get("reason", "quota_exceeded"),
+        "used_pages": decision.get("used_pages"),
+        "cap_pages": decision.get("cap_pages"),
+        "plan": decision.get("plan"),
+    }
@@ -8,9 +8,15 @@ from datetime import datetime, timedelta, timezone
 from . import db, limiter
 from .models_conversion import Conversion
 from .security import sniff_category, size_ok
+from .ooxml import UnsafeContainer
 from .auth_api import require_api_key_if_configured, rate_limit_for_convert, rate_limit_key_func
-from .quality import sha256_file, clean_markdown, pdf_text_fallback
+from .quality import sha256_file, clean_markdown, pdf_fallback_markdown
+from .boilerplate import strip_boilerplate
+from .passthrough import convert as convert_passthrough, is_passthrough
 from .webhooks import deliver_webhook
+from .admission import DOWNGRADE_ENGINE, REJECT, check_admission, rejection_payload, resolve_user_id
+from .api_estimate import estimate_pages_for_stream
+from .scheduling import queue_for_user
 
 bp = Blueprint("api_convert", __name__, url_prefix="/api")
 
@@ -42,6 +48,17 @@ def _convert_with_markitdown(path: str) -> str:
         with open(path, "rb") as fh:
             return fh.read(8192).decode("utf-8", errors="ignore")
 
+def _admission_check(path: str, filename: str):
+    # Cheap pre-conversion quota check; this endpoint always converts with
+    # markitdown, so the only possible outcome that matters is a rejection.
+    # Returns (rejection response or None, decision)
+    with open(path, "rb") as fh:
+        pages = estimate_pages_for_stream(fh, filename)
+    decision = check_admission(resolve_user_id(), pages, DOWNGRADE_ENGINE)
+    if decision["decision"] == REJECT:
+        return (jsonify(rejection_payload(decision)), 402), decision
+    return None, decision
+
 @bp.post("/convert")
 @limiter.limit(rate_limit_for_convert, key_func=rate_limit_key_func)
 def api_convert():
@@ -75,7 +92,12 @@ def api_convert():
         
         # Enforce security checks
         fallback_mime = (f.mimetype or None)
-        mime, category = sniff_category(tmp_path, fallback_mime=fallback_mime)
+        try:
+            mime, category = sniff_category(tmp_path, fallback_mime=fallback_mime)
+        except UnsafeContainer as e:
+            try: os.unlink(tmp_path)
+            except Exception: pass
+            return jsonify(error="unsafe_container", reason=str(e)), 422
         if category is None:
             try: os.unlink(tmp_path)
             except Exception: pass
@@ -102,14 +124,21 @@ def api_convert():
                     links=_links(existing.id),
                     note="deduplicated"
                 ), 200
+
+        rejected, admission = _admission_check(tmp_path, filename)
+        if rejected is not None:
+            try: os.unlink(tmp_path)
+            except Exception: pass
+            return rejected
         
         try:
-            from google.cloud import storage
+            from .services.expiry import stamp_blob
+            from .services.gcs import get_bucket
             bucket_name = os.environ["GCS_BUCKET_NAME"]
-            client = storage.Client()
-            bucket = client.bucket(bucket_name)
+            bucket = get_bucket(bucket_name)
             object_key = f"uploads/{uuid.uuid4()}-{filename}"
             blob = bucket.blob(object_key)
+            stamp_blob(blob, object_key)
             blob.upload_from_filename(tmp_path)
             gcs_uri = f"gs://{bucket_name}/{object_key}"
 
@@ -133,7 +162,10 @@ def api_convert():
             db.session.commit()
 
             from celery_worker import celery
-            celery.send_task("convert_from_gcs", args=[conv.id, gcs_uri, filename, callback_url])
+            queue = queue_for_user(resolve_user_id(), plan=admission.get("plan"),
+                                   size_bytes=original_size, pages=admission.get("pages"),
+                                   engine=DOWNGRADE_ENGINE)
+            celery.send_task("convert_from_gcs", args=[conv.id, gcs_uri, filename, callback_url], queue=queue)
 
             resp = {
                 "id": conv_id,
@@ -169,7 +201,12 @@ def api_convert():
 
     # Enforce security checks
     fallback_mime = (f.mimetype or None)
-    mime, category = sniff_category(tmp_path, fallback_mime=fallback_mime)
+    try:
+        mime, category = sniff_category(tmp_path, fallback_mime=fallback_mime)
+    except UnsafeContainer as e:
+        try: os.unlink(tmp_path)
+        except Exception: pass
+        return jsonify(error="unsafe_container", reason=str(e)), 422
     if category is None:
         try: os.unlink(tmp_path)
         except Exception: pass
@@ -197,19 +234,32 @@ def api_convert():
                 note="deduplicated"
             ), 200
 
+    rejected, _ = _admission_check(tmp_path, filename)
+    if rejected is not None:
+        try: os.unlink(tmp_path)
+        except Exception: pass
+        return rejected
+
     try:
-        markdown = _convert_with_markitdown(tmp_path) or ""
+        if is_passthrough(original_mime):
+            # Text types convert natively here, on the request thread
+            markdown = convert_passthrough(tmp_path, original_mime)
+        else:
+            markdown = _convert_with_markitdown(tmp_path) or ""
         if not markdown and original_mime == "application/pdf":
-            fb = pdf_text_fallback(tmp_path)
-            if fb:
-                markdown = fb
-        markdown = clean_markdown(markdown)
+            # Streamed through boilerplate stripping and cleaning page by page
+            fb, boilerplate = pdf_fallback_markdown(tmp_path)
+            markdown = fb or ""
+        else:
+            markdown, boilerplate = strip_boilerplate(markdown)
+            markdown = clean_markdown(markdown)
 
         ttl_days = int(os.getenv("RETENTION_DAYS", "30"))
         conv = Conversion(
             filename=filename,
             status="COMPLETED",
             markdown=markdown,
+            boilerplate=boilerplate,
             sha256=file_hash,
             original_mime=original_mime,
             original_size=original_size,
@@ -270,6 +320,7 @@ def get_conversion(id):
         filename=conv.filename,
         status=conv.status,
         error=conv.error,
+        boilerplate=conv.boilerplate,
         links={
             "markdown": f"/api/conversions/{conv.id}/markdown",
             "view": f"/v/{conv.id}",
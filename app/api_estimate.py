@@ -7,12 +7,12 @@ for document processing without actually uploading or persisting files.
 from __future__ import annotations
 
 import os
-import io
 from decimal import Decimal
-from typing import Any
+from typing import Any, BinaryIO
 
 from flask import Blueprint, jsonify, request
-from pypdf import PdfReader
+
+from .pagecount import count_pages
 
 
 bp = Blueprint("estimate_api", __name__, url_prefix="/api")
@@ -33,46 +33,24 @@ def _get_file_extension(filename: str) -> str:
     return filename.rsplit('.', 1)[1].lower()
 
 
-def _count_pdf_pages(file_data: bytes) -> int:
-    """Count pages in a PDF file.
+def estimate_pages_for_stream(stream: BinaryIO, filename: str) -> int:
+    """Estimate the number of pages in an uploaded file-like object.
     
-    Args:
-        file_data: The PDF file data as bytes
-        
-    Returns:
-        Number of pages in the PDF
-        
-    Raises:
-        Exception: If PDF cannot be read
-    """
-    try:
-        pdf_file = io.BytesIO(file_data)
-        reader = PdfReader(pdf_file)
-        return len(reader.pages)
-    except Exception:
-        raise Exception("could not read pdf")
-
-
-def _estimate_pages(file_data: bytes, filename: str) -> int:
-    """Estimate the number of pages in a file.
+    Only the parts of the file needed to find the page count are read
+    (the PDF trailer and page tree root, or the ZIP central directory),
+    and results are cached by content hash. The stream position is
+    restored afterwards so callers can keep using the stream.
     
     Args:
-        file_data: The file data as bytes
+        stream: Seekable binary file-like object
         filename: The original filename
         
     Returns:
-        Estimated number of pages
+        Estimated number of pages (1 if estimation fails)
     """
-    filetype = _get_file_extension(filename)
-    
-    if filetype == "pdf":
-        try:
-            return _count_pdf_pages(file_data)
-        except Exception:
-            # If PDF parsing fails, return 1 as fallback
-            return 1
-    else:
-        # Non-PDF files are estimated as 1 page
+    try:
+        return count_pages(stream, filename)
+    except Exception:
         return 1
 
 
@@ -110,15 +88,18 @@ def estimate() -> Any:
     if file.filename == "":
         return jsonify({"error": "file required"}), 400
     
-    # Read file into memory
+    # Measure the upload without reading it into memory
     try:
-        file_data = file.read()
+        stream = file.stream
+        stream.seek(0, os.SEEK_END)
+        file_size = stream.tell()
+        stream.seek(0)
     except Exception:
         return jsonify({"error": "could not read file"}), 400
     
     # Check file size against soft cap
     max_size_bytes = int(os.getenv("MAX_UPLOAD_MB", "10")) * 1024 * 1024
-    if len(file_data) > max_size_bytes:
+    if file_size > max_size_bytes:
         max_mb = os.getenv("MAX_UPLOAD_MB", "10")
         return jsonify({
             "error": f"file too large",
@@ -129,11 +110,7 @@ def estimate() -> Any:
     filetype = _get_file_extension(file.filename or "unknown")
     
     # Estimate pages
-    try:
-        pages = _estimate_pages(file_data, file.filename or "unknown")
-    except Exception:
-        # Fallback to 1 page if estimation fails
-        pages = 1
+    pages = estimate_pages_for_stream(stream, file.filename or "unknown")
     
     # Calculate cost
     est_cost_usd = _calculate_cost(pages)
@@ -17,10 +17,23 @@ from flask_login import current_user
 
 bp = Blueprint("usage_api", __name__, url_prefix="/api")
 
+# Default page caps by plan, used when Redis has no explicit cap for a user
+PLAN_PAGE_CAPS: Dict[str, int] = {
+    "F&F": 300,
+    "Pro": 2000,
+    "Team": 10000
+}
+
+# Redis clients keyed by URL so every call shares one connection pool
+_redis_clients: Dict[str, redis.Redis] = {}
+
 
 def _get_redis_client() -> redis.Redis | None:
     """Get Redis client from environment URL.
     
+    The client is created once per URL and reused, so repeated lookups on
+    the request path do not pay for a new connection pool each time.
+    
     Returns:
         Redis client instance or None if REDIS_URL is not configured
     """
@@ -28,10 +41,29 @@ def _get_redis_client() -> redis.Redis | None:
     if not redis_url:
         return None
     
+    client = _redis_clients.get(redis_url)
+    if client is not None:
+        return client
+    
     try:
-        return redis.Redis.from_url(redis_url)
+        client = redis.Redis.from_url(redis_url)
     except Exception:
         return None
+    _redis_clients[redis_url] = client
+    return client
+
+
+def _usage_key(user_id: int) -> str:
+    """Build the Redis key holding a user's page usage for this month.
+    
+    Args:
+        user_id: The user ID to build the key for
+        
+    Returns:
+        Redis key in the form usage:pages:<user_id>:<YYYYMM>
+    """
+    current_month = datetime.utcnow().strftime("%Y%m")
+    return f"usage:pages:{user_id}:{current_month}"
 
 
 def _get_user_plan_cap(user_id: int) -> int:
@@ -56,19 +88,12 @@ def _get_user_plan_cap(user_id: int) -> int:
     except Exception:
         pass
     
-    # Fallback to default caps by plan
-    plan_defaults = {
-        "F&F": 300,
-        "Pro": 2000,
-        "Team": 10000
-    }
-    
-    # Try to get user's plan from Redis
+    # Try to get user's plan from Redis and fall back to its default cap
     try:
         if redis_client:
             plan = redis_client.hget(f"userplan:{user_id}", "plan")
-            if plan and plan.decode() in plan_defaults:
-                return plan_defaults[plan.decode()]
+            if plan and plan.decode() in PLAN_PAGE_CAPS:
+                return PLAN_PAGE_CAPS[plan.decode()]
     except Exception:
         pass
     
@@ -90,11 +115,7 @@ def _get_used_pages(user_id: int) -> int:
         return 0
     
     try:
-        # Get current month in YYYYMM format
-        current_month = datetime.utcnow().strftime("%Y%m")
-        usage_key = f"usage:pages:{user_id}:{current_month}"
-        
-        used_pages = redis_client.get(usage_key)
+        used_pages = redis_client.get(_usage_key(user_id))
         if used_pages is not None:
             return int(used_pages)
     except Exception:
@@ -0,0 +1,359 @@
+"""
+Micro-batching of small conversions.
+
+For tiny documents the fixed cost of a Celery task (ack, app context,
+row lookups, two commits, storage setup and a markitdown
+process) dominates the conversion itself.  Small conversions can instead
+be routed to a dedicated batch queue, where ``batch_worker.py`` pulls up
+to BATCH_SIZE messages at a time and hands them to ``process_batch``:
+
+- rows for the whole batch are loaded with one query per model;
+- inputs are fetched concurrently through the process-wide storage client;
+- every document is converted on a warm, in-process MarkItDown instance;
+- all status and Markdown updates are written in a single transaction,
+  falling back to per-item commits if the batch commit fails;
+- webhooks and source cleanup run after the commit.
+
+A failure converting one item is recorded on that item only.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+BATCH_QUEUE = "mdraft_batch"
+
+CONVERT_DOCUMENT = "convert_document"
+CONVERT_FROM_GCS = "convert_from_gcs"
+
+_markitdown = None
+_markitdown_lock = threading.Lock()
+
+
+def is_batching_enabled() -> bool:
+    """Check whether small conversions are routed to the batch queue (BATCH_ENABLED, default off)."""
+    return os.getenv("BATCH_ENABLED", "0").lower() in ("1", "true", "yes")
+
+
+def get_batch_max_cost() -> float:
+    """Get the largest estimated cost routed to the batch queue (BATCH_MAX_COST, default 2)."""
+    try:
+        return float(os.getenv("BATCH_MAX_COST", "2"))
+    except ValueError:
+        return 2.0
+
+
+@dataclass
+class BatchItem:
+    """One conversion task pulled from the batch queue."""
+    task: str
+    args: List[Any]
+    kwargs: Dict[str, Any]
+    message: Any = None
+    input_path: Optional[str] = None
+    mime: Optional[str] = None
+    markdown: Optional[str] = None
+    error: Optional[str] = None
+    status: Optional[str] = None
+    extra: Dict[str, Any] = field(default_factory=dict)
+
+
+def parse_task_message(headers: Optional[Dict[str, Any]], body: Any) -> Tuple[str, List[Any], Dict[str, Any]]:
+    """Extract the task name and arguments from a Celery message.
+
+    Supports task protocol 2 (name in headers, body of ``[args, kwargs,
+    embed]``) and protocol 1 (everything in a body dict).
+
+    Returns:
+        Tuple of (task name, args, kwargs)
+    """
+    headers = headers or {}
+    if "task" in headers:
+        args, kwargs = body[0], body[1]
+        return headers["task"], list(args or []), dict(kwargs or {})
+    if isinstance(body, dict) and "task" in body:
+        return body["task"], list(body.get("args") or []), dict(body.get("kwargs") or {})
+    raise ValueError("Unrecognised task message")
+
+
+def get_markitdown():
+    """Get the process-wide MarkItDown instance, creating it once."""
+    global _markitdown
+    with _markitdown_lock:
+        if _markitdown is None:
+            from markitdown import MarkItDown
+            _markitdown = MarkItDown()
+        return _markitdown
+
+
+def convert_warm(path: str, mime: Optional[str] = None) -> Tuple[str, Optional[Dict[str, Any]], bool]:
+    """Convert a local file on the warm MarkItDown instance.
+
+    Args:
+        path: Local input file
+        mime: MIME type, used to decide on the PDF text fallback
+
+    Returns:
+        Tuple of (markdown, boilerplate report, postprocessed); the PDF
+        text fallback's markdown comes back already stripped and cleaned,
+        with its report
+    """
+    from .passthrough import convert as convert_passthrough, is_passthrough
+    from .quality import pdf_fallback_markdown
+
+    if is_passthrough(mime):
+        return convert_passthrough(path, mime), None, False
+    res = get_markitdown().convert(path)
+    markdown = getattr(res, "text_content", None) or getattr(res, "markdown", None) or ""
+    if not markdown and mime == "application/pdf":
+        fallback, report = pdf_fallback_markdown(path)
+        if fallback:
+            return fallback, report, True
+    return markdown, None, False
+
+
+def _sniff_mime(path: str, name: str = "") -> str:
+    import filetype
+    from .passthrough import mime_for_filename
+
+    with open(path, "rb") as f:
+        kind = filetype.guess(f.read(261))
+    return kind.mime if kind else (mime_for_filename(name) or "application/octet-stream")
+
+
+def _write_temp(data: bytes, suffix: str = "") -> str:
+    fd, path = tempfile.mkstemp(suffix=suffix)
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    return path
+
+
+def _fetch_inputs(items: List[BatchItem]) -> None:
+    """Download every item's input concurrently with shared clients."""
+    from .prefetch import _source_suffix
+    from .services.gcs import get_blob
+
+    storage = None
+    if any(item.task == CONVERT_DOCUMENT for item in items):
+        from .services import Storage
+        storage = Storage()
+
+    def fetch(item: BatchItem) -> None:
+        try:
+            if item.task == CONVERT_DOCUMENT:
+                source = item.args[2]
+                item.input_path = _write_temp(storage.read_bytes(source), _source_suffix(source))
+            else:
+                blob = get_blob(item.args[1])
+                with tempfile.NamedTemporaryFile(suffix=_source_suffix(item.args[1]), delete=False) as tmp:
+                    item.input_path = tmp.name
+                blob.download_to_filename(item.input_path)
+        except Exception as e:
+            item.error = f"fetch failed: {e}"
+
+    workers = max(1, min(len(items), int(os.getenv("BATCH_FETCH_WORKERS", "8"))))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(fetch, [item for item in items if item.error is None]))
+
+
+def _convert_items(items: List[BatchItem]) -> None:
+    from .conversion import choose_engine, convert_with_docai, engine_flags
+
+    flags = engine_flags()
+    for item in items:
+        if item.error is not None:
+            continue
+        try:
+            source = item.args[2] if item.task == CONVERT_DOCUMENT else item.args[1]
+            item.mime = item.extra.get("original_mime") or _sniff_mime(item.input_path, source)
+            engine = item.kwargs.get("engine")
+            if item.task == CONVERT_DOCUMENT and engine is None:
+                engine = choose_engine(item.mime, flags)
+            report, postprocessed = None, False
+            if engine == "docai":
+                item.markdown = convert_with_docai(
+                    project_id=flags["GOOGLE_CLOUD_PROJECT"],
+                    location=flags["DOCAI_LOCATION"],
+                    processor_id=flags["DOCAI_PROCESSOR_ID"],
+                    input_path=item.input_path,
+                    mime_type=item.mime,
+                )
+            else:
+                item.markdown, report, postprocessed = convert_warm(item.input_path, item.mime)
+            if item.task == CONVERT_FROM_GCS and not postprocessed:
+                from .boilerplate import strip_boilerplate
+                from .quality import clean_markdown
+                markdown, report = strip_boilerplate(item.markdown)
+                item.markdown = clean_markdown(markdown)
+            item.extra["boilerplate"] = report
+        except Exception as e:
+            item.error = str(e)
+
+
+def _apply(item: BatchItem, row: Any) -> None:
+    """Copy an item's outcome onto its database row."""
+    from .models import Job
+
+    if isinstance(row, Job):
+        row.started_at = item.extra["started_at"]
+        if item.error is None:
+            row.output_uri = item.extra["output_path"]
+            row.completed_at = datetime.utcnow()
+            row.error_message = None
+            row.status = "completed"
+        else:
+            row.status = "failed"
+            row.error_message = item.error
+    else:
+        if item.error is None:
+            row.markdown = item.markdown
+            row.boilerplate = item.extra.get("boilerplate")
+            row.status = "COMPLETED"
+        else:
+            row.status = "FAILED"
+            row.error = item.error
+    item.status = row.status
+
+
+def _persist(items: List[BatchItem], rows: Dict[int, Any]) -> None:
+    """Write every outcome in one transaction, falling back per item."""
+    from . import db
+
+    for index, item in enumerate(items):
+        if index in rows:
+            _apply(item, rows[index])
+    try:
+        db.session.commit()
+        return
+    except Exception as e:
+        logger.warning(f"Batch commit of {len(items)} items failed, retrying per item: {e}")
+        db.session.rollback()
+
+    for index, item in enumerate(items):
+        row = rows.get(index)
+        if row is None:
+            continue
+        try:
+            row = db.session.merge(row)
+            _apply(item, row)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            item.error = item.error or f"persist failed: {e}"
+            item.status = None
+            logger.error(f"Failed to persist batch item {item.task}{item.args[:1]}: {e}")
+
+
+def _notify(items: List[BatchItem]) -> None:
+    from .webhooks import deliver_webhook
+
+    delete_on_done = os.getenv("DELETE_GCS_ON_COMPLETE", "1").lower() in ("1", "true", "yes")
+    for item in items:
+        if item.task == CONVERT_FROM_GCS and item.status:
+            conv_id, gcs_uri = item.args[0], item.args[1]
+            callback_url = item.args[3] if len(item.args) > 3 else item.kwargs.get("callback_url")
+            if callback_url:
+                try:
+                    links = {"self": f"/api/conversions/{conv_id}"}
+                    data = {"id": conv_id, "filename": item.extra.get("filename"), "status": item.status, "links": links}
+                    if item.status == "COMPLETED":
+                        links["markdown"] = f"/api/conversions/{conv_id}/markdown"
+                        links["view"] = f"/v/{conv_id}"
+                        deliver_webhook(callback_url, "conversion.completed", data)
+                    else:
+                        data["error"] = item.error or "unknown"
+                        deliver_webhook(callback_url, "conversion.failed", data)
+                except Exception as e:
+                    logger.warning(f"Batch webhook for {conv_id} failed: {e}")
+            if delete_on_done and item.input_path:
+                try:
+                    from .services.gcs import get_bucket
+                    bucket_name, blob_path = gcs_uri.replace("gs://", "").split("/", 1)
+                    get_bucket(bucket_name).delete_blob(blob_path)
+                except Exception:
+                    pass
+        if item.input_path:
+            try:
+                os.unlink(item.input_path)
+            except OSError:
+                pass
+
+
+def process_batch(items: List[BatchItem]) -> List[BatchItem]:
+    """Convert and persist a batch of small conversion tasks.
+
+    Must be called inside an application context.  Each item's outcome
+    is left in ``item.status`` / ``item.error``; items whose row does not
+    exist are skipped, matching the single-task behaviour.
+
+    Args:
+        items: Parsed tasks from the batch queue
+
+    Returns:
+        The same items, updated in place
+    """
+    from .models import Job
+    from .models_conversion import Conversion
+
+    job_ids = [item.args[0] for item in items if item.task == CONVERT_DOCUMENT]
+    conv_ids = [item.args[0] for item in items if item.task == CONVERT_FROM_GCS]
+    jobs = {j.id: j for j in Job.query.filter(Job.id.in_(job_ids)).all()} if job_ids else {}
+    convs = {c.id: c for c in Conversion.query.filter(Conversion.id.in_(conv_ids)).all()} if conv_ids else {}
+
+    # Recorded on the rows with the outcome, so the batch still commits once
+    started_at = datetime.utcnow()
+    rows: Dict[int, Any] = {}
+    live: List[BatchItem] = []
+    for index, item in enumerate(items):
+        if item.task == CONVERT_DOCUMENT:
+            row = jobs.get(item.args[0])
+            if row is None or row.status == "completed":
+                item.status = "skipped"
+                continue
+            item.extra["started_at"] = started_at
+        elif item.task == CONVERT_FROM_GCS:
+            row = convs.get(item.args[0])
+            if row is None:
+                item.status = "skipped"
+                continue
+            item.extra["original_mime"] = row.original_mime
+            item.extra["filename"] = row.filename
+        else:
+            item.error = f"unsupported task {item.task}"
+            continue
+        rows[index] = row
+        live.append(item)
+
+    _fetch_inputs(live)
+    _convert_items(live)
+
+    # Job outputs go to storage before the rows pointing at them are committed
+    if any(item.task == CONVERT_DOCUMENT and item.error is None for item in live):
+        from .services import Storage
+        storage = Storage()
+        for item in live:
+            if item.task == CONVERT_DOCUMENT and item.error is None:
+                output_path = f"outputs/{item.args[0]}/result.md"
+                try:
+                    storage.write_bytes(output_path, item.markdown.encode("utf-8"))
+                    item.extra["output_path"] = output_path
+                except Exception as e:
+                    item.error = f"store failed: {e}"
+
+    _persist(items, rows)
+    _notify(live)
+
+    logger.info(
+        f"Processed batch of {len(items)}: "
+        f"{sum(1 for i in items if i.status in ('completed', 'COMPLETED'))} completed, "
+        f"{sum(1 for i in items if i.status in ('failed', 'FAILED'))} failed"
+    )
+    return items
@@ -0,0 +1,299 @@
+"""
+Page-aware running header and footer removal.
+
+Converters mark page boundaries with a form feed (pdfminer ends every
+page with ``\\f``).  The first and last BOILERPLATE_EDGE_LINES non-blank
+lines of each page are normalized (case and whitespace folded, and the
+page's own number replaced, so "Page 3 of 40" on page 3 and "page 4 of
+40" on page 4 match) and hashed together with their position from the
+page edge; lines whose hash appears on at least
+BOILERPLATE_MIN_PAGE_RATIO of the pages are removed.  Other numbers are
+kept, so records that differ only by their numbers ("Invoice No. 1001",
+"Invoice No. 1002") never match.  Pages with no more than twice
+BOILERPLATE_EDGE_LINES non-blank lines have no edges, so short pages
+are never emptied.  Only the edge lines are copied and hashed, so the
+pass is linear in the size of the document.  strip_boilerplate_stream
+does the same for text arriving in chunks, such as the PDF text
+fallback's pages, holding one page at a time.
+"""
+from __future__ import annotations
+
+import hashlib
+import io
+import logging
+import math
+import os
+import re
+import tempfile
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+PAGE_BREAK = "\x0c"
+
+_NON_BLANK = re.compile(r"\S")
+_MAX_PATTERNS = 20
+# Longer lines are body text, never running headers or footers
+_MAX_LINE = 120
+
+
+def is_enabled() -> bool:
+    """Check whether boilerplate stripping is enabled (BOILERPLATE_STRIP, default: on)."""
+    return os.getenv("BOILERPLATE_STRIP", "1").strip().lower() not in ("0", "false", "no", "off")
+
+
+def get_edge_lines() -> int:
+    """Get how many non-blank lines at the top and bottom of each page are checked.
+
+    Returns:
+        BOILERPLATE_EDGE_LINES (default: 3)
+    """
+    try:
+        return max(1, int(os.getenv("BOILERPLATE_EDGE_LINES", "3")))
+    except ValueError:
+        return 3
+
+
+def get_min_page_ratio() -> float:
+    """Get the share of pages a line must repeat on to be removed.
+
+    Returns:
+        BOILERPLATE_MIN_PAGE_RATIO (default: 0.5)
+    """
+    try:
+        return min(1.0, max(0.0, float(os.getenv("BOILERPLATE_MIN_PAGE_RATIO", "0.5"))))
+    except ValueError:
+        return 0.5
+
+
+def get_min_pages() -> int:
+    """Get the fewest pages a document needs, and a line must repeat on, to be stripped.
+
+    Returns:
+        BOILERPLATE_MIN_PAGES (default: 3)
+    """
+    try:
+        return max(2, int(os.getenv("BOILERPLATE_MIN_PAGES", "3")))
+    except ValueError:
+        return 3
+
+
+def normalize_line(line: str, page: Optional[int] = None) -> str:
+    """Fold case and whitespace, and the first occurrence of the page number.
+
+    Args:
+        line: Line of text
+        page: 1-based number of the page the line is on; other numbers are kept
+
+    Returns:
+        Normalized line
+    """
+    line = line.replace(PAGE_BREAK, " ")
+    if page is not None:
+        line = re.sub(rf"(?<!\d){page}(?!\d)", "#", line, count=1)
+    return " ".join(line.lower().split())
+
+
+def _line_hash(slot: int, normalized: str) -> bytes:
+    return hashlib.blake2b(f"{slot}\x00{normalized}".encode("utf-8", "surrogatepass"), digest_size=8).digest()
+
+
+def _page_spans(text: str) -> List[Tuple[int, int]]:
+    """(start, end) of each page; a trailing form feed does not start an empty page."""
+    spans, start = [], 0
+    while True:
+        end = text.find(PAGE_BREAK, start)
+        if end == -1:
+            if start < len(text) or not spans:
+                spans.append((start, len(text)))
+            return spans
+        spans.append((start, end))
+        start = end + 1
+
+
+def _edge_spans(text: str, start: int, end: int, count: int) -> List[Tuple[Tuple[int, int], int]]:
+    """Spans and slots of the first and last ``count`` non-blank lines in text[start:end].
+
+    Slots count from the page edge: 0, 1, ... from the top and -1, -2, ...
+    from the bottom.  Pages with ``2 * count`` non-blank lines or fewer
+    have no edges.
+    """
+    head, pos = [], start
+    while pos < end and len(head) < count:
+        stop = text.find("\n", pos, end)
+        stop = end if stop == -1 else stop
+        if not text[pos:stop].isspace() and pos < stop:
+            head.append((pos, stop))
+        pos = stop + 1
+    floor = head[-1][1] if head else start
+    tail, pos = [], end
+    while pos > floor and len(tail) < count:
+        begin = text.rfind("\n", floor, pos) + 1 or floor
+        if not text[begin:pos].isspace() and begin < pos:
+            tail.append((begin, pos))
+        pos = begin - 1
+    if len(tail) < count or not _NON_BLANK.search(text, floor, tail[-1][0]):
+        return []
+    return [(span, slot) for slot, span in enumerate(head)] + [(span, -1 - slot) for slot, span in enumerate(tail)]
+
+
+def _page_cuts(text: str, start: int, end: int, number: int, count: int,
+               samples: Dict[bytes, str]) -> List[Tuple[int, int, bytes]]:
+    """Hash the edge lines of one page.
+
+    Returns:
+        (begin, end, key) of each candidate line, the end including the
+        line's newline, so the line can be cut whole; samples gets the
+        first text seen for each key
+    """
+    cuts = []
+    for (begin, stop), slot in _edge_spans(text, start, end, count):
+        if stop - begin > _MAX_LINE:
+            continue
+        normalized = normalize_line(text[begin:stop], number)
+        if not normalized:
+            continue
+        key = _line_hash(slot, normalized)
+        samples.setdefault(key, text[begin:stop].strip(" \t\r" + PAGE_BREAK))
+        cuts.append((begin, stop + 1 if stop < end and text[stop] == "\n" else stop, key))
+    return cuts
+
+
+def _new_report(pages: int) -> Tuple[Dict[str, Any], int]:
+    threshold = max(get_min_pages(), math.ceil(get_min_page_ratio() * pages))
+    return {"pages": pages, "threshold": threshold, "lines_removed": 0, "chars_removed": 0, "patterns": []}, threshold
+
+
+def _repeated(report: Dict[str, Any], threshold: int, cuts: List[List[Tuple[int, int, bytes]]],
+              samples: Dict[bytes, str]) -> Set[bytes]:
+    """Find the keys on at least ``threshold`` pages and fill in the report."""
+    pages_with: Dict[bytes, int] = {}
+    for page_cuts in cuts:
+        for key in {key for _, _, key in page_cuts}:
+            pages_with[key] = pages_with.get(key, 0) + 1
+    repeated = {key for key, n in pages_with.items() if n >= threshold}
+    if not repeated:
+        return repeated
+    for page_cuts in cuts:
+        for begin, cut_end, key in page_cuts:
+            if key in repeated:
+                report["lines_removed"] += 1
+                report["chars_removed"] += cut_end - begin
+    report["patterns"] = [{"text": samples[key], "pages": pages_with[key]}
+                          for key in sorted(repeated, key=lambda k: (-pages_with[k], samples[k]))[:_MAX_PATTERNS]]
+    logger.info("boilerplate_stripped", extra={"pages": report["pages"],
+                                                "lines_removed": report["lines_removed"],
+                                                "chars_removed": report["chars_removed"]})
+    return repeated
+
+
+def strip_boilerplate(text: str) -> Tuple[str, Optional[Dict[str, Any]]]:
+    """Remove running headers and footers that repeat across pages.
+
+    Args:
+        text: Raw converter output with form feeds between pages
+
+    Returns:
+        Tuple of (text, report).  The report is None when stripping is
+        disabled; otherwise it holds the page count, the page threshold,
+        the lines and characters removed, and the most common removed
+        lines (a sample of each with the number of pages it was on).
+    """
+    if not text or not is_enabled():
+        return text, None
+    pages = _page_spans(text)
+    report, threshold = _new_report(len(pages))
+    if len(pages) < get_min_pages():
+        return text, report
+
+    count = get_edge_lines()
+    samples: Dict[bytes, str] = {}
+    cuts = [_page_cuts(text, start, end, number, count, samples)
+            for number, (start, end) in enumerate(pages, 1)]
+    repeated = _repeated(report, threshold, cuts, samples)
+    if not repeated:
+        return text, report
+
+    out = io.StringIO()
+    pos = 0
+    for page_cuts in cuts:
+        for begin, cut_end, key in page_cuts:
+            if key in repeated:
+                out.write(text[pos:begin])
+                pos = cut_end
+    out.write(text[pos:])
+    return out.getvalue(), report
+
+
+def strip_boilerplate_stream(chunks: Iterable[str], spool_bytes: int = 8 * 1024 * 1024
+                             ) -> Tuple[Iterator[str], Optional[Dict[str, Any]]]:
+    """Remove running headers and footers from text read as a stream of chunks.
+
+    The chunks are read before this returns: the text is spooled (in
+    memory up to ``spool_bytes``, then to a temporary file) while each
+    page's edges are hashed, holding one page at a time.  The returned
+    iterator replays the spool a page at a time with the repeated lines
+    cut, so its concatenation equals strip_boilerplate of the whole text.
+
+    Args:
+        chunks: Text chunks of any size, with form feeds between pages
+        spool_bytes: Spool size kept in memory before moving to disk
+
+    Returns:
+        Tuple of (iterator of output chunks, report); see strip_boilerplate
+    """
+    if not is_enabled():
+        return iter(chunks), None
+    spool = tempfile.SpooledTemporaryFile(max_size=spool_bytes, mode="w+", encoding="utf-8",
+                                          errors="surrogatepass", newline="")
+    count = get_edge_lines()
+    samples: Dict[bytes, str] = {}
+    lengths: List[int] = []
+    cuts: List[List[Tuple[int, int, bytes]]] = []
+    partial: List[str] = []
+    size = 0
+
+    def scan(page: str) -> None:
+        lengths.append(len(page))
+        cuts.append(_page_cuts(page, 0, len(page), len(lengths), count, samples))
+
+    try:
+        for chunk in chunks:
+            spool.write(chunk)
+            size += len(chunk)
+            *complete, rest = chunk.split(PAGE_BREAK)
+            for piece in complete:
+                partial.append(piece)
+                scan("".join(partial))
+                partial = []
+            partial.append(rest)
+        last = "".join(partial)
+        # A trailing form feed does not start an empty page
+        if last or not lengths:
+            scan(last)
+    except BaseException:
+        spool.close()
+        raise
+    if not size:
+        spool.close()
+        return iter(()), None
+
+    report, threshold = _new_report(len(lengths))
+    repeated = _repeated(report, threshold, cuts, samples) if len(lengths) >= get_min_pages() else set()
+
+    def replay() -> Iterator[str]:
+        with spool:
+            spool.seek(0)
+            for page_length, page_cuts in zip(lengths, cuts):
+                page = spool.read(page_length)
+                pieces, pos = [], 0
+                for begin, cut_end, key in page_cuts:
+                    if key in repeated:
+                        pieces.append(page[pos:begin])
+                        pos = cut_end
+                pieces.append(page[pos:])
+                # The form feed after the page, if any
+                pieces.append(spool.read(1))
+                yield "".join(pieces)
+
+    return replay(), report
@@ -1,8 +1,8 @@
 """
 Celery tasks for mdraft.
 
-This module defines Celery tasks for document conversion with proper
-routing based on user priority and comprehensive logging.
+This module defines Celery tasks for document conversion with per-plan
+queue routing and comprehensive logging.
 """
 from __future__ import annotations
 
@@ -15,6 +15,7 @@ from . import db
 from .models import User, Job
 from .conversion import process_job
 from .services import Storage
+from .scheduling import queue_for_user
 
 logger = logging.getLogger(__name__)
 
@@ -38,25 +39,36 @@ def is_pro_user(user_id: int) -> bool:
         return False
 
 
-def get_task_queue(user_id: int) -> str:
-    """Determine task queue based on user priority.
+def get_task_queue(user_id: int, plan: Optional[str] = None, size_bytes: Optional[int] = None,
+                   pages: Optional[int] = None, engine: Optional[str] = None) -> str:
+    """Determine task queue from the user's plan and the conversion cost.
+    
+    Uses the plan cached in Redis so routing never hits the database, and
+    the size/page/engine estimate to pick the small or large lane.
     
     Args:
         user_id: Database user ID
+        plan: Plan already known to the caller, if any
+        size_bytes: File size in bytes, if known
+        pages: Estimated page count, if known
+        engine: Engine the conversion will use, if known
         
     Returns:
-        Queue name: 'mdraft_priority' for pro users, 'mdraft_default' otherwise
+        Queue name such as 'mdraft_pro_small' or 'mdraft_ff_large'
     """
-    return 'mdraft_priority' if is_pro_user(user_id) else 'mdraft_default'
+    return queue_for_user(user_id, plan=plan, size_bytes=size_bytes, pages=pages, engine=engine)
 
 
-def convert_document(job_id: int, user_id: int, gcs_uri: str) -> dict:
+def convert_document(job_id: int, user_id: int, gcs_uri: str, engine: Optional[str] = None,
+                     prefetched_path: Optional[str] = None) -> dict:
     """Convert document using Celery task.
     
     Args:
         job_id: Database job ID
         user_id: Database user ID
         gcs_uri: Storage path for the document
+        engine: Optional engine override decided at admission time
+        prefetched_path: Local copy of the input spooled by the prefetcher
         
     Returns:
         Dictionary with conversion results
@@ -85,7 +97,7 @@ def convert_document(job_id: int, user_id: int, gcs_uri: str) -> dict:
         db.session.commit()
         
         # Process the document
-        markdown_content = process_job(job_id, gcs_uri)
+        markdown_content = process_job(job_id, gcs_uri, engine=engine, prefetched_path=prefetched_path)
         
         # Store result using Storage adapter
         storage = Storage()
@@ -133,13 +145,19 @@ def convert_document(job_id: int, user_id: int, gcs_uri: str) -> dict:
         raise
 
 
-def enqueue_conversion_task(job_id: int, user_id: int, gcs_uri: str) -> Optional[str]:
+def enqueue_conversion_task(job_id: int, user_id: int, gcs_uri: str, engine: Optional[str] = None,
+                            plan: Optional[str] = None, size_bytes: Optional[int] = None,
+                            pages: Optional[int] = None) -> Optional[str]:
     """Enqueue conversion task based on queue mode.
     
     Args:
         job_id: Database job ID
         user_id: Database user ID
         gcs_uri: Storage path for the document
+        engine: Optional engine override decided at admission time
+        plan: User's plan if already known (e.g. from admission control)
+        size_bytes: File size in bytes, used for lane selection
+        pages: Estimated page count, used for lane selection
         
     Returns:
         Task ID if enqueued, None if run synchronously
@@ -147,23 +165,23 @@ def enqueue_conversion_task(job_id: int, user_id: int, gcs_uri: str) -> Optional
     queue_mode = os.getenv("QUEUE_MODE", "celery").lower()
     
     if queue_mode == "celery":
-        # Import Celery app and create task
         from celery_worker import celery
         
-        # Create task function with decorator
-        @celery.task(bind=True)
-        def celery_convert_document(self, job_id: int, user_id: int, gcs_uri: str) -> dict:
-            return convert_document(job_id, user_id, gcs_uri)
-        
-        # Enqueue as Celery task
-        task = celery_convert_document.delay(job_id, user_id, gcs_uri)
-        logger.info(f"Enqueued Celery task {task.id} for job {job_id}")
+        # Route to the plan/lane queue; the task is registered by app.tasks_convert
+        queue = get_task_queue(user_id, plan=plan, size_bytes=size_bytes, pages=pages, engine=engine)
+        task = celery.send_task(
+            "convert_document",
+            args=[job_id, user_id, gcs_uri],
+            kwargs={"engine": engine, "size_bytes": size_bytes, "pages": pages},
+            queue=queue,
+        )
+        logger.info(f"Enqueued Celery task {task.id} for job {job_id} on {queue}")
         return task.id
     else:
         # Run synchronously (for local development)
         logger.info(f"Running conversion synchronously for job {job_id}")
         try:
-            result = convert_document(job_id, user_id, gcs_uri)
+            result = convert_document(job_id, user_id, gcs_uri, engine=engine)
             return f"sync_{job_id}"
         except Exception as e:
             logger.error(f"Sync conversion failed for job {job_id}: {e}")
@@ -192,3 +210,25 @@ def daily_cleanup_task() -> dict:
             "error": str(e),
             "timestamp": datetime.utcnow().isoformat()
         }
+
+
+def expiry_sweep_task() -> dict:
+    """Expiry sweep task for Celery beat.
+    
+    This task expires conversions past their expires_at in small batches
+    and is scheduled to run every EXPIRY_SWEEP_INTERVAL seconds.
+    
+    Returns:
+        Dictionary with sweep results
+    """
+    from .cleanup import sweep_expired_conversions
+    
+    try:
+        return sweep_expired_conversions()
+    except Exception as e:
+        logger.error(f"Expiry sweep failed: {e}")
+        return {
+            "status": "failed",
+            "error": str(e),
+            "timestamp": datetime.utcnow().isoformat()
+        }
@@ -9,9 +9,12 @@ from __future__ import annotations
 
 import logging
 import os
+import time
 from datetime import datetime, timedelta
 from typing import List, Optional
 
+from sqlalchemy import and_, delete, func, select
+
 from . import db
 from .models import Job
 from .services import Storage
@@ -47,11 +50,104 @@ def should_use_gcs() -> bool:
     return os.getenv("USE_GCS", "0") == "1"
 
 
+def get_batch_size() -> int:
+    """Get the number of expired rows handled per batch (CLEANUP_BATCH_SIZE, default 500)."""
+    try:
+        return max(1, int(os.getenv("CLEANUP_BATCH_SIZE", "500")))
+    except ValueError:
+        return 500
+
+
+def get_time_budget() -> float:
+    """Get the seconds a cleanup run may spend deleting files.
+
+    Returns:
+        CLEANUP_TIME_BUDGET (default: 600); 0 means no limit
+    """
+    try:
+        return max(0.0, float(os.getenv("CLEANUP_TIME_BUDGET", "600")))
+    except ValueError:
+        return 600.0
+
+
+def _checkpoint_key(kind: str) -> str:
+    return f"cleanup:checkpoint:{kind}"
+
+
+def _load_checkpoint(kind: str) -> Optional[str]:
+    """Get the last row id handled by an interrupted run, if Redis has one."""
+    from .api_usage import _get_redis_client
+
+    redis_client = _get_redis_client()
+    if redis_client is None:
+        return None
+    try:
+        value = redis_client.get(_checkpoint_key(kind))
+    except Exception as e:
+        logger.warning(f"Could not load cleanup checkpoint for {kind}: {e}")
+        return None
+    if isinstance(value, bytes):
+        value = value.decode()
+    return value or None
+
+
+def _save_checkpoint(kind: str, last_id) -> None:
+    """Record where the next run resumes; None clears the checkpoint."""
+    from .api_usage import _get_redis_client
+
+    redis_client = _get_redis_client()
+    if redis_client is None:
+        return
+    try:
+        if last_id is None:
+            redis_client.delete(_checkpoint_key(kind))
+        else:
+            redis_client.set(_checkpoint_key(kind), str(last_id))
+    except Exception as e:
+        logger.warning(f"Could not save cleanup checkpoint for {kind}: {e}")
+
+
+def _object_key(uri: str, bucket_name: Optional[str]) -> Optional[str]:
+    """Map a stored URI to a Storage path.
+
+    Job URIs are Storage paths already; Conversion URIs are ``gs://`` URIs.
+
+    Returns:
+        Storage path, or None if the object lives outside the storage bucket
+    """
+    if uri.startswith("gs://"):
+        bucket, _, path = uri[len("gs://"):].partition("/")
+        return path if bucket == bucket_name and path else None
+    return uri
+
+
+def _expired_sweeps(cutoff_date: datetime) -> list:
+    """Describe the expired objects to delete, as (kind, model, uri column, expiry filter)."""
+    from .models_conversion import Conversion
+
+    return [
+        ("file", Job, Job.output_uri, Job.completed_at < cutoff_date),
+        ("upload", Job, Job.gcs_uri, Job.created_at < cutoff_date),
+        # Conversions with an expires_at are left to sweep_expired_conversions
+        ("conversion", Conversion, Conversion.stored_uri,
+         and_(Conversion.expires_at.is_(None), Conversion.created_at < cutoff_date)),
+    ]
+
+
 def cleanup_old_files() -> dict:
     """Clean up old files based on retention policy.
     
-    This function is idempotent and safe to run multiple times.
-    It will skip cleanup if GCS is not enabled or if deletion is disabled.
+    Expired Jobs and Conversions are paged from the database in id order
+    (keyset batches of CLEANUP_BATCH_SIZE), their objects are deleted with
+    concurrent bulk requests and the rows' URI columns are cleared in one
+    UPDATE per batch.  Objects under a STORAGE_EXPIRY prefix are left to
+    the object store, which deletes them itself; only their rows are
+    cleared.  Cleared rows drop out of later queries, so the
+    function is idempotent and safe to run multiple times.  When
+    CLEANUP_TIME_BUDGET runs out the run stops with status ``partial`` and,
+    if Redis is configured, records its position so the next run resumes
+    there.  It will skip cleanup if GCS is not enabled or if deletion is
+    disabled.
     
     Returns:
         Dictionary with cleanup results
@@ -79,101 +175,92 @@ def cleanup_old_files() -> dict:
     
     retention_days = get_retention_days()
     cutoff_date = datetime.utcnow() - timedelta(days=retention_days)
+    batch_size = get_batch_size()
+    budget = get_time_budget()
+    deadline = time.monotonic() + budget if budget else None
     
     logger.info(f"Cleaning up files older than {cutoff_date} (retention: {retention_days} days)")
     
     storage = Storage()
     files_deleted = 0
+    rows_cleared = 0
     errors = []
     
-    try:
-        # Clean up outputs directory
-        output_files = storage.list_prefix("outputs/")
-        logger.info(f"Found {len(output_files)} files in outputs/")
+    def sweep(kind: str, model, uri_column, expired) -> bool:
+        """Delete one kind of expired object batch by batch; False if out of time."""
+        nonlocal files_deleted, rows_cleared
+        id_column = model.id
+        last_id = _load_checkpoint(kind)
+        if last_id is not None:
+            last_id = id_column.type.python_type(last_id)
+            logger.info(f"Resuming {kind} cleanup after id {last_id}")
         
-        for file_path in output_files:
-            try:
-                # Extract job ID from path: outputs/<job_id>/result.md
-                path_parts = file_path.split('/')
-                if len(path_parts) >= 2:
-                    job_id_str = path_parts[1]
-                    try:
-                        job_id = int(job_id_str)
-                        
-                        # Check job completion date
-                        job = db.session.get(Job, job_id)
-                        if job and job.completed_at:
-                            if job.completed_at < cutoff_date:
-                                # Delete the file
-                                if storage.delete(file_path):
-                                    files_deleted += 1
-                                    logger.info(f"Deleted old file: {file_path} (job {job_id}, completed {job.completed_at})")
-                                else:
-                                    errors.append(f"Failed to delete file: {file_path}")
-                            else:
-                                logger.debug(f"Keeping file: {file_path} (job {job_id}, completed {job.completed_at})")
-                        else:
-                            logger.warning(f"Job {job_id} not found or has no completion date: {file_path}")
-                            
-                    except ValueError:
-                        logger.warning(f"Invalid job ID in path: {file_path}")
+        while True:
+            if deadline is not None and time.monotonic() >= deadline:
+                _save_checkpoint(kind, last_id)
+                logger.info(f"Cleanup time budget spent; {kind} cleanup stopped after id {last_id}")
+                return False
+            
+            query = db.session.query(id_column, uri_column).filter(uri_column.isnot(None), expired)
+            if last_id is not None:
+                query = query.filter(id_column > last_id)
+            rows = query.order_by(id_column).limit(batch_size).all()
+            if not rows:
+                _save_checkpoint(kind, None)
+                return True
+            last_id = rows[-1][0]
+            
+            # Several rows may share an object; delete it once
+            candidates = {}
+            for row_id, uri in rows:
+                path = _object_key(uri, storage.gcs_bucket_name)
+                if path is None:
+                    errors.append(f"Cannot delete {kind} outside the storage bucket: {uri}")
+                    continue
+                candidates.setdefault(path, []).append(row_id)
+            
+            # Objects written with a STORAGE_EXPIRY expiry are deleted here too:
+            # one batched delete costs less than looking up each one's expiry
+            cleared = []
+            for result in storage.delete_many(list(candidates)):
+                if result.ok:
+                    # Objects that are already gone are cleared too
+                    cleared.extend(candidates[result.path])
+                    if result.value:
+                        files_deleted += 1
+                        logger.debug(f"Deleted old {kind}: {result.path}")
                 else:
-                    logger.warning(f"Invalid file path format: {file_path}")
-                    
-            except Exception as e:
-                error_msg = f"Error processing file {file_path}: {e}"
-                logger.error(error_msg)
-                errors.append(error_msg)
-        
-        # Clean up uploads directory (optional - more aggressive cleanup)
-        upload_files = storage.list_prefix("uploads/")
-        logger.info(f"Found {len(upload_files)} files in uploads/")
-        
-        for file_path in upload_files:
-            try:
-                # Extract job ID from path: uploads/<job_id>/<filename>
-                path_parts = file_path.split('/')
-                if len(path_parts) >= 2:
-                    job_id_str = path_parts[1]
-                    try:
-                        job_id = int(job_id_str)
-                        
-                        # Check job creation date
-                        job = db.session.get(Job, job_id)
-                        if job and job.created_at:
-                            if job.created_at < cutoff_date:
-                                # Delete the file
-                                if storage.delete(file_path):
-                                    files_deleted += 1
-                                    logger.info(f"Deleted old upload: {file_path} (job {job_id}, created {job.created_at})")
-                                else:
-                                    errors.append(f"Failed to delete upload: {file_path}")
-                            else:
-                                logger.debug(f"Keeping upload: {file_path} (job {job_id}, created {job.created_at})")
-                        else:
-                            logger.warning(f"Job {job_id} not found: {file_path}")
-                            
-                    except ValueError:
-                        logger.warning(f"Invalid job ID in path: {file_path}")
-                else:
-                    logger.warning(f"Invalid file path format: {file_path}")
-                    
-            except Exception as e:
-                error_msg = f"Error processing upload {file_path}: {e}"
-                logger.error(error_msg)
-                errors.append(error_msg)
+                    errors.append(f"Failed to delete {kind}: {result.path} ({result.error})")
+            
+            if cleared:
+                db.session.query(model).filter(id_column.in_(cleared)).update(
+                    {uri_column: None}, synchronize_session=False
+                )
+            db.session.commit()
+            rows_cleared += len(cleared)
+            logger.info(f"Cleaned {len(cleared)}/{len(rows)} expired {kind} rows up to id {last_id}")
+    
+    try:
+        complete = True
+        for kind, model, uri_column, expired in _expired_sweeps(cutoff_date):
+            if not sweep(kind, model, uri_column, expired):
+                complete = False
+                break
         
-        logger.info(f"Cleanup completed: {files_deleted} files deleted, {len(errors)} errors")
+        logger.info(f"Cleanup {'completed' if complete else 'paused'}: "
+                    f"{files_deleted} files deleted, {len(errors)} errors")
         
         return {
-            "status": "completed",
+            "status": "completed" if complete else "partial",
             "files_deleted": files_deleted,
+            "rows_cleared": rows_cleared,
             "errors": errors,
             "retention_days": retention_days,
             "cutoff_date": cutoff_date.isoformat()
         }
         
     except Exception as e:
+        db.session.rollback()
         error_msg = f"Cleanup failed: {e}"
         logger.error(error_msg)
         return {
@@ -184,11 +271,78 @@ def cleanup_old_files() -> dict:
         }
 
 
+def get_batch_pause() -> float:
+    """Get the pause in seconds between delete batches (CLEANUP_BATCH_PAUSE, default 0.05).
+
+    The pause lets other transactions on the same tables through between
+    batches.
+    """
+    try:
+        return max(0.0, float(os.getenv("CLEANUP_BATCH_PAUSE", "0.05")))
+    except ValueError:
+        return 0.05
+
+
+def delete_rows_in_batches(model, condition, returning=(), on_batch=None,
+                           batch_size: Optional[int] = None,
+                           pause: Optional[float] = None) -> int:
+    """Delete matching rows in bounded batches, committing after each batch.
+
+    Each batch is a single ``DELETE ... WHERE id IN (SELECT id ... LIMIT n)
+    RETURNING ...`` statement, so neither the rows nor the locks of the
+    whole set are held at once.  Databases without DELETE ... RETURNING
+    select the batch's rows first and delete them by id.
+
+    Args:
+        model: Model whose rows are deleted
+        condition: Filter selecting the rows to delete
+        returning: Extra columns to return for each deleted row
+        on_batch: Called with the returned rows and the running total after each commit
+        batch_size: Rows per batch (default: CLEANUP_BATCH_SIZE)
+        pause: Seconds to sleep between batches (default: CLEANUP_BATCH_PAUSE)
+
+    Returns:
+        Number of rows deleted
+    """
+    batch_size = batch_size or get_batch_size()
+    pause = get_batch_pause() if pause is None else pause
+    columns = (model.id,) + tuple(returning)
+    use_returning = db.session.get_bind().dialect.delete_returning
+    total = 0
+    
+    while True:
+        batch_ids = select(model.id).where(condition).order_by(model.id).limit(batch_size)
+        if use_returning:
+            stmt = delete(model).where(model.id.in_(batch_ids.scalar_subquery())).returning(*columns)
+            rows = db.session.execute(stmt).all()
+        else:
+            rows = db.session.execute(select(*columns).where(model.id.in_(batch_ids.scalar_subquery()))).all()
+            if rows:
+                db.session.execute(delete(model).where(model.id.in_([row[0] for row in rows])))
+        db.session.commit()
+        if not rows:
+            return total
+        
+        total += len(rows)
+        logger.info(f"Deleted {len(rows)} {model.__tablename__} rows ({total} so far)")
+        if on_batch is not None:
+            on_batch(rows, total)
+        if len(rows) < batch_size:
+            return total
+        if pause:
+            time.sleep(pause)
+
+
 def cleanup_old_jobs() -> dict:
     """Clean up old job records from database.
     
     This function removes job records older than retention period
-    that are in terminal states (completed, failed).
+    that are in terminal states (completed, failed), in bounded batches
+    with a commit after each.  When cleanup deletes stored files, rows
+    still holding an output_uri or gcs_uri are kept: their objects have
+    not been deleted yet (the file cleanup ran out of time or failed) and
+    the row is the only reference to them.  A later file cleanup clears
+    the URIs and the row goes on the next run.
     
     Returns:
         Dictionary with cleanup results
@@ -198,22 +352,16 @@ def cleanup_old_jobs() -> dict:
     retention_days = get_retention_days()
     cutoff_date = datetime.utcnow() - timedelta(days=retention_days)
     
+    condition = and_(Job.status.in_(['completed', 'failed']), Job.created_at < cutoff_date)
+    if should_use_gcs() and should_delete_gcs():
+        condition = and_(condition, Job.output_uri.is_(None), Job.gcs_uri.is_(None))
+    
     try:
-        # Delete old completed/failed jobs
-        old_jobs = db.session.query(Job).filter(
-            Job.status.in_(['completed', 'failed']),
-            Job.created_at < cutoff_date
-        ).all()
-        
-        job_count = len(old_jobs)
+        job_count = delete_rows_in_batches(Job, condition)
         if job_count > 0:
-            for job in old_jobs:
-                db.session.delete(job)
-            db.session.commit()
             logger.info(f"Deleted {job_count} old job records")
         else:
             logger.info("No old job records to delete")
-            db.session.commit()  # Commit even when no jobs to delete
         
         return {
             "status": "completed",
@@ -232,6 +380,238 @@ def cleanup_old_jobs() -> dict:
         }
 
 
+def get_sweep_batch_size() -> int:
+    """Get the due conversions expired per sweep batch (EXPIRY_SWEEP_BATCH_SIZE, default 100)."""
+    try:
+        return max(1, int(os.getenv("EXPIRY_SWEEP_BATCH_SIZE", "100")))
+    except ValueError:
+        return 100
+
+
+def get_sweep_time_budget() -> float:
+    """Get the seconds one sweep may run.
+
+    Returns:
+        EXPIRY_SWEEP_TIME_BUDGET (default: 20); 0 means no limit
+    """
+    try:
+        return max(0.0, float(os.getenv("EXPIRY_SWEEP_TIME_BUDGET", "20")))
+    except ValueError:
+        return 20.0
+
+
+def get_sweep_retry_delay() -> int:
+    """Get the seconds before a conversion whose object could not be deleted is retried.
+
+    Returns:
+        EXPIRY_SWEEP_RETRY_DELAY (default: 300)
+    """
+    try:
+        return max(0, int(os.getenv("EXPIRY_SWEEP_RETRY_DELAY", "300")))
+    except ValueError:
+        return 300
+
+
+def _delete_stored_objects(storage, uris: list) -> dict:
+    """Delete conversions' stored objects.
+
+    Objects in the storage bucket go through one bulk request; objects in
+    other buckets are deleted one by one.  Objects that are already gone
+    count as deleted.
+
+    Returns:
+        Mapping of URI to an error message, or None if the object is gone
+    """
+    from google.api_core.exceptions import NotFound
+    from .services.gcs import get_blob
+
+    outcome = {}
+    paths = {}
+    for uri in uris:
+        path = _object_key(uri, storage.gcs_bucket_name)
+        if path is None:
+            try:
+                get_blob(uri).delete()
+                outcome[uri] = None
+            except NotFound:
+                outcome[uri] = None
+            except Exception as e:
+                outcome[uri] = str(e)
+        else:
+            paths[path] = uri
+    for result in storage.delete_many(list(paths)):
+        outcome[paths[result.path]] = None if result.ok else result.error
+    return outcome
+
+
+def delete_conversions_in_batches(condition, on_batch=None, batch_size: Optional[int] = None,
+                                  pause: Optional[float] = None) -> int:
+    """Delete matching conversions and their stored objects, batch by batch.
+
+    Each batch's objects are deleted first (one bulk request for the
+    storage bucket), then only the rows whose objects are gone are
+    deleted and committed.  Rows whose objects could not be deleted are
+    kept, so the next run retries them instead of losing the only
+    reference to the object.
+
+    Args:
+        condition: Filter selecting the conversions to delete
+        on_batch: Called with the running total after each commit
+        batch_size: Rows per batch (default: CLEANUP_BATCH_SIZE)
+        pause: Seconds to sleep between batches (default: CLEANUP_BATCH_PAUSE)
+
+    Returns:
+        Number of rows deleted
+    """
+    from .models_conversion import Conversion
+
+    batch_size = batch_size or get_batch_size()
+    pause = get_batch_pause() if pause is None else pause
+    storage = Storage()
+    total = 0
+    failed = 0
+    last_id = None
+    
+    while True:
+        query = db.session.query(Conversion.id, Conversion.stored_uri).filter(condition)
+        if last_id is not None:
+            query = query.filter(Conversion.id > last_id)
+        rows = query.order_by(Conversion.id).limit(batch_size).all()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        
+        outcome = _delete_stored_objects(storage, [uri for _, uri in rows if uri])
+        done = []
+        for row_id, uri in rows:
+            if uri and outcome.get(uri) is not None:
+                failed += 1
+                logger.warning(f"Keeping conversion {row_id}: failed to delete {uri}: {outcome[uri]}")
+            else:
+                done.append(row_id)
+        if done:
+            db.session.execute(delete(Conversion).where(Conversion.id.in_(done)))
+        db.session.commit()
+        total += len(done)
+        logger.info(f"Deleted {len(done)}/{len(rows)} conversions with their objects ({total} so far)")
+        if on_batch is not None:
+            on_batch(total)
+        if len(rows) < batch_size:
+            break
+        if pause:
+            time.sleep(pause)
+    
+    if failed:
+        logger.warning(f"Kept {failed} conversions whose stored objects could not be deleted")
+    return total
+
+
+def expiry_backlog(now: Optional[datetime] = None) -> dict:
+    """Measure conversions that are past their expires_at but not yet swept.
+
+    Returns:
+        Dictionary with the number of due conversions and the age in
+        seconds of the oldest one
+    """
+    from .models_conversion import Conversion
+
+    now = now or datetime.utcnow()
+    due, oldest = db.session.query(
+        func.count(Conversion.id), func.min(Conversion.expires_at)
+    ).filter(Conversion.expires_at <= now).one()
+    return {
+        "due": due,
+        "oldest_due_seconds": round((now - oldest).total_seconds(), 1) if oldest else 0.0,
+    }
+
+
+def sweep_expired_conversions() -> dict:
+    """Expire due conversions in small batches.
+
+    Meant to run every minute or so.  Each batch takes the conversions
+    with the earliest ``expires_at`` (rows another sweeper holds are
+    skipped), deletes their stored objects when CLEANUP_DELETE_GCS=1, then
+    deletes the rows whose objects are gone.  Rows whose objects could
+    not be deleted are pushed back by EXPIRY_SWEEP_RETRY_DELAY so they do
+    not block the rest of the backlog.  A sweep stops when nothing is due
+    or EXPIRY_SWEEP_TIME_BUDGET is spent.
+
+    Returns:
+        Dictionary with sweep results and the remaining backlog
+    """
+    from .models_conversion import Conversion
+
+    batch_size = get_sweep_batch_size()
+    budget = get_sweep_time_budget()
+    deadline = time.monotonic() + budget if budget else None
+    delete_objects = should_delete_gcs()
+    storage = Storage() if delete_objects else None
+    expired = 0
+    deferred = 0
+    errors = []
+    
+    try:
+        while deadline is None or time.monotonic() < deadline:
+            now = datetime.utcnow()
+            rows = (db.session.query(Conversion.id, Conversion.stored_uri)
+                    .filter(Conversion.expires_at <= now)
+                    .order_by(Conversion.expires_at)
+                    .limit(batch_size)
+                    .with_for_update(skip_locked=True)
+                    .all())
+            if not rows:
+                db.session.commit()
+                break
+            
+            done = [row_id for row_id, uri in rows if not uri or not delete_objects]
+            failed = []
+            if delete_objects:
+                uris = [uri for _, uri in rows if uri]
+                outcome = _delete_stored_objects(storage, uris)
+                for row_id, uri in rows:
+                    if not uri:
+                        continue
+                    if outcome.get(uri) is None:
+                        done.append(row_id)
+                    else:
+                        failed.append(row_id)
+                        errors.append(f"Failed to delete {uri}: {outcome[uri]}")
+            
+            if done:
+                db.session.execute(delete(Conversion).where(Conversion.id.in_(done)))
+            if failed:
+                retry_at = now + timedelta(seconds=get_sweep_retry_delay())
+                db.session.query(Conversion).filter(Conversion.id.in_(failed)).update(
+                    {Conversion.expires_at: retry_at}, synchronize_session=False
+                )
+            db.session.commit()
+            expired += len(done)
+            deferred += len(failed)
+            if len(rows) < batch_size:
+                break
+        
+        backlog = expiry_backlog()
+        logger.info(f"Expiry sweep: {expired} conversions expired, {deferred} deferred, "
+                    f"{backlog['due']} still due")
+        return {
+            "status": "completed",
+            "expired": expired,
+            "deferred": deferred,
+            "errors": errors,
+            "backlog": backlog,
+        }
+    
+    except Exception as e:
+        db.session.rollback()
+        error_msg = f"Expiry sweep failed: {e}"
+        logger.error(error_msg)
+        return {
+            "status": "failed",
+            "error": error_msg,
+            "expired": expired,
+        }
+
+
 def run_cleanup() -> dict:
     """Run complete cleanup process.
     
@@ -1,35 +1,24 @@
 import os
-from datetime import datetime
+from datetime import datetime, timedelta
 from flask import current_app
 from app import create_app, db
 from .models_conversion import Conversion
-from .cleanup import run_cleanup
+from .cleanup import delete_conversions_in_batches, delete_rows_in_batches, run_cleanup
 
-from google.cloud import storage
+def cleanup_impl(retention_days: int, delete_gcs: bool, progress=None):
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+    expired = Conversion.created_at < cutoff
 
-def _delete_gcs_uri(uri: str):
-    if not uri or not uri.startswith("gs://"):
-        return
-    bucket_name, blob_path = uri.replace("gs://", "").split("/", 1)
-    client = storage.Client()
-    bucket = client.bucket(bucket_name)
-    blob = bucket.blob(blob_path)
-    try:
-        blob.delete()
-    except Exception:
-        pass
+    # Objects go before their rows, so a failed delete keeps the row
+    # referencing the object for the next run
+    if delete_gcs:
+        return delete_conversions_in_batches(expired, on_batch=progress)
+
+    def on_batch(rows, total):
+        if progress is not None:
+            progress(total)
 
-def cleanup_impl(retention_days: int, delete_gcs: bool):
-    cutoff = datetime.utcnow().fromtimestamp(int(datetime.utcnow().timestamp() - retention_days*86400))
-    q = (Conversion.query
-         .filter(Conversion.created_at < cutoff))
-    count = 0
-    for row in q:
-        if delete_gcs and row.stored_uri:
-            _delete_gcs_uri(row.stored_uri)
-        db.session.delete(row); count += 1
-    db.session.commit()
-    return count
+    return delete_rows_in_batches(Conversion, expired, on_batch=on_batch)
 
 def backfill_sha_impl():
     from .quality import sha256_file
@@ -50,7 +39,7 @@ def register_cli(app):
     def cleanup_cmd():
         days = int(os.getenv("RETENTION_DAYS", "30"))
         delete_gcs = os.getenv("CLEANUP_DELETE_GCS", "1").lower() in ("1","true","yes")
-        n = cleanup_impl(days, delete_gcs)
+        n = cleanup_impl(days, delete_gcs, progress=lambda total: print(f"[cleanup] {total} rows deleted so far"))
         print(f"[cleanup] deleted {n} rows older than {days} days")
 
     @app.cli.command("cleanup-run-once")
@@ -64,7 +53,7 @@ def register_cli(app):
         
         file_cleanup = result['file_cleanup']
         print(f"File cleanup: {file_cleanup['status']}")
-        if file_cleanup['status'] == 'completed':
+        if file_cleanup['status'] in ('completed', 'partial'):
             print(f"  Files deleted: {file_cleanup['files_deleted']}")
             if file_cleanup['errors']:
                 print(f"  Errors: {len(file_cleanup['errors'])}")
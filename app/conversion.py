@@ -22,6 +22,7 @@ from flask import current_app
 
 from . import db
 from .models import Job
+from .passthrough import ENGINE as PASSTHROUGH_ENGINE, convert as convert_passthrough, is_passthrough, mime_for_filename
 
 
 def convert_with_markitdown(input_path: str) -> str:
@@ -200,6 +201,20 @@ def convert_with_docai(project_id: str, location: str, processor_id: str, input_
         return _generate_stub_conversion(input_path, f"Document AI error: {str(e)}")
 
 
+def engine_flags() -> Dict[str, Any]:
+    """Collect the configuration flags used for conversion engine selection.
+    
+    Returns:
+        Dictionary of flags suitable for passing to choose_engine().
+    """
+    return {
+        "PRO_CONVERSION_ENABLED": os.getenv("PRO_CONVERSION_ENABLED", "false"),
+        "GOOGLE_CLOUD_PROJECT": current_app.config.get("GOOGLE_CLOUD_PROJECT"),
+        "DOCAI_PROCESSOR_ID": current_app.config.get("DOCAI_PROCESSOR_ID"),
+        "DOCAI_LOCATION": current_app.config.get("DOCAI_LOCATION", "us")
+    }
+
+
 def choose_engine(mime_type: str, flags: Dict[str, Any]) -> str:
     """Choose the conversion engine based on MIME type and configuration flags.
     
@@ -208,10 +223,15 @@ def choose_engine(mime_type: str, flags: Dict[str, Any]) -> str:
         flags: Configuration flags including PRO_CONVERSION_ENABLED and DocAI settings.
         
     Returns:
-        Engine name: "markitdown" or "docai"
+        Engine name: "passthrough", "markitdown" or "docai"
     """
     logger = logging.getLogger(__name__)
     
+    # Text, Markdown, CSV and JSON are converted natively on any plan
+    if is_passthrough(mime_type):
+        logger.info(f"Using passthrough converter for {mime_type}")
+        return PASSTHROUGH_ENGINE
+    
     # Check if pro conversion is enabled
     pro_conversion_enabled = flags.get("PRO_CONVERSION_ENABLED", "false").lower() == "true"
     if not pro_conversion_enabled:
@@ -337,7 +357,8 @@ def _extract_table_data(table: Any, document_text: str) -> Dict[str, Any]:
         return {"headers": [], "rows": []}
 
 
-def process_job(job_id: int, gcs_uri: str) -> str:
+def process_job(job_id: int, gcs_uri: str, engine: Optional[str] = None,
+                prefetched_path: Optional[str] = None) -> str:
     """Process a document conversion job with GCS integration.
 
     This function implements the idempotent processing logic required
@@ -348,6 +369,10 @@ def process_job(job_id: int, gcs_uri: str) -> str:
     Args:
         job_id: Primary key of the Job to process.
         gcs_uri: GCS URI of the input file (required)
+        engine: Optional engine override decided at admission time; when
+            omitted the engine is chosen from the MIME type.
+        prefetched_path: Local copy of the input already downloaded by the
+            worker's prefetcher; skips the storage download when given.
 
     Returns:
         Markdown content as string.
@@ -365,6 +390,11 @@ def process_job(job_id: int, gcs_uri: str) -> str:
     
     if job.status == "completed":
         logger.info(f"Duplicate task received for job {job_id}, skipping")
+        if prefetched_path:
+            try:
+                os.unlink(prefetched_path)
+            except OSError:
+                pass
         # Return existing content if available, otherwise empty string
         return ""
     
@@ -373,46 +403,44 @@ def process_job(job_id: int, gcs_uri: str) -> str:
         logger.error(f"No storage path provided for job {job_id}")
         raise ValueError("No storage path provided")
     
-    # Download file from storage to temp
-    try:
-        storage = Storage()
-        
-        # Check if file exists in storage
-        if not storage.exists(gcs_uri):
-            logger.error(f"File not found in storage for job {job_id}: {gcs_uri}")
-            raise FileNotFoundError(f"File not found in storage: {gcs_uri}")
-        
-        # Read file data from storage
-        file_data = storage.read_bytes(gcs_uri)
-        
-        # Write to temporary file for processing
-        import tempfile
-        temp_fd, input_path = tempfile.mkstemp(suffix=f"_{job.filename}")
-        with os.fdopen(temp_fd, 'wb') as f:
-            f.write(file_data)
-        
-        logger.info(f"Downloaded {gcs_uri} to temporary file {input_path}")
-    except Exception as e:
-        logger.error(f"Failed to download file for job {job_id}: {e}")
-        raise
+    # Download file from storage to temp, unless the worker prefetched it
+    if prefetched_path:
+        input_path = prefetched_path
+        logger.info(f"Using prefetched input {input_path} for job {job_id}")
+    else:
+        try:
+            storage = Storage()
+            
+            # Stream it to a temporary file for processing, in one download
+            import tempfile
+            temp_fd, input_path = tempfile.mkstemp(suffix=f"_{job.filename}")
+            try:
+                with os.fdopen(temp_fd, 'wb') as f:
+                    storage.download_to_file(gcs_uri, f)
+            except BaseException as e:
+                os.unlink(input_path)
+                if isinstance(e, FileNotFoundError):
+                    logger.error(f"File not found in storage for job {job_id}: {gcs_uri}")
+                raise
+            
+            logger.info(f"Downloaded {gcs_uri} to temporary file {input_path}")
+        except Exception as e:
+            logger.error(f"Failed to download file for job {job_id}: {e}")
+            raise
     
     # Determine MIME type for conversion engine selection
     import filetype
     with open(input_path, "rb") as f:
         sample = f.read(261)
     kind = filetype.guess(sample)
-    mime_type = kind.mime if kind else "application/octet-stream"
+    mime_type = kind.mime if kind else (mime_for_filename(job.filename) or "application/octet-stream")
     
     # Get configuration flags
-    flags = {
-        "PRO_CONVERSION_ENABLED": os.getenv("PRO_CONVERSION_ENABLED", "false"),
-        "GOOGLE_CLOUD_PROJECT": current_app.config.get("GOOGLE_CLOUD_PROJECT"),
-        "DOCAI_PROCESSOR_ID": current_app.config.get("DOCAI_PROCESSOR_ID"),
-        "DOCAI_LOCATION": current_app.config.get("DOCAI_LOCATION", "us")
-    }
+    flags = engine_flags()
     
-    # Choose conversion engine
-    engine = choose_engine(mime_type, flags)
+    # Choose conversion engine unless admission control already pinned one
+    if engine is None:
+        engine = choose_engine(mime_type, flags)
     logger.info(f"Using {engine} engine for conversion: {job.filename} (MIME: {mime_type})")
     
     try:
@@ -425,6 +453,8 @@ def process_job(job_id: int, gcs_uri: str) -> str:
                 input_path=input_path,
                 mime_type=mime_type
             )
+        elif engine == PASSTHROUGH_ENGINE:
+            markdown_content = convert_passthrough(input_path, mime_type)
         else:
             # Use markitdown for other file types
             markdown_content = convert_with_markitdown(input_path)
@@ -122,3 +122,23 @@ def health() -> tuple[Dict[str, Any], int]:
     except Exception as e:
         logger.exception("Database health check failed")
         return jsonify({"status": "database_error"}), 503
+
+
+@bp.get("/metrics/expiry")
+def expiry_metrics() -> tuple[Dict[str, Any], int]:
+    """Expiry backlog endpoint.
+    
+    Reports conversions past their expires_at that the expiry sweeper
+    has not removed yet, so monitoring can alert when it falls behind.
+    
+    Returns:
+        JSON response with the number of due conversions and the age of
+        the oldest one in seconds
+    """
+    from .cleanup import expiry_backlog
+    
+    try:
+        return jsonify(expiry_backlog()), 200
+    except Exception:
+        logger.exception("Expiry backlog query failed")
+        return jsonify({"status": "database_error"}), 503
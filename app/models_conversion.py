@@ -18,4 +18,5 @@ class Conversion(db.Model):
     original_mime = db.Column(db.String(120), nullable=True)
     original_size = db.Column(db.Integer, nullable=True)
     stored_uri = db.Column(db.String(512), nullable=True)   # e.g., gs://bucket/path
-    expires_at = db.Column(db.DateTime, nullable=True)      # optional TTL
+    expires_at = db.Column(db.DateTime, nullable=True, index=True)  # optional TTL, swept by the expiry sweeper
+    boilerplate = db.Column(db.JSON, nullable=True)  # report of running headers/footers stripped
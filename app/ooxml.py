@@ -0,0 +1,216 @@
+"""
+Bounded-read inspection of OOXML (DOCX, PPTX, XLSX) uploads.
+
+Only the ZIP end-of-central-directory record and the central directory
+are read, with seeks from the end of the stream, so inspecting an upload
+costs a few kilobytes of I/O whatever its size and nothing is
+decompressed.  From the directory the container is classified by its
+main part, its parts are counted, and it is checked against
+decompression bombs: entries that expand more than OOXML_MAX_RATIO
+times, archives that expand to more than OOXML_MAX_EXPANSION_BYTES in
+total, and entries whose data overlap (the trick behind non-recursive
+zip bombs).
+"""
+from __future__ import annotations
+
+import logging
+import os
+import struct
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DOCX_MIME = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+PPTX_MIME = "application/vnd.openxmlformats-officedocument.presentationml.presentation"
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+# Main part that identifies each document type
+MAIN_PARTS = {
+    "word/document.xml": ("docx", DOCX_MIME),
+    "ppt/presentation.xml": ("pptx", PPTX_MIME),
+    "xl/workbook.xml": ("xlsx", XLSX_MIME),
+}
+MIME_TYPES = {DOCX_MIME, PPTX_MIME, XLSX_MIME}
+
+_EOCD = struct.Struct("<4s4H2LH")
+_ZIP64_LOCATOR = struct.Struct("<4sLQL")
+_ZIP64_EOCD = struct.Struct("<4sQ2H2L4Q")
+_ENTRY = struct.Struct("<4s6H3L5H2L")
+_LOCAL_HEADER_SIZE = 30
+_MAX_COMMENT = 0xFFFF
+
+# Largest central directory read; a directory of this size lists
+# thousands of parts, far more than any real document has
+_MAX_DIRECTORY_BYTES = 1024 * 1024
+# Entries smaller than this are never rejected for their ratio alone
+_RATIO_MIN_BYTES = 1024 * 1024
+
+
+class UnsafeContainer(ValueError):
+    """Raised when an upload's ZIP container fails inspection."""
+
+
+def get_max_parts() -> int:
+    """Get the most parts an OOXML container may hold (OOXML_MAX_PARTS, default: 5000)."""
+    try:
+        return max(1, int(os.getenv("OOXML_MAX_PARTS", "5000")))
+    except ValueError:
+        return 5000
+
+
+def get_max_ratio() -> float:
+    """Get the largest compression ratio allowed for one part (OOXML_MAX_RATIO, default: 200)."""
+    try:
+        return max(1.0, float(os.getenv("OOXML_MAX_RATIO", "200")))
+    except ValueError:
+        return 200.0
+
+
+def get_max_expansion() -> int:
+    """Get the largest total uncompressed size allowed (OOXML_MAX_EXPANSION_BYTES, default: 512 MiB)."""
+    try:
+        return max(1, int(os.getenv("OOXML_MAX_EXPANSION_BYTES", str(512 * 1024 * 1024))))
+    except ValueError:
+        return 512 * 1024 * 1024
+
+
+def _read_at(stream: BinaryIO, offset: int, length: int) -> bytes:
+    stream.seek(offset)
+    return stream.read(length)
+
+
+def _find_directory(stream: BinaryIO, size: int) -> Tuple[int, int, int]:
+    """Locate the central directory.
+
+    Returns:
+        Tuple of (entry count, directory size, directory offset)
+    """
+    # Archives rarely carry a comment, so try a short tail first
+    for window in (1024, _EOCD.size + _MAX_COMMENT):
+        tail_start = max(0, size - window)
+        tail = _read_at(stream, tail_start, size - tail_start)
+        pos = tail.rfind(b"PK\x05\x06")
+        if pos != -1 or tail_start == 0:
+            break
+    if pos == -1 or len(tail) - pos < _EOCD.size:
+        raise UnsafeContainer("not a zip container")
+    _, _, _, _, count, dir_size, dir_offset, _ = _EOCD.unpack_from(tail, pos)
+    if count == 0xFFFF or dir_size == 0xFFFFFFFF or dir_offset == 0xFFFFFFFF:
+        locator_at = tail_start + pos - _ZIP64_LOCATOR.size
+        locator = _read_at(stream, locator_at, _ZIP64_LOCATOR.size) if locator_at >= 0 else b""
+        if len(locator) < _ZIP64_LOCATOR.size or not locator.startswith(b"PK\x06\x07"):
+            raise UnsafeContainer("zip64 locator missing")
+        record = _read_at(stream, _ZIP64_LOCATOR.unpack(locator)[2], _ZIP64_EOCD.size)
+        if len(record) < _ZIP64_EOCD.size or not record.startswith(b"PK\x06\x06"):
+            raise UnsafeContainer("zip64 directory record missing")
+        _, _, _, _, _, _, _, count, dir_size, dir_offset = _ZIP64_EOCD.unpack(record)
+    return count, dir_size, dir_offset
+
+
+def _zip64_sizes(extra: bytes, usize: int, csize: int, offset: int) -> Tuple[int, int, int]:
+    """Apply a zip64 extra field to sizes and offset stored as 0xFFFFFFFF."""
+    pos = 0
+    while pos + 4 <= len(extra):
+        tag, length = struct.unpack_from("<2H", extra, pos)
+        if tag == 0x0001:
+            values = list(struct.unpack_from(f"<{min(length, len(extra) - pos - 4) // 8}Q", extra, pos + 4))
+            if usize == 0xFFFFFFFF and values:
+                usize = values.pop(0)
+            if csize == 0xFFFFFFFF and values:
+                csize = values.pop(0)
+            if offset == 0xFFFFFFFF and values:
+                offset = values.pop(0)
+            break
+        pos += 4 + length
+    return usize, csize, offset
+
+
+def _read_entries(stream: BinaryIO, count: int, dir_size: int, dir_offset: int,
+                  size: int) -> List[Tuple[str, int, int, int, int]]:
+    """Parse the central directory into (name, compressed, uncompressed, offset, raw name length) tuples."""
+    if dir_size > _MAX_DIRECTORY_BYTES or count > get_max_parts():
+        raise UnsafeContainer("too many parts")
+    if dir_offset + dir_size > size:
+        raise UnsafeContainer("central directory out of bounds")
+    data = _read_at(stream, dir_offset, dir_size)
+    entries, pos = [], 0
+    for _ in range(count):
+        if pos + _ENTRY.size > len(data) or data[pos:pos + 4] != b"PK\x01\x02":
+            raise UnsafeContainer("corrupt central directory")
+        fields = _ENTRY.unpack_from(data, pos)
+        csize, usize, name_len, extra_len, comment_len, offset = (
+            fields[8], fields[9], fields[10], fields[11], fields[12], fields[16])
+        start = pos + _ENTRY.size
+        name = data[start:start + name_len].decode("utf-8" if fields[3] & 0x800 else "cp437", "replace")
+        extra = data[start + name_len:start + name_len + extra_len]
+        usize, csize, offset = _zip64_sizes(extra, usize, csize, offset)
+        entries.append((name, csize, usize, offset, name_len))
+        pos = start + name_len + extra_len + comment_len
+    return entries
+
+
+def _check_bounds(entries: List[Tuple[str, int, int, int, int]], dir_offset: int) -> Optional[str]:
+    """Return why the entries are unsafe, or None."""
+    max_ratio = get_max_ratio()
+    total = 0
+    for name, csize, usize, _, _ in entries:
+        total += usize
+        if usize > _RATIO_MIN_BYTES and usize > max_ratio * max(csize, 1):
+            return f"part {name} expands {usize // max(csize, 1)}x"
+    if total > get_max_expansion():
+        return f"expands to {total} bytes"
+    # Each entry's local header and data must end before the next entry
+    # starts; the header holds the raw name bytes, not the decoded name
+    spans = sorted((offset, offset + _LOCAL_HEADER_SIZE + name_len + csize)
+                   for _, csize, _, offset, name_len in entries)
+    for (_, end), (next_start, _) in zip(spans, spans[1:] + [(dir_offset, 0)]):
+        if end > next_start:
+            return "overlapping parts"
+    return None
+
+
+def inspect_container(stream: BinaryIO) -> Dict[str, Any]:
+    """Inspect a ZIP upload from its central directory only.
+
+    The stream position is restored before returning.
+
+    Args:
+        stream: Seekable binary stream holding the upload
+
+    Returns:
+        Dictionary with kind ('docx', 'pptx', 'xlsx' or None for other
+        ZIP files), mime, parts, compressed_bytes and uncompressed_bytes
+
+    Raises:
+        UnsafeContainer: If the stream is not a readable ZIP container or
+            would expand past the configured limits
+    """
+    position = stream.tell()
+    try:
+        size = stream.seek(0, os.SEEK_END)
+        count, dir_size, dir_offset = _find_directory(stream, size)
+        entries = _read_entries(stream, count, dir_size, dir_offset, size)
+    finally:
+        stream.seek(position)
+    problem = _check_bounds(entries, dir_offset)
+    if problem:
+        logger.warning(f"Rejected zip container: {problem}")
+        raise UnsafeContainer(problem)
+
+    names = {name for name, _, _, _, _ in entries}
+    kind, mime = None, None
+    if "[Content_Types].xml" in names:
+        kind, mime = next((MAIN_PARTS[name] for name in MAIN_PARTS if name in names), (None, None))
+    return {
+        "kind": kind,
+        "mime": mime,
+        "parts": len(entries),
+        "compressed_bytes": sum(csize for _, csize, _, _, _ in entries),
+        "uncompressed_bytes": sum(usize for _, _, usize, _, _ in entries),
+    }
+
+
+def inspect_path(path: str) -> Dict[str, Any]:
+    """Inspect a ZIP file on disk (see inspect_container)."""
+    with open(path, "rb") as stream:
+        return inspect_container(stream)
@@ -0,0 +1,730 @@
+"""
+Fast page counting for mdraft uploads.
+
+This module estimates the number of pages in an uploaded document without
+parsing its body.  PDFs are counted by following ``startxref`` from the
+tail of the file to the trailer, the document catalog and the root
+``/Pages`` node, reading only those few objects with seeks.  DOCX and PPTX
+files are counted from the ZIP central directory and ``docProps/app.xml``,
+and XLSX files by their worksheet parts.  Results are cached by a
+fingerprint of the upload's size and a few sampled windows (see
+sample_digest), so repeated estimates of the same file are free and a
+cache lookup never reads the whole upload.
+
+All functions operate on seekable binary streams and restore the stream
+position before returning, so they can run against an upload before it is
+saved or forwarded.
+"""
+from __future__ import annotations
+
+import hashlib
+import logging
+import math
+import os
+import re
+import threading
+import zipfile
+import zlib
+from collections import OrderedDict
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Number of bytes read from the end of a PDF when looking for startxref
+PDF_TAIL_BYTES = 4096
+
+# Read windows tried, in order, when an object does not fit the first one
+_OBJECT_WINDOWS = (16 * 1024, 256 * 1024, 4 * 1024 * 1024)
+
+# Chunking used by the fallback scan
+_SCAN_CHUNK = 1024 * 1024
+_SCAN_OVERLAP = 4096
+
+# Cache fingerprint: bytes hashed from each end, plus evenly spaced
+# windows in between; smaller uploads are hashed whole
+_SAMPLE_EDGE_BYTES = 64 * 1024
+_SAMPLE_WINDOWS = 16
+_SAMPLE_WINDOW_BYTES = 4096
+
+# Most bytes an object or xref stream may inflate to
+_MAX_DECODED_STREAM = 16 * 1024 * 1024
+
+# Approximate number of characters on a page of plain text
+TEXT_CHARS_PER_PAGE = 3000
+
+# Approximate uncompressed size of word/document.xml per page of a DOCX
+DOCX_XML_BYTES_PER_PAGE = 20000
+
+# Largest docProps/app.xml we are willing to read
+_MAX_APP_XML_BYTES = 1024 * 1024
+
+_TEXT_EXTENSIONS = {"txt", "md", "markdown", "csv", "json"}
+
+_STARTXREF_RE = re.compile(rb"startxref\s+(\d+)")
+_OBJ_HEADER_RE = re.compile(rb"\s*(\d+)\s+(\d+)\s+obj")
+_XREF_SUBSECTION_RE = re.compile(rb"\s*(\d+)[ \t]+(\d+)[ \t]*(?:\r\n|\r|\n)")
+_XREF_ENTRY_RE = re.compile(rb"(\d{10}) (\d{5}) ([nf])(\r\n| \r| \n|\r|\n)")
+_PAGES_TYPE_RE = re.compile(rb"/Type\s*/Pages(?![A-Za-z])")
+_COUNT_RE = re.compile(rb"/Count\s+(\d+)\b(?!\s+\d+\s+R\b)")
+_APP_PAGES_RE = re.compile(rb"<(?:\w+:)?Pages>\s*(\d+)\s*</(?:\w+:)?Pages>")
+_SLIDE_PART_RE = re.compile(r"^ppt/slides/slide\d+\.xml$")
+_SHEET_PART_RE = re.compile(r"^xl/worksheets/sheet\d+\.xml$")
+
+_WHITESPACE = b" \t\r\n\x0c\x00"
+_DELIMITERS = b"()<>[]{}/%"
+
+
+class _Truncated(Exception):
+    """Raised when an object runs past the end of the bytes read so far."""
+
+
+class _Ref:
+    """An indirect object reference (``n g R``)."""
+
+    __slots__ = ("num", "gen")
+
+    def __init__(self, num: int, gen: int) -> None:
+        self.num = num
+        self.gen = gen
+
+
+class _Lexer:
+    """Minimal PDF object parser for dictionaries, arrays and scalars."""
+
+    def __init__(self, data: bytes, pos: int = 0, at_eof: bool = False) -> None:
+        self.data = data
+        self.pos = pos
+        self.at_eof = at_eof
+
+    def _skip_whitespace(self) -> None:
+        data = self.data
+        n = len(data)
+        while self.pos < n:
+            c = data[self.pos]
+            if c in _WHITESPACE:
+                self.pos += 1
+            elif c == 0x25:  # '%' comment
+                while self.pos < n and data[self.pos] not in b"\r\n":
+                    self.pos += 1
+            else:
+                return
+        if not self.at_eof:
+            raise _Truncated()
+
+    def token(self) -> Any:
+        """Return the next token: a delimiter string, a name, or a scalar."""
+        self._skip_whitespace()
+        data = self.data
+        n = len(data)
+        start = self.pos
+        if start >= n:
+            raise _Truncated()
+        c = data[start]
+        if data.startswith(b"<<", start):
+            self.pos += 2
+            return "<<"
+        if data.startswith(b">>", start):
+            self.pos += 2
+            return ">>"
+        if c in b"[]":
+            self.pos += 1
+            return chr(c)
+        if c == 0x2F:  # '/' name
+            self.pos += 1
+            while self.pos < n and data[self.pos] not in _WHITESPACE and data[self.pos] not in _DELIMITERS:
+                self.pos += 1
+            if self.pos >= n and not self.at_eof:
+                raise _Truncated()
+            return ("name", data[start + 1:self.pos].decode("latin-1"))
+        if c == 0x28:  # '(' literal string
+            depth = 0
+            while self.pos < n:
+                b = data[self.pos]
+                if b == 0x5C:  # backslash escape
+                    self.pos += 2
+                    continue
+                if b == 0x28:
+                    depth += 1
+                elif b == 0x29:
+                    depth -= 1
+                    if depth == 0:
+                        self.pos += 1
+                        return ("string", None)
+                self.pos += 1
+            raise _Truncated()
+        if c == 0x3C:  # '<' hex string
+            end = data.find(b">", start)
+            if end < 0:
+                raise _Truncated()
+            self.pos = end + 1
+            return ("string", None)
+        while self.pos < n and data[self.pos] not in _WHITESPACE and data[self.pos] not in _DELIMITERS:
+            self.pos += 1
+        if self.pos >= n and not self.at_eof:
+            raise _Truncated()
+        word = data[start:self.pos]
+        if not word:
+            # Stray delimiter such as '{' or ')'; skip it
+            self.pos += 1
+            return ("keyword", word)
+        try:
+            return int(word)
+        except ValueError:
+            pass
+        try:
+            return float(word)
+        except ValueError:
+            return ("keyword", word)
+
+    def value(self) -> Any:
+        """Parse one complete PDF value starting at the current position."""
+        tok = self.token()
+        if tok == "<<":
+            result: Dict[str, Any] = {}
+            while True:
+                key = self.token()
+                if key == ">>":
+                    return result
+                if not isinstance(key, tuple) or key[0] != "name":
+                    continue
+                result[key[1]] = self.value()
+        if tok == "[":
+            items: List[Any] = []
+            while True:
+                saved = self.pos
+                tok = self.token()
+                if tok == "]":
+                    return items
+                self.pos = saved
+                items.append(self.value())
+        if isinstance(tok, int):
+            saved = self.pos
+            try:
+                gen = self.token()
+                if isinstance(gen, int):
+                    keyword = self.token()
+                    if keyword == ("keyword", b"R"):
+                        return _Ref(tok, gen)
+            except (_Truncated, IndexError):
+                if not self.at_eof:
+                    raise
+            self.pos = saved
+            return tok
+        if isinstance(tok, tuple) and tok[0] == "name":
+            return tok
+        return tok
+
+
+def _stream_size(stream: BinaryIO) -> int:
+    position = stream.tell()
+    stream.seek(0, os.SEEK_END)
+    size = stream.tell()
+    stream.seek(position)
+    return size
+
+
+def _read_at(stream: BinaryIO, offset: int, length: int) -> bytes:
+    stream.seek(offset)
+    return stream.read(length)
+
+
+def _name(value: Any) -> Optional[str]:
+    if isinstance(value, tuple) and value and value[0] == "name":
+        return value[1]
+    return None
+
+
+class _PdfReader:
+    """Resolve a handful of objects in a PDF by seeking, never loading the body."""
+
+    def __init__(self, stream: BinaryIO, size: int) -> None:
+        self.stream = stream
+        self.size = size
+        # Each entry is ("table", sections) or ("stream", (index, widths, rows))
+        self.xrefs: List[Tuple[str, Any]] = []
+        self.trailer: Dict[str, Any] = {}
+        self._objstm_cache: Dict[int, Tuple[bytes, Dict[str, Any]]] = {}
+
+    # -- xref loading -------------------------------------------------
+
+    def load(self) -> None:
+        tail_start = max(0, self.size - PDF_TAIL_BYTES)
+        tail = _read_at(self.stream, tail_start, PDF_TAIL_BYTES)
+        matches = list(_STARTXREF_RE.finditer(tail))
+        if not matches:
+            raise ValueError("startxref not found")
+        offset: Optional[int] = int(matches[-1].group(1))
+
+        seen = set()
+        while offset is not None and offset not in seen and len(seen) < 64:
+            seen.add(offset)
+            trailer = self._load_xref_at(offset)
+            if not self.trailer:
+                self.trailer = trailer
+            xref_stm = trailer.get("XRefStm")
+            if isinstance(xref_stm, int) and xref_stm not in seen:
+                seen.add(xref_stm)
+                self._load_xref_at(xref_stm)
+            prev = trailer.get("Prev")
+            offset = prev if isinstance(prev, int) else None
+
+    def _load_xref_at(self, offset: int) -> Dict[str, Any]:
+        head = _read_at(self.stream, offset, 32).lstrip(_WHITESPACE)
+        if head.startswith(b"xref"):
+            return self._load_xref_table(offset)
+        return self._load_xref_stream(offset)
+
+    def _load_xref_table(self, offset: int) -> Dict[str, Any]:
+        sections: List[Tuple[int, int, int, int]] = []
+        cursor = offset + _read_at(self.stream, offset, 64).find(b"xref") + 4
+        while True:
+            chunk = _read_at(self.stream, cursor, 128)
+            stripped = chunk.lstrip(_WHITESPACE)
+            if stripped.startswith(b"trailer") or not stripped:
+                cursor += len(chunk) - len(stripped) + len(b"trailer")
+                break
+            header = _XREF_SUBSECTION_RE.match(chunk)
+            if not header:
+                raise ValueError("malformed xref table")
+            first, count = int(header.group(1)), int(header.group(2))
+            entries_at = cursor + header.end()
+            width = 20
+            if count:
+                entry = _XREF_ENTRY_RE.match(_read_at(self.stream, entries_at, 24))
+                if not entry:
+                    raise ValueError("malformed xref entry")
+                width = entry.end()
+            sections.append((first, count, entries_at, width))
+            cursor = entries_at + count * width
+        self.xrefs.append(("table", sections))
+        trailer = self._parse_at(cursor)
+        return trailer if isinstance(trailer, dict) else {}
+
+    def _load_xref_stream(self, offset: int) -> Dict[str, Any]:
+        info, data = self._read_stream_object(offset)
+        widths = [w for w in info.get("W", []) if isinstance(w, int)]
+        if len(widths) != 3:
+            raise ValueError("malformed xref stream")
+        index = info.get("Index") or [0, info.get("Size", 0)]
+        self.xrefs.append(("stream", (index, widths, data)))
+        return info
+
+    # -- object access ------------------------------------------------
+
+    def _parse_at(self, offset: int) -> Any:
+        for window in _OBJECT_WINDOWS:
+            data = _read_at(self.stream, offset, window)
+            lexer = _Lexer(data, 0, at_eof=offset + len(data) >= self.size)
+            try:
+                return lexer.value()
+            except _Truncated:
+                continue
+        raise ValueError("object too large")
+
+    def _read_stream_object(self, offset: int) -> Tuple[Dict[str, Any], bytes]:
+        for window in _OBJECT_WINDOWS:
+            data = _read_at(self.stream, offset, window)
+            header = _OBJ_HEADER_RE.match(data)
+            if not header:
+                raise ValueError("object header not found")
+            lexer = _Lexer(data, header.end(), at_eof=offset + len(data) >= self.size)
+            try:
+                info = lexer.value()
+                lexer._skip_whitespace()
+            except _Truncated:
+                continue
+            if not isinstance(info, dict) or not data.startswith(b"stream", lexer.pos):
+                raise ValueError("stream object expected")
+            start = lexer.pos + len(b"stream")
+            if data.startswith(b"\r\n", start):
+                start += 2
+            elif data.startswith(b"\n", start) or data.startswith(b"\r", start):
+                start += 1
+            length = self.resolve(info.get("Length"))
+            if not isinstance(length, int) or length < 0:
+                raise ValueError("stream length unknown")
+            raw = _read_at(self.stream, offset + start, length)
+            return info, _decode_stream(info, raw)
+        raise ValueError("stream object too large")
+
+    def _lookup(self, num: int) -> Optional[Tuple[int, int, int]]:
+        """Find the xref entry (type, field2, field3) for an object number."""
+        for kind, payload in self.xrefs:
+            if kind == "table":
+                for first, count, entries_at, width in payload:
+                    if first <= num < first + count:
+                        entry = _XREF_ENTRY_RE.match(_read_at(self.stream, entries_at + (num - first) * width, width + 1))
+                        if not entry:
+                            return None
+                        if entry.group(3) == b"f":
+                            return None
+                        return (1, int(entry.group(1)), int(entry.group(2)))
+            else:
+                index, widths, data = payload
+                row_size = sum(widths)
+                row = 0
+                for i in range(0, len(index) - 1, 2):
+                    first, count = index[i], index[i + 1]
+                    if first <= num < first + count:
+                        at = (row + num - first) * row_size
+                        fields = []
+                        for width in widths:
+                            fields.append(int.from_bytes(data[at:at + width], "big") if width else None)
+                            at += width
+                        kind_field = 1 if fields[0] is None else fields[0]
+                        if kind_field == 0:
+                            return None
+                        return (kind_field, fields[1] or 0, fields[2] or 0)
+                    row += count
+        return None
+
+    def resolve(self, value: Any, depth: int = 0) -> Any:
+        """Resolve an indirect reference to the object it points at."""
+        if not isinstance(value, _Ref) or depth > 8:
+            return value
+        entry = self._lookup(value.num)
+        if entry is None:
+            return None
+        kind, field2, field3 = entry
+        if kind == 1:
+            data = _read_at(self.stream, field2, 64)
+            header = _OBJ_HEADER_RE.match(data)
+            if not header:
+                return None
+            return self.resolve(self._parse_at(field2 + header.end()), depth + 1)
+        if kind == 2:
+            return self.resolve(self._from_object_stream(field2, value.num), depth + 1)
+        return None
+
+    def _from_object_stream(self, stream_num: int, num: int) -> Any:
+        cached = self._objstm_cache.get(stream_num)
+        if cached is None:
+            entry = self._lookup(stream_num)
+            if entry is None or entry[0] != 1:
+                return None
+            info, data = self._read_stream_object(entry[1])
+            cached = (data, info)
+            self._objstm_cache[stream_num] = cached
+        data, info = cached
+        first = info.get("First")
+        count = info.get("N")
+        if not isinstance(first, int) or not isinstance(count, int):
+            return None
+        lexer = _Lexer(data[:first], 0, at_eof=True)
+        for _ in range(count):
+            obj_num = lexer.token()
+            obj_offset = lexer.token()
+            if obj_num == num and isinstance(obj_offset, int):
+                return _Lexer(data, first + obj_offset, at_eof=True).value()
+        return None
+
+    def _direct_count(self, ref: Any) -> Optional[int]:
+        """Read /Count straight from a page tree node without parsing /Kids.
+
+        Flat page trees can carry thousands of kid references; only the
+        node's own bytes up to ``endobj`` are searched.
+        """
+        if not isinstance(ref, _Ref):
+            return None
+        entry = self._lookup(ref.num)
+        if entry is None or entry[0] != 1:
+            return None
+        for window in _OBJECT_WINDOWS:
+            data = _read_at(self.stream, entry[1], window)
+            end = data.find(b"endobj")
+            if end < 0 and entry[1] + len(data) < self.size:
+                continue
+            match = _COUNT_RE.search(data, 0, end if end >= 0 else len(data))
+            return int(match.group(1)) if match else None
+        return None
+
+    def page_count(self) -> int:
+        root = self.resolve(self.trailer.get("Root"))
+        if not isinstance(root, dict):
+            raise ValueError("document catalog not found")
+        count = self._direct_count(root.get("Pages"))
+        if count is not None:
+            return count
+        pages = self.resolve(root.get("Pages"))
+        if not isinstance(pages, dict):
+            raise ValueError("page tree not found")
+        count = self.resolve(pages.get("Count"))
+        if not isinstance(count, int) or count < 0:
+            raise ValueError("page count not found")
+        return count
+
+
+def _decode_stream(info: Dict[str, Any], raw: bytes) -> bytes:
+    filters = info.get("Filter")
+    if filters is None:
+        filters = []
+    elif not isinstance(filters, list):
+        filters = [filters]
+    names = [_name(f) for f in filters]
+    if any(name not in ("FlateDecode", "Fl") for name in names):
+        raise ValueError(f"unsupported stream filter {names}")
+    data = raw
+    for _ in names:
+        data = _inflate(data, _MAX_DECODED_STREAM)
+
+    params = info.get("DecodeParms")
+    if isinstance(params, list):
+        params = params[0] if params else None
+    if isinstance(params, dict):
+        predictor = params.get("Predictor", 1)
+        if isinstance(predictor, int) and predictor >= 10:
+            data = _undo_png_predictor(data, int(params.get("Columns", 1)))
+        elif predictor not in (None, 1):
+            raise ValueError(f"unsupported predictor {predictor}")
+    return data
+
+
+def _inflate(data: bytes, limit: int) -> bytes:
+    """Inflate zlib data, refusing output larger than ``limit`` bytes."""
+    obj = zlib.decompressobj()
+    out = obj.decompress(data, limit + 1)
+    if len(out) > limit:
+        raise ValueError(f"stream inflates to more than {limit} bytes")
+    return out
+
+
+def _undo_png_predictor(data: bytes, columns: int) -> bytes:
+    """Reverse PNG row predictors as used by xref and object streams."""
+    row_len = columns + 1
+    prev = bytearray(columns)
+    out = bytearray()
+    for start in range(0, len(data) - len(data) % row_len, row_len):
+        kind = data[start]
+        row = bytearray(data[start + 1:start + row_len])
+        if kind == 1:
+            for i in range(1, columns):
+                row[i] = (row[i] + row[i - 1]) & 0xFF
+        elif kind == 2:
+            for i in range(columns):
+                row[i] = (row[i] + prev[i]) & 0xFF
+        elif kind == 3:
+            for i in range(columns):
+                left = row[i - 1] if i else 0
+                row[i] = (row[i] + ((left + prev[i]) >> 1)) & 0xFF
+        elif kind == 4:
+            for i in range(columns):
+                a = row[i - 1] if i else 0
+                b = prev[i]
+                c = prev[i - 1] if i else 0
+                p = a + b - c
+                pa, pb, pc = abs(p - a), abs(p - b), abs(p - c)
+                predictor = a if pa <= pb and pa <= pc else (b if pb <= pc else c)
+                row[i] = (row[i] + predictor) & 0xFF
+        out += row
+        prev = row
+    return bytes(out)
+
+
+def _scan_pdf_page_count(stream: BinaryIO) -> Optional[int]:
+    """Fallback: scan for /Type /Pages dictionaries and take the largest /Count.
+
+    Reads the file in fixed-size overlapping chunks, so memory stays
+    constant.  Page trees stored inside compressed object streams are not
+    visible to this scan.
+    """
+    stream.seek(0)
+    best: Optional[int] = None
+    carry = b""
+    while True:
+        chunk = stream.read(_SCAN_CHUNK)
+        if not chunk:
+            break
+        window = carry + chunk
+        for match in _PAGES_TYPE_RE.finditer(window):
+            lo = window.rfind(b"<<", 0, match.start())
+            hi = window.find(b">>", match.end())
+            region = window[max(lo, match.start() - 512, 0):hi if hi >= 0 else match.end() + 512]
+            for count in _COUNT_RE.findall(region):
+                value = int(count)
+                if best is None or value > best:
+                    best = value
+        carry = window[-_SCAN_OVERLAP:]
+    return best
+
+
+def count_pdf_pages(stream: BinaryIO) -> int:
+    """Count the pages of a PDF by reading only its trailer and page tree root.
+
+    Args:
+        stream: Seekable binary stream positioned anywhere
+
+    Returns:
+        Number of pages
+
+    Raises:
+        ValueError: If the page count cannot be determined
+    """
+    size = _stream_size(stream)
+    reader = _PdfReader(stream, size)
+    try:
+        reader.load()
+        return reader.page_count()
+    except Exception as e:
+        logger.debug(f"Structured PDF page count failed, scanning instead: {e}")
+
+    count = _scan_pdf_page_count(stream)
+    if count is None:
+        raise ValueError("could not read pdf")
+    return count
+
+
+def count_ooxml_pages(stream: BinaryIO, extension: str) -> int:
+    """Count pages, slides or sheets of an OOXML document.
+
+    Only the ZIP central directory and, for DOCX, the small
+    ``docProps/app.xml`` part are read.
+
+    Args:
+        stream: Seekable binary stream
+        extension: One of 'docx', 'pptx' or 'xlsx'
+
+    Returns:
+        Number of pages (DOCX), slides (PPTX) or worksheets (XLSX)
+
+    Raises:
+        ValueError: If the file is not a readable ZIP container
+    """
+    try:
+        archive = zipfile.ZipFile(stream)
+    except zipfile.BadZipFile:
+        raise ValueError("not a zip container")
+
+    with archive:
+        infos = archive.infolist()
+        if extension == "pptx":
+            return max(1, sum(1 for info in infos if _SLIDE_PART_RE.match(info.filename)))
+        if extension == "xlsx":
+            return max(1, sum(1 for info in infos if _SHEET_PART_RE.match(info.filename)))
+
+        by_name = {info.filename: info for info in infos}
+        app_xml = by_name.get("docProps/app.xml")
+        if app_xml is not None and app_xml.file_size <= _MAX_APP_XML_BYTES:
+            with archive.open(app_xml) as fh:
+                match = _APP_PAGES_RE.search(fh.read(_MAX_APP_XML_BYTES))
+            if match and int(match.group(1)) > 0:
+                return int(match.group(1))
+
+        document = by_name.get("word/document.xml")
+        if document is not None:
+            return max(1, math.ceil(document.file_size / DOCX_XML_BYTES_PER_PAGE))
+        return 1
+
+
+def _detect_kind(stream: BinaryIO, extension: str) -> str:
+    if extension in ("pdf", "docx", "pptx", "xlsx") or extension in _TEXT_EXTENSIONS:
+        return extension
+    head = _read_at(stream, 0, 8)
+    if head.startswith(b"%PDF"):
+        return "pdf"
+    if head.startswith(b"PK\x03\x04"):
+        return "docx"
+    return extension
+
+
+def sample_digest(stream: BinaryIO) -> str:
+    """Fingerprint a seekable stream without reading all of it.
+
+    Hashes the size, the first and last _SAMPLE_EDGE_BYTES and
+    _SAMPLE_WINDOWS evenly spaced windows in between; streams up to twice
+    the edge size are hashed whole.  Edits that keep the size and touch
+    none of the sampled bytes share a fingerprint, which is acceptable for
+    an estimate.
+
+    Args:
+        stream: Seekable binary stream
+
+    Returns:
+        Hex SHA-256 digest of the size and sampled bytes
+    """
+    size = _stream_size(stream)
+    h = hashlib.sha256(str(size).encode())
+    if size <= 2 * _SAMPLE_EDGE_BYTES:
+        h.update(_read_at(stream, 0, size))
+        return h.hexdigest()
+    h.update(_read_at(stream, 0, _SAMPLE_EDGE_BYTES))
+    span = size - 2 * _SAMPLE_EDGE_BYTES - _SAMPLE_WINDOW_BYTES
+    for i in range(_SAMPLE_WINDOWS):
+        offset = _SAMPLE_EDGE_BYTES + max(0, span) * i // max(1, _SAMPLE_WINDOWS - 1)
+        h.update(_read_at(stream, offset, _SAMPLE_WINDOW_BYTES))
+    h.update(_read_at(stream, size - _SAMPLE_EDGE_BYTES, _SAMPLE_EDGE_BYTES))
+    return h.hexdigest()
+
+
+class _PageCountCache:
+    """Small thread-safe LRU mapping content fingerprints to page counts."""
+
+    def __init__(self, max_entries: int) -> None:
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[int]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: str, value: int) -> None:
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+_cache = _PageCountCache(int(os.getenv("PAGECOUNT_CACHE_SIZE", "4096")))
+
+
+def clear_cache() -> None:
+    """Drop all cached page counts."""
+    _cache.clear()
+
+
+def count_pages(stream: BinaryIO, filename: str) -> int:
+    """Estimate the number of pages in an uploaded document.
+
+    Args:
+        stream: Seekable binary stream holding the upload
+        filename: Original filename, used to pick the counting strategy
+
+    Returns:
+        Estimated number of pages (at least 1)
+    """
+    position = stream.tell()
+    try:
+        extension = filename.rsplit(".", 1)[1].lower() if filename and "." in filename else ""
+        digest = sample_digest(stream)
+        cache_key = f"{extension}:{digest}"
+        cached = _cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        kind = _detect_kind(stream, extension)
+        try:
+            if kind == "pdf":
+                pages = count_pdf_pages(stream)
+            elif kind in ("docx", "pptx", "xlsx"):
+                pages = count_ooxml_pages(stream, kind)
+            elif kind in _TEXT_EXTENSIONS:
+                pages = math.ceil(_stream_size(stream) / TEXT_CHARS_PER_PAGE)
+            else:
+                pages = 1
+        except Exception as e:
+            logger.info(f"Page count failed for {filename}: {e}")
+            pages = 1
+
+        pages = max(1, pages)
+        _cache.put(cache_key, pages)
+        return pages
+    finally:
+        stream.seek(position)
@@ -0,0 +1,218 @@
+"""
+Streaming converters for plain text, Markdown, CSV and JSON uploads.
+
+These types need no document parsing, so they are converted here
+instead of going through MarkItDown: text and Markdown pass through,
+CSV becomes a Markdown table and JSON is pretty-printed inside a fenced
+code block.  Each converter reads the file in chunks and yields output
+in chunks, holding at most one chunk (plus, for CSV, a sample of rows
+used to size the columns) in memory.
+"""
+from __future__ import annotations
+
+import csv
+import io
+import itertools
+import os
+import re
+from typing import Iterable, Iterator, List, Optional
+
+ENGINE = "passthrough"
+
+MIME_TYPES = {"text/plain", "text/markdown", "text/csv", "application/json"}
+
+_EXTENSION_MIMES = {
+    ".txt": "text/plain",
+    ".md": "text/markdown",
+    ".markdown": "text/markdown",
+    ".csv": "text/csv",
+    ".json": "application/json",
+}
+
+_CHUNK = 64 * 1024
+# Rows read up front to pick the CSV delimiter and column widths
+_CSV_SAMPLE_ROWS = 100
+# Columns are padded to at most this width; longer cells are left unpadded
+_CSV_MAX_WIDTH = 40
+_CSV_DELIMITERS = ",;\t|"
+
+# Leading whitespace, then a string, an unterminated string at the end of
+# the buffer, punctuation or a literal/number; or trailing whitespace
+_JSON_TOKEN = re.compile(r'\s*("[^"\\]*(?:\\.[^"\\]*)*"|"[^"\\]*(?:\\.[^"\\]*)*\\?\Z|[{}\[\],:]|[^\s{}\[\],:"]+)|\s+', re.S)
+
+
+def is_passthrough(mime: Optional[str]) -> bool:
+    """Check whether a MIME type is converted by this module."""
+    return mime in MIME_TYPES
+
+
+def mime_for_filename(filename: Optional[str]) -> Optional[str]:
+    """Guess a text MIME type from a file name, for files magic numbers cannot identify."""
+    return _EXTENSION_MIMES.get(os.path.splitext(filename or "")[1].lower())
+
+
+def _open_text(path: str):
+    return open(path, "r", encoding="utf-8-sig", errors="replace", newline="")
+
+
+def _read_chunks(fh) -> Iterator[str]:
+    while True:
+        chunk = fh.read(_CHUNK)
+        if not chunk:
+            return
+        yield chunk
+
+
+def _batched(pieces: Iterable[str]) -> Iterator[str]:
+    """Join small output pieces into chunks of about _CHUNK characters."""
+    batch: List[str] = []
+    size = 0
+    for piece in pieces:
+        batch.append(piece)
+        size += len(piece)
+        if size >= _CHUNK:
+            yield "".join(batch)
+            batch, size = [], 0
+    if batch:
+        yield "".join(batch)
+
+
+def iter_text(path: str) -> Iterator[str]:
+    """Pass plain text or Markdown through unchanged, in chunks."""
+    with _open_text(path) as fh:
+        yield from _read_chunks(fh)
+
+
+def _cell(value: str) -> str:
+    return value.strip().replace("\\", "\\\\").replace("|", "\\|").replace("\r\n", "<br>").replace("\n", "<br>")
+
+
+def _table_row(cells: List[str], widths: List[int]) -> str:
+    if len(cells) > len(widths):
+        # Keep cells beyond the header in the last column
+        cells = cells[:len(widths) - 1] + [", ".join(c for c in cells[len(widths) - 1:] if c)]
+    cells = cells + [""] * (len(widths) - len(cells))
+    return "| " + " | ".join(cell.ljust(width) for cell, width in zip(cells, widths)) + " |\n"
+
+
+def _sniff_dialect(sample: str):
+    """Guess the CSV dialect, falling back to the header line's most common delimiter."""
+    try:
+        return csv.Sniffer().sniff(sample, delimiters=_CSV_DELIMITERS)
+    except csv.Error:
+        header = sample.split("\n", 1)[0]
+        delimiter = max(_CSV_DELIMITERS, key=header.count)
+        if header.count(delimiter) == 0:
+            return csv.excel
+        return type("SniffedDialect", (csv.excel,), {"delimiter": delimiter})
+
+
+def iter_csv(path: str) -> Iterator[str]:
+    """Render a CSV file as a Markdown table, in chunks.
+
+    The delimiter and column widths come from the first rows only; the
+    rest of the file is streamed row by row.  The first row is the header.
+    """
+    with _open_text(path) as fh:
+        dialect = _sniff_dialect(fh.read(_CHUNK))
+        fh.seek(0)
+        rows = ([_cell(value) for value in row] for row in csv.reader(fh, dialect) if row)
+        sample = list(itertools.islice(rows, _CSV_SAMPLE_ROWS))
+        if not sample:
+            return
+        columns = len(sample[0])
+        widths = [3] * columns
+        for row in sample:
+            for i, value in enumerate(row[:columns]):
+                widths[i] = min(_CSV_MAX_WIDTH, max(widths[i], len(value)))
+
+        def lines() -> Iterator[str]:
+            yield _table_row(sample[0], widths)
+            yield "| " + " | ".join("-" * width for width in widths) + " |\n"
+            for row in sample[1:]:
+                yield _table_row(row, widths)
+            for row in rows:
+                yield _table_row(row, widths)
+
+        yield from _batched(lines())
+
+
+def iter_json(path: str, indent: int = 2) -> Iterator[str]:
+    """Pretty-print a JSON file inside a fenced code block, in chunks.
+
+    The input is re-indented token by token rather than parsed, so memory
+    stays flat however large the document is; valid JSON comes out as
+    ``json.dumps(..., indent=2, ensure_ascii=False)`` would write it, with
+    strings and numbers kept exactly as they were.
+    """
+    def pieces() -> Iterator[str]:
+        yield "```json\n"
+        pads = ["\n"]
+        depth = 0
+        opened = False  # a bracket was just opened; its line break waits for the next token
+        carry = ""
+        with _open_text(path) as fh:
+            for chunk in itertools.chain(_read_chunks(fh), [None]):
+                final = chunk is None
+                text = carry + (chunk or "")
+                carry = ""
+                out = []
+                for match in _JSON_TOKEN.finditer(text):
+                    if match.end() == len(text) and not final:
+                        # May continue in the next chunk
+                        carry = match.group()
+                        break
+                    token = match.group(1)
+                    if token is None:
+                        continue
+                    if token == ",":
+                        out.append(",")
+                        out.append(pads[depth])
+                        continue
+                    if token == ":":
+                        out.append(": ")
+                        continue
+                    if token == "}" or token == "]":
+                        depth -= 1
+                        if not opened:
+                            out.append(pads[depth])
+                        out.append(token)
+                        opened = False
+                        continue
+                    if opened:
+                        out.append(pads[depth])
+                    out.append(token)
+                    opened = token == "{" or token == "["
+                    if opened:
+                        depth += 1
+                        if depth == len(pads):
+                            pads.append("\n" + " " * (indent * depth))
+                yield "".join(out)
+        yield "\n```\n"
+
+    yield from _batched(pieces())
+
+
+def iter_markdown(path: str, mime: Optional[str]) -> Iterator[str]:
+    """Convert a text upload to Markdown in chunks.
+
+    Args:
+        path: Local input file
+        mime: One of MIME_TYPES; anything else is treated as plain text
+
+    Returns:
+        Iterator of Markdown chunks
+    """
+    if mime == "text/csv":
+        return iter_csv(path)
+    if mime == "application/json":
+        return iter_json(path)
+    return iter_text(path)
+
+
+def convert(path: str, mime: Optional[str]) -> str:
+    """Convert a text upload to a Markdown string (see iter_markdown)."""
+    out = io.StringIO()
+    for chunk in iter_markdown(path, mime):
+        out.write(chunk)
+    return out.getvalue()
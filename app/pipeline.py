@@ -0,0 +1,299 @@
+"""
+Staged conversion pipeline for mdraft.
+
+A conversion is split into stages (fetch, convert, post-process, persist,
+notify), each running on its own executor with its own concurrency.
+I/O-bound stages run on threads; the CPU-bound convert stage runs on a
+process pool so markitdown is not serialised by the GIL.  Stages hand
+work to each other over bounded in-process queues, so a slow stage
+applies back-pressure instead of letting downloads pile up on disk,
+and the I/O of one document overlaps with the conversion of another.
+
+Every item flowing through the pipeline is a plain ``ctx`` dictionary.
+A stage function receives the ctx and returns a dictionary of updates
+(or None).  Process stages must be module-level functions and receive a
+pickled copy of the ctx, so only plain values should be stored in it.
+Once a stage raises, the exception is recorded in ``ctx["error"]`` and
+only stages marked ``run_on_error`` (persist, notify) still run.  A stage
+may set ``ctx["halt"]`` to skip every remaining stage.
+"""
+from __future__ import annotations
+
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+THREAD = "thread"
+PROCESS = "process"
+
+StageFn = Callable[[Dict[str, Any]], Optional[Dict[str, Any]]]
+
+_STOP = object()
+
+# Set in processes started by a pipeline's process pool
+_in_pool_worker = False
+
+
+def _mark_pool_worker() -> None:
+    global _in_pool_worker
+    _in_pool_worker = True
+
+
+def in_pool_worker() -> bool:
+    """Check whether this process is a worker of a pipeline process pool.
+
+    Code running there must not start process pools of its own: each
+    pool worker would add a pool, multiplying processes beyond the
+    stage's configured concurrency.
+    """
+    return _in_pool_worker
+
+
+@dataclass
+class Stage:
+    """One step of a pipeline.
+
+    Attributes:
+        name: Stage name, used for logging and ctx timings
+        fn: Function taking the ctx and returning a dict of updates
+        executor: 'thread' or 'process'
+        workers: Number of items processed concurrently by this stage
+        run_on_error: Whether the stage still runs after an earlier failure
+    """
+    name: str
+    fn: StageFn
+    executor: str = THREAD
+    workers: int = 1
+    run_on_error: bool = False
+
+
+def _run_stage_fn(stage: Stage, ctx: Dict[str, Any],
+                  submit: Optional[Callable[[Stage, Dict[str, Any]], Any]] = None) -> None:
+    if ctx.get("halt"):
+        return
+    if ctx.get("error") is not None and not stage.run_on_error:
+        return
+    started = time.perf_counter()
+    try:
+        if submit is not None:
+            update = submit(stage, ctx)
+        else:
+            update = stage.fn(ctx)
+        if update:
+            ctx.update(update)
+    except Exception as e:
+        logger.warning(f"Pipeline stage {stage.name} failed: {e}")
+        if ctx.get("error") is None:
+            ctx["error"] = e
+            ctx["failed_stage"] = stage.name
+    finally:
+        ctx.setdefault("timings", {})[stage.name] = time.perf_counter() - started
+
+
+def run_serial(stages: List[Stage], ctx: Dict[str, Any]) -> Dict[str, Any]:
+    """Run all stages inline in the calling thread.
+
+    Args:
+        stages: Stages to run in order
+        ctx: Item context
+
+    Returns:
+        The ctx after all stages have run
+    """
+    for stage in stages:
+        _run_stage_fn(stage, ctx, None)
+    return ctx
+
+
+class Pipeline:
+    """Long-lived staged executor shared by all tasks in a worker process.
+
+    Each stage has ``workers`` dispatcher threads reading from a bounded
+    input queue.  Thread stages run the stage function directly in the
+    dispatcher; process stages submit it to a dedicated process pool of
+    the same size and wait for the result, so at most ``workers`` items
+    occupy the pool at once.  A pool broken by a crashed child (OOM, a
+    segfault in a parser) is replaced, and the items it was running are
+    retried once on the new pool, so only an item that crashes it again
+    fails.
+    """
+
+    def __init__(self, stages: List[Stage], queue_size: int = 8, start_method: str = "spawn"):
+        self.stages = stages
+        self.queue_size = queue_size
+        self.start_method = start_method
+        self._queues: List[queue.Queue] = [queue.Queue(maxsize=queue_size) for _ in stages]
+        self._pools: Dict[str, ProcessPoolExecutor] = {}
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Lock()
+        self._started = False
+
+    def start(self) -> None:
+        """Start the stage dispatcher threads and process pools."""
+        with self._lock:
+            if self._started:
+                return
+            for index, stage in enumerate(self.stages):
+                if stage.executor == PROCESS:
+                    self._pools[stage.name] = self._new_pool(stage)
+                for n in range(stage.workers):
+                    thread = threading.Thread(
+                        target=self._dispatch, args=(index,),
+                        name=f"pipeline-{stage.name}-{n}", daemon=True,
+                    )
+                    thread.start()
+                    self._threads.append(thread)
+            self._started = True
+            logger.info("Pipeline started: " + ", ".join(
+                f"{s.name}={s.executor}x{s.workers}" for s in self.stages))
+
+    def submit(self, ctx: Dict[str, Any]) -> Future:
+        """Queue an item; blocks while the first stage's queue is full.
+
+        Args:
+            ctx: Item context
+
+        Returns:
+            Future resolving to the ctx once the last stage has run
+        """
+        if not self._started:
+            self.start()
+        future: Future = Future()
+        self._queues[0].put((ctx, future))
+        return future
+
+    def run(self, ctx: Dict[str, Any], timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Submit an item and wait for it to leave the pipeline."""
+        return self.submit(ctx).result(timeout=timeout)
+
+    def _new_pool(self, stage: Stage) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(
+            max_workers=stage.workers,
+            mp_context=multiprocessing.get_context(self.start_method),
+            initializer=_mark_pool_worker,
+        )
+
+    def _replace_pool(self, stage: Stage, broken: ProcessPoolExecutor) -> None:
+        """Replace a stage's broken pool, unless another dispatcher already did."""
+        with self._lock:
+            if self._pools.get(stage.name) is broken:
+                logger.warning(f"Pipeline stage {stage.name} lost a pool process; starting a new pool")
+                self._pools[stage.name] = self._new_pool(stage)
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def _submit_to_pool(self, stage: Stage, ctx: Dict[str, Any]) -> Any:
+        for attempt in range(2):
+            pool = self._pools[stage.name]
+            try:
+                return pool.submit(stage.fn, ctx).result()
+            except BrokenProcessPool:
+                self._replace_pool(stage, pool)
+                if attempt:
+                    raise
+
+    def _dispatch(self, index: int) -> None:
+        stage = self.stages[index]
+        inbox = self._queues[index]
+        submit = self._submit_to_pool if stage.executor == PROCESS else None
+        while True:
+            item = inbox.get()
+            if item is _STOP:
+                return
+            ctx, future = item
+            try:
+                _run_stage_fn(stage, ctx, submit)
+            except BaseException as e:  # noqa: BLE001 - never lose an item
+                future.set_exception(e)
+                continue
+            if index + 1 < len(self.stages):
+                self._queues[index + 1].put((ctx, future))
+            else:
+                future.set_result(ctx)
+
+    def shutdown(self) -> None:
+        """Stop dispatcher threads once queued items have drained."""
+        with self._lock:
+            if not self._started:
+                return
+            for index, stage in enumerate(self.stages):
+                for _ in range(stage.workers):
+                    self._queues[index].put(_STOP)
+                for thread in [t for t in self._threads if t.name.startswith(f"pipeline-{stage.name}-")]:
+                    thread.join()
+            for pool in self._pools.values():
+                pool.shutdown(wait=True)
+            self._threads = []
+            self._pools = {}
+            self._started = False
+
+
+def stage_workers(name: str, default: int) -> int:
+    """Get a stage's concurrency from PIPELINE_<NAME>_WORKERS.
+
+    Args:
+        name: Stage name
+        default: Value used when the variable is unset or invalid
+
+    Returns:
+        Number of workers (at least 1)
+    """
+    try:
+        return max(1, int(os.getenv(f"PIPELINE_{name.upper()}_WORKERS", default)))
+    except ValueError:
+        return default
+
+
+def get_pipeline_mode() -> str:
+    """Get the pipeline mode from environment variable.
+
+    Returns:
+        'staged' (default) or 'serial'
+    """
+    mode = os.getenv("PIPELINE_MODE", "staged").strip().lower()
+    return mode if mode in ("staged", "serial") else "staged"
+
+
+def convert_stage(ctx: Dict[str, Any]) -> Dict[str, Any]:
+    """CPU stage: convert the fetched file to raw markdown.
+
+    Runs in a pool process, so it only touches the local file and
+    returns plain values.
+    """
+    from .api_convert import _convert_with_markitdown
+    from .passthrough import convert as convert_passthrough, is_passthrough
+    from .quality import pdf_fallback_markdown
+
+    if is_passthrough(ctx.get("mime")):
+        return {"markdown": convert_passthrough(ctx["tmp_path"], ctx["mime"])}
+    markdown = _convert_with_markitdown(ctx["tmp_path"]) or ""
+    if not markdown and ctx.get("mime") == "application/pdf":
+        # The fallback streams its pages through post-processing itself
+        fallback, report = pdf_fallback_markdown(ctx["tmp_path"])
+        if fallback:
+            return {"markdown": fallback, "boilerplate": report, "postprocessed": True}
+    return {"markdown": markdown}
+
+
+def postprocess_stage(ctx: Dict[str, Any]) -> Dict[str, Any]:
+    """Clean up the raw markdown produced by the convert stage.
+
+    Running headers and footers are stripped first, while the converter's
+    page breaks are still in the text.  Markdown the convert stage already
+    post-processed (the PDF text fallback) is left as it is.
+    """
+    from .boilerplate import strip_boilerplate
+    from .quality import clean_markdown
+
+    if ctx.get("postprocessed"):
+        return None
+    markdown, report = strip_boilerplate(ctx.get("markdown") or "")
+    return {"markdown": clean_markdown(markdown), "boilerplate": report}
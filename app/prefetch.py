@@ -0,0 +1,343 @@
+"""
+Input prefetching for conversion workers.
+
+While a worker thread converts document N, the input of the next task
+the worker has already reserved from the broker is downloaded into a
+local spool directory, so the network transfer is hidden behind the
+current conversion.  When that task starts it claims the spooled file
+instead of downloading again.
+
+Prefetching is bounded by a byte budget covering both finished spool
+files and in-flight downloads.  Downloads are written in chunks and stop
+at the next chunk when the task is revoked, the budget is exceeded or
+the worker shuts down; spool files that are never claimed are removed.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import tempfile
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+
+# Celery task name -> index of the positional argument holding the input
+PREFETCHABLE_TASKS: Dict[str, int] = {
+    "convert_from_gcs": 1,
+    "convert_document": 2,
+}
+
+
+class PrefetchCancelled(Exception):
+    """Raised inside a fetch when the prefetch must stop."""
+
+
+def is_prefetch_enabled() -> bool:
+    """Check whether input prefetching is enabled (PREFETCH_ENABLED, default on)."""
+    return os.getenv("PREFETCH_ENABLED", "1").lower() in ("1", "true", "yes")
+
+
+def _source_suffix(source: str) -> str:
+    """Get the file extension of an input's storage location (e.g. ``.pdf``), or ''."""
+    return os.path.splitext(str(source).rsplit("/", 1)[-1])[1]
+
+
+def get_prefetch_multiplier(lanes) -> int:
+    """Get the Celery prefetch multiplier for a worker serving ``lanes``.
+
+    Prefetching needs one extra reserved task per thread, but a worker
+    serving both lanes would then hold a small document behind the large
+    one it is converting, so only single-lane workers reserve ahead.
+
+    Args:
+        lanes: Lanes the worker consumes (see WORKER_LANES)
+
+    Returns:
+        2 for single-lane workers with prefetching enabled, otherwise 1
+    """
+    return 2 if is_prefetch_enabled() and len(set(lanes)) == 1 else 1
+
+
+class _Entry:
+    def __init__(self, task_id: str, source: str, path: str, reserved: int):
+        self.task_id = task_id
+        self.source = source
+        self.path = path
+        self.reserved = reserved
+        self.written = 0
+        self.cancel = threading.Event()
+        self.done = threading.Event()
+        self.error: Optional[BaseException] = None
+
+
+class _SpoolWriter:
+    """File wrapper that enforces cancellation and the byte budget."""
+
+    def __init__(self, fh, entry: _Entry, prefetcher: "Prefetcher"):
+        self._fh = fh
+        self._entry = entry
+        self._prefetcher = prefetcher
+
+    def write(self, data: bytes) -> int:
+        if self._entry.cancel.is_set():
+            raise PrefetchCancelled("cancelled")
+        self._prefetcher._charge(self._entry, len(data))
+        return self._fh.write(data)
+
+
+class Prefetcher:
+    """Spools the inputs of reserved tasks within a byte budget."""
+
+    def __init__(self, spool_dir: Optional[str] = None, budget_bytes: Optional[int] = None,
+                 workers: Optional[int] = None):
+        self.spool_dir = spool_dir or os.getenv(
+            "PREFETCH_SPOOL_DIR", os.path.join(tempfile.gettempdir(), "mdraft-spool"))
+        self.budget_bytes = budget_bytes if budget_bytes is not None else int(
+            os.getenv("PREFETCH_BUDGET_BYTES", str(256 * 1024 * 1024)))
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers or int(os.getenv("PREFETCH_WORKERS", "2")),
+            thread_name_prefix="prefetch",
+        )
+        self._entries: Dict[str, _Entry] = {}
+        self._used = 0
+        self._lock = threading.Lock()
+        self._closed = False
+        os.makedirs(self.spool_dir, exist_ok=True)
+
+    @property
+    def used_bytes(self) -> int:
+        """Bytes currently counted against the budget."""
+        with self._lock:
+            return self._used
+
+    def _charge(self, entry: _Entry, n: int) -> None:
+        with self._lock:
+            extra = max(0, entry.written + n - entry.reserved)
+            if extra and self._used + extra > self.budget_bytes:
+                raise PrefetchCancelled("budget exceeded")
+            self._used += extra
+            entry.reserved += extra
+            entry.written += n
+
+    def _release(self, entry: _Entry) -> None:
+        with self._lock:
+            self._used -= entry.reserved
+            entry.reserved = 0
+
+    def schedule(self, task_id: str, source: str, fetch: Callable[[Any], None],
+                 size_hint: Optional[int] = None) -> bool:
+        """Start prefetching a task's input.
+
+        Args:
+            task_id: Celery task ID the input belongs to
+            source: Storage location of the input; a claim must match it
+            fetch: Callable writing the input into the file object it is given
+            size_hint: Expected size in bytes, reserved up front if known
+
+        Returns:
+            True if a prefetch was started
+        """
+        reserved = max(0, size_hint or 0)
+        with self._lock:
+            if self._closed or task_id in self._entries:
+                return False
+            if self._used + reserved > self.budget_bytes or self._used >= self.budget_bytes:
+                return False
+            # Keep the input's extension: converters pick a format by it
+            path = os.path.join(self.spool_dir, f"{uuid.uuid4().hex}{_source_suffix(source)}.part")
+            entry = _Entry(task_id, source, path, reserved)
+            self._entries[task_id] = entry
+            self._used += reserved
+
+        self._executor.submit(self._run, entry, fetch)
+        logger.debug(f"Prefetching {source} for task {task_id}")
+        return True
+
+    def _run(self, entry: _Entry, fetch: Callable[[Any], None]) -> None:
+        try:
+            with open(entry.path, "wb") as fh:
+                fetch(_SpoolWriter(fh, entry, self))
+        except BaseException as e:  # noqa: BLE001 - recorded for the claimer
+            entry.error = e
+            if not isinstance(e, PrefetchCancelled):
+                logger.warning(f"Prefetch of {entry.source} failed: {e}")
+        finally:
+            if entry.error is not None or entry.cancel.is_set():
+                self._discard(entry)
+            entry.done.set()
+            # A cancel racing with completion may have missed the discard
+            if entry.cancel.is_set():
+                self._discard(entry)
+
+    def _discard(self, entry: _Entry) -> None:
+        with self._lock:
+            if self._entries.get(entry.task_id) is entry:
+                del self._entries[entry.task_id]
+        self._release(entry)
+        try:
+            os.unlink(entry.path)
+        except OSError:
+            pass
+
+    def claim(self, task_id: Optional[str], source: str, timeout: Optional[float] = None) -> Optional[str]:
+        """Take ownership of a task's prefetched input.
+
+        Waits for an in-flight prefetch to finish rather than starting a
+        second download of the same object.
+
+        Args:
+            task_id: Celery task ID of the running task
+            source: Storage location the task is about to read
+            timeout: Maximum seconds to wait for an in-flight prefetch
+
+        Returns:
+            Path of the spooled file, now owned by the caller and ending in
+            the source's extension, or None if nothing usable was prefetched
+        """
+        if not task_id:
+            return None
+        with self._lock:
+            entry = self._entries.get(task_id)
+        if entry is None or entry.source != source:
+            return None
+        if not entry.done.wait(timeout if timeout is not None else float(os.getenv("PREFETCH_CLAIM_TIMEOUT", "60"))):
+            self.cancel(task_id)
+            return None
+        with self._lock:
+            if self._entries.get(task_id) is not entry or entry.error is not None:
+                return None
+            del self._entries[task_id]
+        self._release(entry)
+        claimed = entry.path[:-len(".part")]
+        os.replace(entry.path, claimed)
+        return claimed
+
+    def cancel(self, task_id: str) -> None:
+        """Cancel a task's prefetch and drop its spool file."""
+        with self._lock:
+            entry = self._entries.get(task_id)
+        if entry is None:
+            return
+        entry.cancel.set()
+        if entry.done.is_set():
+            self._discard(entry)
+
+    def shutdown(self) -> None:
+        """Cancel every prefetch and remove unclaimed spool files."""
+        with self._lock:
+            self._closed = True
+            entries = list(self._entries.values())
+        for entry in entries:
+            entry.cancel.set()
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        for entry in entries:
+            self._discard(entry)
+
+
+def fetch_gcs_uri(uri: str) -> Callable[[Any], None]:
+    """Build a chunked fetch for a gs://bucket/path URI."""
+    def fetch(out) -> None:
+        from .services.gcs import get_blob
+
+        blob = get_blob(uri)
+        with blob.open("rb", chunk_size=CHUNK_SIZE) as reader:
+            while True:
+                chunk = reader.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                out.write(chunk)
+    return fetch
+
+
+def fetch_storage_path(flask_app, path: str) -> Callable[[Any], None]:
+    """Build a fetch for a path in the Storage adapter."""
+    def fetch(out) -> None:
+        from .services import Storage
+
+        with flask_app.app_context():
+            Storage().download_to_file(path, out)
+    return fetch
+
+
+_prefetcher: Optional[Prefetcher] = None
+_prefetcher_lock = threading.Lock()
+
+
+def get_prefetcher() -> Prefetcher:
+    """Get the process-wide prefetcher."""
+    global _prefetcher
+    with _prefetcher_lock:
+        if _prefetcher is None:
+            _prefetcher = Prefetcher()
+        return _prefetcher
+
+
+def prefetch_reserved(flask_app, current_task_id: Optional[str] = None) -> int:
+    """Start prefetches for conversion tasks reserved by this worker.
+
+    Args:
+        flask_app: Application used for Storage-adapter reads
+        current_task_id: Task that is starting now (never prefetched)
+
+    Returns:
+        Number of prefetches started
+    """
+    from celery.worker import state
+
+    prefetcher = get_prefetcher()
+    active = {r.id for r in list(state.active_requests)}
+    started = 0
+    for request in list(state.reserved_requests):
+        if request.id == current_task_id or request.id in active:
+            continue
+        index = PREFETCHABLE_TASKS.get(request.name)
+        args = list(request.args or ())
+        if index is None or len(args) <= index or not args[index]:
+            continue
+        source = args[index]
+        kwargs = request.kwargs or {}
+        if str(source).startswith("gs://"):
+            fetch = fetch_gcs_uri(source)
+        else:
+            fetch = fetch_storage_path(flask_app, source)
+        if prefetcher.schedule(request.id, source, fetch, size_hint=kwargs.get("size_bytes")):
+            started += 1
+    return started
+
+
+def connect_signals(flask_app) -> None:
+    """Hook prefetching into the Celery worker lifecycle.
+
+    Prefetches start whenever a task starts running (the worker then has
+    a free reservation slot filled by the broker), are cancelled when a
+    task is revoked or finishes without claiming its input, and are all
+    cancelled on worker shutdown.
+    """
+    from celery.signals import task_postrun, task_prerun, task_revoked, worker_shutdown
+
+    @task_prerun.connect(weak=False)
+    def _on_prerun(task_id=None, **kwargs):
+        try:
+            prefetch_reserved(flask_app, current_task_id=task_id)
+        except Exception as e:
+            logger.warning(f"Prefetch scheduling failed: {e}")
+
+    @task_postrun.connect(weak=False)
+    def _on_postrun(task_id=None, **kwargs):
+        if _prefetcher is not None and task_id:
+            _prefetcher.cancel(task_id)
+
+    @task_revoked.connect(weak=False)
+    def _on_revoked(request=None, **kwargs):
+        if _prefetcher is not None and request is not None:
+            _prefetcher.cancel(request.id)
+
+    @worker_shutdown.connect(weak=False)
+    def _on_shutdown(**kwargs):
+        if _prefetcher is not None:
+            _prefetcher.shutdown()
@@ -1,5 +1,9 @@
-import hashlib, os, re
-from typing import Optional
+import hashlib, io, logging, multiprocessing, os, tempfile, threading, time
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
 
 def sha256_file(path: str, chunk: int = 1024 * 1024) -> str:
     h = hashlib.sha256()
@@ -10,37 +14,407 @@ def sha256_file(path: str, chunk: int = 1024 * 1024) -> str:
             h.update(b)
     return h.hexdigest()
 
-def clean_markdown(md: str) -> str:
-    if not md: return md
-    # Normalize line endings
-    md = md.replace("\r\n", "\n").replace("\r", "\n")
-    # Trim trailing spaces
-    md = "\n".join(line.rstrip() for line in md.split("\n"))
-    # Collapse >2 blank lines to exactly 2
-    md = re.sub(r"\n{3,}", "\n\n", md)
-    # Normalize fenced code blocks ```lang ... ```
-    md = re.sub(r"(```+)\s*\n", r"```\n", md)
-    # Remove obvious page footer/header repeats if they appear on many lines (simple heuristic)
-    # (Keep conservative: only strip 1-2 word all-caps lines repeated 10+ times)
-    lines = md.split("\n")
-    freq = {}
+# Text is normalized in windows of this many characters, so line endings
+# and splitting run in C without copying the whole text at once
+_WINDOW = 64 * 1024
+# Repeated short all-caps lines (running headers) are dropped once seen this often
+_HEADER_REPEATS = 10
+_OUTPUT_BATCH = 64 * 1024
+
+
+class MarkdownNormalizer:
+    """Streaming line normalizer behind clean_markdown.
+
+    Text is fed in chunks of any size and normalized lines come back as
+    soon as they are complete: line endings unified, trailing whitespace
+    trimmed, runs of blank lines collapsed and code fences normalized,
+    exactly as the original whole-string passes did.  Beyond one window
+    of text, only the current partial line, a pending carriage return and
+    a count of blank lines are held, so memory does not grow with the text.
+    """
+
+    def __init__(self) -> None:
+        self._partial: List[str] = []  # pieces of the unterminated line
+        self._cr = False                # text so far ends in "\r"; a leading "\n" pairs with it
+        self._blanks = 0                # blank lines not emitted yet
+        self._started = False           # a non-blank line has been emitted
+        self._fence = False             # last non-blank line was a normalized fence
+
+    def feed(self, chunk: str) -> Iterator[str]:
+        for start in range(0, len(chunk), _WINDOW):
+            text = chunk[start:start + _WINDOW]
+            if self._cr:
+                text = text[1:] if text[0] == "\n" else text
+                text = "\n" + text
+                self._cr = False
+            if text[-1] == "\r":
+                # Might be the first half of a CRLF split across windows
+                text = text[:-1]
+                self._cr = True
+            lines = text.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+            if len(lines) == 1:
+                self._partial.append(lines[0])
+                continue
+            if self._partial:
+                self._partial.append(lines[0])
+                lines[0] = "".join(self._partial)
+                self._partial = []
+            self._partial.append(lines.pop())
+            yield from self._emit(lines)
+
+    def close(self) -> Iterator[str]:
+        if self._cr:
+            self._cr = False
+            yield from self._emit(["".join(self._partial)])
+            self._partial = []
+        line = "".join(self._partial).rstrip()
+        self._partial = []
+        if line:
+            yield from self._emit([line], terminated=False)
+            return
+        # Trailing blank lines, counting the final empty line
+        blanks = self._blanks + 1
+        if not self._started:
+            newlines = blanks - 1
+            blanks = (2 if newlines >= 3 else newlines) + 1
+        elif self._fence:
+            blanks = 1
+        elif blanks >= 3:
+            blanks = 2
+        yield from [""] * blanks
+
+    def _emit(self, lines: List[str], terminated: bool = True) -> List[str]:
+        out = []
+        for line in lines:
+            line = line.rstrip()
+            if not line:
+                self._blanks += 1
+                continue
+            if self._blanks:
+                # "\n{3,}" -> "\n\n", then a fence swallows the blank lines after it
+                if not self._started:
+                    out.extend([""] * (2 if self._blanks >= 3 else self._blanks))
+                elif not self._fence:
+                    out.append("")
+                self._blanks = 0
+            # "(```+)\s*\n" -> "```\n" needs a line break after the fence
+            self._fence = terminated and line.endswith("```")
+            if self._fence:
+                line = line.rstrip("`") + "```"
+            self._started = True
+            out.append(line)
+        return out
+
+
+def _normalized_lines(chunks: Iterable[str]) -> Iterator[str]:
+    normalizer = MarkdownNormalizer()
+    for chunk in chunks:
+        yield from normalizer.feed(chunk)
+    yield from normalizer.close()
+
+
+def _is_header_candidate(line: str) -> bool:
+    return 2 <= len(line) <= 40 and line.isupper()
+
+
+def _repeated_headers(lines: Iterable[str]) -> Set[str]:
+    freq: Dict[str, int] = {}
     for ln in lines:
-        if 2 <= len(ln) <= 40 and ln.isupper():
+        if _is_header_candidate(ln):
             freq[ln] = freq.get(ln, 0) + 1
-    common = {k for k, v in freq.items() if v >= 10}
-    if common:
-        lines = [ln for ln in lines if ln not in common]
-        md = "\n".join(lines)
-    return md.strip()
-
-def pdf_text_fallback(path: str) -> Optional[str]:
-    try:
-        from pdfminer.high_level import extract_text
-        txt = extract_text(path) or ""
-        txt = txt.strip()
-        if not txt: return None
-        # naive paragraphs → markdown paragraphs
-        paragraphs = [p.strip() for p in txt.split("\n\n") if p.strip()]
-        return "\n\n".join(paragraphs)
-    except Exception:
-        return None
+    return {k for k, v in freq.items() if v >= _HEADER_REPEATS}
+
+
+def _finish(lines: Iterable[str], common: Set[str]) -> Iterator[str]:
+    """Drop repeated header lines and strip leading/trailing whitespace of the text."""
+    started = False
+    blanks = 0
+    for ln in lines:
+        if not ln:
+            if started:
+                blanks += 1
+            continue
+        if common and len(ln) <= 40 and ln in common:
+            continue
+        if started:
+            yield "\n" * (blanks + 1)
+            yield ln
+        else:
+            yield ln.lstrip()
+            started = True
+        blanks = 0
+
+
+def clean_markdown(md: str) -> str:
+    if not md: return md
+    # Two streaming passes over the input: count running headers, then emit
+    common = _repeated_headers(_normalized_lines((md,)))
+    out = io.StringIO()
+    for piece in _finish(_normalized_lines((md,)), common):
+        out.write(piece)
+    return out.getvalue()
+
+
+def clean_markdown_stream(chunks: Iterable[str], spool_bytes: int = 8 * 1024 * 1024) -> Iterator[str]:
+    """Clean markdown read from a stream of text chunks.
+
+    Normalized lines are spooled (in memory up to ``spool_bytes``, then
+    to a temporary file) while running headers are counted, and replayed
+    through the header filter, so the input is read only once.
+
+    Args:
+        chunks: Text chunks of any size
+        spool_bytes: Spool size kept in memory before moving to disk
+
+    Returns:
+        Iterator of output chunks whose concatenation equals clean_markdown
+        of the whole input
+    """
+    freq: Dict[str, int] = {}
+    with tempfile.SpooledTemporaryFile(max_size=spool_bytes, mode="w+", encoding="utf-8",
+                                       errors="surrogatepass", newline="\n") as spool:
+        for ln in _normalized_lines(chunks):
+            if _is_header_candidate(ln):
+                freq[ln] = freq.get(ln, 0) + 1
+            spool.write(ln)
+            spool.write("\n")
+        common = {k for k, v in freq.items() if v >= _HEADER_REPEATS}
+        spool.seek(0)
+        batch: List[str] = []
+        size = 0
+        for piece in _finish((ln[:-1] for ln in spool), common):
+            batch.append(piece)
+            size += len(piece)
+            if size >= _OUTPUT_BATCH:
+                yield "".join(batch)
+                batch, size = [], 0
+        if batch:
+            yield "".join(batch)
+
+def get_pdf_fallback_max_pages() -> int:
+    """Get the most pages the PDF text fallback extracts (PDF_FALLBACK_MAX_PAGES, default: 0 = all)."""
+    try:
+        return max(0, int(os.getenv("PDF_FALLBACK_MAX_PAGES", "0")))
+    except ValueError:
+        return 0
+
+
+def get_pdf_fallback_time_budget() -> float:
+    """Get the seconds the PDF text fallback may run (PDF_FALLBACK_TIME_BUDGET, default: 60; 0 = no limit)."""
+    try:
+        return max(0.0, float(os.getenv("PDF_FALLBACK_TIME_BUDGET", "60")))
+    except ValueError:
+        return 60.0
+
+
+def get_pdf_fallback_layout() -> str:
+    """Get the PDF text fallback layout mode (PDF_FALLBACK_LAYOUT).
+
+    Returns:
+        'full' (default) for pdfminer's complete layout analysis, or 'fast'
+        to group characters into lines but skip ordering text boxes
+    """
+    mode = os.getenv("PDF_FALLBACK_LAYOUT", "full").strip().lower()
+    return mode if mode in ("full", "fast") else "full"
+
+
+def get_pdf_fallback_workers() -> int:
+    """Get the worker processes for the PDF text fallback (PDF_FALLBACK_WORKERS, default: 1 = in-process)."""
+    try:
+        return max(1, int(os.getenv("PDF_FALLBACK_WORKERS", "1")))
+    except ValueError:
+        return 1
+
+
+# Pages extracted per task when the fallback runs on a process pool
+_PDF_PAGES_PER_TASK = 8
+
+_pdf_pool: Optional[ProcessPoolExecutor] = None
+_pdf_pool_workers = 0
+_pdf_pool_lock = threading.Lock()
+
+
+def _pdf_page_markdown(text: str) -> str:
+    # naive paragraphs → markdown paragraphs
+    return "\n\n".join(p.strip() for p in text.split("\n\n") if p.strip())
+
+
+def _extract_pdf_pages(path: str, pages: Optional[Iterable[int]] = None, layout: str = "full") -> Iterator[str]:
+    """Extract the text of a PDF one page at a time with pdfminer.
+
+    Args:
+        path: Local PDF file
+        pages: Zero-based page numbers to extract (default: all)
+        layout: 'full' or 'fast' (see get_pdf_fallback_layout)
+
+    Returns:
+        Iterator of page texts, as markdown paragraphs
+    """
+    from pdfminer.converter import TextConverter
+    from pdfminer.layout import LAParams
+    from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+    from pdfminer.pdfpage import PDFPage
+
+    laparams = LAParams() if layout == "full" else LAParams(boxes_flow=None, detect_vertical=False)
+    buf = io.StringIO()
+    rsrcmgr = PDFResourceManager(caching=True)
+    device = TextConverter(rsrcmgr, buf, laparams=laparams)
+    try:
+        interpreter = PDFPageInterpreter(rsrcmgr, device)
+        wanted = set(pages) if pages is not None else None
+        with open(path, "rb") as fp:
+            for page in PDFPage.get_pages(fp, pagenos=wanted, maxpages=max(wanted) + 1 if wanted else 0):
+                interpreter.process_page(page)
+                text = buf.getvalue()
+                buf.seek(0)
+                buf.truncate()
+                yield _pdf_page_markdown(text)
+    finally:
+        device.close()
+
+
+def _extract_pdf_page_range(path: str, start: int, stop: int, layout: str) -> List[str]:
+    """Pool task: extract pages [start, stop) of a PDF."""
+    return list(_extract_pdf_pages(path, range(start, stop), layout))
+
+
+def _get_pdf_pool(workers: int) -> ProcessPoolExecutor:
+    global _pdf_pool, _pdf_pool_workers
+    with _pdf_pool_lock:
+        if _pdf_pool is None or _pdf_pool_workers != workers:
+            if _pdf_pool is not None:
+                _pdf_pool.shutdown(wait=False, cancel_futures=True)
+            _pdf_pool_workers = workers
+            _pdf_pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context(os.getenv("PIPELINE_START_METHOD", "spawn")),
+            )
+        return _pdf_pool
+
+
+def _discard_pdf_pool(pool: ProcessPoolExecutor) -> None:
+    """Stop using a fallback pool that is broken or still busy, without waiting for it."""
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is pool:
+            _pdf_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _parallel_pdf_pages(path: str, page_count: int, workers: int, layout: str,
+                        deadline: Optional[float]) -> Iterator[str]:
+    def submit(pool: ProcessPoolExecutor) -> List[Future]:
+        return [pool.submit(_extract_pdf_page_range, path, start, min(start + _PDF_PAGES_PER_TASK, page_count), layout)
+                for start in range(0, page_count, _PDF_PAGES_PER_TASK)]
+
+    pool = _get_pdf_pool(workers)
+    try:
+        futures = submit(pool)
+    except BrokenProcessPool:
+        # A child died during an earlier document; start over on a new pool
+        _discard_pdf_pool(pool)
+        pool = _get_pdf_pool(workers)
+        futures = submit(pool)
+    try:
+        for future in futures:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                pages = future.result(timeout=timeout)
+            except FutureTimeout:
+                logger.warning(f"PDF text fallback stopped at its time budget: {path}")
+                return
+            except BrokenProcessPool:
+                _discard_pdf_pool(pool)
+                raise
+            yield from pages
+    finally:
+        for future in futures:
+            future.cancel()
+        if not all(future.done() for future in futures):
+            # Ranges still running would hold up the next document
+            _discard_pdf_pool(pool)
+
+
+def iter_pdf_text(path: str, max_pages: Optional[int] = None, time_budget: Optional[float] = None,
+                  layout: Optional[str] = None, workers: Optional[int] = None) -> Iterator[str]:
+    """Extract a PDF's text page by page, for when the converter returns nothing.
+
+    Pages come back in order as soon as they are extracted, each followed
+    by a form feed, so they can go straight into clean_markdown_stream.
+    Extraction stops after ``max_pages`` pages or once ``time_budget``
+    seconds have passed, keeping the pages extracted so far.  With more
+    than one worker, ranges of pages are extracted on a process pool,
+    unless this process is itself a pipeline pool worker: pools are never
+    nested, so the fallback then runs in-process.
+
+    Args:
+        path: Local PDF file
+        max_pages: Most pages extracted (default: PDF_FALLBACK_MAX_PAGES; 0 = all)
+        time_budget: Seconds allowed (default: PDF_FALLBACK_TIME_BUDGET; 0 = no limit)
+        layout: 'full' or 'fast' (default: PDF_FALLBACK_LAYOUT)
+        workers: Worker processes (default: PDF_FALLBACK_WORKERS)
+
+    Returns:
+        Iterator of page texts ending in "\\f"
+    """
+    max_pages = get_pdf_fallback_max_pages() if max_pages is None else max_pages
+    time_budget = get_pdf_fallback_time_budget() if time_budget is None else time_budget
+    layout = layout or get_pdf_fallback_layout()
+    workers = workers or get_pdf_fallback_workers()
+    if workers > 1:
+        from .pipeline import in_pool_worker
+        if in_pool_worker():
+            workers = 1
+    deadline = time.monotonic() + time_budget if time_budget else None
+
+    page_count = 0
+    if workers > 1:
+        from .pagecount import count_pdf_pages
+        try:
+            with open(path, "rb") as fp:
+                page_count = count_pdf_pages(fp)
+        except ValueError:
+            pass
+        if max_pages:
+            page_count = min(page_count, max_pages)
+    if page_count > _PDF_PAGES_PER_TASK:
+        pages = _parallel_pdf_pages(path, page_count, workers, layout, deadline)
+    else:
+        pages = _extract_pdf_pages(path, range(max_pages) if max_pages else None, layout)
+
+    try:
+        for text in pages:
+            yield text + "\n\n\f"
+            if deadline is not None and time.monotonic() >= deadline:
+                logger.warning(f"PDF text fallback stopped at its time budget: {path}")
+                break
+    finally:
+        pages.close()
+
+
+def pdf_fallback_markdown(path: str) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+    """Extract a PDF's text when the converter returns nothing, already post-processed.
+
+    Pages go from iter_pdf_text through strip_boilerplate_stream into
+    clean_markdown_stream as they are extracted, so the raw text is never
+    joined; only the cleaned result is built, once.
+
+    Args:
+        path: Local PDF file
+
+    Returns:
+        Tuple of (clean markdown, boilerplate report), or (None, None) if
+        no text could be extracted
+    """
+    from .boilerplate import strip_boilerplate_stream
+
+    try:
+        stripped, report = strip_boilerplate_stream(iter_pdf_text(path))
+        out = io.StringIO()
+        for chunk in clean_markdown_stream(stripped):
+            out.write(chunk)
+    except Exception as e:
+        logger.info(f"PDF text fallback failed for {path}: {e}")
+        return None, None
+    markdown = out.getvalue()
+    return (markdown, report) if markdown else (None, None)
@@ -12,15 +12,23 @@ from __future__ import annotations
 import os
 from typing import Any, Dict
 
-from flask import Blueprint, current_app, jsonify, request, send_from_directory, abort
+import filetype
+from flask import Blueprint, current_app, jsonify, request, send_file, send_from_directory, abort, redirect
 from sqlalchemy import text
+from werkzeug.exceptions import HTTPException
 
 from . import db, limiter
 from .models import Job
+from .admission import DOWNGRADE, REJECT, check_admission, rejection_payload, resolve_user_id
+from .api_estimate import estimate_pages_for_stream
+from .conversion import choose_engine, engine_flags
+from .ooxml import MIME_TYPES as OOXML_MIMES, UnsafeContainer, inspect_container
 
 from .utils import is_file_allowed, generate_job_id
 from .storage import upload_stream_to_gcs, generate_download_url, generate_signed_url, generate_v4_signed_url
 from .services import Storage
+from .services import compression as storage_compression
+from .services.storage import get_chunk_size as storage_chunk_size
 from .celery_tasks import enqueue_conversion_task
 
 
@@ -69,10 +77,33 @@ def upload() -> Any:
     if file.filename == "":
         return jsonify({"error": "No selected file"}), 400
     
-    # Validate MIME type using magic number and allowed MIME types
-    if not is_file_allowed(file.stream, file.filename):
+    # Validate the file type against the extension allowlist
+    if not is_file_allowed(file.filename):
         return jsonify({"error": "File type not allowed"}), 400
     
+    # Admission is checked for the requesting user, as /api/convert does;
+    # anonymous uploads are still recorded against the MVP's default user 1
+    user_id = resolve_user_id()
+    
+    # Admission control: estimate pages and check the cached plan usage
+    # before spending any storage or worker time on the upload
+    file.stream.seek(0)
+    kind = filetype.guess(file.stream.read(261))
+    file.stream.seek(0)
+    mime_type = kind.mime if kind else (file.mimetype or "application/octet-stream")
+    
+    # ZIP containers are classified and checked for decompression bombs
+    # from their central directory, before any worker opens them
+    if mime_type == "application/zip" or mime_type in OOXML_MIMES:
+        try:
+            mime_type = inspect_container(file.stream)["mime"] or mime_type
+        except UnsafeContainer as e:
+            return jsonify({"error": "Unsafe file container", "reason": str(e)}), 400
+    pages = estimate_pages_for_stream(file.stream, file.filename)
+    admission = check_admission(user_id, pages, choose_engine(mime_type, engine_flags()))
+    if admission["decision"] == REJECT:
+        return jsonify(rejection_payload(admission)), 402
+    
     # Generate a unique filename using job ID
     job_id_str = generate_job_id()
     filename = f"{job_id_str}_{file.filename}"
@@ -82,10 +113,15 @@ def upload() -> Any:
     upload_path = f"uploads/{job_id_str}/{file.filename}"
     
     try:
-        # Reset stream position after validation
+        # Reset stream position after validation and stream to storage
         file.stream.seek(0)
-        file_data = file.read()
-        storage.write_bytes(upload_path, file_data)
+        with storage.open_write(upload_path) as out:
+            while True:
+                chunk = file.stream.read(storage_chunk_size())
+                if not chunk:
+                    break
+                out.write(chunk)
+        size_bytes = out.bytes_written
         
         # Store the path for job tracking
         gcs_uri = upload_path
@@ -95,10 +131,8 @@ def upload() -> Any:
         return jsonify({"error": "Upload failed"}), 500
     
     # Create job record in the database with status='queued'
-    # For this MVP we don't have authentication, so user_id is 1
-    # In a multi-user system current_user.id would be used instead
     job = Job(
-        user_id=1,
+        user_id=user_id if user_id is not None else 1,
         filename=filename,
         status="queued",
         gcs_uri=gcs_uri
@@ -111,7 +145,11 @@ def upload() -> Any:
     
     # Enqueue background task for conversion
     try:
-        task_id = enqueue_conversion_task(job.id, job.user_id, gcs_uri)
+        # Only pin the engine when admission control downgraded the request
+        engine = admission["engine"] if admission["decision"] == DOWNGRADE else None
+        task_id = enqueue_conversion_task(job.id, job.user_id, gcs_uri, engine=engine,
+                                          plan=admission.get("plan"), size_bytes=size_bytes,
+                                          pages=pages)
         if task_id:
             current_app.logger.info(f"Enqueued conversion task {task_id} for job {job.id}")
         else:
@@ -121,7 +159,11 @@ def upload() -> Any:
         current_app.logger.exception(f"Error enqueueing conversion task for job {job.id}: {e}")
         # Don't fail the upload if task enqueueing fails
     
-    return jsonify({"job_id": job.id}), 202
+    response: Dict[str, Any] = {"job_id": job.id}
+    if admission["decision"] == DOWNGRADE:
+        response["engine"] = admission["engine"]
+        response["admission"] = admission["reason"]
+    return jsonify(response), 202
 
 
 @bp.route("/jobs/<int:job_id>", methods=["GET"])
@@ -172,35 +214,165 @@ def job_status(job_id: int) -> Any:
     return jsonify(response)
 
 
+def _download_mode() -> str:
+    """Get how downloads are served (DOWNLOAD_MODE: offload, the default, or proxy)."""
+    mode = os.getenv("DOWNLOAD_MODE", "offload").lower()
+    return mode if mode in ("offload", "proxy") else "offload"
+
+
+def _offload_download(storage: Storage, storage_path: str, filename: str) -> Any:
+    """Hand the byte transfer to GCS or the front-end server.
+
+    Returns:
+        A response, or None if the download cannot be offloaded
+    """
+    if storage.backend == "memory":
+        # Only this process can serve in-memory objects
+        return _proxy_download(storage, storage_path, filename)
+
+    if storage.use_gcs:
+        if (storage_compression.rule_for(storage_path) == storage_compression.ZSTD
+                and not request.accept_encodings[storage_compression.ZSTD]):
+            # GCS transcodes gzip for clients that do not accept it, but not zstd
+            return _proxy_download(storage, storage_path, filename)
+        ttl = int(os.getenv("DOWNLOAD_URL_TTL", "300"))
+        url = storage.signed_url(storage_path, expires_seconds=ttl, filename=filename)
+        if url is None:
+            return None
+        response = redirect(url, code=302)
+        response.headers['Cache-Control'] = 'private, no-store'
+        return response
+
+    file_path = storage.local_path(storage_path)
+    if file_path is None or not file_path.is_file():
+        return jsonify({"error": "File not found"}), 404
+
+    encoding = None
+    if storage_compression.rule_for(storage_path):
+        encoding = storage_compression.read_local_encoding(file_path)
+    if encoding:
+        # Compressed at rest: send as stored if the client can decode it
+        if not request.accept_encodings[encoding]:
+            return _proxy_download(storage, storage_path, filename)
+        response = send_file(file_path, mimetype='application/octet-stream', as_attachment=True,
+                             download_name=filename, conditional=True)
+        response.headers['Content-Encoding'] = encoding
+        response.headers['Vary'] = 'Accept-Encoding'
+        return response
+
+    accel_prefix = os.getenv("DOWNLOAD_ACCEL_PREFIX")
+    if accel_prefix:
+        # nginx serves the file from an internal location mapped to ./data
+        from flask import Response
+        response = Response(status=200, mimetype='application/octet-stream')
+        response.headers['X-Accel-Redirect'] = accel_prefix.rstrip('/') + '/' + storage_path.lstrip('/')
+        response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+    # send_file hands the open file to the WSGI server's file wrapper (sendfile)
+    return send_file(file_path, mimetype='application/octet-stream', as_attachment=True,
+                     download_name=filename, conditional=True)
+
+
 @bp.route("/download/<path:storage_path>", methods=["GET"])
 def download_file(storage_path: str) -> Any:
     """Serve a file from storage.
 
-    This endpoint serves files from the Storage adapter (GCS or local).
-    It's provided for development convenience. In production, files should
-    be served directly from GCS using temporary signed URLs.
+    By default (DOWNLOAD_MODE=offload) no bytes pass through the app: on
+    GCS the client is redirected (302) to a short-lived signed URL, and
+    local files are handed to the WSGI server's sendfile support or, with
+    DOWNLOAD_ACCEL_PREFIX set, to nginx via X-Accel-Redirect.
+
+    The object is streamed through the app in STORAGE_CHUNK_SIZE chunks
+    only with DOWNLOAD_MODE=proxy, or when a GCS URL cannot be signed and
+    DOWNLOAD_PROXY_FALLBACK is enabled.  A single ``Range: bytes=...``
+    request is answered with 206 Partial Content in every mode.
     """
+    # Determine filename for download
+    filename = storage_path.split('/')[-1]
+    if not filename:
+        filename = "download"
+
     try:
         storage = Storage()
-        
-        # Check if file exists
-        if not storage.exists(storage_path):
-            return jsonify({"error": "File not found"}), 404
-        
-        # Read file data
-        file_data = storage.read_bytes(storage_path)
-        
-        # Determine filename for download
-        filename = storage_path.split('/')[-1]
-        if not filename:
-            filename = "download"
-        
-        # Return file as attachment
-        from flask import Response
-        response = Response(file_data, mimetype='application/octet-stream')
-        response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
-        return response
-        
+
+        if _download_mode() == "offload":
+            response = _offload_download(storage, storage_path, filename)
+            if response is not None:
+                return response
+            if os.getenv("DOWNLOAD_PROXY_FALLBACK", "0").lower() not in ("1", "true", "yes"):
+                current_app.logger.error(f"Could not offload download of {storage_path}")
+                return jsonify({"error": "Download unavailable"}), 503
+            current_app.logger.warning(f"Could not offload download of {storage_path}, proxying")
+
+        return _proxy_download(storage, storage_path, filename)
+
+    except HTTPException:
+        # e.g. 416 from send_file for an unsatisfiable range
+        raise
     except Exception as e:
         current_app.logger.error(f"Error serving file {storage_path}: {e}")
-        return jsonify({"error": "Internal server error"}), 500
\ No newline at end of file
+        return jsonify({"error": "Internal server error"}), 500
+
+
+def _encoded_download(storage: Storage, storage_path: str, filename: str) -> Any:
+    """Stream an object under a compressed prefix in chunks.
+
+    The stored bytes go out unchanged with ``Content-Encoding`` when the
+    client accepts the encoding, and are decoded chunk by chunk otherwise.
+    """
+    from flask import Response, stream_with_context
+    try:
+        reader = storage.open_read(storage_path, decode=False)
+    except FileNotFoundError:
+        return jsonify({"error": "File not found"}), 404
+
+    encoding = reader.encoding
+    accepted = encoding is not None and request.accept_encodings[encoding]
+    if encoding and not accepted:
+        reader = reader.decoded()
+    response = Response(stream_with_context(reader.iter_chunks()), mimetype='application/octet-stream')
+    response.headers['Content-Length'] = str(reader.size)
+    if accepted:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response.headers['Accept-Ranges'] = 'bytes'
+    return response
+
+
+def _proxy_download(storage: Storage, storage_path: str, filename: str) -> Any:
+    """Stream an object through the app in chunks."""
+    if request.range is None and storage_compression.rule_for(storage_path):
+        return _encoded_download(storage, storage_path, filename)
+
+    # Open the object (404 if it does not exist)
+    try:
+        reader = storage.open_read(storage_path)
+    except FileNotFoundError:
+        return jsonify({"error": "File not found"}), 404
+
+    # Resolve an optional byte range against the object size
+    start, stop = 0, reader.size
+    status = 200
+    if request.range is not None:
+        byte_range = request.range.range_for_length(reader.size)
+        if byte_range is None:
+            reader.close()
+            response = jsonify({"error": "Requested range not satisfiable"})
+            response.headers['Content-Range'] = f"bytes */{reader.size}"
+            return response, 416
+        start, stop = byte_range
+        status = 206
+    reader.seek(start)
+
+    # Return file as attachment
+    from flask import Response, stream_with_context
+    response = Response(stream_with_context(reader.iter_chunks(stop - start)),
+                        status=status, mimetype='application/octet-stream')
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response.headers['Content-Length'] = str(stop - start)
+    response.headers['Accept-Ranges'] = 'bytes'
+    if status == 206:
+        response.headers['Content-Range'] = f"bytes {start}-{stop - 1}/{reader.size}"
+    return response
@@ -0,0 +1,300 @@
+"""
+Plan-aware queue scheduling for mdraft.
+
+Conversions are routed at enqueue time onto one Celery queue per plan
+(F&F, Pro, Team), using the plan cached in Redis so routing never touches
+the database.  Workers consume all plan queues with ``weighted_cycle``, a
+kombu queue-order strategy implementing smooth weighted round-robin:
+when every queue has work, each plan is served in proportion to its
+weight, and an idle queue cannot bank unlimited credit, so a burst from
+one plan never locks the others out.  Every plan has a weight of at
+least 1, which keeps the free tier moving under sustained paid load.
+
+Each plan queue is further split into a small and a large lane by the
+estimated cost of the conversion (bytes, pages and engine), so a flood
+of one-page files is never stuck behind scanned books.  Workers pick the
+lanes they serve with WORKER_LANES, which allows dedicating capacity to
+the small lane while other workers share both.
+"""
+from __future__ import annotations
+
+import logging
+import os
+from typing import Dict, Iterable, List, Optional
+
+from .api_usage import _get_redis_client
+from .batching import BATCH_QUEUE, get_batch_max_cost, is_batching_enabled
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUEUE = "mdraft_default"
+
+# One queue per plan; unknown plans fall back to the free-tier queue
+PLAN_QUEUES: Dict[str, str] = {
+    "F&F": "mdraft_ff",
+    "Pro": "mdraft_pro",
+    "Team": "mdraft_team",
+}
+FALLBACK_PLAN = "F&F"
+
+# Share of worker pulls each plan gets when all queues are busy
+DEFAULT_PLAN_WEIGHTS: Dict[str, int] = {
+    "F&F": 1,
+    "Pro": 3,
+    "Team": 4,
+}
+
+
+# Conversion cost lanes, cheapest first
+LANES = ("small", "large")
+
+# Relative per-page cost of each engine; Document AI is network-bound and
+# slower per page than local markitdown extraction, and text types copied
+# through by the passthrough converter cost next to nothing
+DEFAULT_ENGINE_PAGE_COST: Dict[str, float] = {
+    "passthrough": 0.1,
+    "markitdown": 1.0,
+    "docai": 3.0,
+}
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        return default
+
+
+def estimate_cost(size_bytes: Optional[int], pages: Optional[int], engine: Optional[str]) -> float:
+    """Estimate the cost of a conversion in page-equivalent units.
+
+    The cost is the page count weighted by the engine's per-page cost,
+    plus the file size expressed in LANE_BYTES_PER_UNIT chunks (default
+    1 MiB) so large image-heavy files with few pages are not mistaken for
+    cheap ones.
+
+    Args:
+        size_bytes: File size in bytes, if known
+        pages: Estimated page count, if known
+        engine: Engine the conversion will use, if known
+
+    Returns:
+        Estimated cost
+    """
+    page_cost = DEFAULT_ENGINE_PAGE_COST.get(engine or "markitdown", 1.0)
+    if engine == "docai":
+        page_cost = _env_float("LANE_DOCAI_PAGE_COST", page_cost)
+    bytes_per_unit = max(1.0, _env_float("LANE_BYTES_PER_UNIT", 1024 * 1024))
+    return (pages or 1) * page_cost + (size_bytes or 0) / bytes_per_unit
+
+
+def lane_for(size_bytes: Optional[int], pages: Optional[int], engine: Optional[str]) -> str:
+    """Pick the lane for a conversion from its estimated cost.
+
+    Conversions costing at least LANE_LARGE_COST (default 50) go to the
+    large lane; everything else goes to the small lane.
+
+    Args:
+        size_bytes: File size in bytes, if known
+        pages: Estimated page count, if known
+        engine: Engine the conversion will use, if known
+
+    Returns:
+        'small' or 'large'
+    """
+    threshold = _env_float("LANE_LARGE_COST", 50)
+    return "large" if estimate_cost(size_bytes, pages, engine) >= threshold else "small"
+
+
+def lane_queue(queue: str, lane: str) -> str:
+    """Build the lane-specific name of a plan queue.
+
+    Args:
+        queue: Plan queue name (e.g. 'mdraft_pro')
+        lane: 'small' or 'large'
+
+    Returns:
+        Queue name such as 'mdraft_pro_small'
+    """
+    return f"{queue}_{lane}"
+
+
+def get_worker_lanes() -> List[str]:
+    """Get the lanes this worker consumes.
+
+    Reads WORKER_LANES as a comma-separated list (default: 'small,large',
+    i.e. shared capacity).  Set it to 'small' to dedicate a worker to
+    small documents.
+
+    Returns:
+        List of lane names
+    """
+    raw = os.getenv("WORKER_LANES", ",".join(LANES))
+    lanes = [lane.strip() for lane in raw.split(",") if lane.strip() in LANES]
+    return lanes or list(LANES)
+
+
+def get_plan_weights() -> Dict[str, int]:
+    """Get per-plan scheduling weights.
+
+    Reads PLAN_QUEUE_WEIGHTS as a comma-separated list of plan=weight
+    pairs (e.g. "F&F=1,Pro=3,Team=4"); plans not listed keep their
+    default.  Weights are clamped to a minimum of 1 so no plan can be
+    starved entirely.
+
+    Returns:
+        Dictionary mapping plan name to weight
+    """
+    weights = dict(DEFAULT_PLAN_WEIGHTS)
+    raw = os.getenv("PLAN_QUEUE_WEIGHTS", "")
+    for part in raw.split(","):
+        if "=" not in part:
+            continue
+        plan, _, value = part.partition("=")
+        plan = plan.strip()
+        if plan not in PLAN_QUEUES:
+            continue
+        try:
+            weights[plan] = max(1, int(value))
+        except ValueError:
+            logger.warning(f"Ignoring invalid PLAN_QUEUE_WEIGHTS entry: {part!r}")
+    return weights
+
+
+def get_queue_weights() -> Dict[str, int]:
+    """Get scheduling weights keyed by queue name.
+
+    Both lanes of a plan share the plan's weight.
+
+    Returns:
+        Dictionary mapping queue name to weight
+    """
+    return {
+        lane_queue(PLAN_QUEUES[plan], lane): weight
+        for plan, weight in get_plan_weights().items()
+        for lane in LANES
+    }
+
+
+def plan_queue_names(lanes: Optional[Iterable[str]] = None) -> List[str]:
+    """List plan queues for the given lanes, highest weight first.
+
+    Args:
+        lanes: Lanes to include (default: all lanes)
+
+    Returns:
+        Queue names ordered by descending weight, small lane first
+    """
+    lanes = list(lanes) if lanes is not None else list(LANES)
+    weights = get_plan_weights()
+    plans = sorted(weights, key=lambda p: -weights[p])
+    return [lane_queue(PLAN_QUEUES[plan], lane) for lane in LANES if lane in lanes for plan in plans]
+
+
+def queue_for_plan(plan: Optional[str], lane: str = "small") -> str:
+    """Map a plan name and lane to its queue.
+
+    Args:
+        plan: Plan name as stored in Redis, or None
+        lane: 'small' or 'large'
+
+    Returns:
+        Queue name for the plan (free-tier queue if unknown)
+    """
+    queue = PLAN_QUEUES.get(plan or FALLBACK_PLAN, PLAN_QUEUES[FALLBACK_PLAN])
+    return lane_queue(queue, lane if lane in LANES else "small")
+
+
+def get_cached_plan(user_id: Optional[int]) -> Optional[str]:
+    """Read a user's plan from the Redis plan cache.
+
+    Args:
+        user_id: The user ID to look up, or None
+
+    Returns:
+        The cached plan name, or None if unavailable
+    """
+    if user_id is None:
+        return None
+    redis_client = _get_redis_client()
+    if not redis_client:
+        return None
+    try:
+        plan = redis_client.hget(f"userplan:{user_id}", "plan")
+    except Exception as e:
+        logger.warning(f"Plan lookup failed for user {user_id}: {e}")
+        return None
+    return plan.decode() if plan is not None else None
+
+
+def queue_for_user(user_id: Optional[int], plan: Optional[str] = None,
+                   size_bytes: Optional[int] = None, pages: Optional[int] = None,
+                   engine: Optional[str] = None) -> str:
+    """Select the queue for a user's conversion at enqueue time.
+
+    Args:
+        user_id: The requesting user, or None for anonymous requests
+        plan: Plan already known to the caller (e.g. from admission
+            control); skips the Redis lookup when given
+        size_bytes: File size in bytes, if known
+        pages: Estimated page count, if known
+        engine: Engine the conversion will use, if known
+
+    Returns:
+        Queue name to publish the task to (the batch queue for tiny
+        conversions when BATCH_ENABLED is set)
+    """
+    # Tiny conversions go to the micro-batching worker when it is enabled;
+    # without a size the cost is unknown, so those keep the regular lanes
+    if (is_batching_enabled() and size_bytes is not None
+            and estimate_cost(size_bytes, pages, engine) <= get_batch_max_cost()):
+        return BATCH_QUEUE
+    if plan is None:
+        plan = get_cached_plan(user_id)
+    return queue_for_plan(plan, lane_for(size_bytes, pages, engine))
+
+
+class weighted_cycle:
+    """Smooth weighted round-robin queue order for kombu virtual transports.
+
+    Drop-in replacement for ``kombu.utils.scheduling.round_robin_cycle``,
+    selected with ``broker_transport_options={"queue_order_strategy":
+    "app.scheduling:weighted_cycle"}``.  The transport asks for the queue
+    order before each poll (``consume``) and reports which queue actually
+    delivered (``rotate``); credit is only charged for real deliveries, so
+    empty queues do not distort the shares of the busy ones.
+    """
+
+    def __init__(self, it: Optional[List[str]] = None):
+        self.items: List[str] = it if it is not None else []
+        self.weights = get_queue_weights()
+        self._credit: Dict[str, int] = {}
+
+    def _weight(self, queue: str) -> int:
+        return self.weights.get(queue, 1)
+
+    def update(self, it: Iterable[str]) -> None:
+        """Update items from iterable."""
+        self.items[:] = it
+        self._credit = {q: self._credit.get(q, 0) for q in self.items}
+
+    def consume(self, n: int) -> List[str]:
+        """Return up to n queues, the one owed the most service first."""
+        return sorted(
+            self.items[:n],
+            key=lambda q: (-(self._credit.get(q, 0) + self._weight(q)), -self._weight(q)),
+        )
+
+    def rotate(self, last_used: str) -> str:
+        """Charge the queue that delivered a message."""
+        if last_used not in self._credit:
+            return last_used
+        total = sum(self._weight(q) for q in self.items)
+        for q in self.items:
+            # Bound credit so a long-idle queue cannot monopolise workers
+            # once it refills, and a long-busy one is never locked out
+            credit = self._credit[q] + self._weight(q)
+            if q == last_used:
+                credit -= total
+            self._credit[q] = max(-total, min(total, credit))
+        return last_used
@@ -1,6 +1,8 @@
 import os
 import filetype
 
+from .ooxml import MIME_TYPES as OOXML_MIMES, inspect_path
+
 # max sizes in bytes per category
 MAX_BY_TYPE = {
     "text": 5 * 1024 * 1024,       # 5 MB
@@ -22,8 +24,16 @@ ALLOWED_MIMES = {
 }
 
 def sniff_category(path: str, fallback_mime: str | None = None) -> tuple[str|None, str|None]:
+    """Detect an upload's MIME type and size category.
+
+    ZIP-based uploads are classified from their central directory, which
+    tells DOCX, PPTX and XLSX apart and raises ooxml.UnsafeContainer for
+    decompression bombs before any converter opens them.
+    """
     kind = filetype.guess(path)
     mime = kind.mime if kind else (fallback_mime or None)
+    if mime == "application/zip" or mime in OOXML_MIMES:
+        mime = inspect_path(path)["mime"] or "application/zip"
     if not mime:
         return None, None
     category = ALLOWED_MIMES.get(mime)
@@ -5,6 +5,6 @@ This package contains service layer components that provide business logic
 and external integrations for the mdraft application.
 """
 
-from .storage import Storage
+from .storage import BulkResult, PreconditionFailedError, Storage, StorageReader, StorageWriter
 
-__all__ = ['Storage']
+__all__ = ['BulkResult', 'PreconditionFailedError', 'Storage', 'StorageReader', 'StorageWriter']
@@ -0,0 +1,361 @@
+"""
+Local read-through disk cache for GCS objects.
+
+Objects under configured prefixes are kept in a size-bounded directory
+on local disk so repeat reads of the same upload or output cost local
+I/O instead of a cross-region GET.  Configuration is per prefix via
+STORAGE_CACHE_PREFIXES, a comma-separated list of ``prefix=max_age``:
+
+- ``outputs/=0``: always revalidate with a conditional GET, which is a
+  304 with no body while the cached generation is current;
+- ``outputs/=60``: trust an entry for 60 seconds after it was validated;
+- ``uploads/=immutable``: never revalidate (write-once objects).
+
+A prefix without ``=`` revalidates on every read.  Entries are checked
+against the object's CRC32C when filled and the stored checksum when
+read, fills hold a file lock so parallel readers (threads or processes)
+trigger a single download, and the least recently used entries are
+evicted once STORAGE_CACHE_MAX_BYTES is exceeded.  Locks are striped over
+a fixed set of lock files, so the directory only grows with its entries.
+"""
+from __future__ import annotations
+
+import base64
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+from . import gcs
+
+logger = logging.getLogger(__name__)
+
+IMMUTABLE = float("inf")
+
+# Paths share this many lock files; colliding paths only serialise their fills
+_LOCK_STRIPES = 64
+
+
+def parse_prefixes(spec: Optional[str]) -> List[Tuple[str, float]]:
+    """Parse STORAGE_CACHE_PREFIXES into (prefix, max_age) pairs, longest prefix first.
+
+    Args:
+        spec: Comma-separated ``prefix[=seconds|immutable]`` entries
+
+    Returns:
+        List of (prefix, max_age in seconds) tuples
+    """
+    rules = []
+    for item in (spec or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        prefix, _, age = item.partition("=")
+        age = age.strip().lower()
+        if age in ("immutable", "inf"):
+            max_age = IMMUTABLE
+        else:
+            try:
+                max_age = max(0.0, float(age or 0))
+            except ValueError:
+                logger.warning(f"Ignoring invalid cache max age for {prefix}: {age}")
+                continue
+        rules.append((prefix.strip(), max_age))
+    return sorted(rules, key=lambda rule: len(rule[0]), reverse=True)
+
+
+def crc32c_b64(data: bytes) -> Optional[str]:
+    """CRC32C of ``data`` in the base64 form GCS reports, or None if unavailable."""
+    try:
+        import google_crc32c
+    except ImportError:
+        return None
+    return base64.b64encode(google_crc32c.value(data).to_bytes(4, "big")).decode("ascii")
+
+
+def file_crc32c_b64(path: str, chunk_size: int = 1024 * 1024) -> Optional[str]:
+    """CRC32C of a file, computed in chunks, in the base64 form GCS reports."""
+    try:
+        import google_crc32c
+    except ImportError:
+        return None
+    checksum = google_crc32c.Checksum()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(chunk_size), b""):
+            checksum.update(chunk)
+    return base64.b64encode(checksum.digest()).decode("ascii")
+
+
+class DiskCache:
+    """Size-bounded LRU cache of GCS objects on local disk."""
+
+    def __init__(self, directory: str, max_bytes: int, prefixes: List[Tuple[str, float]]):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.prefixes = prefixes
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._stats: Counter = Counter()
+        self._stats_lock = threading.Lock()
+
+    # -- configuration and bookkeeping --------------------------------------
+
+    def max_age_for(self, path: str) -> Optional[float]:
+        """Get the max age configured for a path, or None if it is not cached."""
+        for prefix, max_age in self.prefixes:
+            if path.startswith(prefix):
+                return max_age
+        return None
+
+    def _count(self, name: str, n: int = 1) -> None:
+        with self._stats_lock:
+            self._stats[name] += n
+
+    def stats(self) -> Dict[str, Any]:
+        """Get hit/miss counters and the hit rate since the last reset."""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        hits = stats.get("hits", 0) + stats.get("revalidated", 0)
+        lookups = hits + stats.get("misses", 0)
+        stats["hit_rate"] = round(hits / lookups, 4) if lookups else 0.0
+        return stats
+
+    def reset_stats(self) -> None:
+        with self._stats_lock:
+            self._stats.clear()
+
+    def _key(self, path: str) -> str:
+        return hashlib.sha256(path.encode("utf-8")).hexdigest()
+
+    def _files(self, path: str) -> Tuple[Path, Path]:
+        key = self._key(path)
+        return self.directory / f"{key}.data", self.directory / f"{key}.json"
+
+    @contextmanager
+    def _locked(self, path: str) -> Iterator[None]:
+        stripe = int(self._key(path)[:4], 16) % _LOCK_STRIPES
+        with open(self.directory / f"lock-{stripe:02d}", "a") as fh:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+
+    def _load_meta(self, path: str) -> Optional[Dict[str, Any]]:
+        data_file, meta_file = self._files(path)
+        try:
+            meta = json.loads(meta_file.read_text())
+            if meta.get("path") != path or data_file.stat().st_size != meta.get("size"):
+                return None
+            return meta
+        except (OSError, ValueError):
+            return None
+
+    def _write_meta(self, path: str, meta: Dict[str, Any]) -> None:
+        _, meta_file = self._files(path)
+        tmp = meta_file.with_name(f"{meta_file.name}.{uuid.uuid4().hex}.tmp")
+        tmp.write_text(json.dumps(meta))
+        os.replace(tmp, meta_file)
+
+    # -- public API ---------------------------------------------------------
+
+    def open(self, path: str, blob, operation: str = "read_bytes") -> Tuple[BinaryIO, Dict[str, Any]]:
+        """Open a local copy of a GCS object, downloading it at most once.
+
+        The file is opened while the entry's lock is held, so a concurrent
+        eviction or refresh cannot pull it out from under the caller.
+
+        Args:
+            path: Storage path of the object (must be under a cached prefix)
+            blob: ``google.cloud.storage.Blob`` for the object
+            operation: Storage operation the round trips are counted against
+
+        Returns:
+            Tuple of (open binary file, entry metadata)
+
+        Raises:
+            google.api_core.exceptions.NotFound: If the object does not exist
+        """
+        max_age = self.max_age_for(path)
+        if max_age is None:
+            raise ValueError(f"{path} is not under a cached prefix")
+
+        with self._locked(path):
+            data_file, meta, filled = self._ensure(path, blob, max_age, operation)
+            fh = open(data_file, "rb")
+        if filled:
+            self._evict()
+        return fh, meta
+
+    def _ensure(self, path: str, blob, max_age: float, operation: str) -> Tuple[Path, Dict[str, Any], bool]:
+        """Serve, revalidate or fill an entry; the caller holds its lock."""
+        from google.api_core.exceptions import NotModified
+
+        data_file, _ = self._files(path)
+        meta = self._load_meta(path)
+        if meta is not None and time.time() - meta["checked_at"] <= max_age:
+            self._count("hits")
+            self._touch(data_file)
+            return data_file, meta, False
+
+        fd, tmp_name = tempfile.mkstemp(dir=self.directory, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as fh:
+                gcs.record_round_trip(operation)
+                # Entries hold the stored bytes, still compressed if the object is
+                if meta is not None:
+                    blob.download_to_file(fh, raw_download=True, if_generation_not_match=meta["generation"])
+                else:
+                    blob.download_to_file(fh, raw_download=True)
+        except NotModified:
+            os.unlink(tmp_name)
+            meta["checked_at"] = time.time()
+            self._write_meta(path, meta)
+            self._count("revalidated")
+            self._touch(data_file)
+            return data_file, meta, False
+        except BaseException:
+            os.unlink(tmp_name)
+            raise
+
+        self._count("misses")
+        size = os.path.getsize(tmp_name)
+        checksum = file_crc32c_b64(tmp_name)
+        expected = getattr(blob, "crc32c", None)
+        if checksum and isinstance(expected, str) and expected != checksum:
+            os.unlink(tmp_name)
+            self._count("corrupt")
+            raise IOError(f"Checksum mismatch downloading {path}")
+        encoding = getattr(blob, "content_encoding", None)
+        meta = {
+            "path": path,
+            "generation": getattr(blob, "generation", None),
+            "size": size,
+            "crc32c": checksum,
+            "content_encoding": encoding if isinstance(encoding, str) else None,
+            "checked_at": time.time(),
+        }
+        os.replace(tmp_name, data_file)
+        self._write_meta(path, meta)
+        self._count("bytes_filled", size)
+        return data_file, meta, True
+
+    def read(self, path: str, blob, operation: str = "read_bytes") -> bytes:
+        """Read a GCS object through the cache, checking the cached bytes' CRC32C.
+
+        A corrupted entry is dropped and fetched again.
+        """
+        return self.read_entry(path, blob, operation)[0]
+
+    def read_entry(self, path: str, blob, operation: str = "read_bytes") -> Tuple[bytes, Dict[str, Any]]:
+        """Read a GCS object through the cache (see ``read``) together with its entry metadata."""
+        for _ in range(2):
+            fh, meta = self.open(path, blob, operation)
+            with fh:
+                data = fh.read()
+            if meta.get("crc32c") and crc32c_b64(data) != meta["crc32c"]:
+                self._count("corrupt")
+                self.invalidate(path)
+                continue
+            return data, meta
+        raise IOError(f"Could not read a consistent cached copy of {path}")
+
+    def store(self, path: str, data: bytes, generation: Optional[int],
+              content_encoding: Optional[str] = None) -> None:
+        """Write-through: cache bytes just uploaded as the given generation."""
+        if self.max_age_for(path) is None:
+            return
+        data_file, _ = self._files(path)
+        with self._locked(path):
+            fd, tmp_name = tempfile.mkstemp(dir=self.directory, suffix=".part")
+            with os.fdopen(fd, "wb") as fh:
+                fh.write(data)
+            os.replace(tmp_name, data_file)
+            self._write_meta(path, {
+                "path": path,
+                "generation": generation,
+                "size": len(data),
+                "crc32c": crc32c_b64(data),
+                "content_encoding": content_encoding,
+                "checked_at": time.time(),
+            })
+        self._evict()
+
+    def invalidate(self, path: str) -> None:
+        """Drop a path's entry (after a delete or overwrite)."""
+        data_file, meta_file = self._files(path)
+        with self._locked(path):
+            for f in (meta_file, data_file):
+                try:
+                    f.unlink()
+                except FileNotFoundError:
+                    pass
+
+    def _touch(self, data_file: Path) -> None:
+        try:
+            os.utime(data_file)
+        except OSError:
+            pass
+
+    def _evict(self) -> None:
+        """Remove least recently used entries until under the size bound."""
+        entries = []
+        total = 0
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".lock"):
+                # Per-path lock files left by earlier versions of the cache
+                try:
+                    os.unlink(entry.path)
+                except FileNotFoundError:
+                    pass
+            elif entry.name.endswith(".data"):
+                try:
+                    st = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, entry.path))
+                total += st.st_size
+        if total <= self.max_bytes:
+            return
+        entries.sort()
+        for _, size, data_path in entries:
+            if total <= self.max_bytes:
+                break
+            base = data_path[:-len(".data")]
+            for suffix in (".json", ".data"):
+                try:
+                    os.unlink(base + suffix)
+                except FileNotFoundError:
+                    pass
+            total -= size
+            self._count("evictions")
+
+
+_cache: Optional[DiskCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_disk_cache() -> Optional[DiskCache]:
+    """Get the process-wide disk cache, or None if no prefixes are configured.
+
+    The cache is rebuilt if STORAGE_CACHE_PREFIXES, STORAGE_CACHE_DIR or
+    STORAGE_CACHE_MAX_BYTES change.
+    """
+    global _cache
+    prefixes = parse_prefixes(os.getenv("STORAGE_CACHE_PREFIXES"))
+    if not prefixes:
+        return None
+    directory = Path(os.getenv("STORAGE_CACHE_DIR", os.path.join(tempfile.gettempdir(), "mdraft-cache")))
+    max_bytes = int(os.getenv("STORAGE_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))
+    with _cache_lock:
+        if _cache is None or (_cache.prefixes, _cache.directory, _cache.max_bytes) != (prefixes, directory, max_bytes):
+            _cache = DiskCache(str(directory), max_bytes, prefixes)
+        return _cache
@@ -0,0 +1,289 @@
+"""
+Compression at rest for Storage objects.
+
+Objects under the prefixes in STORAGE_COMPRESSION (``prefix=encoding``
+pairs, default ``outputs/=gzip``) are stored gzip- or zstd-encoded and
+decoded again when read, so callers keep writing and reading plain bytes.
+The encoding is recorded with the object, never guessed from its bytes:
+on GCS as the object's Content-Encoding (which also lets GCS transcode
+gzip objects for clients that do not accept it), locally in a small
+sidecar file next to the object.  Objects written before compression was
+enabled (or below STORAGE_COMPRESSION_MIN_BYTES) have no encoding and are
+read back unchanged.  Reads decode incrementally (see Decompressor), so
+only a chunk of a large object is held in memory.
+
+zstd needs the optional ``zstandard`` package; without it zstd rules fall
+back to gzip.
+"""
+from __future__ import annotations
+
+import gzip
+import logging
+import os
+import zlib
+from pathlib import Path
+from typing import BinaryIO, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+GZIP = "gzip"
+ZSTD = "zstd"
+ENCODINGS = (GZIP, ZSTD)
+
+_MAGIC = {GZIP: b"\x1f\x8b", ZSTD: b"\x28\xb5\x2f\xfd"}
+_warned_zstd = False
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+
+def parse_rules(spec: Optional[str]) -> List[Tuple[str, str]]:
+    """Parse STORAGE_COMPRESSION into (prefix, encoding) pairs, longest prefix first.
+
+    Args:
+        spec: Comma-separated ``prefix=gzip|zstd|none`` entries
+
+    Returns:
+        List of (prefix, encoding) tuples; ``none`` entries exempt a prefix
+    """
+    rules = []
+    for item in (spec or "").split(","):
+        prefix, _, encoding = item.strip().partition("=")
+        encoding = (encoding.strip().lower() or GZIP)
+        if not prefix.strip():
+            continue
+        if encoding not in ENCODINGS + ("none",):
+            logger.warning(f"Ignoring unknown storage encoding for {prefix}: {encoding}")
+            continue
+        rules.append((prefix.strip(), encoding))
+    return sorted(rules, key=lambda rule: len(rule[0]), reverse=True)
+
+
+def get_min_bytes() -> int:
+    """Get the smallest object worth compressing (STORAGE_COMPRESSION_MIN_BYTES, default 512)."""
+    try:
+        return max(0, int(os.getenv("STORAGE_COMPRESSION_MIN_BYTES", "512")))
+    except ValueError:
+        return 512
+
+
+def rule_for(path: str) -> Optional[str]:
+    """Get the STORAGE_COMPRESSION rule covering ``path``, or None.
+
+    Objects under any rule, including ``none``, are decoded on read; a
+    ``none`` rule stops compressing new writes without stranding objects
+    that are already compressed.
+    """
+    for prefix, encoding in parse_rules(os.getenv("STORAGE_COMPRESSION", "outputs/=gzip")):
+        if path.startswith(prefix):
+            return encoding
+    return None
+
+
+def encoding_for(path: str) -> Optional[str]:
+    """Get the encoding new objects at ``path`` are stored with, or None."""
+    global _warned_zstd
+    encoding = rule_for(path)
+    if encoding == ZSTD and zstandard is None:
+        if not _warned_zstd:
+            logger.warning("zstandard is not installed; storing zstd prefixes with gzip")
+            _warned_zstd = True
+        return GZIP
+    return None if encoding == "none" else encoding
+
+
+def encoding_file(file_path: Path) -> Path:
+    """Get the sidecar file recording the encoding of a local object."""
+    return file_path.with_name(f".{file_path.name}.encoding")
+
+
+def read_local_encoding(file_path: Path) -> Optional[str]:
+    """Get the encoding recorded for a local object, or None if it is stored raw."""
+    try:
+        encoding = encoding_file(file_path).read_text().strip()
+    except FileNotFoundError:
+        return None
+    return encoding if encoding in ENCODINGS else None
+
+
+def write_local_encoding(file_path: Path, encoding: Optional[str]) -> None:
+    """Record a local object's encoding, or remove the record for raw objects."""
+    sidecar = encoding_file(file_path)
+    if encoding:
+        sidecar.write_text(encoding)
+    else:
+        try:
+            sidecar.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def sniff(data: bytes) -> Optional[str]:
+    """Get the encoding of stored bytes from their magic number, or None."""
+    for encoding, magic in _MAGIC.items():
+        if data.startswith(magic):
+            return encoding
+    return None
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    """Encode bytes for storage."""
+    if encoding == ZSTD:
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    return gzip.compress(data, compresslevel=6, mtime=0)
+
+
+def decompress(data: bytes, encoding: str) -> bytes:
+    """Decode stored bytes.
+
+    Raises:
+        RuntimeError: If the object is zstd-encoded and zstandard is not installed
+    """
+    if encoding == ZSTD:
+        if zstandard is None:
+            raise RuntimeError("zstandard is required to read zstd-encoded objects")
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    return gzip.decompress(data)
+
+
+def decoded_size(encoding: str, head: bytes, tail: bytes) -> Optional[int]:
+    """Get an encoded object's decoded size from its header or trailer, if recorded there.
+
+    Args:
+        encoding: Stored encoding
+        head: The object's first 18 bytes (a zstd frame header)
+        tail: The object's last 4 bytes (the gzip ISIZE field)
+
+    Returns:
+        Decoded size, or None if the encoding does not record it; gzip
+        records it modulo 4 GiB, and only for single-member objects as
+        written here
+    """
+    if encoding == ZSTD:
+        if zstandard is None:
+            return None
+        try:
+            size = zstandard.frame_content_size(head)
+        except zstandard.ZstdError:
+            return None
+        return size if size >= 0 else None
+    return int.from_bytes(tail, "little") if len(tail) == 4 else None
+
+
+class Compressor:
+    """Incremental encoder for streaming writes."""
+
+    def __init__(self, encoding: str) -> None:
+        self.encoding = encoding
+        if encoding == ZSTD:
+            self._obj = zstandard.ZstdCompressor(level=3).compressobj()
+        else:
+            # wbits=31: gzip container
+            self._obj = zlib.compressobj(6, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._obj.compress(data)
+
+    def flush(self) -> bytes:
+        return self._obj.flush()
+
+
+class Decompressor:
+    """Incremental decoder reading stored bytes from a file-like object.
+
+    ``read(size)`` returns at most ``size`` decoded bytes and reads the
+    source ``chunk_size`` bytes at a time, so memory stays bounded by the
+    chunk size however large the object is.
+
+    Raises:
+        RuntimeError: If the object is zstd-encoded and zstandard is not installed
+    """
+
+    def __init__(self, source: BinaryIO, encoding: str, chunk_size: int = 64 * 1024) -> None:
+        self._source = source
+        self._chunk_size = chunk_size
+        if encoding == ZSTD:
+            if zstandard is None:
+                raise RuntimeError("zstandard is required to read zstd-encoded objects")
+            self._reader = zstandard.ZstdDecompressor().stream_reader(
+                source, read_size=chunk_size, read_across_frames=True)
+            self._obj = None
+        else:
+            self._reader = None
+            self._obj = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        self._pending = b""
+        self._eof = False
+
+    def read(self, size: int) -> bytes:
+        """Decode up to ``size`` bytes; an empty result means the end of the object."""
+        if size <= 0:
+            return b""
+        if self._reader is not None:
+            return self._reader.read(size)
+        while True:
+            if not self._pending:
+                self._pending = b"" if self._eof else self._source.read(self._chunk_size)
+                if not self._pending:
+                    self._eof = True
+                    return b""
+            out = self._obj.decompress(self._pending, size)
+            if self._obj.eof:
+                # Another gzip member may follow
+                self._pending = self._obj.unused_data
+                self._obj = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            else:
+                self._pending = self._obj.unconsumed_tail
+            if out:
+                return out
+
+
+class DecodingWriter:
+    """File-like sink decoding the stored bytes written to it into ``out``.
+
+    The push counterpart of Decompressor, for downloads that write into a
+    file object; output is written ``chunk_size`` bytes at a time.
+
+    Raises:
+        RuntimeError: If the object is zstd-encoded and zstandard is not installed
+    """
+
+    def __init__(self, out: BinaryIO, encoding: str, chunk_size: int = 64 * 1024) -> None:
+        self._out = out
+        self._encoding = encoding
+        self._chunk_size = chunk_size
+        if encoding == ZSTD and zstandard is None:
+            raise RuntimeError("zstandard is required to read zstd-encoded objects")
+        self._obj = self._new()
+        self.bytes_written = 0
+
+    def _new(self):
+        if self._encoding == ZSTD:
+            return zstandard.ZstdDecompressor().decompressobj(write_size=self._chunk_size)
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+    def _emit(self, data: bytes) -> None:
+        if data:
+            self._out.write(data)
+            self.bytes_written += len(data)
+
+    def write(self, data: bytes) -> int:
+        consumed = len(data)
+        if self._encoding == ZSTD:
+            self._emit(self._obj.decompress(data))
+            return consumed
+        while data:
+            self._emit(self._obj.decompress(data, self._chunk_size))
+            if self._obj.eof:
+                # Another gzip member may follow
+                data = self._obj.unused_data
+                self._obj = self._new()
+            else:
+                data = self._obj.unconsumed_tail
+        return consumed
+
+    def close(self) -> None:
+        """Write out anything still buffered by the decoder."""
+        if self._encoding != ZSTD:
+            self._emit(self._obj.flush())
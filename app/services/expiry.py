@@ -0,0 +1,239 @@
+"""
+Object expiry for Storage writes.
+
+Objects under the prefixes in STORAGE_EXPIRY (``prefix=ttl`` pairs, where
+ttl is seconds or a number with an ``s``/``m``/``h``/``d`` suffix, e.g.
+``uploads/=30d,outputs/=30d``) are written with an expiry time so the
+object store removes them itself instead of a cleanup job deleting them
+one request at a time.
+
+On GCS the expiry is the object's ``custom_time``; the bucket lifecycle
+rule ``daysSinceCustomTime: 0`` (see infrastructure/gcs/lifecycle.json)
+deletes objects once it has passed.  The local backend records expiries
+in a small SQLite index next to the files, and a background reaper
+thread deletes due files every STORAGE_EXPIRY_REAP_INTERVAL seconds.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from . import compression
+
+logger = logging.getLogger(__name__)
+
+INDEX_NAME = ".expiry.sqlite"
+
+_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+_reapers: Dict[Path, "_Reaper"] = {}
+_reapers_lock = threading.Lock()
+
+
+def parse_ttl(value: str) -> Optional[int]:
+    """Parse a TTL such as ``3600``, ``90m`` or ``30d`` into seconds, or None if invalid."""
+    value = value.strip().lower()
+    unit = _UNITS.get(value[-1:], None)
+    number = value[:-1] if unit else value
+    try:
+        seconds = float(number) * (unit or 1)
+    except ValueError:
+        return None
+    return int(seconds) if seconds > 0 else None
+
+
+def parse_rules(spec: Optional[str]) -> List[Tuple[str, int]]:
+    """Parse STORAGE_EXPIRY into (prefix, seconds) pairs, longest prefix first.
+
+    Args:
+        spec: Comma-separated ``prefix=ttl`` entries
+
+    Returns:
+        List of (prefix, ttl seconds) tuples
+    """
+    rules = []
+    for item in (spec or "").split(","):
+        prefix, _, ttl = item.strip().partition("=")
+        if not prefix.strip():
+            continue
+        seconds = parse_ttl(ttl)
+        if seconds is None:
+            logger.warning(f"Ignoring invalid storage expiry for {prefix}: {ttl!r}")
+            continue
+        rules.append((prefix.strip(), seconds))
+    return sorted(rules, key=lambda rule: len(rule[0]), reverse=True)
+
+
+def get_rules() -> List[Tuple[str, int]]:
+    """Get the configured STORAGE_EXPIRY rules (default: none)."""
+    return parse_rules(os.getenv("STORAGE_EXPIRY", ""))
+
+
+def ttl_for(path: str) -> Optional[int]:
+    """Get the TTL in seconds for objects written at ``path``, or None."""
+    for prefix, seconds in get_rules():
+        if path.startswith(prefix):
+            return seconds
+    return None
+
+
+def expires_at_for(path: str, now: Optional[datetime] = None) -> Optional[datetime]:
+    """Get the expiry time for an object written now at ``path``, or None.
+
+    Returns:
+        Timezone-aware UTC datetime
+    """
+    seconds = ttl_for(path)
+    if seconds is None:
+        return None
+    return (now or datetime.now(timezone.utc)) + timedelta(seconds=seconds)
+
+
+def stamp_blob(blob, path: str) -> None:
+    """Set a GCS blob's custom_time from STORAGE_EXPIRY before it is uploaded."""
+    expires_at = expires_at_for(path)
+    if expires_at is not None:
+        blob.custom_time = expires_at
+
+
+def as_utc(value: datetime) -> datetime:
+    """Make a datetime timezone-aware; naive datetimes are taken to be UTC."""
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+
+def get_reap_interval() -> float:
+    """Get the local reaper interval in seconds.
+
+    Returns:
+        STORAGE_EXPIRY_REAP_INTERVAL (default: 60); 0 disables the reaper thread
+    """
+    try:
+        return max(0.0, float(os.getenv("STORAGE_EXPIRY_REAP_INTERVAL", "60")))
+    except ValueError:
+        return 60.0
+
+
+class LocalExpiryIndex:
+    """Expiry times of local objects, kept in SQLite next to the files.
+
+    Every call opens its own connection, so the index is safe to share
+    between threads and processes.
+    """
+
+    def __init__(self, data_dir: Path) -> None:
+        self.data_dir = Path(data_dir)
+        self.db_path = self.data_dir / INDEX_NAME
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS expiry (path TEXT PRIMARY KEY, expires_at REAL NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_expiry_expires_at ON expiry (expires_at)")
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def set(self, path: str, expires_at: datetime) -> None:
+        """Record when the object at ``path`` expires."""
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO expiry (path, expires_at) VALUES (?, ?)",
+                         (path, as_utc(expires_at).timestamp()))
+
+    def get(self, path: str) -> Optional[datetime]:
+        """Get the expiry of the object at ``path``, or None."""
+        with self._connect() as conn:
+            row = conn.execute("SELECT expires_at FROM expiry WHERE path = ?", (path,)).fetchone()
+        return datetime.fromtimestamp(row[0], timezone.utc) if row else None
+
+    def discard(self, path: str) -> None:
+        """Forget the expiry of the object at ``path``."""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM expiry WHERE path = ?", (path,))
+
+    def reap(self, now: Optional[datetime] = None, limit: int = 1000) -> int:
+        """Delete files whose expiry has passed.
+
+        Args:
+            now: Current time (default: now)
+            limit: Most files deleted per call
+
+        Returns:
+            Number of files deleted
+        """
+        now = as_utc(now) if now else datetime.now(timezone.utc)
+        with self._connect() as conn:
+            due = [path for (path,) in conn.execute(
+                "SELECT path FROM expiry WHERE expires_at <= ? ORDER BY expires_at LIMIT ?",
+                (now.timestamp(), limit))]
+        deleted = 0
+        for path in due:
+            try:
+                (self.data_dir / path).unlink()
+                deleted += 1
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"Could not reap expired local object {path}: {e}")
+                continue
+            compression.write_local_encoding(self.data_dir / path, None)
+            # Only forget entries that did not get a new expiry meanwhile
+            with self._connect() as conn:
+                conn.execute("DELETE FROM expiry WHERE path = ? AND expires_at <= ?", (path, now.timestamp()))
+        if deleted:
+            logger.info(f"Reaped {deleted} expired local objects")
+        return deleted
+
+
+class _Reaper(threading.Thread):
+    """Daemon thread reaping one local data directory."""
+
+    def __init__(self, index: LocalExpiryIndex, interval: float) -> None:
+        super().__init__(name="storage-expiry-reaper", daemon=True)
+        self.index = index
+        self.interval = interval
+        self.pid = os.getpid()
+        self.stopped = threading.Event()
+
+    def run(self) -> None:
+        while not self.stopped.wait(self.interval):
+            try:
+                while self.index.reap() > 0 and not self.stopped.is_set():
+                    pass
+            except Exception as e:
+                logger.warning(f"Local expiry reaper failed: {e}")
+
+
+def get_local_index(data_dir: Path) -> LocalExpiryIndex:
+    """Get the expiry index for a local data directory, starting its reaper.
+
+    One reaper thread runs per directory and process; forked children
+    start their own.
+    """
+    key = Path(data_dir).absolute()
+    with _reapers_lock:
+        reaper = _reapers.get(key)
+        if reaper is not None and reaper.pid == os.getpid():
+            return reaper.index
+        index = LocalExpiryIndex(key)
+        reaper = _Reaper(index, get_reap_interval())
+        _reapers[key] = reaper
+        if reaper.interval:
+            reaper.start()
+        return index
+
+
+def stop_reapers() -> None:
+    """Stop all reaper threads and forget their indexes (used by tests)."""
+    with _reapers_lock:
+        for reaper in _reapers.values():
+            reaper.stopped.set()
+        _reapers.clear()
@@ -0,0 +1,379 @@
+"""
+In-memory and fault-injecting storage backends for mdraft.
+
+``MemoryBucket`` implements the part of the ``google.cloud.storage``
+Bucket/Blob API the Storage adapter uses, keeping objects in process
+memory, so ``STORAGE_BACKEND=memory`` runs the adapter's GCS code paths
+(generations, preconditions, ranged reads, resumable writes) without a
+network or credentials.
+
+``FaultInjectingBucket`` wraps any bucket, real or in-memory, and adds
+per-request latency, a bandwidth limit and random errors, configured by
+the STORAGE_FAULT_* environment variables.  Together they let the whole
+upload, convert and download flow be benchmarked offline under realistic
+object-store behaviour.
+"""
+from __future__ import annotations
+
+import io
+import os
+import random
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from .cache import crc32c_b64
+
+_buckets: Dict[str, "MemoryBucket"] = {}
+_buckets_lock = threading.Lock()
+
+
+def _errors():
+    from google.api_core import exceptions
+    return exceptions
+
+
+class MemoryBucket:
+    """Process-local object store with GCS bucket semantics."""
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        # name -> (data, generation, metadata such as content_encoding)
+        self._objects: Dict[str, Tuple[bytes, int, Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+        self._generation = time.time_ns()
+
+    def blob(self, name: str) -> "MemoryBlob":
+        return MemoryBlob(self, name)
+
+    def get_blob(self, name: str) -> Optional["MemoryBlob"]:
+        blob = MemoryBlob(self, name)
+        try:
+            blob.reload()
+        except _errors().NotFound:
+            return None
+        return blob
+
+    def list_blobs(self, prefix: Optional[str] = None) -> List["MemoryBlob"]:
+        with self._lock:
+            names = sorted(n for n in self._objects if n.startswith(prefix or ""))
+        blobs = []
+        for name in names:
+            blob = self.get_blob(name)
+            if blob is not None:
+                blobs.append(blob)
+        return blobs
+
+    def exists(self) -> bool:
+        return True
+
+    def delete_blob(self, name: str) -> None:
+        MemoryBlob(self, name).delete()
+
+    def _get(self, name: str) -> Tuple[bytes, int, Dict[str, Any]]:
+        with self._lock:
+            entry = self._objects.get(name)
+        if entry is None:
+            raise _errors().NotFound(f"No such object: {self.name}/{name}")
+        return entry
+
+    def _put(self, name: str, data: bytes, if_generation_match: Optional[int] = None,
+             metadata: Optional[Dict[str, Any]] = None) -> int:
+        with self._lock:
+            current = self._objects.get(name)
+            if if_generation_match is not None and (current[1] if current else 0) != if_generation_match:
+                raise _errors().PreconditionFailed(f"Generation mismatch for {self.name}/{name}")
+            self._generation = max(self._generation + 1, time.time_ns())
+            self._objects[name] = (bytes(data), self._generation, dict(metadata or {}))
+            return self._generation
+
+    def _delete(self, name: str) -> None:
+        with self._lock:
+            if self._objects.pop(name, None) is None:
+                raise _errors().NotFound(f"No such object: {self.name}/{name}")
+
+
+class MemoryBlob:
+    """Handle on one object of a ``MemoryBucket``."""
+
+    def __init__(self, bucket: MemoryBucket, name: str) -> None:
+        self.bucket = bucket
+        self.name = name
+        self.size: Optional[int] = None
+        self.generation: Optional[int] = None
+        self.crc32c: Optional[str] = None
+        self.content_encoding: Optional[str] = None
+        self.custom_time = None
+
+    def _load(self, data: bytes, generation: int, metadata: Dict[str, Any]) -> None:
+        self.size = len(data)
+        self.generation = generation
+        self.crc32c = crc32c_b64(data)
+        self.content_encoding = metadata.get("content_encoding")
+        self.custom_time = metadata.get("custom_time")
+
+    def reload(self, **kwargs) -> None:
+        self._load(*self.bucket._get(self.name))
+
+    def exists(self, **kwargs) -> bool:
+        try:
+            self.bucket._get(self.name)
+        except _errors().NotFound:
+            return False
+        return True
+
+    def upload_from_string(self, data, content_type: Optional[str] = None,
+                           if_generation_match: Optional[int] = None, **kwargs) -> None:
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        metadata = {"content_encoding": self.content_encoding, "custom_time": self.custom_time}
+        generation = self.bucket._put(self.name, data, if_generation_match, metadata)
+        self._load(data, generation, metadata)
+
+    def download_as_bytes(self, start: Optional[int] = None, end: Optional[int] = None, **kwargs) -> bytes:
+        data, generation, metadata = self.bucket._get(self.name)
+        self._load(data, generation, metadata)
+        if start is None and end is None:
+            return data
+        start = start or 0
+        if start >= len(data):
+            raise _errors().RequestRangeNotSatisfiable(f"Range starts past the end of {self.name}")
+        # ``end`` is inclusive, as in the GCS client
+        return data[start:None if end is None else end + 1]
+
+    def download_to_file(self, file_obj, if_generation_not_match: Optional[int] = None, **kwargs) -> None:
+        data, generation, metadata = self.bucket._get(self.name)
+        if if_generation_not_match is not None and generation == if_generation_not_match:
+            raise _errors().NotModified(f"{self.name} is unchanged")
+        self._load(data, generation, metadata)
+        file_obj.write(data)
+
+    def download_to_filename(self, filename: str, **kwargs) -> None:
+        with open(filename, "wb") as fh:
+            self.download_to_file(fh)
+
+    def delete(self, **kwargs) -> None:
+        self.bucket._delete(self.name)
+
+    def open(self, mode: str = "rb", if_generation_match: Optional[int] = None, **kwargs):
+        if mode == "rb":
+            return io.BytesIO(self.download_as_bytes())
+        if mode != "wb":
+            raise ValueError(f"Unsupported mode: {mode}")
+        return _MemoryUpload(self, if_generation_match)
+
+
+class _MemoryUpload:
+    """Writable file for ``MemoryBlob.open("wb")``; stores the object on close."""
+
+    def __init__(self, blob: MemoryBlob, if_generation_match: Optional[int]) -> None:
+        self._blob = blob
+        self._if_generation_match = if_generation_match
+        self._buffer = io.BytesIO()
+
+    def write(self, data: bytes) -> int:
+        return self._buffer.write(data)
+
+    def close(self) -> None:
+        if self._buffer is None:
+            return
+        data, self._buffer = self._buffer.getvalue(), None
+        self._blob.upload_from_string(data, if_generation_match=self._if_generation_match)
+
+
+def get_memory_bucket(name: str) -> MemoryBucket:
+    """Get the process-wide in-memory bucket with this name, creating it if needed."""
+    with _buckets_lock:
+        bucket = _buckets.get(name)
+        if bucket is None:
+            bucket = _buckets[name] = MemoryBucket(name)
+        return bucket
+
+
+def reset_memory_buckets() -> None:
+    """Drop every in-memory bucket and its objects."""
+    with _buckets_lock:
+        _buckets.clear()
+
+
+class FaultConfig:
+    """Latency, bandwidth and error-rate settings for ``FaultInjectingBucket``."""
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, bandwidth: Optional[float] = None,
+                 error_rate: float = 0.0, seed: Optional[Any] = None) -> None:
+        self.latency = latency
+        self.jitter = jitter
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.latency or self.jitter or self.bandwidth or self.error_rate)
+
+    def request(self) -> None:
+        """Pay one request's latency and maybe fail it."""
+        with self._lock:
+            delay = self.latency + (self.rng.uniform(0, self.jitter) if self.jitter else 0.0)
+            fail = self.error_rate > 0 and self.rng.random() < self.error_rate
+        if delay:
+            time.sleep(delay)
+        if fail:
+            raise _errors().ServiceUnavailable("Injected storage fault")
+
+    def transfer(self, nbytes: int) -> None:
+        """Pay the time ``nbytes`` take at the configured bandwidth."""
+        if self.bandwidth and nbytes:
+            time.sleep(nbytes / self.bandwidth)
+
+
+_fault_config: Optional[FaultConfig] = None
+_fault_key: Optional[Tuple] = None
+_fault_lock = threading.Lock()
+
+
+def get_fault_config() -> FaultConfig:
+    """Get the process-wide fault settings from the environment.
+
+    STORAGE_FAULT_LATENCY_MS and STORAGE_FAULT_JITTER_MS add a fixed and a
+    uniformly random delay to every request, STORAGE_FAULT_BANDWIDTH caps
+    transfers in bytes per second, STORAGE_FAULT_ERROR_RATE fails that
+    fraction of requests with a 503, and STORAGE_FAULT_SEED makes the
+    random choices repeatable.  The settings are re-read when they change.
+    """
+    global _fault_config, _fault_key
+
+    def number(name: str) -> float:
+        try:
+            return max(0.0, float(os.getenv(name, "0") or 0))
+        except ValueError:
+            return 0.0
+
+    seed = os.getenv("STORAGE_FAULT_SEED")
+    key = (number("STORAGE_FAULT_LATENCY_MS"), number("STORAGE_FAULT_JITTER_MS"),
+           number("STORAGE_FAULT_BANDWIDTH"), min(1.0, number("STORAGE_FAULT_ERROR_RATE")), seed)
+    with _fault_lock:
+        if _fault_config is None or key != _fault_key:
+            latency_ms, jitter_ms, bandwidth, error_rate, _ = key
+            _fault_config = FaultConfig(latency_ms / 1000, jitter_ms / 1000, bandwidth or None, error_rate, seed)
+            _fault_key = key
+        return _fault_config
+
+
+def wrap_with_faults(bucket, config: Optional[FaultConfig] = None):
+    """Wrap a bucket in a ``FaultInjectingBucket`` if any fault is configured.
+
+    Args:
+        bucket: Real or in-memory bucket
+        config: Fault settings (default: from the environment)
+
+    Returns:
+        The wrapped bucket, or ``bucket`` itself if no fault is configured
+    """
+    config = config or get_fault_config()
+    return FaultInjectingBucket(bucket, config) if config.enabled else bucket
+
+
+class FaultInjectingBucket:
+    """Bucket wrapper adding latency, bandwidth limits and errors to each request."""
+
+    def __init__(self, inner, config: FaultConfig) -> None:
+        self._inner = inner
+        self._faults = config
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._inner, name)
+
+    def blob(self, name: str) -> "FaultInjectingBlob":
+        return FaultInjectingBlob(self._inner.blob(name), self._faults)
+
+    def get_blob(self, name: str, **kwargs):
+        self._faults.request()
+        blob = self._inner.get_blob(name, **kwargs)
+        return FaultInjectingBlob(blob, self._faults) if blob is not None else None
+
+    def list_blobs(self, **kwargs):
+        self._faults.request()
+        return list(self._inner.list_blobs(**kwargs))
+
+    def exists(self, **kwargs) -> bool:
+        self._faults.request()
+        return self._inner.exists(**kwargs)
+
+    def delete_blob(self, name: str, **kwargs) -> None:
+        self._faults.request()
+        self._inner.delete_blob(name, **kwargs)
+
+
+class FaultInjectingBlob:
+    """Blob wrapper used by ``FaultInjectingBucket``."""
+
+    def __init__(self, inner, config: FaultConfig) -> None:
+        self._inner = inner
+        self._faults = config
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._inner, name)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        # Properties such as content_encoding belong to the wrapped blob
+        if name.startswith("_"):
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self._inner, name, value)
+
+    def reload(self, **kwargs) -> None:
+        self._faults.request()
+        self._inner.reload(**kwargs)
+
+    def exists(self, **kwargs) -> bool:
+        self._faults.request()
+        return self._inner.exists(**kwargs)
+
+    def delete(self, **kwargs) -> None:
+        self._faults.request()
+        self._inner.delete(**kwargs)
+
+    def upload_from_string(self, data, **kwargs) -> None:
+        self._faults.request()
+        self._faults.transfer(len(data))
+        self._inner.upload_from_string(data, **kwargs)
+
+    def download_as_bytes(self, **kwargs) -> bytes:
+        self._faults.request()
+        data = self._inner.download_as_bytes(**kwargs)
+        self._faults.transfer(len(data))
+        return data
+
+    def download_to_file(self, file_obj, **kwargs) -> None:
+        self._faults.request()
+        buffer = io.BytesIO()
+        self._inner.download_to_file(buffer, **kwargs)
+        self._faults.transfer(buffer.tell())
+        file_obj.write(buffer.getvalue())
+
+    def download_to_filename(self, filename: str, **kwargs) -> None:
+        with open(filename, "wb") as fh:
+            self.download_to_file(fh, **kwargs)
+
+    def open(self, mode: str = "rb", **kwargs):
+        self._faults.request()
+        handle = self._inner.open(mode, **kwargs)
+        return _FaultInjectingUpload(handle, self._faults) if mode == "wb" else handle
+
+
+class _FaultInjectingUpload:
+    """Resumable upload whose chunks pay the configured bandwidth."""
+
+    def __init__(self, inner, config: FaultConfig) -> None:
+        self._inner = inner
+        self._faults = config
+
+    def write(self, data: bytes) -> int:
+        self._faults.transfer(len(data))
+        return self._inner.write(data)
+
+    def close(self) -> None:
+        self._faults.request()
+        self._inner.close()
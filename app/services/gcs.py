@@ -0,0 +1,228 @@
+"""
+Process-lifetime Google Cloud Storage clients for mdraft.
+
+Creating a ``storage.Client`` resolves credentials, and its first request
+on a fresh HTTP session pays for a token exchange and a TLS handshake.
+This module keeps one client per project for the lifetime of the
+process, with a pooled HTTP session shared by every thread, and
+remembers which buckets have already been validated so ``bucket.exists()``
+runs at most once per bucket per process.
+
+The registry is fork-safe: a forked child (Celery prefork, gunicorn)
+starts with an empty registry instead of inheriting sockets and locks
+from its parent.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+from collections import Counter
+from typing import Any, Dict, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+_clients: Dict[Optional[str], Any] = {}
+_buckets: Dict[Tuple[Optional[str], str], Any] = {}
+_validated: Set[str] = set()
+_lock = threading.Lock()
+_pid = os.getpid()
+_batch_clients = threading.local()
+_round_trips: Counter = Counter()
+_round_trips_lock = threading.Lock()
+
+
+def get_pool_size() -> int:
+    """Get the HTTP connection pool size per client (GCS_POOL_SIZE, default 32)."""
+    try:
+        return max(1, int(os.getenv("GCS_POOL_SIZE", "32")))
+    except ValueError:
+        return 32
+
+
+def reset_clients() -> None:
+    """Forget every cached client, bucket and validation result."""
+    global _lock, _pid, _batch_clients
+    _clients.clear()
+    _batch_clients = threading.local()
+    _buckets.clear()
+    _validated.clear()
+    _lock = threading.Lock()
+    _pid = os.getpid()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=reset_clients)
+
+
+def _mount_pool(client: Any) -> None:
+    """Give the client's authorized session a larger connection pool."""
+    try:
+        from requests.adapters import HTTPAdapter
+
+        size = get_pool_size()
+        client._http.mount("https://", HTTPAdapter(pool_connections=size, pool_maxsize=size))
+    except Exception as e:
+        logger.warning(f"Could not configure GCS connection pool: {e}")
+
+
+def get_client(project: Optional[str] = None):
+    """Get the process-wide GCS client for a project.
+
+    Args:
+        project: Google Cloud project ID, or None for the default project
+
+    Returns:
+        Shared ``google.cloud.storage.Client``
+
+    Raises:
+        ImportError: If google-cloud-storage is not installed
+    """
+    if _pid != os.getpid():
+        reset_clients()
+    client = _clients.get(project)
+    if client is not None:
+        return client
+    with _lock:
+        client = _clients.get(project)
+        if client is None:
+            from google.cloud import storage
+
+            client = storage.Client(project=project) if project else storage.Client()
+            _mount_pool(client)
+            _clients[project] = client
+            logger.info(f"Created GCS client (project={project or 'default'}, pool={get_pool_size()})")
+        return client
+
+
+def get_batch_client(project: Optional[str] = None):
+    """Get this thread's GCS client for batch requests.
+
+    A batch captures every request made through its client while it is
+    open, so batches must not run on the shared client other threads are
+    using.  Each thread gets its own client, created once.
+
+    Args:
+        project: Google Cloud project ID, or None for the default project
+
+    Returns:
+        Thread-local ``google.cloud.storage.Client``
+    """
+    if _pid != os.getpid():
+        reset_clients()
+    clients = getattr(_batch_clients, "clients", None)
+    if clients is None:
+        clients = _batch_clients.clients = {}
+    client = clients.get(project)
+    if client is None:
+        from google.cloud import storage
+
+        client = storage.Client(project=project) if project else storage.Client()
+        clients[project] = client
+    return client
+
+
+_result_batch_class = None
+
+
+def open_batch(client: Any):
+    """Open a batch on ``client`` that keeps one response per deferred request.
+
+    ``Batch.finish()`` returns the per-request responses, but the batch's
+    ``with`` block discards them; the batch returned here records them as
+    ``responses`` when the block exits.
+
+    Args:
+        client: Client whose requests the batch defers, usually from get_batch_client
+
+    Returns:
+        ``google.cloud.storage.batch.Batch`` not raising for failed requests
+    """
+    global _result_batch_class
+    if _result_batch_class is None:
+        from google.cloud.storage.batch import Batch
+
+        class ResultBatch(Batch):
+            responses: list = []
+
+            def finish(self, raise_exception=True):
+                self.responses = super().finish(raise_exception=raise_exception)
+                return self.responses
+
+        _result_batch_class = ResultBatch
+    return _result_batch_class(client, raise_exception=False)
+
+
+def get_bucket(name: str, project: Optional[str] = None):
+    """Get a shared bucket handle without any network round trip.
+
+    Args:
+        name: Bucket name
+        project: Google Cloud project ID, or None for the default project
+
+    Returns:
+        ``google.cloud.storage.Bucket``
+    """
+    key = (project, name)
+    bucket = _buckets.get(key)
+    if bucket is None:
+        bucket = get_client(project).bucket(name)
+        _buckets[key] = bucket
+    return bucket
+
+
+def get_blob(uri: str):
+    """Get a blob handle for a gs://bucket/path URI.
+
+    Args:
+        uri: GCS URI in the format gs://bucket/blob
+
+    Returns:
+        ``google.cloud.storage.Blob``
+    """
+    bucket_name, blob_path = uri.replace("gs://", "").split("/", 1)
+    return get_bucket(bucket_name).blob(blob_path)
+
+
+def ensure_bucket(name: str, project: Optional[str] = None):
+    """Get a bucket handle, checking once per process that it exists.
+
+    Only successful checks are remembered, so a bucket created after a
+    failed check is picked up on the next call.
+
+    Args:
+        name: Bucket name
+        project: Google Cloud project ID, or None for the default project
+
+    Returns:
+        ``google.cloud.storage.Bucket``
+
+    Raises:
+        ValueError: If the bucket does not exist or is not accessible
+    """
+    bucket = get_bucket(name, project)
+    if name in _validated:
+        return bucket
+    record_round_trip("validate_bucket")
+    if not bucket.exists():
+        raise ValueError(f"GCS bucket '{name}' does not exist or is not accessible")
+    _validated.add(name)
+    return bucket
+
+
+def record_round_trip(operation: str, count: int = 1) -> None:
+    """Count requests sent to GCS on behalf of a storage operation."""
+    with _round_trips_lock:
+        _round_trips[operation] += count
+
+
+def get_round_trips() -> Dict[str, int]:
+    """Get requests sent to GCS per storage operation since the last reset."""
+    with _round_trips_lock:
+        return dict(_round_trips)
+
+
+def reset_round_trips() -> None:
+    """Zero the per-operation round-trip counters."""
+    with _round_trips_lock:
+        _round_trips.clear()
@@ -0,0 +1,163 @@
+"""
+Signed URL cache for mdraft.
+
+Signing a V4 URL is an RSA operation, or an IAM ``signBlob`` call with a
+credential refresh when the runtime has no private key.  Pollers of
+``/jobs/<id>`` and page loads ask for the same object's URL over and over,
+so signed URLs are cached in-process (and optionally in Redis, shared by
+every web process) keyed by bucket, blob, method, lifetime and response
+headers.  A cached URL is handed out again while it still has more than
+SIGNED_URL_MIN_REMAINING seconds of validity left, so each object is
+signed about once per TTL window.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter, OrderedDict
+from datetime import timedelta
+from typing import Dict, Optional, Tuple
+
+from . import gcs
+
+logger = logging.getLogger(__name__)
+
+_urls: "OrderedDict[Tuple, Tuple[str, float]]" = OrderedDict()
+_lock = threading.Lock()
+_stats: Counter = Counter()
+
+
+def _reset_lock() -> None:
+    global _lock
+    _lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_lock)
+
+
+def get_min_remaining(expires_seconds: int) -> float:
+    """Get the validity a cached URL must still have to be reused.
+
+    SIGNED_URL_MIN_REMAINING (default 60 seconds), capped at half the
+    URL's lifetime so short-lived URLs are still reused for a while.
+    """
+    try:
+        threshold = float(os.getenv("SIGNED_URL_MIN_REMAINING", "60"))
+    except ValueError:
+        threshold = 60.0
+    return min(max(0.0, threshold), expires_seconds / 2)
+
+
+def _max_entries() -> int:
+    try:
+        return max(0, int(os.getenv("SIGNED_URL_CACHE_SIZE", "10000")))
+    except ValueError:
+        return 10000
+
+
+def _redis():
+    """Get the shared Redis client if SIGNED_URL_CACHE_REDIS=1, else None."""
+    if os.getenv("SIGNED_URL_CACHE_REDIS", "0") != "1":
+        return None
+    from ..api_usage import _get_redis_client
+    return _get_redis_client()
+
+
+def _redis_key(key: Tuple) -> str:
+    return "signedurl:" + hashlib.sha256(repr(key).encode("utf-8")).hexdigest()
+
+
+def stats() -> Dict[str, int]:
+    """Get signing and cache hit counters since the last clear."""
+    with _lock:
+        return dict(_stats)
+
+
+def clear() -> None:
+    """Forget every cached URL and zero the counters."""
+    with _lock:
+        _urls.clear()
+        _stats.clear()
+
+
+def get_signed_url(bucket: str, blob: str, expires_seconds: int, method: str = "GET",
+                   query_parameters: Optional[Dict[str, str]] = None,
+                   project: Optional[str] = None) -> str:
+    """Get a V4 signed URL, reusing a cached one while it is fresh enough.
+
+    Args:
+        bucket: Name of the GCS bucket
+        blob: Name of the object
+        expires_seconds: Lifetime of a newly signed URL in seconds
+        method: HTTP method the URL allows
+        query_parameters: Response header overrides, e.g. ``response-content-disposition``
+        project: Google Cloud project ID, or None for the default project
+
+    Returns:
+        Signed URL with more than ``get_min_remaining(expires_seconds)`` seconds left
+
+    Raises:
+        Exception: Whatever the client library raises if signing fails
+    """
+    params = dict(query_parameters or {})
+    key = (bucket, blob, method.upper(), int(expires_seconds), tuple(sorted(params.items())))
+    min_remaining = get_min_remaining(expires_seconds)
+    now = time.time()
+
+    with _lock:
+        cached = _urls.get(key)
+        if cached is not None and cached[1] - now > min_remaining:
+            _urls.move_to_end(key)
+            _stats["hits"] += 1
+            return cached[0]
+
+    redis_client = _redis()
+    if redis_client is not None:
+        try:
+            raw = redis_client.get(_redis_key(key))
+            if raw:
+                url, expires_at = json.loads(raw)
+                if expires_at - now > min_remaining:
+                    _remember(key, url, expires_at)
+                    with _lock:
+                        _stats["redis_hits"] += 1
+                    return url
+        except Exception as e:
+            logger.warning(f"Signed URL cache lookup in Redis failed: {e}")
+
+    expires_at = now + expires_seconds
+    url = gcs.get_bucket(bucket, project).blob(blob).generate_signed_url(
+        version="v4",
+        expiration=timedelta(seconds=expires_seconds),
+        method=method,
+        query_parameters=params,
+    )
+    with _lock:
+        _stats["signed"] += 1
+    _remember(key, url, expires_at)
+
+    if redis_client is not None:
+        # Expire the shared entry once it is no longer worth handing out
+        reusable_for = int(expires_at - now - min_remaining)
+        if reusable_for > 0:
+            try:
+                redis_client.set(_redis_key(key), json.dumps([url, expires_at]), ex=reusable_for)
+            except Exception as e:
+                logger.warning(f"Signed URL cache store in Redis failed: {e}")
+    return url
+
+
+def _remember(key: Tuple, url: str, expires_at: float) -> None:
+    limit = _max_entries()
+    if not limit:
+        return
+    with _lock:
+        _urls[key] = (url, expires_at)
+        _urls.move_to_end(key)
+        while len(_urls) > limit:
+            _urls.popitem(last=False)
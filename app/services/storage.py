@@ -7,34 +7,496 @@ consistent error handling.
 """
 from __future__ import annotations
 
+import asyncio
 import os
 import logging
-from typing import List, Optional
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 from pathlib import Path
 
 from flask import current_app
 
+from . import compression, expiry, gcs
+from .cache import get_disk_cache
+from .fakes import get_memory_bucket, wrap_with_faults
+
+# GCS resumable uploads need chunks in multiples of 256 KiB
+_GCS_CHUNK_ALIGN = 256 * 1024
+
+
+def get_chunk_size() -> int:
+    """Get the streaming chunk size in bytes (STORAGE_CHUNK_SIZE, default 1 MiB)."""
+    try:
+        return max(1, int(os.getenv("STORAGE_CHUNK_SIZE", str(1024 * 1024))))
+    except ValueError:
+        return 1024 * 1024
+
+
+def get_bulk_concurrency() -> int:
+    """Get the worker count for bulk operations (STORAGE_BULK_CONCURRENCY, default 16)."""
+    try:
+        return max(1, int(os.getenv("STORAGE_BULK_CONCURRENCY", "16")))
+    except ValueError:
+        return 16
+
+
+# GCS accepts at most 100 calls in one batch request
+_GCS_BATCH_LIMIT = 100
+
+
+@dataclass
+class BulkResult:
+    """Outcome of one item of a bulk storage operation.
+
+    ``value`` is the bytes read (get), the new generation (put) or whether
+    the object existed (delete); ``error`` is set when ``ok`` is False.
+    """
+    path: str
+    ok: bool
+    value: Any = None
+    error: Optional[str] = None
+
+
+def _run_sync(coro):
+    """Run a bulk coroutine to completion from synchronous code."""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    coro.close()
+    raise RuntimeError("Synchronous bulk storage calls cannot run inside an event loop; "
+                       "await aget_many/aput_many/adelete_many instead")
+
+
+STORAGE_BACKENDS = ("gcs", "local", "memory")
+
+
+def get_backend_name(config) -> str:
+    """Get the configured storage backend.
+    
+    STORAGE_BACKEND (app config or environment) selects ``gcs``, ``local``
+    or ``memory``; without it the backend follows USE_GCS.
+    """
+    backend = (config.get('STORAGE_BACKEND') or os.getenv('STORAGE_BACKEND') or '').lower()
+    if backend in STORAGE_BACKENDS:
+        return backend
+    return 'gcs' if config.get('USE_GCS', False) else 'local'
+
+
+class PreconditionFailedError(RuntimeError):
+    """Raised when a write's ``if_generation_match`` precondition does not hold."""
+
+
+def _gcs_errors():
+    """Get the google-api-core NotFound and PreconditionFailed exception types."""
+    from google.api_core.exceptions import NotFound, PreconditionFailed
+    return NotFound, PreconditionFailed
+
+
+def _known_encoding(encoding: Any) -> Optional[str]:
+    """Keep a Content-Encoding only if it is one this adapter writes."""
+    return encoding if encoding in compression.ENCODINGS else None
+
+
+def _is_sidecar(file_path: Path) -> bool:
+    """Check whether a local file records another object's encoding."""
+    return file_path.name.startswith(".") and file_path.name.endswith(".encoding")
+
+
+def _copy_stored(source: BinaryIO, out: BinaryIO, encoding: Optional[str]) -> None:
+    """Copy an object's stored bytes from ``source`` to ``out``, decoding them if encoded."""
+    chunk_size = get_chunk_size()
+    reader = compression.Decompressor(source, encoding, chunk_size) if encoding else source
+    while True:
+        chunk = reader.read(chunk_size)
+        if not chunk:
+            return
+        out.write(chunk)
+
+
+class _SinkError(Exception):
+    """Wraps an exception raised by the caller's file object during a download."""
+
+
+class _CountingWriter:
+    """Sink counting the bytes a download writes to the caller's file object.
+
+    Exceptions from the file object come out as _SinkError, so they reach
+    the caller unchanged instead of being reported as storage failures.
+    """
+
+    def __init__(self, out: BinaryIO) -> None:
+        self._out = out
+        self.bytes_written = 0
+
+    def write(self, data: bytes) -> int:
+        try:
+            self._out.write(data)
+        except Exception as e:
+            raise _SinkError() from e
+        self.bytes_written += len(data)
+        return len(data)
+
+
+def _local_generation(file_path: Path) -> Optional[int]:
+    """Local stand-in for a GCS generation: the file's mtime in nanoseconds."""
+    try:
+        return file_path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+class StorageReader:
+    """Seekable, chunked reader over one stored object.
+    
+    Bytes are fetched ``chunk_size`` at a time through ``fetch(offset,
+    length)``, so only one chunk is held in memory however large the
+    object is.  ``encoding`` names the compression of the bytes read
+    (``gzip``, ``zstd``) when they are the object's stored bytes, and is
+    None for plain bytes.
+    """
+    
+    def __init__(self, size: int, fetch: Callable[[int, int], bytes], start: int = 0,
+                 end: Optional[int] = None, chunk_size: Optional[int] = None,
+                 on_close: Optional[Callable[[], None]] = None, initial: bytes = b"",
+                 encoding: Optional[str] = None) -> None:
+        self.size = size
+        self.encoding = encoding
+        self.end = size if end is None else max(0, min(end, size))
+        self.chunk_size = chunk_size or get_chunk_size()
+        self._fetch = fetch
+        self._on_close = on_close
+        self._pos = max(0, min(start, self.end))
+        # Bytes already fetched from ``start`` while opening
+        self._buf = initial
+        self._buf_start = self._pos
+        self.closed = False
+    
+    def tell(self) -> int:
+        return self._pos
+    
+    def seek(self, offset: int) -> int:
+        """Move to an absolute offset, clamped to the readable range."""
+        self._pos = max(0, min(offset, self.end))
+        return self._pos
+    
+    def read(self, size: int = -1) -> bytes:
+        """Read up to ``size`` bytes (everything left if negative)."""
+        remaining = self.end - self._pos
+        if size is None or size < 0 or size > remaining:
+            size = remaining
+        parts = []
+        while size > 0:
+            offset = self._pos - self._buf_start
+            if not 0 <= offset < len(self._buf):
+                length = min(max(size, self.chunk_size), self.end - self._pos)
+                self._buf = self._fetch(self._pos, length)
+                self._buf_start = self._pos
+                offset = 0
+                if not self._buf:
+                    break
+            part = self._buf[offset:offset + size]
+            parts.append(part)
+            self._pos += len(part)
+            size -= len(part)
+        return b"".join(parts)
+    
+    def read_at(self, offset: int, length: int) -> bytes:
+        """Read bytes at an absolute offset without moving the position."""
+        relative = offset - self._buf_start
+        if 0 <= relative and relative + length <= len(self._buf):
+            return self._buf[relative:relative + length]
+        return self._fetch(offset, length)
+    
+    def narrow(self, start: int = 0, end: Optional[int] = None) -> "StorageReader":
+        """Limit reading to ``start``..``end`` and move to ``start``."""
+        self.end = self.size if end is None else max(0, min(end, self.size))
+        self.seek(start)
+        return self
+    
+    def decoded(self, start: int = 0, end: Optional[int] = None) -> "StorageReader":
+        """Get a reader over this object's decoded bytes.
+        
+        Stored bytes are decoded front to back as they are read, one chunk
+        at a time; ``start``, ``end`` and the new reader's ``size`` refer to
+        the decoded bytes.  Closing the new reader closes this one.
+        
+        Raises:
+            RuntimeError: If the object is zstd-encoded and zstandard is not installed
+        """
+        if not self.encoding:
+            return self.narrow(start, end)
+        source = _DecodedSource(self)
+        return StorageReader(source.size(), source.fetch, start, end, chunk_size=self.chunk_size,
+                             on_close=self.close)
+    
+    def iter_chunks(self, length: Optional[int] = None) -> Iterator[bytes]:
+        """Yield the next ``length`` bytes (default: the rest) chunk by chunk, then close."""
+        remaining = self.end - self._pos if length is None else length
+        try:
+            while remaining > 0:
+                chunk = self.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+        finally:
+            self.close()
+    
+    def close(self) -> None:
+        if not self.closed:
+            self.closed = True
+            self._buf = b""
+            if self._on_close is not None:
+                self._on_close()
+    
+    def __enter__(self) -> "StorageReader":
+        return self
+    
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class _DecodedSource:
+    """Decodes a stored object front to back to serve a StorageReader's fetches.
+    
+    Fetches at or after the decoded position continue the stream, skipping
+    forward if needed; fetches before it start over from the first byte.
+    """
+    
+    def __init__(self, raw: StorageReader) -> None:
+        self._raw = raw
+        self._restart()
+    
+    def _restart(self) -> None:
+        self._raw.seek(0)
+        self._decoder = compression.Decompressor(self._raw, self._raw.encoding, self._raw.chunk_size)
+        self._pos = 0
+    
+    def size(self) -> int:
+        """Get the decoded size, from the stored header or trailer, else by decoding once."""
+        raw = self._raw
+        if raw.encoding == compression.ZSTD:
+            size = compression.decoded_size(raw.encoding, raw.read_at(0, min(18, raw.size)), b"")
+        else:
+            size = compression.decoded_size(raw.encoding, b"", raw.read_at(raw.size - 4, 4) if raw.size >= 4 else b"")
+        if size is None:
+            size = 0
+            while True:
+                chunk = self._decoder.read(raw.chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+            self._restart()
+        return size
+    
+    def fetch(self, offset: int, length: int) -> bytes:
+        if offset < self._pos:
+            self._restart()
+        while self._pos < offset:
+            skipped = self._decoder.read(min(offset - self._pos, self._raw.chunk_size))
+            if not skipped:
+                return b""
+            self._pos += len(skipped)
+        data = self._decoder.read(length)
+        self._pos += len(data)
+        return data
+
+
+class StorageWriter:
+    """Chunked writer for one stored object.
+    
+    The object only becomes visible once ``close()`` succeeds; leaving a
+    ``with`` block on an exception (or calling ``abort()``) discards it.
+    """
+    
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.bytes_written = 0
+        self.closed = False
+    
+    def write(self, data: bytes) -> int:
+        if self.closed:
+            raise ValueError("write to closed StorageWriter")
+        self._write(data)
+        self.bytes_written += len(data)
+        return len(data)
+    
+    def close(self) -> None:
+        """Commit the object."""
+        if not self.closed:
+            self.closed = True
+            self._commit()
+    
+    def abort(self) -> None:
+        """Discard everything written so far."""
+        if not self.closed:
+            self.closed = True
+            self._discard()
+    
+    def __enter__(self) -> "StorageWriter":
+        return self
+    
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+    
+    def _write(self, data: bytes) -> None:
+        raise NotImplementedError
+    
+    def _commit(self) -> None:
+        raise NotImplementedError
+    
+    def _discard(self) -> None:
+        raise NotImplementedError
+
+
+class _LocalWriter(StorageWriter):
+    """Writes to a temporary file renamed over the target on commit.
+    
+    The object's encoding is recorded in its sidecar file on commit.
+    """
+    
+    def __init__(self, path: str, file_path: Path, if_generation_match: Optional[int] = None,
+                 encoding: Optional[str] = None) -> None:
+        super().__init__(path)
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        self._target = file_path
+        self._if_generation_match = if_generation_match
+        self._encoding = encoding
+        self._tmp = file_path.with_name(f".{file_path.name}.{uuid.uuid4().hex}.part")
+        self._fh = open(self._tmp, 'wb')
+    
+    def _write(self, data: bytes) -> None:
+        self._fh.write(data)
+    
+    def _commit(self) -> None:
+        self._fh.close()
+        if self._if_generation_match == 0:
+            # Create only: link fails atomically if the target exists
+            try:
+                os.link(self._tmp, self._target)
+            except FileExistsError:
+                self._discard()
+                raise PreconditionFailedError(f"Object already exists: {self.path}")
+            self._tmp.unlink()
+            compression.write_local_encoding(self._target, self._encoding)
+            return
+        previous = _local_generation(self._target)
+        if self._if_generation_match is not None and previous != self._if_generation_match:
+            self._discard()
+            raise PreconditionFailedError(f"Generation mismatch for {self.path}")
+        compression.write_local_encoding(self._target, self._encoding)
+        os.replace(self._tmp, self._target)
+        # Keep generations increasing even within one mtime tick
+        if previous is not None and _local_generation(self._target) <= previous:
+            os.utime(self._target, ns=(previous + 1, previous + 1))
+    
+    def _discard(self) -> None:
+        if not self._fh.closed:
+            self._fh.close()
+        try:
+            self._tmp.unlink()
+        except OSError:
+            pass
+
+
+class _GCSWriter(StorageWriter):
+    """Buffers the first chunk, then switches to a resumable upload.
+    
+    Objects smaller than one chunk are sent in a single request.
+    """
+    
+    def __init__(self, path: str, blob, chunk_size: int, if_generation_match: Optional[int] = None) -> None:
+        super().__init__(path)
+        self._blob = blob
+        self._preconditions = {} if if_generation_match is None else {"if_generation_match": if_generation_match}
+        self._chunk_size = max(_GCS_CHUNK_ALIGN, chunk_size - chunk_size % _GCS_CHUNK_ALIGN)
+        self._buffer = bytearray()
+        self._upload = None
+    
+    def _write(self, data: bytes) -> None:
+        if self._upload is None:
+            self._buffer.extend(data)
+            if len(self._buffer) <= self._chunk_size:
+                return
+            self._upload = self._blob.open("wb", chunk_size=self._chunk_size, ignore_flush=True,
+                                           **self._preconditions)
+            data, self._buffer = bytes(self._buffer), bytearray()
+        self._upload.write(data)
+    
+    def _commit(self) -> None:
+        _, PreconditionFailed = _gcs_errors()
+        try:
+            if self._upload is None:
+                gcs.record_round_trip("open_write")
+                self._blob.upload_from_string(bytes(self._buffer), **self._preconditions)
+            else:
+                # Session start plus one request per chunk
+                gcs.record_round_trip("open_write", 1 + -(-self.bytes_written // self._chunk_size))
+                self._upload.close()
+        except PreconditionFailed as e:
+            raise PreconditionFailedError(f"Generation mismatch for {self.path}: {e}")
+    
+    def _discard(self) -> None:
+        # An unfinished resumable session is never finalized and expires
+        self._buffer = bytearray()
+        self._upload = None
+
+
+class _CompressingWriter(StorageWriter):
+    """Encodes chunks on their way to another writer."""
+    
+    def __init__(self, inner: StorageWriter, encoding: str) -> None:
+        super().__init__(inner.path)
+        self._inner = inner
+        self._compressor = compression.Compressor(encoding)
+    
+    def _write(self, data: bytes) -> None:
+        encoded = self._compressor.compress(data)
+        if encoded:
+            self._inner.write(encoded)
+    
+    def _commit(self) -> None:
+        self._inner.write(self._compressor.flush())
+        self._inner.close()
+    
+    def _discard(self) -> None:
+        self._inner.abort()
+
 
 class Storage:
-    """Unified storage adapter for GCS and local file system."""
+    """Unified storage adapter for GCS, in-memory and local file system storage."""
     
     def __init__(self) -> None:
         """Initialize storage adapter based on environment configuration."""
         self.logger = logging.getLogger(__name__)
         
         # Read configuration from environment
-        self.use_gcs = current_app.config.get('USE_GCS', False)
+        self.backend = get_backend_name(current_app.config)
+        self.use_gcs = self.backend == 'gcs'
         self.gcs_bucket_name = current_app.config.get('GCS_BUCKET_NAME')
         self.google_cloud_project = current_app.config.get('GOOGLE_CLOUD_PROJECT')
         
         # Initialize GCS client if needed
         self._gcs_client = None
         self._gcs_bucket = None
+        self._cache = None
         
         if self.use_gcs:
             if not self.gcs_bucket_name:
                 raise ValueError("GCS_BUCKET_NAME must be set when USE_GCS=True")
             self._init_gcs()
+        elif self.backend == 'memory':
+            # Runs the GCS code paths against a process-local bucket
+            self.gcs_bucket_name = self.gcs_bucket_name or 'memory'
+            self._gcs_bucket = wrap_with_faults(get_memory_bucket(self.gcs_bucket_name))
+            self.logger.info(f"Using in-memory storage bucket {self.gcs_bucket_name}")
         else:
             # Ensure local data directory exists
             self._data_dir = Path("./data")
@@ -42,108 +504,448 @@ class Storage:
             self.logger.info(f"Using local storage at {self._data_dir.absolute()}")
     
     def _init_gcs(self) -> None:
-        """Initialize Google Cloud Storage client and bucket."""
+        """Attach to the process-wide GCS client and bucket.
+
+        No network round trip happens here; the bucket is validated on
+        first use, once per process (see ``_gcs_ready``).
+        """
         try:
-            from google.cloud import storage
-            
-            self._gcs_client = storage.Client(project=self.google_cloud_project)
-            self._gcs_bucket = self._gcs_client.bucket(self.gcs_bucket_name)
-            
-            # Verify bucket exists and is accessible
-            if not self._gcs_bucket.exists():
-                raise ValueError(f"GCS bucket '{self.gcs_bucket_name}' does not exist or is not accessible")
-            
-            self.logger.info(f"Initialized GCS storage with bucket: {self.gcs_bucket_name}")
+            self._gcs_client = gcs.get_client(self.google_cloud_project)
+            self._gcs_bucket = wrap_with_faults(gcs.get_bucket(self.gcs_bucket_name, self.google_cloud_project))
+            self._cache = get_disk_cache()
             
         except ImportError:
             raise ImportError("google-cloud-storage package is required when USE_GCS=True")
         except Exception as e:
             raise RuntimeError(f"Failed to initialize GCS storage: {e}")
     
-    def write_bytes(self, path: str, data: bytes) -> None:
-        """Write bytes to storage at the specified path.
+    def _cached(self, path: str) -> bool:
+        """Check whether a GCS path is served through the local disk cache."""
+        return self._cache is not None and self._cache.max_age_for(path) is not None
+    
+    def _gcs_ready(self) -> bool:
+        """Check whether a GCS-style bucket is in use, validating it on first use.
+        
+        True for the ``gcs`` and ``memory`` backends, which share code paths.
+        
+        Raises:
+            ValueError: If the bucket does not exist or is not accessible
+        """
+        if self.backend == 'local':
+            return False
+        if self.use_gcs:
+            gcs.ensure_bucket(self.gcs_bucket_name, self.google_cloud_project)
+        return True
+    
+    def _expires_at(self, path: str, expires_at: Optional[datetime]) -> Optional[datetime]:
+        """Get the expiry to store with an object: the caller's, else the STORAGE_EXPIRY rule's."""
+        if expires_at is not None:
+            return expiry.as_utc(expires_at)
+        return expiry.expires_at_for(path)
+    
+    def _record_local_expiry(self, path: str, expires_at: Optional[datetime]) -> None:
+        """Record a local object's expiry, or forget a stale one when it is rewritten without."""
+        if expires_at is not None:
+            expiry.get_local_index(self._data_dir).set(path, expires_at)
+        elif (self._data_dir / expiry.INDEX_NAME).exists():
+            expiry.get_local_index(self._data_dir).discard(path)
+    
+    def write_bytes(self, path: str, data: bytes, if_generation_match: Optional[int] = None,
+                    expires_at: Optional[datetime] = None) -> Optional[int]:
+        """Write bytes to storage at the specified path in a single request.
         
         Args:
             path: Relative path where to write the data
             data: Bytes to write
+            if_generation_match: Only write if the object's current generation
+                matches (0: only if it does not exist yet)
+            expires_at: When the object store should delete the object
+                (default: from STORAGE_EXPIRY, if a rule covers ``path``)
+            
+        Returns:
+            Generation of the written object, if known
             
         Raises:
+            PreconditionFailedError: If ``if_generation_match`` does not hold
             RuntimeError: If write operation fails
         """
         try:
-            if self.use_gcs:
-                self._write_bytes_gcs(path, data)
+            encoding = compression.encoding_for(path)
+            if encoding and len(data) >= compression.get_min_bytes():
+                data = compression.compress(data, encoding)
             else:
-                self._write_bytes_local(path, data)
+                encoding = None
+            expires_at = self._expires_at(path, expires_at)
+            if self._gcs_ready():
+                return self._write_bytes_gcs(path, data, if_generation_match, encoding, expires_at)
+            else:
+                generation = self._write_bytes_local(path, data, if_generation_match, encoding)
+                self._record_local_expiry(path, expires_at)
+                return generation
+        except PreconditionFailedError:
+            raise
         except Exception as e:
             self.logger.error(f"Failed to write bytes to {path}: {e}")
             raise RuntimeError(f"Storage write failed: {e}")
     
-    def _write_bytes_gcs(self, path: str, data: bytes) -> None:
+    def _write_bytes_gcs(self, path: str, data: bytes, if_generation_match: Optional[int],
+                         encoding: Optional[str] = None, expires_at: Optional[datetime] = None) -> Optional[int]:
         """Write bytes to GCS."""
+        _, PreconditionFailed = _gcs_errors()
         blob = self._gcs_bucket.blob(path)
-        blob.upload_from_string(data)
+        if encoding:
+            blob.content_encoding = encoding
+        if expires_at is not None:
+            # Deleted by the bucket's daysSinceCustomTime lifecycle rule
+            blob.custom_time = expires_at
+        gcs.record_round_trip("write_bytes")
+        try:
+            if if_generation_match is None:
+                blob.upload_from_string(data)
+            else:
+                blob.upload_from_string(data, if_generation_match=if_generation_match)
+        except PreconditionFailed as e:
+            raise PreconditionFailedError(f"Generation mismatch for {path}: {e}")
         self.logger.debug(f"Wrote {len(data)} bytes to GCS: {path}")
+        if self._cached(path):
+            self._cache.store(path, data, blob.generation, encoding)
+        return blob.generation
     
-    def _write_bytes_local(self, path: str, data: bytes) -> None:
+    def _write_bytes_local(self, path: str, data: bytes, if_generation_match: Optional[int],
+                           encoding: Optional[str] = None) -> Optional[int]:
         """Write bytes to local file system."""
         file_path = self._data_dir / path
         
-        # Ensure parent directory exists
-        file_path.parent.mkdir(parents=True, exist_ok=True)
-        
-        with open(file_path, 'wb') as f:
-            f.write(data)
+        with _LocalWriter(path, file_path, if_generation_match, encoding) as out:
+            out.write(data)
         
         self.logger.debug(f"Wrote {len(data)} bytes to local file: {file_path}")
+        return _local_generation(file_path)
     
     def read_bytes(self, path: str) -> bytes:
-        """Read bytes from storage at the specified path.
+        """Read bytes from storage at the specified path in a single request.
+        
+        Args:
+            path: Relative path to read from
+            
+        Returns:
+            Bytes read from storage, decompressed if stored compressed
+            
+        Raises:
+            FileNotFoundError: If file does not exist
+            RuntimeError: If read operation fails
+        """
+        try:
+            data, encoding = self.read_encoded(path)
+            return compression.decompress(data, encoding) if encoding else data
+        except FileNotFoundError:
+            raise
+        except Exception as e:
+            self.logger.error(f"Failed to read bytes from {path}: {e}")
+            raise RuntimeError(f"Storage read failed: {e}")
+    
+    def read_encoded(self, path: str) -> Tuple[bytes, Optional[str]]:
+        """Read an object's bytes as stored, without decompressing them.
         
         Args:
             path: Relative path to read from
             
         Returns:
-            Bytes read from storage
+            Tuple of (stored bytes, encoding such as ``gzip``, or None)
             
         Raises:
             FileNotFoundError: If file does not exist
             RuntimeError: If read operation fails
         """
         try:
-            if self.use_gcs:
+            if self._gcs_ready():
                 return self._read_bytes_gcs(path)
-            else:
-                return self._read_bytes_local(path)
+            return self._read_bytes_local(path)
         except FileNotFoundError:
             raise
         except Exception as e:
             self.logger.error(f"Failed to read bytes from {path}: {e}")
             raise RuntimeError(f"Storage read failed: {e}")
     
-    def _read_bytes_gcs(self, path: str) -> bytes:
-        """Read bytes from GCS."""
+    def _read_bytes_gcs(self, path: str) -> Tuple[bytes, Optional[str]]:
+        """Read bytes and their encoding from GCS."""
+        NotFound, _ = _gcs_errors()
         blob = self._gcs_bucket.blob(path)
+        encoded = compression.rule_for(path) is not None
         
-        if not blob.exists():
+        try:
+            if self._cached(path):
+                data, meta = self._cache.read_entry(path, blob)
+                encoding = meta.get("content_encoding")
+            elif encoded:
+                # Keep the stored encoding; read_bytes decodes it
+                gcs.record_round_trip("read_bytes")
+                data = blob.download_as_bytes(raw_download=True)
+                encoding = getattr(blob, "content_encoding", None)
+            else:
+                gcs.record_round_trip("read_bytes")
+                data = blob.download_as_bytes()
+                encoding = None
+        except NotFound:
             raise FileNotFoundError(f"File not found in GCS: {path}")
-        
-        data = blob.download_as_bytes()
         self.logger.debug(f"Read {len(data)} bytes from GCS: {path}")
-        return data
+        return data, _known_encoding(encoding) if encoded else None
     
-    def _read_bytes_local(self, path: str) -> bytes:
-        """Read bytes from local file system."""
+    def _read_bytes_local(self, path: str) -> Tuple[bytes, Optional[str]]:
+        """Read bytes and their encoding from local file system."""
         file_path = self._data_dir / path
         
-        if not file_path.exists():
+        try:
+            with open(file_path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
             raise FileNotFoundError(f"File not found locally: {file_path}")
         
-        with open(file_path, 'rb') as f:
-            data = f.read()
-        
         self.logger.debug(f"Read {len(data)} bytes from local file: {file_path}")
-        return data
+        return data, compression.read_local_encoding(file_path) if compression.rule_for(path) else None
+    
+    def generation(self, path: str) -> Optional[int]:
+        """Get an object's current generation, for use with ``if_generation_match``.
+        
+        Args:
+            path: Relative path of the object
+            
+        Returns:
+            Generation (GCS object generation, or file mtime in nanoseconds
+            locally), or None if the object does not exist
+        """
+        if self._gcs_ready():
+            gcs.record_round_trip("generation")
+            blob = self._gcs_bucket.get_blob(path)
+            return blob.generation if blob is not None else None
+        return _local_generation(self._data_dir / path)
+    
+    def open_read(self, path: str, start: int = 0, end: Optional[int] = None,
+                  decode: bool = True) -> StorageReader:
+        """Open an object for chunked reading.
+        
+        Compressed objects are decoded chunk by chunk as they are read, so
+        memory stays bounded by the chunk size either way.
+        
+        Args:
+            path: Relative path to read from
+            start: Offset of the first byte to read
+            end: Offset one past the last byte to read (default: end of object)
+            decode: Decode compressed objects (offsets then refer to the
+                decoded bytes); if False the stored bytes are read and the
+                reader's ``encoding`` names their encoding
+            
+        Returns:
+            StorageReader whose ``size`` is the full object size
+            
+        Raises:
+            FileNotFoundError: If file does not exist
+            RuntimeError: If the object cannot be opened
+        """
+        try:
+            if compression.rule_for(path):
+                # Whether the object is encoded is only known once it is opened
+                reader = self._open_read_stored(path, 0, None)
+                return reader.decoded(start, end) if decode else reader.narrow(start, end)
+            return self._open_read_stored(path, start, end)
+        except FileNotFoundError:
+            raise
+        except Exception as e:
+            self.logger.error(f"Failed to open {path} for reading: {e}")
+            raise RuntimeError(f"Storage read failed: {e}")
+    
+    def download_to_file(self, path: str, out: BinaryIO) -> int:
+        """Download a whole object into a file object, decoded.
+        
+        Unlike open_read, which fetches one ranged GET per chunk, the
+        object is streamed in a single download; on GCS, objects under a
+        STORAGE_COMPRESSION prefix also take a metadata request, since
+        their encoding must be known before their bytes arrive.
+        
+        Args:
+            path: Relative path to read from
+            out: Binary file object the decoded bytes are written to
+            
+        Returns:
+            Number of bytes written
+            
+        Raises:
+            FileNotFoundError: If file does not exist
+            RuntimeError: If the object cannot be read; exceptions raised
+                by ``out`` itself propagate unchanged
+        """
+        counter = _CountingWriter(out)
+        try:
+            if self._gcs_ready():
+                self._download_gcs(path, counter)
+            else:
+                self._download_local(path, counter)
+        except _SinkError as e:
+            raise e.__cause__
+        except FileNotFoundError:
+            raise
+        except Exception as e:
+            self.logger.error(f"Failed to download {path}: {e}")
+            raise RuntimeError(f"Storage read failed: {e}")
+        return counter.bytes_written
+    
+    def _download_gcs(self, path: str, out: BinaryIO) -> None:
+        """Stream a GCS object into ``out`` with one download request."""
+        NotFound, _ = _gcs_errors()
+        blob = self._gcs_bucket.blob(path)
+        encoded = compression.rule_for(path) is not None
+        try:
+            if self._cached(path):
+                fh, meta = self._cache.open(path, blob, "download")
+                with fh:
+                    encoding = _known_encoding(meta.get("content_encoding")) if encoded else None
+                    _copy_stored(fh, out, encoding)
+                return
+            options = {}
+            encoding = None
+            if encoded:
+                gcs.record_round_trip("download")
+                blob.reload()
+                encoding = _known_encoding(getattr(blob, "content_encoding", None))
+                # Read as stored, from the generation whose encoding was just read
+                options = {"raw_download": True, "if_generation_match": blob.generation}
+            sink = compression.DecodingWriter(out, encoding) if encoding else out
+            gcs.record_round_trip("download")
+            blob.download_to_file(sink, **options)
+        except NotFound:
+            raise FileNotFoundError(f"File not found in GCS: {path}")
+        if encoding:
+            sink.close()
+    
+    def _download_local(self, path: str, out: BinaryIO) -> None:
+        """Copy a local file into ``out``."""
+        file_path = self._data_dir / path
+        try:
+            fh = open(file_path, 'rb')
+        except FileNotFoundError:
+            raise FileNotFoundError(f"File not found locally: {file_path}")
+        with fh:
+            encoding = compression.read_local_encoding(file_path) if compression.rule_for(path) else None
+            _copy_stored(fh, out, encoding)
+    
+    def _open_read_stored(self, path: str, start: int, end: Optional[int]) -> StorageReader:
+        """Open an object's stored bytes."""
+        if self._gcs_ready():
+            return self._open_read_gcs(path, start, end)
+        return self._open_read_local(path, start, end)
+    
+    def _open_read_gcs(self, path: str, start: int, end: Optional[int]) -> StorageReader:
+        """Open a GCS object with ranged GETs pinned to one generation.
+        
+        The first chunk is fetched while opening; it pins the generation
+        and, when it comes back short, also gives the object size, so
+        objects up to one chunk take a single request.  Only larger
+        objects need a metadata request for their size.
+        """
+        from google.api_core.exceptions import RequestRangeNotSatisfiable
+        NotFound, _ = _gcs_errors()
+        blob = self._gcs_bucket.blob(path)
+        chunk_size = get_chunk_size()
+        encoded = compression.rule_for(path) is not None
+        # Encoded objects are read as stored; GCS would transcode gzip otherwise
+        options = {"checksum": None, "raw_download": True} if encoded else {"checksum": None}
+        
+        if self._cached(path):
+            try:
+                fh, meta = self._cache.open(path, blob, "open_read")
+            except NotFound:
+                raise FileNotFoundError(f"File not found in GCS: {path}")
+            
+            def read_cached(offset: int, length: int) -> bytes:
+                fh.seek(offset)
+                return fh.read(length)
+            
+            return StorageReader(meta["size"], read_cached, start, end, chunk_size=chunk_size, on_close=fh.close,
+                                 encoding=_known_encoding(meta.get("content_encoding")) if encoded else None)
+        wanted = chunk_size if end is None else min(chunk_size, end - start)
+        
+        first = b""
+        size = None
+        try:
+            if wanted > 0:
+                gcs.record_round_trip("open_read")
+                first = blob.download_as_bytes(start=start, end=start + wanted - 1, **options)
+                if len(first) < wanted:
+                    size = start + len(first)
+        except RequestRangeNotSatisfiable:
+            first = b""
+        except NotFound:
+            raise FileNotFoundError(f"File not found in GCS: {path}")
+        if size is None:
+            gcs.record_round_trip("open_read")
+            try:
+                blob.reload()
+            except NotFound:
+                raise FileNotFoundError(f"File not found in GCS: {path}")
+            size = blob.size or 0
+        
+        def fetch(offset: int, length: int) -> bytes:
+            gcs.record_round_trip("open_read")
+            return blob.download_as_bytes(start=offset, end=offset + length - 1, **options)
+        
+        # Content-Encoding comes with the first chunk or the metadata request
+        return StorageReader(size, fetch, start, end, chunk_size=chunk_size, initial=first,
+                             encoding=_known_encoding(getattr(blob, "content_encoding", None)) if encoded else None)
+    
+    def _open_read_local(self, path: str, start: int, end: Optional[int]) -> StorageReader:
+        """Open a local file."""
+        file_path = self._data_dir / path
+        
+        try:
+            fh = open(file_path, 'rb')
+        except FileNotFoundError:
+            raise FileNotFoundError(f"File not found locally: {file_path}")
+        
+        def fetch(offset: int, length: int) -> bytes:
+            fh.seek(offset)
+            return fh.read(length)
+        
+        encoding = compression.read_local_encoding(file_path) if compression.rule_for(path) else None
+        return StorageReader(os.fstat(fh.fileno()).st_size, fetch, start, end, on_close=fh.close,
+                             encoding=encoding)
+    
+    def open_write(self, path: str, if_generation_match: Optional[int] = None,
+                   expires_at: Optional[datetime] = None) -> StorageWriter:
+        """Open an object for chunked writing.
+        
+        Args:
+            path: Relative path where to write the data
+            if_generation_match: Only commit if the object's current generation
+                matches (0: only if it does not exist yet); checked on close
+            expires_at: When the object store should delete the object
+                (default: from STORAGE_EXPIRY, if a rule covers ``path``)
+            
+        Returns:
+            StorageWriter; the object is stored when it is closed
+            
+        Raises:
+            RuntimeError: If the object cannot be opened
+        """
+        try:
+            encoding = compression.encoding_for(path)
+            expires_at = self._expires_at(path, expires_at)
+            if self._gcs_ready():
+                if self._cached(path):
+                    self._cache.invalidate(path)
+                blob = self._gcs_bucket.blob(path)
+                if encoding:
+                    blob.content_encoding = encoding
+                if expires_at is not None:
+                    blob.custom_time = expires_at
+                writer = _GCSWriter(path, blob, get_chunk_size(), if_generation_match)
+            else:
+                writer = _LocalWriter(path, self._data_dir / path, if_generation_match, encoding)
+                # Recorded up front; the reaper ignores files that never appear
+                self._record_local_expiry(path, expires_at)
+            return _CompressingWriter(writer, encoding) if encoding else writer
+        except Exception as e:
+            self.logger.error(f"Failed to open {path} for writing: {e}")
+            raise RuntimeError(f"Storage write failed: {e}")
     
     def exists(self, path: str) -> bool:
         """Check if a file exists in storage.
@@ -155,7 +957,7 @@ class Storage:
             True if file exists, False otherwise
         """
         try:
-            if self.use_gcs:
+            if self._gcs_ready():
                 return self._exists_gcs(path)
             else:
                 return self._exists_local(path)
@@ -166,6 +968,7 @@ class Storage:
     def _exists_gcs(self, path: str) -> bool:
         """Check if file exists in GCS."""
         blob = self._gcs_bucket.blob(path)
+        gcs.record_round_trip("exists")
         return blob.exists()
     
     def _exists_local(self, path: str) -> bool:
@@ -173,6 +976,31 @@ class Storage:
         file_path = self._data_dir / path
         return file_path.exists()
     
+    def get_expiry(self, path: str) -> Optional[datetime]:
+        """Get the expiry recorded with an object, if the object store will delete it.
+
+        Args:
+            path: Relative path of the object
+
+        Returns:
+            The object's custom_time on GCS or its local index entry, as a
+            timezone-aware UTC datetime; None if no expiry is recorded, the
+            object is missing or the lookup fails
+        """
+        try:
+            if self._gcs_ready():
+                gcs.record_round_trip("metadata")
+                blob = self._gcs_bucket.get_blob(path)
+                expires_at = getattr(blob, "custom_time", None) if blob is not None else None
+            elif (self._data_dir / expiry.INDEX_NAME).exists():
+                expires_at = expiry.get_local_index(self._data_dir).get(path)
+            else:
+                expires_at = None
+        except Exception as e:
+            self.logger.warning(f"Failed to read the expiry of {path}: {e}")
+            return None
+        return expiry.as_utc(expires_at) if isinstance(expires_at, datetime) else None
+    
     def list_prefix(self, prefix: str) -> List[str]:
         """List all files with the given prefix.
         
@@ -183,7 +1011,7 @@ class Storage:
             List of file paths matching the prefix
         """
         try:
-            if self.use_gcs:
+            if self._gcs_ready():
                 return self._list_prefix_gcs(prefix)
             else:
                 return self._list_prefix_local(prefix)
@@ -194,7 +1022,10 @@ class Storage:
     def _list_prefix_gcs(self, prefix: str) -> List[str]:
         """List files with prefix in GCS."""
         blobs = self._gcs_bucket.list_blobs(prefix=prefix)
-        return [blob.name for blob in blobs]
+        names = [blob.name for blob in blobs]
+        # One request per page of results
+        gcs.record_round_trip("list_prefix", getattr(blobs, "page_number", 1) or 1)
+        return names
     
     def _list_prefix_local(self, prefix: str) -> List[str]:
         """List files with prefix locally."""
@@ -205,7 +1036,7 @@ class Storage:
         
         files = []
         for file_path in prefix_path.rglob('*'):
-            if file_path.is_file():
+            if file_path.is_file() and not _is_sidecar(file_path):
                 # Convert to relative path from data directory
                 relative_path = file_path.relative_to(self._data_dir)
                 files.append(str(relative_path))
@@ -222,7 +1053,7 @@ class Storage:
             True if deletion was successful, False otherwise
         """
         try:
-            if self.use_gcs:
+            if self._gcs_ready():
                 return self._delete_gcs(path)
             else:
                 return self._delete_local(path)
@@ -232,18 +1063,196 @@ class Storage:
     
     def _delete_gcs(self, path: str) -> bool:
         """Delete file from GCS."""
+        NotFound, _ = _gcs_errors()
         blob = self._gcs_bucket.blob(path)
-        if blob.exists():
+        if self._cached(path):
+            self._cache.invalidate(path)
+        gcs.record_round_trip("delete")
+        try:
             blob.delete()
-            self.logger.debug(f"Deleted file from GCS: {path}")
-            return True
-        return False
+        except NotFound:
+            return False
+        self.logger.debug(f"Deleted file from GCS: {path}")
+        return True
     
     def _delete_local(self, path: str) -> bool:
         """Delete file locally."""
         file_path = self._data_dir / path
-        if file_path.exists():
+        try:
             file_path.unlink()
-            self.logger.debug(f"Deleted local file: {file_path}")
-            return True
-        return False
+        except FileNotFoundError:
+            return False
+        compression.write_local_encoding(file_path, None)
+        if (self._data_dir / expiry.INDEX_NAME).exists():
+            expiry.get_local_index(self._data_dir).discard(path)
+        self.logger.debug(f"Deleted local file: {file_path}")
+        return True
+    
+    async def aget_many(self, paths: Iterable[str], concurrency: Optional[int] = None) -> List[BulkResult]:
+        """Read many objects concurrently.
+        
+        Args:
+            paths: Relative paths to read
+            concurrency: Maximum requests in flight (default: STORAGE_BULK_CONCURRENCY)
+            
+        Returns:
+            One BulkResult per path, in input order, with the bytes as ``value``
+        """
+        return await self._fan_out(list(paths), self._get_one, concurrency)
+    
+    async def aput_many(self, items: Union[Dict[str, bytes], Iterable[Tuple[str, bytes]]],
+                        concurrency: Optional[int] = None) -> List[BulkResult]:
+        """Write many objects concurrently.
+        
+        Args:
+            items: Mapping or (path, data) pairs to write
+            concurrency: Maximum requests in flight (default: STORAGE_BULK_CONCURRENCY)
+            
+        Returns:
+            One BulkResult per item, in input order, with the generation as ``value``
+        """
+        pairs = list(items.items()) if isinstance(items, dict) else list(items)
+        return await self._fan_out(pairs, self._put_one, concurrency)
+    
+    async def adelete_many(self, paths: Iterable[str], concurrency: Optional[int] = None) -> List[BulkResult]:
+        """Delete many objects concurrently.
+        
+        On GCS deletes are sent as batch requests of up to 100 objects each,
+        with several batches in flight at once.
+        
+        Args:
+            paths: Relative paths to delete
+            concurrency: Maximum requests in flight (default: STORAGE_BULK_CONCURRENCY)
+            
+        Returns:
+            One BulkResult per path, in input order, with ``value`` False if
+            the object did not exist
+        """
+        paths = list(paths)
+        try:
+            self._gcs_ready()
+        except Exception as e:
+            self.logger.error(f"Failed to delete {len(paths)} objects: {e}")
+            return [BulkResult(path, False, error=str(e)) for path in paths]
+        if not self.use_gcs:
+            return await self._fan_out(paths, self._delete_one, concurrency)
+        batches = [paths[i:i + _GCS_BATCH_LIMIT] for i in range(0, len(paths), _GCS_BATCH_LIMIT)]
+        results = await self._fan_out(batches, self._delete_batch_gcs, concurrency)
+        return [result for batch in results for result in batch]
+    
+    def get_many(self, paths: Iterable[str], concurrency: Optional[int] = None) -> List[BulkResult]:
+        """Synchronous wrapper for ``aget_many``."""
+        return _run_sync(self.aget_many(paths, concurrency))
+    
+    def put_many(self, items: Union[Dict[str, bytes], Iterable[Tuple[str, bytes]]],
+                 concurrency: Optional[int] = None) -> List[BulkResult]:
+        """Synchronous wrapper for ``aput_many``."""
+        return _run_sync(self.aput_many(items, concurrency))
+    
+    def delete_many(self, paths: Iterable[str], concurrency: Optional[int] = None) -> List[BulkResult]:
+        """Synchronous wrapper for ``adelete_many``."""
+        return _run_sync(self.adelete_many(paths, concurrency))
+    
+    async def _fan_out(self, items: list, fn: Callable[[Any], Any], concurrency: Optional[int]) -> list:
+        """Run ``fn`` over ``items`` on a bounded thread pool, preserving order."""
+        if not items:
+            return []
+        workers = min(len(items), concurrency or get_bulk_concurrency())
+        loop = asyncio.get_running_loop()
+        pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="storage-bulk")
+        try:
+            return await asyncio.gather(*(loop.run_in_executor(pool, fn, item) for item in items))
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+    
+    def _get_one(self, path: str) -> BulkResult:
+        try:
+            return BulkResult(path, True, self.read_bytes(path))
+        except Exception as e:
+            return BulkResult(path, False, error=str(e))
+    
+    def _put_one(self, item: Tuple[str, bytes]) -> BulkResult:
+        path, data = item
+        try:
+            return BulkResult(path, True, self.write_bytes(path, data))
+        except Exception as e:
+            return BulkResult(path, False, error=str(e))
+    
+    def _delete_one(self, path: str) -> BulkResult:
+        try:
+            deleted = self._delete_gcs(path) if self.backend == 'memory' else self._delete_local(path)
+            return BulkResult(path, True, deleted)
+        except Exception as e:
+            self.logger.error(f"Failed to delete {path}: {e}")
+            return BulkResult(path, False, error=str(e))
+    
+    def _delete_batch_gcs(self, paths: List[str]) -> List[BulkResult]:
+        """Delete up to 100 GCS objects in one batch request."""
+        # Batches capture every request on their client, so use this thread's own
+        client = gcs.get_batch_client(self.google_cloud_project)
+        bucket = client.bucket(self.gcs_bucket_name)
+        for path in paths:
+            if self._cached(path):
+                self._cache.invalidate(path)
+        gcs.record_round_trip("delete_many")
+        try:
+            with gcs.open_batch(client) as batch:
+                for path in paths:
+                    bucket.delete_blob(path)
+        except Exception as e:
+            self.logger.error(f"Batch delete of {len(paths)} objects failed: {e}")
+            return [BulkResult(path, False, error=str(e)) for path in paths]
+        
+        results = []
+        for path, response in zip(paths, batch.responses):
+            status = response.status_code
+            if 200 <= status < 300:
+                results.append(BulkResult(path, True, True))
+            elif status == 404:
+                results.append(BulkResult(path, True, False))
+            else:
+                results.append(BulkResult(path, False, error=f"Delete failed with HTTP {status}"))
+        self.logger.debug(f"Batch deleted {len(paths)} objects from GCS")
+        return results
+    
+    def signed_url(self, path: str, expires_seconds: int = 300, filename: Optional[str] = None) -> Optional[str]:
+        """Get a short-lived V4 signed GET URL for an object.
+        
+        Args:
+            path: Relative path of the object
+            expires_seconds: URL lifetime in seconds
+            filename: If set, the URL makes GCS serve the object as an attachment with this name
+            
+        Returns:
+            Signed URL, or None on local storage or if signing fails
+        """
+        if not self.use_gcs:
+            return None
+        from .signing import get_signed_url
+        
+        query_parameters = {}
+        if filename:
+            query_parameters['response-content-disposition'] = f'attachment; filename="{filename}"'
+        try:
+            return get_signed_url(self.gcs_bucket_name, path, expires_seconds,
+                                  query_parameters=query_parameters,
+                                  project=self.google_cloud_project)
+        except Exception as e:
+            self.logger.error(f"Failed to sign URL for {path}: {e}")
+            return None
+    
+    def local_path(self, path: str) -> Optional[Path]:
+        """Get the absolute file system path of an object in local storage.
+        
+        Args:
+            path: Relative path of the object
+            
+        Returns:
+            Absolute path, or None unless on local storage or if ``path`` escapes the data directory
+        """
+        if self.backend != 'local':
+            return None
+        from werkzeug.security import safe_join
+        
+        joined = safe_join(str(self._data_dir.absolute()), path)
+        return Path(joined) if joined else None
@@ -10,7 +10,6 @@ from __future__ import annotations
 import os
 import logging
 from typing import Optional, Tuple
-from datetime import datetime, timedelta
 
 from flask import current_app
 
@@ -56,12 +55,11 @@ def download_from_gcs(bucket_name: str, blob_name: str, local_filename: str) ->
     logger = logging.getLogger(__name__)
     
     try:
-        from google.cloud import storage
+        from .services.gcs import get_bucket
         import tempfile
         
-        # Initialize GCS client
-        client = storage.Client()
-        bucket = client.bucket(bucket_name)
+        # Shared process-wide client
+        bucket = get_bucket(bucket_name)
         blob = bucket.blob(blob_name)
         
         # Create temporary file
@@ -96,12 +94,13 @@ def upload_stream_to_gcs(file_stream, bucket_name: str, blob_name: str) -> Optio
     logger = logging.getLogger(__name__)
     
     try:
-        from google.cloud import storage
+        from .services.expiry import stamp_blob
+        from .services.gcs import get_bucket
         
-        # Initialize GCS client
-        client = storage.Client()
-        bucket = client.bucket(bucket_name)
+        # Shared process-wide client
+        bucket = get_bucket(bucket_name)
         blob = bucket.blob(blob_name)
+        stamp_blob(blob, blob_name)
         
         # Upload the file stream directly
         blob.upload_from_file(file_stream)
@@ -133,12 +132,13 @@ def upload_to_gcs(file_path: str, bucket_name: str, blob_name: str) -> Optional[
     logger = logging.getLogger(__name__)
     
     try:
-        from google.cloud import storage
+        from .services.expiry import stamp_blob
+        from .services.gcs import get_bucket
         
-        # Initialize GCS client
-        client = storage.Client()
-        bucket = client.bucket(bucket_name)
+        # Shared process-wide client
+        bucket = get_bucket(bucket_name)
         blob = bucket.blob(blob_name)
+        stamp_blob(blob, blob_name)
         
         # Upload the file
         blob.upload_from_filename(file_path)
@@ -171,12 +171,13 @@ def upload_text_to_gcs(bucket_name: str, blob_name: str, text: str, content_type
     logger = logging.getLogger(__name__)
     
     try:
-        from google.cloud import storage
+        from .services.expiry import stamp_blob
+        from .services.gcs import get_bucket
         
-        # Initialize GCS client
-        client = storage.Client()
-        bucket = client.bucket(bucket_name)
+        # Shared process-wide client
+        bucket = get_bucket(bucket_name)
         blob = bucket.blob(blob_name)
+        stamp_blob(blob, blob_name)
         
         # Set content type
         blob.content_type = content_type
@@ -216,15 +217,7 @@ def generate_v4_signed_url(bucket: str, blob: str, method: str = "GET", minutes:
     logger = logging.getLogger(__name__)
     
     try:
-        from google.cloud import storage
-        
-        # Initialize GCS client
-        client = storage.Client()
-        bucket_obj = client.bucket(bucket)
-        blob_obj = bucket_obj.blob(blob)
-        
-        # Generate V4 signed URL
-        expiration = datetime.utcnow() + timedelta(minutes=minutes)
+        from .services.signing import get_signed_url
         
         # Build query parameters for response headers
         query_parameters = {}
@@ -233,12 +226,9 @@ def generate_v4_signed_url(bucket: str, blob: str, method: str = "GET", minutes:
         if response_content_type:
             query_parameters['response-content-type'] = response_content_type
         
-        signed_url = blob_obj.generate_signed_url(
-            version="v4",
-            expiration=expiration,
-            method=method,
-            query_parameters=query_parameters
-        )
+        # Reuses a cached URL while it has enough validity left
+        signed_url = get_signed_url(bucket, blob, minutes * 60, method=method,
+                                    query_parameters=query_parameters)
         
         logger.info(f"Generated V4 signed URL for gs://{bucket}/{blob} (method: {method}, expires: {minutes}m)")
         return signed_url
@@ -283,24 +273,14 @@ def generate_signed_url(gcs_uri: str, expires_in: int = 900) -> Optional[str]:
         return f"/download/{filename}"
     
     try:
-        from google.cloud import storage
+        from .services.signing import get_signed_url
         
         # Parse GCS URI
         bucket_name = gcs_uri.split("/")[2]
         blob_name = "/".join(gcs_uri.split("/")[3:])
         
-        # Initialize GCS client
-        client = storage.Client()
-        bucket = client.bucket(bucket_name)
-        blob = bucket.blob(blob_name)
-        
-        # Generate signed URL
-        expiration = datetime.utcnow() + timedelta(seconds=expires_in)
-        signed_url = blob.generate_signed_url(
-            version="v4",
-            expiration=expiration,
-            method="GET"
-        )
+        # Reuses a cached URL while it has enough validity left
+        signed_url = get_signed_url(bucket_name, blob_name, expires_in)
         
         logger.info(f"Generated signed URL for {gcs_uri}")
         return signed_url
@@ -335,15 +315,14 @@ def delete_from_gcs(gcs_uri: str) -> bool:
             return False
     
     try:
-        from google.cloud import storage
+        from .services.gcs import get_bucket
         
         # Parse GCS URI
         bucket_name = gcs_uri.split("/")[2]
         blob_name = "/".join(gcs_uri.split("/")[3:])
         
-        # Initialize GCS client
-        client = storage.Client()
-        bucket = client.bucket(bucket_name)
+        # Shared process-wide client
+        bucket = get_bucket(bucket_name)
         blob = bucket.blob(blob_name)
         
         # Delete the blob
@@ -380,15 +359,14 @@ def get_file_size(gcs_uri: str) -> Optional[int]:
             return None
     
     try:
-        from google.cloud import storage
+        from .services.gcs import get_bucket
         
         # Parse GCS URI
         bucket_name = gcs_uri.split("/")[2]
         blob_name = "/".join(gcs_uri.split("/")[3:])
         
-        # Initialize GCS client
-        client = storage.Client()
-        bucket = client.bucket(bucket_name)
+        # Shared process-wide client
+        bucket = get_bucket(bucket_name)
         blob = bucket.blob(blob_name)
         
         # Get blob properties
@@ -1,91 +1,177 @@
-import tempfile, os
+import tempfile, os, threading
+from celery.signals import worker_shutdown
 from celery_worker import celery
 from app import create_app, db
 from .models_conversion import Conversion
-from .api_convert import _convert_with_markitdown
-from .quality import clean_markdown, pdf_text_fallback
+from .pipeline import (
+    PROCESS, Pipeline, Stage, convert_stage, get_pipeline_mode, postprocess_stage,
+    run_serial, stage_workers,
+)
+from .prefetch import connect_signals, get_prefetcher, is_prefetch_enabled
 from .webhooks import deliver_webhook
+from .celery_tasks import convert_document as _convert_document
+from .celery_tasks import daily_cleanup_task as _daily_cleanup_task
+from .celery_tasks import expiry_sweep_task as _expiry_sweep_task
 from flask import current_app
 
 app = create_app()
 
-@celery.task(name="convert_from_gcs")
-def convert_from_gcs(conv_id: str, gcs_uri: str, filename: str = None, callback_url: str = None):
-    from google.cloud import storage
+if is_prefetch_enabled():
+    connect_signals(app)
 
+def _claim_prefetched(task_id, source):
+    if not is_prefetch_enabled():
+        return None
+    return get_prefetcher().claim(task_id, source)
+
+@celery.task(name="convert_document", bind=True)
+def convert_document(self, job_id: int, user_id: int, gcs_uri: str, engine: str = None,
+                     size_bytes: int = None, pages: int = None):
+    prefetched_path = _claim_prefetched(self.request.id, gcs_uri)
+    with app.app_context():
+        return _convert_document(job_id, user_id, gcs_uri, engine=engine, prefetched_path=prefetched_path)
+
+# Periodic tasks, registered under the names celery_worker's beat schedule publishes
+@celery.task(name="app.celery_tasks.daily_cleanup_task")
+def daily_cleanup_task():
     with app.app_context():
-        conv = db.session.get(Conversion, conv_id)
+        return _daily_cleanup_task()
+
+@celery.task(name="app.celery_tasks.expiry_sweep_task")
+def expiry_sweep_task():
+    with app.app_context():
+        return _expiry_sweep_task()
+
+def _fetch_stage(ctx):
+    from .services.gcs import get_blob
+
+    with app.app_context():
+        conv = db.session.get(Conversion, ctx["conv_id"])
         if not conv:
-            return
+            return {"halt": True}
         conv.status = "PROCESSING"
+        mime = conv.original_mime
         db.session.commit()
 
-        # download to tmp
-        bucket_name, blob_path = gcs_uri.replace("gs://", "").split("/", 1)
-        client = storage.Client()
-        bucket = client.bucket(bucket_name)
-        blob = bucket.blob(blob_path)
-        with tempfile.NamedTemporaryFile(delete=False) as tmp:
-            blob.download_to_filename(tmp.name)
-            tmp_path = tmp.name
-
-        try:
-            markdown = _convert_with_markitdown(tmp_path) or ""
-            if not markdown and conv.original_mime == "application/pdf":
-                fb = pdf_text_fallback(tmp_path)
-                if fb: markdown = fb
-            conv.markdown = clean_markdown(markdown)
+    # use the input prefetched while the previous task ran, if any
+    prefetched_path = _claim_prefetched(ctx.get("task_id"), ctx["gcs_uri"])
+    if prefetched_path:
+        ctx["tmp_path"] = prefetched_path
+        return {"mime": mime, "prefetched": True}
+
+    # download to tmp
+    blob = get_blob(ctx["gcs_uri"])
+    with tempfile.NamedTemporaryFile(delete=False) as tmp:
+        ctx["tmp_path"] = tmp.name
+    blob.download_to_filename(ctx["tmp_path"])
+    return {"mime": mime}
+
+def _persist_stage(ctx):
+    with app.app_context():
+        conv = db.session.get(Conversion, ctx["conv_id"])
+        if ctx.get("error") is None:
+            conv.markdown = ctx["markdown"]
+            conv.boilerplate = ctx.get("boilerplate")
             conv.status = "COMPLETED"
-            db.session.commit()
-            
-            if callback_url:
-                try:
-                    code, _ = deliver_webhook(
-                        callback_url,
-                        "conversion.completed",
-                        {
-                            "id": conv.id,
-                            "filename": conv.filename,
-                            "status": "COMPLETED",
-                            "links": {
-                                "self": f"/api/conversions/{conv.id}",
-                                "markdown": f"/api/conversions/{conv.id}/markdown",
-                                "view": f"/v/{conv.id}",
-                            },
-                        },
-                    )
-                    current_app.logger.info("webhook_delivered_async", extra={"url": callback_url, "code": code})
-                except Exception as e:
-                    current_app.logger.exception("webhook_async_error: %s", e)
-        except Exception as e:
+        else:
             conv.status = "FAILED"
-            conv.error = str(e)
-            db.session.commit()
-            
-            if callback_url:
-                try:
-                    code, _ = deliver_webhook(
-                        callback_url,
-                        "conversion.failed",
-                        {
-                            "id": conv.id,
-                            "filename": conv.filename,
-                            "status": "FAILED",
-                            "error": conv.error or "unknown",
-                            "links": {"self": f"/api/conversions/{conv.id}"},
-                        },
-                    )
-                    current_app.logger.info("webhook_delivered_async_failed", extra={"url": callback_url, "code": code})
-                except Exception as e:
-                    current_app.logger.exception("webhook_async_error_failed: %s", e)
-        finally:
-            try: os.unlink(tmp_path)
-            except Exception: pass
-            
-            # Delete GCS object to save storage costs
-            delete_on_done = os.getenv("DELETE_GCS_ON_COMPLETE", "1").lower() in ("1","true","yes")
-            if delete_on_done:
-                try:
-                    bucket.delete_blob(blob.path if hasattr(blob, "path") else blob.name)
-                except Exception:
-                    pass
+            conv.error = str(ctx["error"])
+        db.session.commit()
+        return {"filename": conv.filename, "status": conv.status, "conv_error": conv.error}
+
+def _notify_stage(ctx):
+    conv_id = ctx["conv_id"]
+    callback_url = ctx.get("callback_url")
+    try:
+        if callback_url:
+            with app.app_context():
+                if ctx.get("status") == "COMPLETED":
+                    try:
+                        code, _ = deliver_webhook(
+                            callback_url,
+                            "conversion.completed",
+                            {
+                                "id": conv_id,
+                                "filename": ctx.get("filename"),
+                                "status": "COMPLETED",
+                                "links": {
+                                    "self": f"/api/conversions/{conv_id}",
+                                    "markdown": f"/api/conversions/{conv_id}/markdown",
+                                    "view": f"/v/{conv_id}",
+                                },
+                            },
+                        )
+                        current_app.logger.info("webhook_delivered_async", extra={"url": callback_url, "code": code})
+                    except Exception as e:
+                        current_app.logger.exception("webhook_async_error: %s", e)
+                else:
+                    try:
+                        code, _ = deliver_webhook(
+                            callback_url,
+                            "conversion.failed",
+                            {
+                                "id": conv_id,
+                                "filename": ctx.get("filename"),
+                                "status": "FAILED",
+                                "error": ctx.get("conv_error") or str(ctx.get("error") or "") or "unknown",
+                                "links": {"self": f"/api/conversions/{conv_id}"},
+                            },
+                        )
+                        current_app.logger.info("webhook_delivered_async_failed", extra={"url": callback_url, "code": code})
+                    except Exception as e:
+                        current_app.logger.exception("webhook_async_error_failed: %s", e)
+    finally:
+        try: os.unlink(ctx["tmp_path"])
+        except Exception: pass
+
+        # Delete GCS object to save storage costs
+        delete_on_done = os.getenv("DELETE_GCS_ON_COMPLETE", "1").lower() in ("1","true","yes")
+        if delete_on_done and "tmp_path" in ctx:
+            try:
+                from .services.gcs import get_bucket
+                bucket_name, blob_path = ctx["gcs_uri"].replace("gs://", "").split("/", 1)
+                get_bucket(bucket_name).delete_blob(blob_path)
+            except Exception:
+                pass
+
+def conversion_stages():
+    # I/O stages on threads, CPU-bound conversion on processes
+    return [
+        Stage("fetch", _fetch_stage, workers=stage_workers("fetch", 4)),
+        Stage("convert", convert_stage, executor=PROCESS, workers=stage_workers("convert", os.cpu_count() or 2)),
+        Stage("postprocess", postprocess_stage, workers=stage_workers("postprocess", 2)),
+        Stage("persist", _persist_stage, workers=stage_workers("persist", 2), run_on_error=True),
+        Stage("notify", _notify_stage, workers=stage_workers("notify", 4), run_on_error=True),
+    ]
+
+_pipeline = None
+_pipeline_lock = threading.Lock()
+
+def get_pipeline():
+    global _pipeline
+    with _pipeline_lock:
+        if _pipeline is None:
+            _pipeline = Pipeline(
+                conversion_stages(),
+                queue_size=int(os.getenv("PIPELINE_QUEUE_SIZE", "8")),
+                start_method=os.getenv("PIPELINE_START_METHOD", "spawn"),
+            )
+            _pipeline.start()
+        return _pipeline
+
+@worker_shutdown.connect
+def _shutdown_pipeline(**kwargs):
+    if _pipeline is not None:
+        _pipeline.shutdown()
+
+@celery.task(name="convert_from_gcs", bind=True)
+def convert_from_gcs(self, conv_id: str, gcs_uri: str, filename: str = None, callback_url: str = None):
+    ctx = {"conv_id": conv_id, "gcs_uri": gcs_uri, "filename": filename, "callback_url": callback_url,
+           "task_id": self.request.id}
+    if get_pipeline_mode() == "serial":
+        ctx = run_serial(conversion_stages(), ctx)
+    else:
+        # Blocks this Celery thread while the shared pipeline works, so
+        # concurrent tasks overlap their fetch/convert/persist stages
+        ctx = get_pipeline().run(ctx)
+    return {"conv_id": conv_id, "status": ctx.get("status"), "timings": ctx.get("timings")}
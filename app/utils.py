@@ -11,9 +11,7 @@ import os
 import time
 import uuid
 import logging
-import zipfile
 from typing import Iterable, Optional
-from io import BytesIO
 
 import filetype
 
@@ -103,33 +101,29 @@ def is_file_allowed(stream, filename: str = "") -> bool:
 def _validate_docx_structure(sample: bytes, stream, logger) -> bool:
     """Validate that a ZIP file contains DOCX structure.
     
-    This function checks if the ZIP file contains the expected DOCX
-    structure by looking for 'word/document.xml' entry.
+    The ZIP central directory is read from the end of the stream (see
+    app.ooxml), so the check sees every part however large the file is,
+    and containers that would expand past the configured limits are
+    rejected.
     
     Args:
         sample: Initial bytes from the file stream
-        stream: File stream (will be reset after validation)
+        stream: File stream (its position is restored after validation)
         logger: Logger instance for recording validation steps
         
     Returns:
         True if DOCX structure is valid, False otherwise
     """
+    from .ooxml import UnsafeContainer, inspect_container
+
     try:
-        # Create a BytesIO object from the sample for ZIP validation
-        zip_data = BytesIO(sample)
-        
-        # Try to open as ZIP and check for DOCX structure
-        with zipfile.ZipFile(zip_data) as zip_file:
-            # Check if 'word/document.xml' exists in the ZIP
-            if 'word/document.xml' in zip_file.namelist():
-                logger.info("DOCX structure validated - found word/document.xml")
-                return True
-            else:
-                logger.info("ZIP file does not contain DOCX structure")
-                return False
-                
-    except zipfile.BadZipFile:
-        logger.info("File is not a valid ZIP archive")
+        if inspect_container(stream)["kind"] == "docx":
+            logger.info("DOCX structure validated - found word/document.xml")
+            return True
+        logger.info("ZIP file does not contain DOCX structure")
+        return False
+    except UnsafeContainer as e:
+        logger.info(f"ZIP container rejected: {e}")
         return False
     except Exception as e:
         logger.warning(f"Error validating DOCX structure: {e}")
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Batch conversion worker for mdraft.
+
+Consumes the batch queue (see app/batching.py) directly with kombu,
+collecting up to BATCH_SIZE small conversion tasks or waiting at most
+BATCH_MAX_WAIT seconds after the first one arrives, then converts and
+persists them together and acknowledges the whole batch once the
+results are committed.  If processing the batch fails outright, every
+message is requeued for another attempt.
+
+Run alongside the Celery workers:
+
+    python batch_worker.py
+"""
+import logging
+import os
+import signal
+import socket
+import time
+
+from kombu import Queue
+
+from app import create_app
+from app.batching import BATCH_QUEUE, BatchItem, parse_task_message, process_batch
+from celery_worker import celery
+
+logger = logging.getLogger("mdraft.batch_worker")
+
+
+class BatchConsumer:
+    """Collects messages from the batch queue and processes them in groups."""
+
+    def __init__(self, flask_app, batch_size: int = None, max_wait: float = None):
+        self.app = flask_app
+        self.batch_size = batch_size or int(os.getenv("BATCH_SIZE", "16"))
+        self.max_wait = max_wait if max_wait is not None else float(os.getenv("BATCH_MAX_WAIT", "0.5"))
+        self.running = True
+        self._buffer = []
+
+    def _on_message(self, body, message):
+        self._buffer.append((body, message))
+
+    def _collect(self, conn) -> list:
+        deadline = None
+        while self.running and len(self._buffer) < self.batch_size:
+            if deadline is None:
+                timeout = 1.0
+            else:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+            try:
+                conn.drain_events(timeout=timeout)
+            except socket.timeout:
+                if deadline is not None:
+                    break
+                continue
+            if deadline is None and self._buffer:
+                deadline = time.monotonic() + self.max_wait
+        batch, self._buffer = self._buffer, []
+        return batch
+
+    def handle(self, batch: list) -> None:
+        """Process one batch of (body, message) pairs and settle the messages."""
+        items = []
+        for body, message in batch:
+            try:
+                task, args, kwargs = parse_task_message(message.headers, body)
+            except Exception as e:
+                logger.error(f"Rejecting malformed batch message: {e}")
+                message.reject()
+                continue
+            items.append(BatchItem(task=task, args=args, kwargs=kwargs, message=message))
+
+        if not items:
+            return
+        try:
+            with self.app.app_context():
+                process_batch(items)
+        except Exception as e:
+            logger.exception(f"Batch of {len(items)} failed, requeueing: {e}")
+            for item in items:
+                item.message.requeue()
+            return
+
+        # Results are committed; acknowledge the whole batch together
+        for item in items:
+            item.message.ack()
+
+    def run(self) -> None:
+        """Consume until stopped by SIGTERM/SIGINT."""
+        queue = Queue(BATCH_QUEUE, routing_key=BATCH_QUEUE)
+        with celery.connection_for_read() as conn:
+            with conn.Consumer([queue], callbacks=[self._on_message], accept=["json"]) as consumer:
+                consumer.qos(prefetch_count=self.batch_size)
+                logger.info(f"Batch worker consuming {BATCH_QUEUE} (size={self.batch_size}, wait={self.max_wait}s)")
+                while self.running:
+                    batch = self._collect(conn)
+                    if batch:
+                        self.handle(batch)
+
+    def stop(self, *args) -> None:
+        self.running = False
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO)
+    consumer = BatchConsumer(create_app())
+    signal.signal(signal.SIGTERM, consumer.stop)
+    signal.signal(signal.SIGINT, consumer.stop)
+    consumer.run()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,9 @@
 import os
 from celery import Celery
+from kombu import Queue
+
+from app.prefetch import get_prefetch_multiplier
+from app.scheduling import DEFAULT_QUEUE, get_worker_lanes, plan_queue_names
 
 def make_celery():
     broker = os.getenv("CELERY_BROKER_URL", "")
@@ -7,9 +11,20 @@ def make_celery():
     c = Celery("mdraft", broker=broker or None, backend=backend)
     
     # Set default queue
-    c.conf.task_default_queue = 'mdraft_default'
-    c.conf.task_default_exchange = 'mdraft_default'
-    c.conf.task_default_routing_key = 'mdraft_default'
+    c.conf.task_default_queue = DEFAULT_QUEUE
+    c.conf.task_default_exchange = DEFAULT_QUEUE
+    c.conf.task_default_routing_key = DEFAULT_QUEUE
+    
+    # Per-plan, per-lane conversion queues; the queue is chosen at enqueue
+    # time and WORKER_LANES selects which lanes this worker serves
+    lanes = get_worker_lanes()
+    queues = plan_queue_names(lanes) + [DEFAULT_QUEUE]
+    c.conf.task_queues = [Queue(q, routing_key=q) for q in queues]
+    
+    # Weighted fair consumption across plan queues (Redis broker)
+    c.conf.broker_transport_options = {
+        "queue_order_strategy": "app.scheduling:weighted_cycle",
+    }
     
     # TLS for rediss://
     if broker.startswith("rediss://"):
@@ -18,15 +33,13 @@ def make_celery():
     
     # Worker configuration
     c.conf.task_acks_late = True
-    c.conf.worker_prefetch_multiplier = 1
-    
-    # Task routing for priority queue
-    c.conf.task_routes = {
-        'app.celery_tasks.convert_document': {
-            'queue': 'mdraft_priority',
-            'routing_key': 'mdraft_priority',
-        }
-    }
+    # Reserve one extra task per thread when input prefetching is on, so
+    # the next document downloads while the current one converts; only
+    # lane-dedicated workers do, so shared workers keep lanes isolated
+    c.conf.worker_prefetch_multiplier = get_prefetch_multiplier(lanes)
+    
+    # Task modules imported by the worker at startup
+    c.conf.include = ['app.tasks_convert']
     
     # Beat schedule for periodic tasks
     c.conf.beat_schedule = {
@@ -34,10 +47,12 @@ def make_celery():
             'task': 'app.celery_tasks.daily_cleanup_task',
             'schedule': 86400.0,  # 24 hours in seconds
         },
+        'expiry-sweep': {
+            'task': 'app.celery_tasks.expiry_sweep_task',
+            'schedule': float(os.getenv('EXPIRY_SWEEP_INTERVAL', '60')),
+        },
     }
     
     return c
 
 celery = make_celery()
-
-# Tasks are registered dynamically when needed
@@ -0,0 +1,26 @@
+"""conversion_expires_at_index
+
+Revision ID: 3c7d9e2f4a15
+Revises: 926e733b4f22
+Create Date: 2026-10-18 09:12:41.318604
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c7d9e2f4a15'
+down_revision = '926e733b4f22'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('conversions', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_conversions_expires_at'), ['expires_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('conversions', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_conversions_expires_at'))
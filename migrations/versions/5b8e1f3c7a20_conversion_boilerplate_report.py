@@ -0,0 +1,26 @@
+"""conversion_boilerplate_report
+
+Revision ID: 5b8e1f3c7a20
+Revises: 3c7d9e2f4a15
+Create Date: 2026-10-18 22:04:17.552190
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b8e1f3c7a20'
+down_revision = '3c7d9e2f4a15'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('conversions', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('boilerplate', sa.JSON(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('conversions', schema=None) as batch_op:
+        batch_op.drop_column('boilerplate')
@@ -0,0 +1,118 @@
+"""
+Tests for upload-time admission control.
+
+This module tests the quota decision logic with a mocked Redis client.
+"""
+from unittest.mock import Mock, patch
+
+from app.admission import (
+    ADMIT, DOWNGRADE, REJECT, check_admission, get_usage_snapshot
+)
+
+
+def _mock_redis(plan_fields, used_pages):
+    """Build a mock Redis client whose pipeline returns the given values."""
+    mock_pipe = Mock()
+    mock_pipe.execute.return_value = [plan_fields, used_pages]
+    mock_client = Mock()
+    mock_client.pipeline.return_value = mock_pipe
+    return mock_client
+
+
+class TestUsageSnapshot:
+    """Test the cached usage lookup."""
+
+    def test_defaults_without_redis(self):
+        """Test defaults are returned when Redis is not configured."""
+        with patch('app.admission._get_redis_client', return_value=None):
+            result = get_usage_snapshot(1)
+            assert result == {"plan": "F&F", "cap_pages": 300, "used_pages": 0}
+
+    def test_single_round_trip(self):
+        """Test plan and usage are read through one pipeline execution."""
+        client = _mock_redis({b"plan": b"Pro"}, b"150")
+        with patch('app.admission._get_redis_client', return_value=client):
+            result = get_usage_snapshot(7)
+            assert result == {"plan": "Pro", "cap_pages": 2000, "used_pages": 150}
+            client.pipeline.return_value.execute.assert_called_once()
+
+    def test_explicit_cap_overrides_plan_default(self):
+        """Test an explicit cap_pages value wins over the plan default."""
+        client = _mock_redis({b"plan": b"Pro", b"cap_pages": b"50"}, None)
+        with patch('app.admission._get_redis_client', return_value=client):
+            assert get_usage_snapshot(7)["cap_pages"] == 50
+
+
+class TestCheckAdmission:
+    """Test admission decisions."""
+
+    def _check(self, usage, pages, engine, mode="enforce"):
+        with patch('app.admission.get_usage_snapshot', return_value=usage), \
+             patch('app.admission.os.getenv', return_value=mode):
+            return check_admission(1, pages, engine)
+
+    def test_admit_under_cap(self):
+        """Test requests within the cap are admitted unchanged."""
+        result = self._check({"plan": "F&F", "cap_pages": 300, "used_pages": 10}, 5, "docai")
+        assert result["decision"] == ADMIT
+        assert result["engine"] == "docai"
+
+    def test_reject_over_cap(self):
+        """Test users already over their cap are rejected."""
+        result = self._check({"plan": "F&F", "cap_pages": 300, "used_pages": 300}, 1, "markitdown")
+        assert result["decision"] == REJECT
+        assert result["reason"] == "quota_exceeded"
+
+    def test_downgrade_mode_never_rejects(self):
+        """Test downgrade mode moves over-cap users to the free engine."""
+        result = self._check({"plan": "F&F", "cap_pages": 300, "used_pages": 400}, 1, "docai", mode="downgrade")
+        assert result["decision"] == DOWNGRADE
+        assert result["engine"] == "markitdown"
+
+    def test_downgrade_docai_when_request_would_exceed_cap(self):
+        """Test DocAI requests that would cross the cap are downgraded."""
+        result = self._check({"plan": "F&F", "cap_pages": 300, "used_pages": 290}, 20, "docai")
+        assert result["decision"] == DOWNGRADE
+        assert result["engine"] == "markitdown"
+
+    def test_markitdown_request_crossing_cap_is_admitted(self):
+        """Test free-engine requests crossing the cap are still admitted."""
+        result = self._check({"plan": "F&F", "cap_pages": 300, "used_pages": 290}, 20, "markitdown")
+        assert result["decision"] == ADMIT
+
+    def test_passthrough_keeps_its_engine(self):
+        """Test text uploads stay on the passthrough converter when downgraded."""
+        crossing = self._check({"plan": "F&F", "cap_pages": 300, "used_pages": 290}, 20, "passthrough")
+        assert crossing["decision"] == ADMIT
+        over = self._check({"plan": "F&F", "cap_pages": 300, "used_pages": 400}, 1, "passthrough", mode="downgrade")
+        assert (over["decision"], over["engine"]) == (DOWNGRADE, "passthrough")
+
+    def test_anonymous_and_off_mode_skip_lookup(self):
+        """Test anonymous requests and disabled mode never touch Redis."""
+        with patch('app.admission.get_usage_snapshot') as mock_usage:
+            assert check_admission(None, 5, "docai")["decision"] == ADMIT
+            with patch('app.admission.os.getenv', return_value='off'):
+                assert check_admission(1, 5, "docai")["decision"] == ADMIT
+            mock_usage.assert_not_called()
+
+
+class TestUploadAdmission:
+    """Test /upload checks admission for the requesting user."""
+
+    def test_upload_uses_requesting_user(self):
+        """Test the upload is admitted against the resolved user, not a fixed one."""
+        import io
+        from flask import Flask
+        from app.routes import upload
+
+        app = Flask(__name__)
+        app.add_url_rule("/upload", view_func=upload, methods=["POST"])
+        rejected = {"decision": REJECT, "reason": "cap", "plan": "free"}
+        with patch('app.routes.resolve_user_id', return_value=42), \
+             patch('app.routes.check_admission', return_value=rejected) as check, \
+             patch('app.routes.rejection_payload', return_value={}):
+            resp = app.test_client().post(
+                "/upload", data={"file": (io.BytesIO(b"hello"), "notes.txt")},
+                content_type="multipart/form-data")
+        assert resp.status_code == 402
+        assert check.call_args.args[0] == 42
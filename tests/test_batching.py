@@ -0,0 +1,237 @@
+"""
+Tests for micro-batching of small conversions.
+
+This module tests message parsing, single-transaction persistence,
+per-item failure isolation and batch queue routing.
+"""
+import os
+from unittest.mock import Mock, patch
+
+import pytest
+from flask import Flask
+from sqlalchemy import event
+
+from app import db
+from app.batching import BATCH_QUEUE, BatchItem, parse_task_message, process_batch
+from app.models import Job, User
+from app.models_conversion import Conversion
+from app.services import gcs
+from app.scheduling import queue_for_user
+
+
+@pytest.fixture
+def app():
+    """Create a test Flask app with an in-memory database."""
+    app = Flask(__name__)
+    app.config['TESTING'] = True
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def commits(app):
+    """Count commits on the session."""
+    count = {'n': 0}
+
+    def on_commit(session):
+        count['n'] += 1
+
+    event.listen(db.session, 'after_commit', on_commit)
+    yield count
+    event.remove(db.session, 'after_commit', on_commit)
+
+
+def _storage(files):
+    storage = Mock()
+    storage.read_bytes.side_effect = lambda path: files[path]
+    return storage
+
+
+def _fake_convert(path, mime=None):
+    with open(path, 'rb') as f:
+        data = f.read()
+    if data == b'broken':
+        raise ValueError('cannot parse')
+    return data.decode().upper(), None, False
+
+
+class TestParseTaskMessage:
+    """Test Celery message parsing."""
+
+    def test_protocol_2(self):
+        """Test the task name comes from headers in protocol 2."""
+        task, args, kwargs = parse_task_message({'task': 'convert_document'}, [[1, 2, 'p'], {'engine': None}, {}])
+        assert (task, args, kwargs) == ('convert_document', [1, 2, 'p'], {'engine': None})
+
+    def test_protocol_1(self):
+        """Test protocol 1 bodies carry the task name."""
+        task, args, _ = parse_task_message({}, {'task': 'convert_from_gcs', 'args': ['c', 'gs://b/k']})
+        assert (task, args) == ('convert_from_gcs', ['c', 'gs://b/k'])
+
+    def test_unknown_message(self):
+        """Test unrecognised messages raise."""
+        with pytest.raises(ValueError):
+            parse_task_message({}, 'nonsense')
+
+
+class TestProcessBatch:
+    """Test batch conversion and persistence."""
+
+    def _jobs(self, n):
+        user = User(email='u@example.com', password_hash='x')
+        db.session.add(user)
+        db.session.commit()
+        jobs = [Job(user_id=user.id, filename=f'f{i}.txt', status='queued', gcs_uri=f'uploads/{i}/f.txt')
+                for i in range(n)]
+        db.session.add_all(jobs)
+        db.session.commit()
+        return jobs
+
+    def test_batch_commits_once_and_isolates_failures(self, app, commits):
+        """Test all outcomes land in one commit and one bad file fails alone."""
+        jobs = self._jobs(3)
+        files = {'uploads/0/f.txt': b'one', 'uploads/1/f.txt': b'broken', 'uploads/2/f.txt': b'three'}
+        storage = _storage(files)
+        items = [BatchItem('convert_document', [j.id, j.user_id, j.gcs_uri], {}) for j in jobs]
+        commits['n'] = 0
+
+        with patch('app.services.Storage', return_value=storage), \
+             patch('app.batching.convert_warm', side_effect=_fake_convert), \
+             patch('app.conversion.choose_engine', return_value='markitdown'):
+            process_batch(items)
+
+        assert commits['n'] == 1
+        assert [i.status for i in items] == ['completed', 'failed', 'completed']
+        assert 'cannot parse' in items[1].error
+        statuses = {j.id: (j.status, j.output_uri) for j in Job.query.all()}
+        assert statuses[jobs[0].id] == ('completed', f'outputs/{jobs[0].id}/result.md')
+        assert statuses[jobs[1].id][0] == 'failed'
+        storage.write_bytes.assert_any_call(f'outputs/{jobs[2].id}/result.md', b'THREE')
+        assert all(j.started_at is not None for j in Job.query.all())
+        assert all(i.input_path.endswith('.txt') for i in items)
+        assert not any(os.path.exists(i.input_path) for i in items)
+
+    def test_conversions_and_missing_rows(self, app, commits):
+        """Test Conversion rows are updated and missing rows are skipped."""
+        conv = Conversion(filename='a.txt', status='QUEUED', original_mime='text/plain')
+        db.session.add(conv)
+        db.session.commit()
+        items = [
+            BatchItem('convert_from_gcs', [conv.id, 'gs://b/a.txt', 'a.txt', None], {}),
+            BatchItem('convert_from_gcs', ['missing', 'gs://b/m.txt', 'm.txt', None], {}),
+        ]
+
+        def download(path):
+            with open(path, 'wb') as f:
+                f.write(b'hello\n\n\n\nworld')
+
+        client = Mock()
+        client.bucket.return_value.blob.return_value.download_to_filename.side_effect = download
+        gcs.reset_clients()
+        with patch('google.cloud.storage.Client', return_value=client), \
+             patch('app.batching.convert_warm', side_effect=lambda p, m=None: (open(p).read(), None, False)):
+            process_batch(items)
+
+        assert items[0].status == 'COMPLETED'
+        assert items[0].input_path.endswith('.txt')
+        assert items[1].status == 'skipped'
+        row = db.session.get(Conversion, conv.id)
+        assert row.markdown == 'hello\n\nworld'
+        assert row.boilerplate == {'pages': 1, 'threshold': 3, 'lines_removed': 0, 'chars_removed': 0,
+                                   'patterns': []}
+        client.bucket.return_value.delete_blob.assert_called_once_with('a.txt')
+        gcs.reset_clients()
+
+    def test_fallback_output_is_not_postprocessed_again(self, app):
+        """Test PDF fallback markdown keeps its own boilerplate report and is stored as returned."""
+        conv = Conversion(filename='a.pdf', status='QUEUED', original_mime='application/pdf')
+        db.session.add(conv)
+        db.session.commit()
+        items = [BatchItem('convert_from_gcs', [conv.id, 'gs://b/a.pdf', 'a.pdf', None], {})]
+        report = {'pages': 3, 'threshold': 3, 'lines_removed': 3, 'chars_removed': 30, 'patterns': ['Header']}
+
+        client = Mock()
+        gcs.reset_clients()
+        with patch('google.cloud.storage.Client', return_value=client), \
+             patch('app.batching.convert_warm', return_value=('cleaned\n\n\n', report, True)), \
+             patch('app.boilerplate.strip_boilerplate', side_effect=AssertionError):
+            process_batch(items)
+
+        row = db.session.get(Conversion, conv.id)
+        assert (row.status, row.markdown, row.boilerplate) == ('COMPLETED', 'cleaned\n\n\n', report)
+        gcs.reset_clients()
+
+    def test_falls_back_to_per_item_commits(self, app):
+        """Test a failing batch commit is retried item by item."""
+        jobs = self._jobs(2)
+        storage = _storage({j.gcs_uri: b'ok' for j in jobs})
+        items = [BatchItem('convert_document', [j.id, j.user_id, j.gcs_uri], {}) for j in jobs]
+        original_commit = db.session.commit
+        calls = {'n': 0}
+
+        def flaky_commit():
+            calls['n'] += 1
+            if calls['n'] == 1:
+                raise RuntimeError('deadlock')
+            return original_commit()
+
+        with patch('app.services.Storage', return_value=storage), \
+             patch('app.batching.convert_warm', return_value=('OK', None, False)), \
+             patch('app.conversion.choose_engine', return_value='markitdown'), \
+             patch.object(db.session, 'commit', side_effect=flaky_commit):
+            process_batch(items)
+
+        assert calls['n'] == 3
+        assert [j.status for j in Job.query.order_by(Job.id)] == ['completed', 'completed']
+        assert all(j.started_at is not None for j in Job.query.all())
+
+
+class TestBatchRouting:
+    """Test routing tiny conversions to the batch queue."""
+
+    def test_tiny_conversions_use_batch_queue_when_enabled(self):
+        """Test only small, sized conversions are batched."""
+        with patch.dict('os.environ', {'BATCH_ENABLED': '1'}):
+            assert queue_for_user(None, plan='Pro', size_bytes=2000, pages=1) == BATCH_QUEUE
+            assert queue_for_user(None, plan='Pro', size_bytes=None, pages=1) == 'mdraft_pro_small'
+            assert queue_for_user(None, plan='Pro', size_bytes=2000, pages=8) == 'mdraft_pro_small'
+        with patch.dict('os.environ', {'BATCH_ENABLED': '0'}):
+            assert queue_for_user(None, plan='Pro', size_bytes=2000, pages=1) == 'mdraft_pro_small'
+
+
+class TestBatchConsumer:
+    """Test message settlement in the batch worker."""
+
+    def _message(self, task='convert_document'):
+        message = Mock()
+        message.headers = {'task': task} if task else {}
+        return message
+
+    def test_acks_whole_batch_after_processing(self, app):
+        """Test messages are acked together once the batch is processed."""
+        from batch_worker import BatchConsumer
+
+        good, bad = self._message(), self._message(task=None)
+        consumer = BatchConsumer(app, batch_size=4, max_wait=0)
+        with patch('batch_worker.process_batch') as mock_process:
+            consumer.handle([([[1, 1, 'p'], {}, {}], good), ('junk', bad)])
+        assert len(mock_process.call_args.args[0]) == 1
+        good.ack.assert_called_once()
+        bad.reject.assert_called_once()
+
+    def test_requeues_batch_on_failure(self, app):
+        """Test an unexpected failure requeues every message."""
+        from batch_worker import BatchConsumer
+
+        messages = [self._message(), self._message()]
+        consumer = BatchConsumer(app, batch_size=4, max_wait=0)
+        with patch('batch_worker.process_batch', side_effect=RuntimeError('db down')):
+            consumer.handle([([[i, 1, 'p'], {}, {}], m) for i, m in enumerate(messages)])
+        for message in messages:
+            message.requeue.assert_called_once()
+            message.ack.assert_not_called()
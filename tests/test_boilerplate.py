@@ -0,0 +1,138 @@
+"""
+Tests for page-aware header and footer removal.
+
+This module tests edge-line detection, the page threshold, the report
+and that body text is never touched.
+"""
+import os
+from unittest.mock import patch
+
+from app.boilerplate import normalize_line, strip_boilerplate, strip_boilerplate_stream
+from app.pipeline import postprocess_stage
+from app.quality import clean_markdown
+
+
+def _document(pages, header="ACME Corp — Confidential", footer="Page {n} of {total}"):
+    """Build converter-style output: one form feed after every page."""
+    words = ["Revenue", "Outlook", "Risks", "Staff", "Capital", "Notes", "Appendix"]
+    out = []
+    for n in range(1, pages + 1):
+        body = (f"## {words[n % 7]}\n\nThe {words[(n + 3) % 7].lower()} paragraph mentions ACME Corp — Confidential.\n"
+                f"\n- {words[(n + 1) % 7]}\n- {words[(n + 2) % 7]}\n- {words[(n + 4) % 7]}\n")
+        out.append(f"{header}\n\n{body}\n{footer.format(n=n, total=pages)}\n\x0c")
+    return "".join(out)
+
+
+def _invoices(pages):
+    """Build one invoice per page, each line differing from page to page only by its numbers."""
+    return "".join(f"Invoice No. {1000 + n}\nDate: 2024-03-{n:02d}\nCustomer 4{n}7\n"
+                   f"Widgets qty {n + 2}\nGadgets qty {n}\nSprockets qty {n * 3}\n"
+                   f"Subtotal: ${n * 40}.00\nTax: ${n * 4}.00\nTotal due: ${n * 44}.00\n\x0c"
+                   for n in range(1, pages + 1))
+
+
+class TestStripBoilerplate:
+    """Test running header and footer detection."""
+
+    def test_normalize_line(self):
+        """Test the page number, case and whitespace are folded and other numbers kept."""
+        assert normalize_line("  Page 3  of 40 ", 3) == normalize_line("PAGE 40 of 40", 40) == "page # of 40"
+        assert normalize_line("Invoice No. 1003", 3) == "invoice no. 1003"
+        assert normalize_line("Page 3") == "page 3"
+
+    def test_headers_and_footers_removed(self):
+        """Test mixed-case headers and numbered footers go; bodies and page breaks stay."""
+        text, report = strip_boilerplate(_document(6))
+        assert "ACME Corp — Confidential\n" not in text.replace("Confidential.\n", "")
+        assert "Page " not in text
+        assert text.count("\x0c") == 6
+        assert "The revenue paragraph mentions ACME Corp — Confidential." in text
+        assert [p["pages"] for p in report["patterns"]] == [6, 6]
+        assert {p["text"] for p in report["patterns"]} == {"ACME Corp — Confidential", "Page 1 of 6"}
+        assert report["pages"] == 6 and report["lines_removed"] == 12
+        assert report["chars_removed"] == len(_document(6)) - len(text)
+
+    def test_threshold(self):
+        """Test lines repeating on fewer pages than the threshold are kept."""
+        doc = "".join(f"{'Draft' if n < 2 else 'Final'}\n{w}1\n{w}2\n{w}3\n{w}4\n{w}5\n{w}6\n\x0c"
+                      for n, w in enumerate("abcdef"))
+        text, report = strip_boilerplate(doc)
+        assert report["threshold"] == 3
+        assert "Draft" in text and "Final" not in text
+        with patch.dict(os.environ, {'BOILERPLATE_MIN_PAGE_RATIO': '0.9'}):
+            assert strip_boilerplate(doc)[0] == doc
+
+    def test_short_documents_and_disabled(self):
+        """Test documents with too few pages are untouched and the switch turns it off."""
+        doc = _document(2)
+        assert strip_boilerplate(doc) == (doc, {"pages": 2, "threshold": 3, "lines_removed": 0,
+                                                 "chars_removed": 0, "patterns": []})
+        with patch.dict(os.environ, {'BOILERPLATE_STRIP': '0'}):
+            assert strip_boilerplate(_document(6)) == (_document(6), None)
+
+    def test_only_page_edges_checked(self):
+        """Test repeated lines in the middle of pages are kept."""
+        doc = "".join(f"Top {n}\n{w}A\nrepeated\n{w}D\nBottom {n}\n\x0c" for n, w in enumerate("abcde", 1))
+        with patch.dict(os.environ, {'BOILERPLATE_EDGE_LINES': '2'}):
+            text, report = strip_boilerplate(doc)
+        assert text.count("repeated") == 5
+        assert "Top" not in text and "Bottom" not in text
+        assert text.count("A\n") == text.count("D\n") == 5
+
+    def test_long_lines_kept(self):
+        """Test body-length lines are never taken for footers, even when they repeat."""
+        doc = "".join(f"{w}1\n{w}2\n{w}3\n{w}4\n{w}5\n" + "lorem ipsum " * 12 + f"\nPage {n}\n\x0c"
+                      for n, w in enumerate("abcde", 1))
+        text, report = strip_boilerplate(doc)
+        assert text.count("lorem") == 60 and "Page" not in text
+
+    def test_numbered_records_kept(self):
+        """Test invoices whose lines differ only by their numbers lose nothing."""
+        doc = _invoices(12)
+        assert strip_boilerplate(doc)[0] == doc
+        with patch.dict(os.environ, {'BOILERPLATE_EDGE_LINES': '1'}):
+            assert strip_boilerplate(doc)[0] == doc
+
+    def test_numbered_records_keep_running_headers(self):
+        """Test a real running header is still removed from numbered records."""
+        doc = "".join(f"ACME Billing\n{page}Page {n}\n\x0c" for n, page in enumerate(_invoices(6).split("\x0c")[:6], 1))
+        text, report = strip_boilerplate(doc)
+        assert "ACME" not in text and "Page" not in text
+        assert text.count("Invoice No.") == text.count("Total due") == 6
+
+    def test_same_line_at_other_positions_kept(self):
+        """Test a line only counts when it repeats at the same position from the page edge."""
+        doc = "".join(f"{w}0\nHead\n{w}1\n{w}2\n{w}3\n{w}4\n{w}5\n\x0c" if n % 2 else f"Head\n{w}1\n{w}2\n{w}3\n{w}4\n{w}5\n\x0c"
+                      for n, w in enumerate("abcdef"))
+        with patch.dict(os.environ, {'BOILERPLATE_MIN_PAGE_RATIO': '0.9'}):
+            assert strip_boilerplate(doc)[0] == doc
+
+    def test_short_pages_untouched(self):
+        """Test pages too short to have separate edges are never emptied."""
+        doc = "".join(f"Statement for account 88{n}\n\x0c" for n in range(1, 8))
+        assert strip_boilerplate(doc)[0] == doc
+        assert clean_markdown(strip_boilerplate(doc)[0]).count("Statement for account") == 7
+        repeated = "".join("Same line\nOther line\n\x0c" for _ in range(8))
+        assert strip_boilerplate(repeated)[0] == repeated
+
+    def test_stream_matches_whole_text(self):
+        """Test the streaming pass gives the same text and report for any chunking."""
+        docs = [_document(6), _document(6).rstrip("\x0c") + "trailing page\n", _invoices(6),
+                _document(2), "no page breaks", "\x0c", ""]
+        for doc in docs:
+            expected = strip_boilerplate(doc)
+            for size in (1, 7, 4096):
+                chunks = (doc[i:i + size] for i in range(0, len(doc), size))
+                stripped, report = strip_boilerplate_stream(chunks, spool_bytes=64)
+                assert ("".join(stripped), report) == expected
+        with patch.dict(os.environ, {'BOILERPLATE_STRIP': '0'}):
+            stripped, report = strip_boilerplate_stream(iter([_document(6)]))
+            assert ("".join(stripped), report) == (_document(6), None)
+
+    def test_postprocess_reports(self):
+        """Test the pipeline's postprocess stage returns the report with clean markdown."""
+        result = postprocess_stage({"markdown": _document(4)})
+        assert result["boilerplate"]["lines_removed"] == 8
+        assert not result["markdown"].startswith("ACME")
+        # The PDF text fallback arrives already post-processed
+        assert postprocess_stage({"markdown": _document(4), "postprocessed": True}) is None
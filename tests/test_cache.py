@@ -0,0 +1,206 @@
+"""
+Tests for the local read-through disk cache.
+
+This module tests prefix configuration, revalidation, checksum checks,
+single-flight fills, LRU eviction and the Storage integration.
+"""
+import os
+import threading
+import time
+from unittest.mock import Mock, patch
+
+import pytest
+from google.api_core.exceptions import NotFound, NotModified
+
+from app.services import gcs
+from app.services.cache import IMMUTABLE, DiskCache, crc32c_b64, parse_prefixes
+from app.services.storage import Storage
+
+
+class FakeBlob:
+    """Minimal stand-in for a GCS blob supporting conditional downloads."""
+
+    def __init__(self, data=b"hello", generation=1, delay=0.0):
+        self.data = data
+        self.generation = generation
+        self.crc32c = crc32c_b64(data) if data is not None else None
+        self.delay = delay
+        self.downloads = 0
+        self.not_modified = 0
+
+    def download_to_file(self, fh, if_generation_not_match=None, raw_download=False):
+        if self.data is None:
+            raise NotFound("gone")
+        if if_generation_not_match is not None and if_generation_not_match == self.generation:
+            self.not_modified += 1
+            raise NotModified("unchanged")
+        self.downloads += 1
+        time.sleep(self.delay)
+        fh.write(self.data)
+
+    def update(self, data):
+        self.data = data
+        self.generation += 1
+        self.crc32c = crc32c_b64(data)
+
+
+def _cache(tmp_path, spec="outputs/=0,uploads/=immutable", max_bytes=1024):
+    return DiskCache(str(tmp_path), max_bytes, parse_prefixes(spec))
+
+
+class TestParsePrefixes:
+    """Test STORAGE_CACHE_PREFIXES parsing."""
+
+    def test_parse(self):
+        """Test max ages and longest-prefix-first ordering."""
+        rules = parse_prefixes("outputs/=30, uploads/=immutable,outputs/big/,bad=x")
+        assert rules == [("outputs/big/", 0.0), ("outputs/", 30.0), ("uploads/", IMMUTABLE)]
+        assert parse_prefixes("") == []
+
+
+class TestDiskCache:
+    """Test cache reads, revalidation and eviction."""
+
+    def test_miss_then_hit(self, tmp_path):
+        """Test the second read of an immutable object does not contact GCS."""
+        cache = _cache(tmp_path)
+        blob = FakeBlob()
+        assert cache.read("uploads/a", blob) == b"hello"
+        assert cache.read("uploads/a", blob) == b"hello"
+        assert blob.downloads == 1
+        assert cache.stats()["hits"] == 1
+        assert cache.stats()["hit_rate"] == 0.5
+        assert cache.max_age_for("other/x") is None
+
+    def test_revalidation_uses_generation(self, tmp_path):
+        """Test revalidated reads get a 304 until the object changes."""
+        cache = _cache(tmp_path)
+        blob = FakeBlob()
+        cache.read("outputs/1/result.md", blob)
+        assert cache.read("outputs/1/result.md", blob) == b"hello"
+        assert (blob.downloads, blob.not_modified) == (1, 1)
+        blob.update(b"changed")
+        assert cache.read("outputs/1/result.md", blob) == b"changed"
+        assert blob.downloads == 2
+        assert cache.stats()["revalidated"] == 1
+
+    def test_checksum_mismatch_on_fill(self, tmp_path):
+        """Test a download not matching the object's CRC32C is rejected."""
+        cache = _cache(tmp_path)
+        blob = FakeBlob()
+        blob.crc32c = crc32c_b64(b"something else")
+        with pytest.raises(IOError):
+            cache.read("uploads/a", blob)
+        assert not list(tmp_path.glob("*.data"))
+
+    def test_corrupted_entry_is_refetched(self, tmp_path):
+        """Test a cached file whose bytes changed on disk is replaced."""
+        cache = _cache(tmp_path)
+        blob = FakeBlob()
+        cache.read("uploads/a", blob)
+        data_file = next(tmp_path.glob("*.data"))
+        data_file.write_bytes(b"HELLO")
+        assert cache.read("uploads/a", blob) == b"hello"
+        assert blob.downloads == 2
+        assert cache.stats()["corrupt"] == 1
+
+    def test_parallel_readers_download_once(self, tmp_path):
+        """Test concurrent readers of a cold object share one download."""
+        cache = _cache(tmp_path)
+        blob = FakeBlob(delay=0.05)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.read("uploads/a", blob)))
+                   for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert results == [b"hello"] * 8
+        assert blob.downloads == 1
+
+    def test_lru_eviction(self, tmp_path):
+        """Test the least recently used entry goes first when over budget."""
+        cache = _cache(tmp_path, max_bytes=25)
+        for name in ("a", "b"):
+            cache.read(f"uploads/{name}", FakeBlob(data=name.encode() * 10))
+        # b was used more recently than a
+        os.utime(cache._files("uploads/a")[0], (1, 1))
+        os.utime(cache._files("uploads/b")[0], (2, 2))
+        cache.read("uploads/c", FakeBlob(data=b"c" * 10))
+        assert not cache._files("uploads/a")[0].exists()
+        assert cache._files("uploads/b")[0].exists()
+        assert cache._files("uploads/c")[0].exists()
+        assert cache.stats()["evictions"] == 1
+
+    def test_lock_files_are_bounded(self, tmp_path):
+        """Test locks reuse a fixed set of files and leave nothing behind per path."""
+        from app.services.cache import _LOCK_STRIPES
+        cache = _cache(tmp_path, max_bytes=10 ** 6)
+        (tmp_path / ("0" * 64 + ".lock")).touch()
+        for i in range(200):
+            cache.read(f"uploads/{i}", FakeBlob(data=b"x"))
+            cache.invalidate(f"uploads/{i}")
+        assert not list(tmp_path.glob("*.lock"))
+        assert 1 < len(list(tmp_path.glob("lock-*"))) <= _LOCK_STRIPES
+        assert not list(tmp_path.glob("*.data")) and not list(tmp_path.glob("*.json"))
+
+    def test_not_found_propagates(self, tmp_path):
+        """Test a missing object is not cached."""
+        cache = _cache(tmp_path)
+        with pytest.raises(NotFound):
+            cache.read("uploads/a", FakeBlob(data=None))
+        assert not list(tmp_path.glob("*.data"))
+
+
+class TestStorageCache:
+    """Test the cache underneath the Storage adapter."""
+
+    def setup_method(self):
+        """Set up GCS-mode storage with a fake blob."""
+        gcs.reset_clients()
+        gcs.reset_round_trips()
+        self.blob = FakeBlob(b"cached bytes")
+        self.mock_bucket = Mock()
+        self.mock_bucket.exists.return_value = True
+        self.mock_bucket.blob.return_value = self.blob
+        mock_client = Mock()
+        mock_client.bucket.return_value = self.mock_bucket
+        self.patchers = [
+            patch('google.cloud.storage.Client', return_value=mock_client),
+            patch('app.services.storage.current_app', Mock(config={
+                'USE_GCS': True, 'GCS_BUCKET_NAME': 'b', 'GOOGLE_CLOUD_PROJECT': None})),
+        ]
+        for p in self.patchers:
+            p.start()
+
+    def teardown_method(self):
+        """Clean up test environment."""
+        for p in self.patchers:
+            p.stop()
+        gcs.reset_clients()
+        gcs.reset_round_trips()
+
+    def _storage(self, tmp_path):
+        env = {'STORAGE_CACHE_PREFIXES': 'uploads/=immutable', 'STORAGE_CACHE_DIR': str(tmp_path)}
+        with patch.dict(os.environ, env):
+            return Storage()
+
+    def test_repeat_reads_hit_disk(self, tmp_path):
+        """Test repeat read_bytes/open_read calls cost no GCS requests."""
+        storage = self._storage(tmp_path)
+        assert storage.read_bytes("uploads/x") == b"cached bytes"
+        assert storage.read_bytes("uploads/x") == b"cached bytes"
+        with storage.open_read("uploads/x", start=7) as reader:
+            assert reader.read() == b"bytes"
+        assert self.blob.downloads == 1
+        assert gcs.get_round_trips() == {"validate_bucket": 1, "read_bytes": 1}
+
+    def test_uncached_prefix_and_delete(self, tmp_path):
+        """Test other prefixes bypass the cache and deletes invalidate it."""
+        storage = self._storage(tmp_path)
+        self.blob.download_as_bytes = Mock(return_value=b"direct")
+        self.blob.delete = Mock()
+        assert storage.read_bytes("outputs/1/result.md") == b"direct"
+        storage.read_bytes("uploads/x")
+        storage.delete("uploads/x")
+        assert not list(tmp_path.glob("*.data"))
@@ -68,28 +68,42 @@ class TestCeleryTasks:
                 assert result is False
     
     def test_get_task_queue_pro_user(self, app):
-        """Test get_task_queue returns priority queue for pro user."""
+        """Test get_task_queue returns the Pro queue for a cached Pro plan."""
         with app.app_context():
-            with patch('app.celery_tasks.is_pro_user', return_value=True):
+            with patch('app.scheduling.get_cached_plan', return_value='Pro'):
                 result = get_task_queue(1)
-                assert result == 'mdraft_priority'
+                assert result == 'mdraft_pro_small'
     
     def test_get_task_queue_free_user(self, app):
-        """Test get_task_queue returns default queue for free user."""
+        """Test get_task_queue returns the free-tier queue without plan data."""
         with app.app_context():
-            with patch('app.celery_tasks.is_pro_user', return_value=False):
+            with patch('app.scheduling.get_cached_plan', return_value=None):
                 result = get_task_queue(1)
-                assert result == 'mdraft_default'
+                assert result == 'mdraft_ff_small'
+    
+    def test_get_task_queue_known_plan_skips_lookup(self, app):
+        """Test a plan passed by the caller is used without a Redis lookup."""
+        with app.app_context():
+            with patch('app.scheduling.get_cached_plan') as mock_plan:
+                assert get_task_queue(1, plan='Team') == 'mdraft_team_small'
+                mock_plan.assert_not_called()
     
     def test_enqueue_conversion_task_celery_mode(self, app):
-        """Test enqueue_conversion_task in celery mode."""
+        """Test enqueue_conversion_task publishes to the plan queue."""
         with app.app_context():
             with patch('app.celery_tasks.os.getenv', return_value='celery'), \
-                 patch('app.celery_tasks.convert_document') as mock_convert:
+                 patch('celery_worker.celery.send_task') as mock_send:
+                mock_send.return_value = Mock(id='task-1')
                 
-                # Skip Celery test for now - requires complex mocking
-                # This test would require a full Celery setup
-                pytest.skip("Celery mode test requires full Celery setup")
+                result = enqueue_conversion_task(1, 2, 'test/path', engine='markitdown', plan='Pro',
+                                                 size_bytes=4096, pages=300)
+                assert result == 'task-1'
+                mock_send.assert_called_once_with(
+                    'convert_document',
+                    args=[1, 2, 'test/path'],
+                    kwargs={'engine': 'markitdown', 'size_bytes': 4096, 'pages': 300},
+                    queue='mdraft_pro_large',
+                )
     
     def test_enqueue_conversion_task_sync_mode(self, app):
         """Test enqueue_conversion_task in sync mode."""
@@ -101,4 +115,22 @@ class TestCeleryTasks:
                 
                 result = enqueue_conversion_task(1, 1, 'test/path')
                 assert result == 'sync_1'
-                mock_convert.assert_called_once_with(1, 1, 'test/path')
+                mock_convert.assert_called_once_with(1, 1, 'test/path', engine=None)
+
+
+class TestBeatTasks:
+    """Test the periodic tasks published by the beat schedule."""
+
+    def test_beat_tasks_are_registered(self):
+        """Test every beat schedule entry names a task the worker registers."""
+        import os
+        with patch.dict(os.environ, {'DATABASE_URL': 'sqlite://'}):
+            import app.tasks_convert  # noqa: F401
+        from celery_worker import celery
+
+        assert 'app.celery_tasks.expiry_sweep_task' in celery.tasks
+        for entry in celery.conf.beat_schedule.values():
+            assert entry['task'] in celery.tasks
+        with patch('app.cleanup.sweep_expired_conversions', return_value={'expired': 0}) as mock_sweep:
+            assert celery.tasks['app.celery_tasks.expiry_sweep_task']() == {'expired': 0}
+        mock_sweep.assert_called_once_with()
@@ -4,15 +4,49 @@ Tests for cleanup functionality.
 This module tests the cleanup tasks including file cleanup,
 job cleanup, and CLI commands with mocked dependencies.
 """
+import os
+
 import pytest
 from unittest.mock import Mock, patch, MagicMock
 from datetime import datetime, timedelta
 from flask import Flask
+from sqlalchemy import event
 
 from app.cleanup import (
     get_retention_days, should_delete_gcs, should_use_gcs,
-    cleanup_old_files, cleanup_old_jobs, run_cleanup
+    cleanup_old_files, cleanup_old_jobs, delete_rows_in_batches, run_cleanup,
+    sweep_expired_conversions
 )
+from app import db
+from app.models import Job, User
+from app.models_conversion import Conversion
+from app.services import BulkResult
+
+
+def _delete_all(paths):
+    """Bulk delete stub where every object existed."""
+    return [BulkResult(path, True, True) for path in paths]
+
+
+def _storage():
+    storage = Mock()
+    storage.gcs_bucket_name = 'bucket'
+    storage.delete_many.side_effect = _delete_all
+    return storage
+
+
+def _ago(days):
+    return datetime.utcnow() - timedelta(days=days)
+
+
+def _add_job(job_id, **fields):
+    db.session.add(Job(id=job_id, user_id=1, filename=f'{job_id}.pdf', status='completed', **fields))
+
+
+def _enabled(**env):
+    """Enable file deletion with the given cleanup settings."""
+    env = {'USE_GCS': '1', 'CLEANUP_DELETE_GCS': '1', 'RETENTION_DAYS': '30', **env}
+    return patch.dict(os.environ, env)
 
 
 @pytest.fixture
@@ -23,6 +57,22 @@ def app():
     return app
 
 
+@pytest.fixture
+def db_app():
+    """Create a test Flask app with an in-memory database and one user."""
+    app = Flask(__name__)
+    app.config['TESTING'] = True
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        db.session.add(User(id=1, email='u@example.com', password_hash='x'))
+        db.session.commit()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
 class TestCleanupConfig:
     """Test cleanup configuration functions."""
     
@@ -85,152 +135,201 @@ class TestCleanupOldFiles:
                 assert result['reason'] == 'CLEANUP_DELETE_GCS=0'
                 assert result['files_deleted'] == 0
     
-    def test_cleanup_old_files_success(self, app):
-        """Test successful file cleanup."""
-        with app.app_context():
-            with patch('app.cleanup.should_use_gcs', return_value=True), \
-                 patch('app.cleanup.should_delete_gcs', return_value=True), \
-                 patch('app.cleanup.get_retention_days', return_value=30), \
-                 patch('app.cleanup.Storage') as mock_storage_class, \
-                 patch('app.cleanup.db') as mock_db:
-                
-                # Mock storage
-                mock_storage = Mock()
-                mock_storage.list_prefix.side_effect = [
-                    ['outputs/123/result.md', 'outputs/456/result.md'],  # outputs
-                    ['uploads/123/document.pdf', 'uploads/789/document.pdf']  # uploads
-                ]
-                mock_storage.delete.return_value = True
-                mock_storage_class.return_value = mock_storage
-                
-                # Mock jobs
-                mock_job_old = Mock()
-                mock_job_old.completed_at = datetime.utcnow() - timedelta(days=35)
-                mock_job_old.created_at = datetime.utcnow() - timedelta(days=35)
-                
-                mock_job_new = Mock()
-                mock_job_new.completed_at = datetime.utcnow() - timedelta(days=10)
-                mock_job_new.created_at = datetime.utcnow() - timedelta(days=10)
-                
-                mock_db.session.get.side_effect = [mock_job_old, mock_job_new, mock_job_old, mock_job_new]
-                
-                result = cleanup_old_files()
-                
-                assert result['status'] == 'completed'
-                assert result['files_deleted'] == 2  # 2 old files deleted
-                assert len(result['errors']) == 0
-                assert result['retention_days'] == 30
+    def test_cleanup_old_files_success(self, db_app):
+        """Test expired objects are deleted and their rows cleared."""
+        old, new = _ago(35), _ago(10)
+        _add_job(1, output_uri='outputs/1/result.md', gcs_uri='uploads/1/a.pdf', created_at=old, completed_at=old)
+        _add_job(2, output_uri='outputs/2/result.md', gcs_uri='uploads/2/b.pdf', created_at=new, completed_at=new)
+        db.session.add(Conversion(id='c1', filename='c.pdf', stored_uri='gs://bucket/uploads/c.pdf', created_at=old))
+        db.session.commit()
+        
+        storage = _storage()
+        with _enabled(), patch('app.cleanup.Storage', return_value=storage):
+            result = cleanup_old_files()
+        
+        assert result['status'] == 'completed'
+        assert result['files_deleted'] == 3
+        assert result['rows_cleared'] == 3
+        assert result['errors'] == []
+        assert result['retention_days'] == 30
+        deleted = [p for call in storage.delete_many.call_args_list for p in call.args[0]]
+        assert deleted == ['outputs/1/result.md', 'uploads/1/a.pdf', 'uploads/c.pdf']
+        assert db.session.get(Job, 1).output_uri is None and db.session.get(Job, 1).gcs_uri is None
+        assert db.session.get(Job, 2).output_uri == 'outputs/2/result.md'
+        assert db.session.get(Conversion, 'c1').stored_uri is None
+        
+        # Cleared rows are not visited again
+        with _enabled(), patch('app.cleanup.Storage', return_value=storage):
+            assert cleanup_old_files()['files_deleted'] == 0
     
-    def test_cleanup_old_files_with_errors(self, app):
-        """Test file cleanup with some errors."""
-        with app.app_context():
-            with patch('app.cleanup.should_use_gcs', return_value=True), \
-                 patch('app.cleanup.should_delete_gcs', return_value=True), \
-                 patch('app.cleanup.get_retention_days', return_value=30), \
-                 patch('app.cleanup.Storage') as mock_storage_class, \
-                 patch('app.cleanup.db') as mock_db:
-                
-                # Mock storage with some failures
-                mock_storage = Mock()
-                mock_storage.list_prefix.side_effect = [
-                    ['outputs/123/result.md'],  # outputs
-                    ['uploads/123/document.pdf']  # uploads
-                ]
-                mock_storage.delete.side_effect = [True, False]  # First succeeds, second fails
-                mock_storage_class.return_value = mock_storage
-                
-                # Mock job
-                mock_job = Mock()
-                mock_job.completed_at = datetime.utcnow() - timedelta(days=35)
-                mock_job.created_at = datetime.utcnow() - timedelta(days=35)
-                mock_db.session.get.return_value = mock_job
-                
-                result = cleanup_old_files()
-                
-                assert result['status'] == 'completed'
-                assert result['files_deleted'] == 1
-                assert len(result['errors']) == 1
-                assert 'Failed to delete upload' in result['errors'][0]
+    def test_cleanup_old_files_with_errors(self, db_app):
+        """Test failed deletes are reported and their rows kept for a later run."""
+        old = _ago(35)
+        _add_job(1, output_uri='outputs/1/result.md', gcs_uri='uploads/1/a.pdf', created_at=old, completed_at=old)
+        db.session.add(Conversion(id='c1', filename='c.pdf', stored_uri='gs://other/c.pdf', created_at=old))
+        db.session.commit()
+        
+        storage = _storage()
+        storage.delete_many.side_effect = [
+            [BulkResult('outputs/1/result.md', True, False)],  # already gone
+            [BulkResult('uploads/1/a.pdf', False, error='HTTP 503')],
+            [],
+        ]
+        with _enabled(), patch('app.cleanup.Storage', return_value=storage):
+            result = cleanup_old_files()
+        
+        assert result['status'] == 'completed'
+        assert result['files_deleted'] == 0
+        assert len(result['errors']) == 2
+        assert 'Failed to delete upload: uploads/1/a.pdf' in result['errors'][0]
+        assert 'outside the storage bucket' in result['errors'][1]
+        job = db.session.get(Job, 1)
+        assert job.output_uri is None and job.gcs_uri == 'uploads/1/a.pdf'
     
-    def test_cleanup_old_files_invalid_paths(self, app):
-        """Test cleanup handles invalid file paths gracefully."""
-        with app.app_context():
-            with patch('app.cleanup.should_use_gcs', return_value=True), \
-                 patch('app.cleanup.should_delete_gcs', return_value=True), \
-                 patch('app.cleanup.get_retention_days', return_value=30), \
-                 patch('app.cleanup.Storage') as mock_storage_class, \
-                 patch('app.cleanup.db') as mock_db:
-                
-                # Mock storage with invalid paths
-                mock_storage = Mock()
-                mock_storage.list_prefix.side_effect = [
-                    ['invalid/path', 'outputs/123/result.md'],  # outputs
-                    ['invalid/path']  # uploads (no valid paths)
-                ]
-                mock_storage.delete.return_value = True
-                mock_storage_class.return_value = mock_storage
-                
-                # Mock job for valid path (123)
-                mock_job = Mock()
-                mock_job.completed_at = datetime.utcnow() - timedelta(days=35)
-                mock_job.created_at = datetime.utcnow() - timedelta(days=35)
-                mock_db.session.get.return_value = mock_job
-                
-                result = cleanup_old_files()
-                
-                assert result['status'] == 'completed'
-                assert result['files_deleted'] == 1  # Only valid path processed
-                assert len(result['errors']) == 0
+    def test_cleanup_old_files_deletes_expiring_objects_in_bulk(self, db_app):
+        """Test objects written with a storage expiry join the bulk delete without metadata lookups."""
+        old = _ago(35)
+        _add_job(1, output_uri='outputs/1/result.md', gcs_uri='uploads/1/a.pdf', created_at=old, completed_at=old)
+        _add_job(2, gcs_uri='uploads/2/b.pdf', created_at=old)
+        db.session.commit()
+        
+        storage = _storage()
+        with _enabled(STORAGE_EXPIRY='uploads/=30d'), patch('app.cleanup.Storage', return_value=storage):
+            result = cleanup_old_files()
+        
+        assert (result['files_deleted'], result['rows_cleared']) == (3, 3)
+        deleted = [p for call in storage.delete_many.call_args_list for p in call.args[0]]
+        assert deleted == ['outputs/1/result.md', 'uploads/1/a.pdf', 'uploads/2/b.pdf']
+        storage.get_expiry.assert_not_called()
+        assert db.session.get(Job, 1).gcs_uri is None
+    
+    def test_cleanup_old_files_keyset_batches(self, db_app):
+        """Test rows are paged in id order, one bulk delete and commit per batch."""
+        old = _ago(35)
+        for job_id in range(1, 6):
+            _add_job(job_id, output_uri=f'outputs/{job_id}/result.md', created_at=old, completed_at=old)
+        db.session.commit()
+        
+        storage = _storage()
+        with _enabled(CLEANUP_BATCH_SIZE='2'), patch('app.cleanup.Storage', return_value=storage):
+            result = cleanup_old_files()
+        
+        assert result['files_deleted'] == 5
+        assert [call.args[0] for call in storage.delete_many.call_args_list] == [
+            ['outputs/1/result.md', 'outputs/2/result.md'],
+            ['outputs/3/result.md', 'outputs/4/result.md'],
+            ['outputs/5/result.md'],
+        ]
+    
+    def test_cleanup_old_files_time_budget_checkpoint(self, db_app):
+        """Test a run out of time stops early and the next run resumes from its checkpoint."""
+        old = _ago(35)
+        for job_id in range(1, 4):
+            _add_job(job_id, output_uri=f'outputs/{job_id}/result.md', created_at=old, completed_at=old)
+        db.session.commit()
+        
+        checkpoints = {}
+        redis_client = Mock()
+        redis_client.get.side_effect = checkpoints.get
+        redis_client.set.side_effect = checkpoints.__setitem__
+        redis_client.delete.side_effect = lambda key: checkpoints.pop(key, None)
+        storage = _storage()
+        # The budget is spent after the first batch
+        clock = iter([0.0, 0.0, 11.0])
+        with _enabled(CLEANUP_BATCH_SIZE='1', CLEANUP_TIME_BUDGET='10'), \
+             patch('app.cleanup.Storage', return_value=storage), \
+             patch('app.api_usage._get_redis_client', return_value=redis_client), \
+             patch('app.cleanup.time.monotonic', side_effect=lambda: next(clock)):
+            result = cleanup_old_files()
+        
+        assert result['status'] == 'partial'
+        assert result['files_deleted'] == 1
+        assert checkpoints == {'cleanup:checkpoint:file': '1'}
+        
+        # Pretend job 2 failed earlier: its row is still set but the checkpoint skips it
+        db.session.get(Job, 1).output_uri = 'outputs/1/result.md'
+        db.session.commit()
+        storage.delete_many.reset_mock()
+        with _enabled(), patch('app.cleanup.Storage', return_value=storage), \
+             patch('app.api_usage._get_redis_client', return_value=redis_client):
+            result = cleanup_old_files()
+        
+        assert result['status'] == 'completed'
+        assert storage.delete_many.call_args_list[0].args[0] == ['outputs/2/result.md', 'outputs/3/result.md']
+        assert checkpoints == {}
 
 
 class TestCleanupOldJobs:
     """Test job cleanup functionality."""
     
-    def test_cleanup_old_jobs_success(self, app):
-        """Test successful job cleanup."""
-        with app.app_context():
-            with patch('app.cleanup.get_retention_days', return_value=30), \
-                 patch('app.cleanup.db') as mock_db:
-                
-                # Mock old jobs
-                mock_job1 = Mock()
-                mock_job1.status = 'completed'
-                mock_job1.created_at = datetime.utcnow() - timedelta(days=35)
-                
-                mock_job2 = Mock()
-                mock_job2.status = 'failed'
-                mock_job2.created_at = datetime.utcnow() - timedelta(days=40)
-                
-                # Mock query
-                mock_query = Mock()
-                mock_query.filter.return_value = mock_query
-                mock_query.all.return_value = [mock_job1, mock_job2]
-                mock_db.session.query.return_value = mock_query
-                
-                result = cleanup_old_jobs()
-                
-                assert result['status'] == 'completed'
-                assert result['jobs_deleted'] == 2
-                assert result['retention_days'] == 30
-                mock_db.session.commit.assert_called_once()
+    def test_cleanup_old_jobs_success(self, db_app):
+        """Test old terminal jobs are deleted in batches with a commit each."""
+        _add_job(1, created_at=_ago(35))
+        _add_job(2, created_at=_ago(40))
+        _add_job(3, created_at=_ago(50))
+        db.session.add(Job(id=4, user_id=1, filename='4.pdf', status='processing', created_at=_ago(40)))
+        _add_job(5, created_at=_ago(10))
+        db.session.commit()
+        
+        commits = []
+        
+        def on_commit(session):
+            commits.append(session)
+        
+        event.listen(db.session, 'after_commit', on_commit)
+        with _enabled(CLEANUP_BATCH_SIZE='2', CLEANUP_BATCH_PAUSE='0'):
+            result = cleanup_old_jobs()
+        event.remove(db.session, 'after_commit', on_commit)
+        
+        assert result['status'] == 'completed'
+        assert result['jobs_deleted'] == 3
+        assert result['retention_days'] == 30
+        assert len(commits) == 2
+        assert sorted(job_id for (job_id,) in db.session.query(Job.id)) == [4, 5]
     
-    def test_cleanup_old_jobs_no_jobs(self, app):
+    def test_cleanup_old_jobs_keeps_rows_with_objects(self, db_app):
+        """Test rows whose objects were not deleted yet keep their reference."""
+        _add_job(1, created_at=_ago(40), completed_at=_ago(40), output_uri='outputs/1/result.md')
+        _add_job(2, created_at=_ago(40), gcs_uri='uploads/2.pdf')
+        _add_job(3, created_at=_ago(40))
+        db.session.commit()
+        
+        with _enabled(CLEANUP_BATCH_PAUSE='0'):
+            assert cleanup_old_jobs()['jobs_deleted'] == 1
+        assert sorted(job_id for (job_id,) in db.session.query(Job.id)) == [1, 2]
+        
+        with _enabled(CLEANUP_DELETE_GCS='0', CLEANUP_BATCH_PAUSE='0'):
+            # Stored files are not managed by cleanup, so nothing can be orphaned
+            assert cleanup_old_jobs()['jobs_deleted'] == 2
+    
+    def test_run_cleanup_after_partial_file_cleanup(self, db_app):
+        """Test a file cleanup that runs out of time leaves its rows for the next run."""
+        for job_id in (1, 2):
+            _add_job(job_id, created_at=_ago(40), completed_at=_ago(40), output_uri=f'outputs/{job_id}/result.md')
+        db.session.commit()
+        
+        # The budget is spent after the first batch
+        clock = iter([0.0, 0.0, 11.0])
+        with _enabled(CLEANUP_BATCH_SIZE='1', CLEANUP_BATCH_PAUSE='0', CLEANUP_TIME_BUDGET='10'), \
+             patch('app.cleanup.Storage', return_value=_storage()), \
+             patch('app.api_usage._get_redis_client', return_value=None), \
+             patch('app.cleanup.time.monotonic', side_effect=lambda: next(clock)):
+            result = run_cleanup()
+        
+        assert result['file_cleanup']['status'] == 'partial'
+        assert result['job_cleanup']['jobs_deleted'] == 1
+        assert db.session.get(Job, 2).output_uri == 'outputs/2/result.md'
+    
+    def test_cleanup_old_jobs_no_jobs(self, db_app):
         """Test job cleanup when no old jobs exist."""
-        with app.app_context():
-            with patch('app.cleanup.get_retention_days', return_value=30), \
-                 patch('app.cleanup.db') as mock_db:
-                
-                # Mock empty query
-                mock_query = Mock()
-                mock_query.filter.return_value = mock_query
-                mock_query.all.return_value = []
-                mock_db.session.query.return_value = mock_query
-                
-                result = cleanup_old_jobs()
-                
-                assert result['status'] == 'completed'
-                assert result['jobs_deleted'] == 0
-                mock_db.session.commit.assert_called_once()
+        _add_job(1, created_at=_ago(10))
+        db.session.commit()
+        
+        with _enabled():
+            result = cleanup_old_jobs()
+        
+        assert result['status'] == 'completed'
+        assert result['jobs_deleted'] == 0
     
     def test_cleanup_old_jobs_database_error(self, app):
         """Test job cleanup handles database errors."""
@@ -239,7 +338,7 @@ class TestCleanupOldJobs:
                  patch('app.cleanup.db') as mock_db:
                 
                 # Mock database error
-                mock_db.session.query.side_effect = Exception("Database error")
+                mock_db.session.execute.side_effect = Exception("Database error")
                 
                 result = cleanup_old_jobs()
                 
@@ -248,6 +347,139 @@ class TestCleanupOldJobs:
                 mock_db.session.rollback.assert_called_once()
 
 
+class TestBatchedRowDeletion:
+    """Test bounded-batch row deletion."""
+    
+    def _conversions(self, count, days=35):
+        for i in range(count):
+            db.session.add(Conversion(id=f'c{i}', filename='c.pdf', stored_uri=f'gs://bucket/uploads/c{i}.pdf',
+                                      created_at=_ago(days)))
+        db.session.commit()
+    
+    def test_returns_columns_and_reports_progress(self, db_app):
+        """Test deleted rows' columns come back batch by batch with the running total."""
+        self._conversions(5)
+        batches = []
+        with patch('app.cleanup.time.sleep') as sleep:
+            total = delete_rows_in_batches(
+                Conversion, Conversion.created_at < _ago(30), returning=(Conversion.stored_uri,),
+                on_batch=lambda rows, total: batches.append(([tuple(r) for r in rows], total)),
+                batch_size=2, pause=0.5,
+            )
+        assert total == 5
+        assert [(len(rows), running) for rows, running in batches] == [(2, 2), (2, 4), (1, 5)]
+        assert batches[0][0] == [('c0', 'gs://bucket/uploads/c0.pdf'), ('c1', 'gs://bucket/uploads/c1.pdf')]
+        assert sleep.call_count == 2
+        assert Conversion.query.count() == 0
+    
+    def test_without_delete_returning(self, db_app):
+        """Test databases without DELETE ... RETURNING select each batch first."""
+        self._conversions(3)
+        dialect = db.session.get_bind().dialect
+        with patch.object(dialect, 'delete_returning', False):
+            total = delete_rows_in_batches(Conversion, Conversion.created_at < _ago(30), batch_size=2, pause=0)
+        assert total == 3
+        assert Conversion.query.count() == 0
+    
+    def test_cli_cleanup_deletes_objects(self, db_app):
+        """Test the CLI cleanup bulk-deletes each batch's objects before deleting its rows."""
+        from app.cli import cleanup_impl
+        
+        self._conversions(3)
+        db.session.add(Conversion(id='new', filename='n.pdf', stored_uri='gs://bucket/n.pdf', created_at=_ago(1)))
+        db.session.commit()
+        storage = _storage()
+        storage.delete_many.side_effect = lambda paths: [
+            BulkResult(path, False, error='503') if path == 'uploads/c1.pdf' else BulkResult(path, True, True)
+            for path in paths]
+        progress = []
+        with patch('app.cleanup.Storage', return_value=storage), \
+             patch.dict(os.environ, {'CLEANUP_BATCH_SIZE': '2', 'CLEANUP_BATCH_PAUSE': '0'}):
+            assert cleanup_impl(30, True, progress=progress.append) == 2
+        assert [c.args[0] for c in storage.delete_many.call_args_list] == [
+            ['uploads/c0.pdf', 'uploads/c1.pdf'], ['uploads/c2.pdf']]
+        assert progress == [1, 2]
+        # The object that could not be deleted keeps its row for the next run
+        assert sorted(c.id for c in Conversion.query) == ['c1', 'new']
+
+
+class TestExpirySweep:
+    """Test the expires_at-driven sweeper."""
+    
+    def _conversion(self, conv_id, expires_in_days, uri='gs://bucket/uploads/{}.pdf'):
+        db.session.add(Conversion(id=conv_id, filename='c.pdf', stored_uri=uri.format(conv_id) if uri else None,
+                                  expires_at=_ago(-expires_in_days)))
+    
+    def test_expires_due_rows_and_objects(self, db_app):
+        """Test due conversions lose their objects and rows, earliest first, in batches."""
+        self._conversion('a', -1)
+        self._conversion('b', -3)
+        self._conversion('c', -2, uri=None)
+        self._conversion('later', 5)
+        db.session.commit()
+        
+        storage = _storage()
+        with _enabled(EXPIRY_SWEEP_BATCH_SIZE='2'), patch('app.cleanup.Storage', return_value=storage):
+            result = sweep_expired_conversions()
+        
+        assert result['status'] == 'completed'
+        assert result['expired'] == 3
+        assert result['backlog'] == {'due': 0, 'oldest_due_seconds': 0.0}
+        assert [call.args[0] for call in storage.delete_many.call_args_list] == [
+            ['uploads/b.pdf'], ['uploads/a.pdf']]
+        assert [c.id for c in Conversion.query] == ['later']
+    
+    def test_failed_deletes_are_deferred(self, db_app):
+        """Test rows whose objects could not be deleted are retried later instead of blocking the sweep."""
+        self._conversion('a', -1)
+        self._conversion('b', -1, uri='gs://other/b.pdf')
+        db.session.commit()
+        
+        storage = _storage()
+        storage.delete_many.side_effect = lambda paths: [BulkResult(p, False, error='HTTP 503') for p in paths]
+        with _enabled(), patch('app.cleanup.Storage', return_value=storage), \
+             patch('app.services.gcs.get_blob') as get_blob:
+            result = sweep_expired_conversions()
+        
+        assert (result['expired'], result['deferred']) == (1, 1)
+        assert 'Failed to delete gs://bucket/uploads/a.pdf: HTTP 503' in result['errors']
+        get_blob.assert_called_once_with('gs://other/b.pdf')
+        assert db.session.get(Conversion, 'a').expires_at > datetime.utcnow() + timedelta(seconds=200)
+        assert db.session.get(Conversion, 'b') is None
+    
+    def test_rows_only_when_deletion_disabled(self, db_app):
+        """Test rows still expire when CLEANUP_DELETE_GCS is off, leaving objects to the bucket."""
+        self._conversion('a', -1)
+        db.session.commit()
+        
+        with _enabled(CLEANUP_DELETE_GCS='0'), patch('app.cleanup.Storage') as storage_class:
+            assert sweep_expired_conversions()['expired'] == 1
+        storage_class.assert_not_called()
+    
+    def test_backlog_metric(self, db_app):
+        """Test the backlog endpoint reports due rows and the oldest one's age."""
+        from app.health import bp
+        
+        self._conversion('a', -1)
+        self._conversion('b', -2)
+        self._conversion('c', 1)
+        db.session.commit()
+        db_app.register_blueprint(bp)
+        
+        data = db_app.test_client().get('/metrics/expiry').get_json()
+        assert data['due'] == 2
+        assert 2 * 86400 <= data['oldest_due_seconds'] < 2 * 86400 + 60
+    
+    def test_daily_cleanup_skips_expiring_conversions(self, db_app):
+        """Test the daily file cleanup leaves conversions with an expires_at to the sweeper."""
+        db.session.add(Conversion(id='a', filename='c.pdf', stored_uri='gs://bucket/a.pdf',
+                                  created_at=_ago(40), expires_at=_ago(-1)))
+        db.session.commit()
+        
+        with _enabled(), patch('app.cleanup.Storage', return_value=_storage()):
+            assert cleanup_old_files()['files_deleted'] == 0
+
+
 class TestRunCleanup:
     """Test complete cleanup process."""
     
@@ -312,28 +544,16 @@ class TestCleanupIntegration:
                 assert result['status'] == 'skipped'
                 assert result['reason'] == 'USE_GCS=0'
     
-    def test_cleanup_respects_retention_days(self, app):
+    def test_cleanup_respects_retention_days(self, db_app):
         """Test cleanup respects retention days configuration."""
-        with app.app_context():
-            with patch('app.cleanup.should_use_gcs', return_value=True), \
-                 patch('app.cleanup.should_delete_gcs', return_value=True), \
-                 patch('app.cleanup.get_retention_days', return_value=7), \
-                 patch('app.cleanup.Storage') as mock_storage_class, \
-                 patch('app.cleanup.db') as mock_db:
-                
-                # Mock storage
-                mock_storage = Mock()
-                mock_storage.list_prefix.return_value = ['outputs/123/result.md']
-                mock_storage.delete.return_value = True
-                mock_storage_class.return_value = mock_storage
-                
-                # Mock job that's 10 days old (should be deleted with 7-day retention)
-                mock_job = Mock()
-                mock_job.completed_at = datetime.utcnow() - timedelta(days=10)
-                mock_db.session.get.return_value = mock_job
-                
-                result = cleanup_old_files()
-                
-                assert result['status'] == 'completed'
-                assert result['files_deleted'] == 1
-                assert result['retention_days'] == 7
+        _add_job(1, output_uri='outputs/1/result.md', created_at=_ago(10), completed_at=_ago(10))
+        db.session.commit()
+        
+        storage = _storage()
+        with _enabled(), patch('app.cleanup.get_retention_days', return_value=7), \
+             patch('app.cleanup.Storage', return_value=storage):
+            result = cleanup_old_files()
+        
+        assert result['status'] == 'completed'
+        assert result['files_deleted'] == 1
+        assert result['retention_days'] == 7
@@ -0,0 +1,237 @@
+"""
+Tests for compression at rest in the Storage adapter.
+
+This module tests rule parsing, transparent compression on write and
+decompression on read, and serving stored encodings to clients.
+"""
+import gzip
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from unittest.mock import Mock, patch
+
+import pytest
+
+from app.services import compression
+from app.services.fakes import MemoryBlob, reset_memory_buckets
+from app.services.storage import Storage
+
+MARKDOWN = ("# Title\n\n" + "Some repetitive markdown text. " * 200).encode()
+
+
+class TestRules:
+    """Test STORAGE_COMPRESSION parsing."""
+
+    def test_parse_rules(self):
+        """Test encodings, defaults and longest-prefix-first ordering."""
+        rules = compression.parse_rules("outputs/=gzip, outputs/raw/=none,exports/,bad=lzma")
+        assert rules == [("outputs/raw/", "none"), ("outputs/", "gzip"), ("exports/", "gzip")]
+
+    def test_encoding_for(self):
+        """Test the default rule and that zstd falls back without zstandard."""
+        assert compression.encoding_for("outputs/1/result.md") == "gzip"
+        assert compression.encoding_for("uploads/1/a.pdf") is None
+        with patch.dict(os.environ, {'STORAGE_COMPRESSION': 'outputs/=zstd,outputs/raw/=none'}), \
+             patch.object(compression, 'zstandard', None):
+            assert compression.encoding_for("outputs/1/result.md") == "gzip"
+            assert compression.encoding_for("outputs/raw/x") is None
+            assert compression.rule_for("outputs/raw/x") == "none"
+
+    def test_streaming_compressor(self):
+        """Test chunked compression produces a valid gzip stream."""
+        compressor = compression.Compressor("gzip")
+        data = b"".join(compressor.compress(MARKDOWN[i:i + 100]) for i in range(0, len(MARKDOWN), 100))
+        data += compressor.flush()
+        assert compression.sniff(data) == "gzip"
+        assert gzip.decompress(data) == MARKDOWN
+
+
+class TestLocalCompression:
+    """Test compression on local storage."""
+
+    def setup_method(self):
+        """Set up local storage in a temporary directory."""
+        self.temp_dir = tempfile.mkdtemp()
+        self.app_patcher = patch('app.services.storage.current_app', Mock(config={'USE_GCS': False}))
+        self.app_patcher.start()
+        self.storage = Storage()
+        self.storage._data_dir = Path(self.temp_dir)
+
+    def teardown_method(self):
+        """Clean up test environment."""
+        self.app_patcher.stop()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_round_trip(self):
+        """Test outputs are stored compressed and read back unchanged."""
+        self.storage.write_bytes("outputs/1/result.md", MARKDOWN)
+        stored = (Path(self.temp_dir) / "outputs/1/result.md").read_bytes()
+        assert compression.sniff(stored) == "gzip"
+        assert len(stored) < len(MARKDOWN) / 10
+        assert self.storage.read_bytes("outputs/1/result.md") == MARKDOWN
+        assert self.storage.read_encoded("outputs/1/result.md") == (stored, "gzip")
+        with self.storage.open_read("outputs/1/result.md", start=2, end=7) as reader:
+            assert (reader.size, reader.read()) == (len(MARKDOWN), b"Title")
+
+    def test_small_other_and_legacy_objects(self):
+        """Test small objects, other prefixes and old raw outputs stay raw."""
+        self.storage.write_bytes("outputs/1/tiny.md", b"# hi")
+        self.storage.write_bytes("uploads/1/doc.txt", MARKDOWN)
+        (Path(self.temp_dir) / "outputs/2").mkdir(parents=True)
+        (Path(self.temp_dir) / "outputs/2/result.md").write_bytes(MARKDOWN)
+        assert (Path(self.temp_dir) / "outputs/1/tiny.md").read_bytes() == b"# hi"
+        assert (Path(self.temp_dir) / "uploads/1/doc.txt").read_bytes() == MARKDOWN
+        assert self.storage.read_bytes("outputs/2/result.md") == MARKDOWN
+
+    def test_encoding_comes_from_metadata(self):
+        """Test raw objects that happen to start with gzip's magic bytes are not decoded."""
+        raw = gzip.compress(b"a stored archive")
+        (Path(self.temp_dir) / "outputs/3").mkdir(parents=True)
+        (Path(self.temp_dir) / "outputs/3/archive.gz").write_bytes(raw)
+        assert self.storage.read_bytes("outputs/3/archive.gz") == raw
+        with self.storage.open_read("outputs/3/archive.gz") as reader:
+            assert (reader.encoding, reader.read()) == (None, raw)
+        self.storage.write_bytes("outputs/1/result.md", MARKDOWN)
+        assert compression.read_local_encoding(Path(self.temp_dir) / "outputs/1/result.md") == "gzip"
+        assert self.storage.list_prefix("outputs/1/") == ["outputs/1/result.md"]
+        self.storage.write_bytes("outputs/1/result.md", b"# now small")
+        assert self.storage.read_bytes("outputs/1/result.md") == b"# now small"
+        assert self.storage.delete("outputs/1/result.md")
+        assert not compression.encoding_file(Path(self.temp_dir) / "outputs/1/result.md").exists()
+
+    def test_open_read_decodes_in_chunks(self):
+        """Test compressed objects are decoded chunk by chunk, never read whole."""
+        self.storage.write_bytes("outputs/1/result.md", MARKDOWN)
+        with patch.dict(os.environ, {'STORAGE_CHUNK_SIZE': '256'}), \
+             patch.object(Storage, 'read_bytes', side_effect=AssertionError), \
+             patch.object(Storage, 'read_encoded', side_effect=AssertionError):
+            with self.storage.open_read("outputs/1/result.md") as reader:
+                assert reader.size == len(MARKDOWN)
+                chunks = list(reader.iter_chunks())
+                assert max(map(len, chunks)) <= 256
+                assert b"".join(chunks) == MARKDOWN
+            with self.storage.open_read("outputs/1/result.md", start=4000, end=4100) as reader:
+                assert reader.read() == MARKDOWN[4000:4100]
+                reader.seek(2)
+                assert reader.read(5) == b"Title"
+            with self.storage.open_read("outputs/1/result.md", decode=False) as reader:
+                assert reader.encoding == "gzip"
+                assert gzip.decompress(reader.read()) == MARKDOWN
+
+    def test_download_to_file_decodes(self):
+        """Test whole-object downloads decode local objects and pass writer errors through."""
+        import io
+        self.storage.write_bytes("outputs/1/result.md", MARKDOWN)
+        out = io.BytesIO()
+        with patch.dict(os.environ, {'STORAGE_CHUNK_SIZE': '256'}):
+            assert self.storage.download_to_file("outputs/1/result.md", out) == len(MARKDOWN)
+        assert out.getvalue() == MARKDOWN
+        broken = Mock(write=Mock(side_effect=KeyError("stop")))
+        with pytest.raises(KeyError):
+            self.storage.download_to_file("outputs/1/result.md", broken)
+
+    def test_open_write_compresses(self):
+        """Test streamed writes under a compressed prefix are encoded."""
+        with self.storage.open_write("outputs/1/result.md") as out:
+            for i in range(0, len(MARKDOWN), 1000):
+                out.write(MARKDOWN[i:i + 1000])
+        assert out.bytes_written == len(MARKDOWN)
+        assert compression.sniff((Path(self.temp_dir) / "outputs/1/result.md").read_bytes()) == "gzip"
+        assert self.storage.read_bytes("outputs/1/result.md") == MARKDOWN
+
+
+class TestBucketCompression:
+    """Test compression on a GCS-style bucket."""
+
+    def test_raw_reads(self):
+        """Test bucket objects are downloaded without expansion and decoded here."""
+        reset_memory_buckets()
+        with patch('app.services.storage.current_app', Mock(config={'STORAGE_BACKEND': 'memory'})):
+            storage = Storage()
+        storage.write_bytes("outputs/1/result.md", MARKDOWN)
+        with patch.object(MemoryBlob, 'download_as_bytes', autospec=True,
+                          side_effect=MemoryBlob.download_as_bytes) as download:
+            assert storage.read_bytes("outputs/1/result.md") == MARKDOWN
+        assert download.call_args.kwargs == {'raw_download': True}
+        reset_memory_buckets()
+
+    def test_ranged_raw_reads(self):
+        """Test open_read decodes ranged raw reads using the stored Content-Encoding."""
+        reset_memory_buckets()
+        with patch('app.services.storage.current_app', Mock(config={'STORAGE_BACKEND': 'memory'})):
+            storage = Storage()
+        storage.write_bytes("outputs/1/result.md", MARKDOWN)
+        with patch.dict(os.environ, {'STORAGE_CHUNK_SIZE': '16'}), \
+             patch.object(MemoryBlob, 'download_as_bytes', autospec=True,
+                          side_effect=MemoryBlob.download_as_bytes) as download:
+            with storage.open_read("outputs/1/result.md") as reader:
+                assert reader.read() == MARKDOWN
+        assert download.call_count > 2
+        assert all(call.kwargs['raw_download'] and call.kwargs['end'] - call.kwargs['start'] < 16
+                   for call in download.call_args_list)
+        reset_memory_buckets()
+
+    def test_gcs_upload_sets_content_encoding(self):
+        """Test the blob's Content-Encoding is set before a GCS upload."""
+        from app.services import gcs
+        gcs.reset_clients()
+        mock_blob = Mock()
+        client = Mock()
+        client.bucket.return_value.blob.return_value = mock_blob
+        config = {'USE_GCS': True, 'GCS_BUCKET_NAME': 'b', 'GOOGLE_CLOUD_PROJECT': None}
+        with patch('google.cloud.storage.Client', return_value=client), \
+             patch('app.services.storage.current_app', Mock(config=config)):
+            Storage().write_bytes("outputs/1/result.md", MARKDOWN)
+        assert mock_blob.content_encoding == "gzip"
+        assert gzip.decompress(mock_blob.upload_from_string.call_args.args[0]) == MARKDOWN
+        gcs.reset_clients()
+
+
+class TestEncodedDownloads:
+    """Test downloads of compressed outputs."""
+
+    @pytest.fixture(params=['offload', 'proxy'])
+    def client(self, request):
+        """Serve a local storage directory holding one compressed output."""
+        from flask import Flask
+        from app.routes import download_file
+
+        temp_dir = tempfile.mkdtemp()
+        cwd = os.getcwd()
+        os.chdir(temp_dir)
+        app = Flask(__name__)
+        app.add_url_rule("/download/<path:storage_path>", view_func=download_file)
+        with app.app_context():
+            Storage().write_bytes("outputs/1/result.md", MARKDOWN)
+        with patch.dict(os.environ, {'DOWNLOAD_MODE': request.param}):
+            yield app.test_client()
+        os.chdir(cwd)
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    def test_sent_compressed_when_accepted(self, client):
+        """Test clients accepting gzip get the stored bytes with Content-Encoding."""
+        resp = client.get("/download/outputs/1/result.md", headers={'Accept-Encoding': 'gzip, br'})
+        assert resp.status_code == 200
+        assert resp.headers['Content-Encoding'] == 'gzip'
+        assert resp.headers['Vary'] == 'Accept-Encoding'
+        assert gzip.decompress(resp.data) == MARKDOWN
+
+    def test_decoded_otherwise(self, client):
+        """Test clients without gzip support get the decoded bytes."""
+        resp = client.get("/download/outputs/1/result.md")
+        assert resp.status_code == 200
+        assert 'Content-Encoding' not in resp.headers
+        assert resp.data == MARKDOWN
+
+    def test_proxied_downloads_stream(self, client):
+        """Test proxied downloads stream chunks instead of reading the object whole."""
+        with patch.dict(os.environ, {'DOWNLOAD_MODE': 'proxy'}), \
+             patch.object(Storage, 'read_encoded', side_effect=AssertionError):
+            for headers in ({'Accept-Encoding': 'gzip'}, {}):
+                resp = client.get("/download/outputs/1/result.md", headers=headers)
+                assert resp.is_streamed
+                assert int(resp.headers['Content-Length']) == len(resp.data)
+            assert resp.data == MARKDOWN
+            resp = client.get("/download/outputs/1/result.md", headers={'Range': 'bytes=2-6'})
+            assert (resp.status_code, resp.data) == (206, b"Title")
@@ -0,0 +1,147 @@
+"""
+Tests for object expiry in the Storage adapter.
+
+This module tests STORAGE_EXPIRY parsing, GCS custom-time stamping and
+the local backend's expiry index and reaper.
+"""
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from unittest.mock import Mock, patch
+
+import pytest
+
+from app.services import expiry
+from app.services.storage import Storage
+
+
+@pytest.fixture(autouse=True)
+def reapers():
+    """Stop reaper threads started by a test."""
+    expiry.stop_reapers()
+    yield
+    expiry.stop_reapers()
+
+
+class TestRules:
+    """Test STORAGE_EXPIRY parsing."""
+
+    def test_parse_ttl(self):
+        """Test plain seconds and unit suffixes."""
+        assert [expiry.parse_ttl(v) for v in ("3600", "90m", "12h", "30d", "0", "soon")] == \
+            [3600, 5400, 43200, 2592000, None, None]
+
+    def test_rules(self):
+        """Test longest-prefix matching and invalid entries."""
+        with patch.dict(os.environ, {'STORAGE_EXPIRY': 'uploads/=30d,uploads/tmp/=1h,outputs/=never'}):
+            assert expiry.ttl_for("uploads/tmp/a") == 3600
+            assert expiry.ttl_for("uploads/a") == 30 * 86400
+            assert expiry.ttl_for("outputs/1/result.md") is None
+            now = datetime(2026, 1, 1, tzinfo=timezone.utc)
+            assert expiry.expires_at_for("uploads/a", now) == now + timedelta(days=30)
+
+
+class TestGCSExpiry:
+    """Test expiries are written as GCS custom time."""
+
+    def test_custom_time_set_before_upload(self):
+        """Test write_bytes and open_write stamp blobs under expiring prefixes only."""
+        from app.services import gcs
+        gcs.reset_clients()
+        blobs = {}
+        client = Mock()
+        client.bucket.return_value.blob.side_effect = lambda name: blobs.setdefault(name, Mock(custom_time=None))
+        config = {'USE_GCS': True, 'GCS_BUCKET_NAME': 'b', 'GOOGLE_CLOUD_PROJECT': None}
+        with patch('google.cloud.storage.Client', return_value=client), \
+             patch('app.services.storage.current_app', Mock(config=config)), \
+             patch.dict(os.environ, {'STORAGE_EXPIRY': 'uploads/=1d'}):
+            storage = Storage()
+            storage.write_bytes("uploads/a.pdf", b"x")
+            storage.write_bytes("outputs/1/result.md", b"x")
+            storage.write_bytes("exports/e.md", b"x", expires_at=datetime(2030, 1, 1))
+            storage.open_write("uploads/b.pdf")
+        assert blobs["uploads/a.pdf"].custom_time - datetime.now(timezone.utc) > timedelta(hours=23)
+        assert blobs["uploads/b.pdf"].custom_time is not None
+        assert blobs["outputs/1/result.md"].custom_time is None
+        assert blobs["exports/e.md"].custom_time == datetime(2030, 1, 1, tzinfo=timezone.utc)
+        gcs.reset_clients()
+
+    def test_get_expiry_reads_custom_time(self):
+        """Test get_expiry reports the custom time stored with the object, not the rule."""
+        from app.services.fakes import reset_memory_buckets
+        reset_memory_buckets()
+        with patch('app.services.storage.current_app', Mock(config={'STORAGE_BACKEND': 'memory'})):
+            storage = Storage()
+        storage.write_bytes("uploads/old.pdf", b"x")
+        with patch.dict(os.environ, {'STORAGE_EXPIRY': 'uploads/=1d'}):
+            storage.write_bytes("uploads/new.pdf", b"x")
+            assert storage.get_expiry("uploads/old.pdf") is None
+            assert storage.get_expiry("uploads/new.pdf") > datetime.now(timezone.utc)
+            assert storage.get_expiry("uploads/missing.pdf") is None
+        reset_memory_buckets()
+
+
+class TestLocalExpiry:
+    """Test the local expiry index and reaper."""
+
+    def setup_method(self):
+        """Set up local storage in a temporary directory."""
+        self.temp_dir = tempfile.mkdtemp()
+        self.app_patcher = patch('app.services.storage.current_app', Mock(config={'USE_GCS': False}))
+        self.app_patcher.start()
+        self.storage = Storage()
+        self.storage._data_dir = Path(self.temp_dir)
+
+    def teardown_method(self):
+        """Clean up test environment."""
+        self.app_patcher.stop()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_reap(self):
+        """Test due files are deleted and later ones kept."""
+        with patch.dict(os.environ, {'STORAGE_EXPIRY': 'uploads/=1h', 'STORAGE_EXPIRY_REAP_INTERVAL': '0'}):
+            self.storage.write_bytes("uploads/a.txt", b"a")
+            with self.storage.open_write("uploads/b.txt") as out:
+                out.write(b"b")
+            self.storage.write_bytes("outputs/c.txt", b"c")
+            self.storage.write_bytes("outputs/d.txt", b"d", expires_at=datetime.utcnow() + timedelta(hours=3))
+        index = expiry.get_local_index(Path(self.temp_dir))
+
+        assert index.reap() == 0
+        assert index.reap(now=datetime.now(timezone.utc) + timedelta(hours=2)) == 2
+        assert not self.storage.exists("uploads/a.txt") and not self.storage.exists("uploads/b.txt")
+        assert self.storage.exists("outputs/c.txt") and index.get("outputs/d.txt") is not None
+        assert index.get("uploads/a.txt") is None
+
+    def test_delete_and_rewrite_forget_expiry(self):
+        """Test deleting or rewriting an object without expiry clears its entry."""
+        later = datetime.utcnow() + timedelta(hours=1)
+        with patch.dict(os.environ, {'STORAGE_EXPIRY_REAP_INTERVAL': '0'}):
+            self.storage.write_bytes("a", b"1", expires_at=later)
+            self.storage.write_bytes("b", b"1", expires_at=later)
+            index = expiry.get_local_index(Path(self.temp_dir))
+            assert self.storage.delete("a")
+            self.storage.write_bytes("b", b"2")
+        assert index.get("a") is None and index.get("b") is None
+
+    def test_get_expiry_reads_index(self):
+        """Test get_expiry reports local index entries only."""
+        assert self.storage.get_expiry("a") is None
+        later = datetime.utcnow() + timedelta(hours=1)
+        with patch.dict(os.environ, {'STORAGE_EXPIRY_REAP_INTERVAL': '0'}):
+            self.storage.write_bytes("a", b"1", expires_at=later)
+            self.storage.write_bytes("b", b"1")
+            assert self.storage.get_expiry("a") == later.replace(tzinfo=timezone.utc)
+            assert self.storage.get_expiry("b") is None
+
+    def test_background_reaper(self):
+        """Test the reaper thread deletes files once they expire."""
+        with patch.dict(os.environ, {'STORAGE_EXPIRY_REAP_INTERVAL': '0.01'}):
+            self.storage.write_bytes("uploads/a.txt", b"a", expires_at=datetime.utcnow() - timedelta(seconds=1))
+        deadline = time.monotonic() + 5
+        while self.storage.exists("uploads/a.txt") and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert not self.storage.exists("uploads/a.txt")
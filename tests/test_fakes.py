@@ -0,0 +1,165 @@
+"""
+Tests for the in-memory and fault-injecting storage backends.
+
+This module tests the Storage adapter on STORAGE_BACKEND=memory, the
+latency, bandwidth and error injection wrapper, and offline downloads.
+"""
+import os
+from unittest.mock import Mock, patch
+
+import pytest
+from google.api_core.exceptions import ServiceUnavailable
+
+from app.services import gcs
+from app.services.fakes import FaultConfig, MemoryBucket, get_fault_config, reset_memory_buckets, wrap_with_faults
+from app.services.storage import PreconditionFailedError, Storage
+
+
+def _memory_storage(**env):
+    config = {'STORAGE_BACKEND': 'memory', 'GCS_BUCKET_NAME': 'bench'}
+    with patch('app.services.storage.current_app', Mock(config=config)), patch.dict(os.environ, env):
+        return Storage()
+
+
+class TestMemoryBackend:
+    """Test the Storage adapter against the in-memory bucket."""
+
+    def setup_method(self):
+        """Start every test with empty buckets."""
+        reset_memory_buckets()
+        gcs.reset_round_trips()
+
+    def teardown_method(self):
+        """Clean up test environment."""
+        reset_memory_buckets()
+        gcs.reset_round_trips()
+
+    def test_round_trip(self):
+        """Test objects written by one Storage are visible to the next."""
+        storage = _memory_storage()
+        assert storage.backend == 'memory' and not storage.use_gcs
+        storage.write_bytes("outputs/1/result.md", b"hello")
+        other = _memory_storage()
+        assert other.read_bytes("outputs/1/result.md") == b"hello"
+        assert other.list_prefix("outputs/") == ["outputs/1/result.md"]
+        assert other.exists("outputs/1/result.md")
+        assert other.delete("outputs/1/result.md") is True
+        assert other.delete("outputs/1/result.md") is False
+        with pytest.raises(FileNotFoundError):
+            other.read_bytes("outputs/1/result.md")
+        assert other.signed_url("x") is None and other.local_path("x") is None
+        assert gcs.get_round_trips()["read_bytes"] == 2
+
+    def test_streaming_and_ranges(self):
+        """Test chunked writes and ranged reads use the GCS code paths."""
+        storage = _memory_storage(STORAGE_CHUNK_SIZE=str(256 * 1024))
+        data = bytes(range(256)) * 4096
+        with storage.open_write("uploads/big.bin") as out:
+            for i in range(0, len(data), 100000):
+                out.write(data[i:i + 100000])
+        with storage.open_read("uploads/big.bin", start=10, end=300000) as reader:
+            assert reader.read() == data[10:300000]
+        with storage.open_read("uploads/big.bin", start=len(data)) as reader:
+            assert reader.read() == b""
+
+    def test_whole_object_download(self):
+        """Test whole-object downloads take one request however many chunks they span."""
+        import io
+        storage = _memory_storage(STORAGE_CHUNK_SIZE='1024')
+        data = bytes(range(256)) * 400
+        storage.write_bytes("uploads/big.bin", data)
+        storage.write_bytes("outputs/1/result.md", data)
+        gcs.reset_round_trips()
+        out = io.BytesIO()
+        assert storage.download_to_file("uploads/big.bin", out) == len(data)
+        assert out.getvalue() == data
+        assert gcs.get_round_trips()["download"] == 1
+        # Compressed objects add a metadata request and are decoded
+        out = io.BytesIO()
+        assert storage.download_to_file("outputs/1/result.md", out) == len(data)
+        assert out.getvalue() == data
+        assert gcs.get_round_trips()["download"] == 3
+        with pytest.raises(FileNotFoundError):
+            storage.download_to_file("uploads/missing.bin", io.BytesIO())
+
+    def test_generations(self):
+        """Test preconditions behave like GCS generations."""
+        storage = _memory_storage()
+        generation = storage.write_bytes("a", b"one", if_generation_match=0)
+        assert storage.generation("a") == generation
+        with pytest.raises(PreconditionFailedError):
+            storage.write_bytes("a", b"two", if_generation_match=0)
+        assert storage.write_bytes("a", b"two", if_generation_match=generation) > generation
+        assert storage.generation("missing") is None
+
+    def test_bulk_delete(self):
+        """Test delete_many works without GCS batch requests."""
+        storage = _memory_storage()
+        storage.put_many({"a": b"1", "b": b"2"})
+        results = storage.delete_many(["a", "b", "c"])
+        assert [r.value for r in results] == [True, True, False]
+
+
+class TestFaultInjection:
+    """Test latency, bandwidth and error injection."""
+
+    def test_latency_and_bandwidth(self):
+        """Test each request sleeps for latency plus transfer time."""
+        bucket = wrap_with_faults(MemoryBucket("b"), FaultConfig(latency=0.05, bandwidth=1000))
+        with patch('app.services.fakes.time.sleep') as sleep:
+            bucket.blob("a").upload_from_string(b"x" * 500)
+            assert bucket.blob("a").download_as_bytes() == b"x" * 500
+        assert [c.args[0] for c in sleep.call_args_list] == [0.05, 0.5, 0.05, 0.5]
+
+    def test_error_rate(self):
+        """Test errors are injected at the configured rate, repeatably with a seed."""
+        def outcomes():
+            bucket = wrap_with_faults(MemoryBucket("b"), FaultConfig(error_rate=0.5, seed=7))
+            results = []
+            for _ in range(20):
+                try:
+                    bucket.blob("a").exists()
+                    results.append(True)
+                except ServiceUnavailable:
+                    results.append(False)
+            return results
+
+        first = outcomes()
+        assert first == outcomes()
+        assert 0 < first.count(False) < 20
+
+    def test_storage_surfaces_injected_errors(self):
+        """Test an injected fault reaches callers as a storage error."""
+        reset_memory_buckets()
+        storage = _memory_storage(STORAGE_FAULT_ERROR_RATE='1')
+        with pytest.raises(RuntimeError, match="Injected storage fault"):
+            storage.write_bytes("a", b"x")
+        assert _memory_storage()._gcs_bucket.__class__ is MemoryBucket
+
+    def test_config_from_environment(self):
+        """Test the environment settings and that no settings mean no wrapper."""
+        with patch.dict(os.environ, {'STORAGE_FAULT_LATENCY_MS': '20', 'STORAGE_FAULT_BANDWIDTH': '1e6'}):
+            config = get_fault_config()
+            assert (config.latency, config.bandwidth, config.error_rate) == (0.02, 1e6, 0.0)
+        bucket = MemoryBucket("b")
+        assert wrap_with_faults(bucket, FaultConfig()) is bucket
+
+
+class TestOfflineDownload:
+    """Test downloads are proxied from the in-memory backend."""
+
+    def test_download_is_proxied(self):
+        """Test offload mode streams in-memory objects through the app."""
+        from flask import Flask
+        from app.routes import download_file
+
+        reset_memory_buckets()
+        app = Flask(__name__)
+        app.config.update(STORAGE_BACKEND='memory')
+        app.add_url_rule("/download/<path:storage_path>", view_func=download_file)
+        with app.app_context():
+            Storage().write_bytes("outputs/1/result.md", b"# hi")
+        with patch.dict(os.environ, {'DOWNLOAD_MODE': 'offload'}):
+            resp = app.test_client().get("/download/outputs/1/result.md")
+        assert (resp.status_code, resp.data) == (200, b"# hi")
+        reset_memory_buckets()
@@ -0,0 +1,139 @@
+"""
+Tests for OOXML container inspection.
+
+This module tests classification from the ZIP central directory, the
+decompression-bomb limits and that inspection reads only a few KB.
+"""
+import io
+import os
+import struct
+import zipfile
+from unittest.mock import patch
+
+import pytest
+
+from app.ooxml import DOCX_MIME, PPTX_MIME, XLSX_MIME, UnsafeContainer, inspect_container
+from app.security import sniff_category
+
+
+def _zip(parts, **kwargs):
+    """Build a ZIP archive from a mapping of part names to bytes."""
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", compression=zipfile.ZIP_DEFLATED, **kwargs) as archive:
+        for name, data in parts.items():
+            archive.writestr(name, data)
+    buf.seek(0)
+    return buf
+
+
+def _ooxml(main_part, extra=None):
+    parts = {"[Content_Types].xml": b"<Types/>", "_rels/.rels": b"<Relationships/>", main_part: b"<doc/>"}
+    parts.update(extra or {})
+    return _zip(parts)
+
+
+class CountingStream(io.BytesIO):
+    """BytesIO that counts the bytes read from it."""
+
+    bytes_read = 0
+
+    def read(self, size=-1):
+        data = super().read(size)
+        self.bytes_read += len(data)
+        return data
+
+
+class TestInspectContainer:
+    """Test classification and limits."""
+
+    @pytest.mark.parametrize("main_part,kind,mime", [
+        ("word/document.xml", "docx", DOCX_MIME),
+        ("ppt/presentation.xml", "pptx", PPTX_MIME),
+        ("xl/workbook.xml", "xlsx", XLSX_MIME),
+    ])
+    def test_classifies_types(self, main_part, kind, mime):
+        """Test each document type is recognized by its main part."""
+        stream = _ooxml(main_part)
+        stream.seek(5)
+        info = inspect_container(stream)
+        assert (info["kind"], info["mime"], info["parts"]) == (kind, mime, 3)
+        assert stream.tell() == 5
+
+    def test_other_zip_and_non_zip(self):
+        """Test plain ZIP files are not classified and other files are rejected."""
+        assert inspect_container(_zip({"word/document.xml": b"x"}))["kind"] is None
+        with pytest.raises(UnsafeContainer, match="not a zip"):
+            inspect_container(io.BytesIO(b"%PDF-1.4" + b"x" * 5000))
+
+    def test_bounded_reads(self):
+        """Test only the directory is read from a large archive."""
+        media = {f"word/media/image{i}.bin": os.urandom(1024 * 1024) for i in range(8)}
+        data = _ooxml("word/document.xml", media).getvalue()
+        stream = CountingStream(data)
+        assert inspect_container(stream)["parts"] == 11
+        assert stream.bytes_read < 4096
+
+    def test_zip64(self):
+        """Test zip64 archives are read through their zip64 records."""
+        with patch.object(zipfile, 'ZIP_FILECOUNT_LIMIT', 1):
+            stream = _ooxml("xl/workbook.xml")
+        data = stream.getvalue()
+        assert data.rfind(b"PK\x06\x07") != -1
+        info = inspect_container(stream)
+        assert (info["kind"], info["parts"]) == ("xlsx", 3)
+
+    def test_ratio_limit(self):
+        """Test a highly compressed part is rejected."""
+        bomb = _ooxml("word/document.xml", {"word/bomb.xml": b"\0" * (20 * 1024 * 1024)})
+        with pytest.raises(UnsafeContainer, match="expands"):
+            inspect_container(bomb)
+        with patch.dict(os.environ, {'OOXML_MAX_RATIO': '100000'}):
+            assert inspect_container(bomb)["uncompressed_bytes"] > 20 * 1024 * 1024
+
+    def test_expansion_and_part_limits(self):
+        """Test the total expansion and part count limits."""
+        stream = _ooxml("word/document.xml", {f"p{i}.xml": b"a" * 1000 for i in range(10)})
+        with patch.dict(os.environ, {'OOXML_MAX_EXPANSION_BYTES': '5000'}):
+            with pytest.raises(UnsafeContainer, match="expands to"):
+                inspect_container(stream)
+        with patch.dict(os.environ, {'OOXML_MAX_PARTS': '5'}):
+            with pytest.raises(UnsafeContainer, match="too many parts"):
+                inspect_container(stream)
+
+    def test_overlapping_parts(self):
+        """Test entries sharing compressed data are rejected."""
+        data = bytearray(_ooxml("word/document.xml").getvalue())
+        # Point the last central directory entry at the first local header
+        entry = data.rfind(b"PK\x01\x02")
+        struct.pack_into("<L", data, entry + 42, 0)
+        with pytest.raises(UnsafeContainer, match="overlapping"):
+            inspect_container(io.BytesIO(bytes(data)))
+
+    def test_cp437_part_names(self):
+        """Test a part name whose raw bytes are shorter than its decoded form is not an overlap."""
+        data = _ooxml("word/document.xml", {"word/media/Xber.png": b"png" * 100}).getvalue()
+        # cp437 0x81 is u-umlaut, two bytes once re-encoded as UTF-8
+        stream = io.BytesIO(data.replace(b"word/media/Xber.png", b"word/media/\x81ber.png"))
+        with zipfile.ZipFile(stream) as archive:
+            assert "word/media/\xfcber.png" in archive.namelist()
+            assert archive.testzip() is None
+        assert inspect_container(stream)["kind"] == "docx"
+
+
+class TestSniffCategory:
+    """Test upload sniffing uses the container inspection."""
+
+    def test_zip_reclassified(self, tmp_path):
+        """Test an OOXML file is identified from its directory."""
+        path = tmp_path / "deck"
+        # Main part last, beyond what magic-number sniffing looks at
+        path.write_bytes(_zip({"[Content_Types].xml": b"<Types/>", "docProps/app.xml": b"x" * 20000,
+                               "ppt/presentation.xml": b"<p/>"}, compresslevel=0).getvalue())
+        assert sniff_category(str(path)) == (PPTX_MIME, "doc")
+
+    def test_bomb_rejected(self, tmp_path):
+        """Test a decompression bomb raises before conversion."""
+        path = tmp_path / "bomb.docx"
+        path.write_bytes(_ooxml("word/document.xml", {"word/bomb.xml": b"\0" * (20 * 1024 * 1024)}).getvalue())
+        with pytest.raises(UnsafeContainer):
+            sniff_category(str(path))
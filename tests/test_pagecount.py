@@ -0,0 +1,210 @@
+"""
+Tests for the fast page counter.
+
+This module tests PDF page counting through classic xref tables and
+cross-reference streams, OOXML counting from the ZIP directory, and the
+content-fingerprint cache.
+"""
+import io
+import zipfile
+import zlib
+from unittest.mock import patch
+
+import pytest
+from reportlab.pdfgen import canvas
+
+from app import pagecount
+from app.pagecount import count_pages, count_pdf_pages, count_ooxml_pages
+
+
+def _reportlab_pdf(pages: int, lines: int = 1) -> bytes:
+    """Build a PDF with a classic xref table."""
+    buf = io.BytesIO()
+    c = canvas.Canvas(buf, pageCompression=0)
+    for i in range(pages):
+        for j in range(lines):
+            c.drawString(50, 50 + j * 15, f"line {j} of page {i}")
+        c.showPage()
+    c.save()
+    return buf.getvalue()
+
+
+def _xref_stream_pdf(pages: int) -> bytes:
+    """Build a PDF 1.5 file whose catalog and page tree live in an object
+    stream, indexed by a PNG-predicted cross-reference stream."""
+    out = bytearray(b"%PDF-1.5\n")
+    kids = " ".join(f"{4 + i} 0 R" for i in range(pages))
+    inner = [
+        (1, b"<< /Type /Catalog /Pages 2 0 R >>"),
+        (2, f"<< /Type /Pages /Kids [{kids}] /Count {pages} >>".encode()),
+    ]
+    header = b""
+    body = b""
+    for num, obj in inner:
+        header += f"{num} {len(body)} ".encode()
+        body += obj + b"\n"
+    objstm_data = zlib.compress(header + body)
+    offsets = {}
+
+    offsets[3] = len(out)
+    out += (f"3 0 obj\n<< /Type /ObjStm /N 2 /First {len(header)} /Filter /FlateDecode "
+            f"/Length {len(objstm_data)} >>\nstream\n").encode() + objstm_data + b"\nendstream\nendobj\n"
+    for i in range(pages):
+        offsets[4 + i] = len(out)
+        out += f"{4 + i} 0 obj\n<< /Type /Page /Parent 2 0 R >>\nendobj\n".encode()
+
+    xref_num = 4 + pages
+    offsets[xref_num] = len(out)
+    rows = [(0, 0, 0), (2, 3, 0), (2, 3, 1), (1, offsets[3], 0)]
+    rows += [(1, offsets[4 + i], 0) for i in range(pages)]
+    rows.append((1, offsets[xref_num], 0))
+    raw = bytearray()
+    prev = bytes(6)
+    for kind, field2, field3 in rows:
+        row = bytes([kind]) + field2.to_bytes(4, "big") + bytes([field3])
+        raw += b"\x02" + bytes((row[i] - prev[i]) & 0xFF for i in range(6))
+        prev = row
+    xref_data = zlib.compress(bytes(raw))
+    out += (f"{xref_num} 0 obj\n<< /Type /XRef /Size {xref_num + 1} /W [1 4 1] /Root 1 0 R "
+            f"/Filter /FlateDecode /DecodeParms << /Predictor 12 /Columns 6 >> "
+            f"/Length {len(xref_data)} >>\nstream\n").encode() + xref_data + b"\nendstream\nendobj\n"
+    out += f"startxref\n{offsets[xref_num]}\n%%EOF\n".encode()
+    return bytes(out)
+
+
+def _zip(parts: dict) -> bytes:
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
+        for name, data in parts.items():
+            zf.writestr(name, data)
+    return buf.getvalue()
+
+
+@pytest.fixture(autouse=True)
+def _clear_cache():
+    pagecount.clear_cache()
+    yield
+    pagecount.clear_cache()
+
+
+class TestPdfPageCount:
+    """Test PDF page counting."""
+
+    @pytest.mark.parametrize("pages", [1, 3, 250])
+    def test_classic_xref_table(self, pages):
+        """Test counting through a classic xref table and trailer."""
+        assert count_pdf_pages(io.BytesIO(_reportlab_pdf(pages))) == pages
+
+    @pytest.mark.parametrize("pages", [1, 12])
+    def test_xref_stream_and_object_stream(self, pages):
+        """Test counting through an xref stream into an object stream."""
+        assert count_pdf_pages(io.BytesIO(_xref_stream_pdf(pages))) == pages
+
+    def test_object_stream_inflation_is_bounded(self):
+        """Test compressed streams may not inflate past the decode budget."""
+        bomb = zlib.compress(bytes(10 * 1024 * 1024))
+        with pytest.raises(ValueError):
+            pagecount._inflate(bomb, 1024)
+        assert pagecount._inflate(zlib.compress(b"abc"), 3) == b"abc"
+        with patch.object(pagecount, '_MAX_DECODED_STREAM', 16):
+            with pytest.raises(ValueError):
+                pagecount._decode_stream({"Filter": ("name", "FlateDecode")}, zlib.compress(bytes(100)))
+
+    def test_falls_back_to_scan_without_startxref(self):
+        """Test the chunked scan is used when the trailer is unusable."""
+        data = _reportlab_pdf(4).replace(b"startxref", b"startxxxx")
+        assert count_pdf_pages(io.BytesIO(data)) == 4
+
+    def test_does_not_read_whole_body(self):
+        """Test only a small fraction of a large PDF is read."""
+        data = _reportlab_pdf(300, lines=40)
+        stream = io.BytesIO(data)
+        reads = []
+        original_read = stream.read
+
+        def tracking_read(n=-1):
+            chunk = original_read(n)
+            reads.append(len(chunk))
+            return chunk
+
+        stream.read = tracking_read
+        assert count_pdf_pages(stream) == 300
+        assert sum(reads) < len(data) / 10
+
+
+class TestOoxmlPageCount:
+    """Test OOXML page, slide and sheet counting."""
+
+    def test_docx_pages_from_app_xml(self):
+        """Test DOCX pages come from docProps/app.xml."""
+        data = _zip({
+            "word/document.xml": "<w:document/>",
+            "docProps/app.xml": "<Properties><Pages>17</Pages></Properties>",
+        })
+        assert count_ooxml_pages(io.BytesIO(data), "docx") == 17
+
+    def test_pptx_counts_slide_parts(self):
+        """Test PPTX slides are counted from the central directory."""
+        parts = {"ppt/presentation.xml": "<p/>"}
+        parts.update({f"ppt/slides/slide{i}.xml": "<s/>" for i in range(1, 6)})
+        parts["ppt/slides/_rels/slide1.xml.rels"] = "<r/>"
+        assert count_ooxml_pages(io.BytesIO(_zip(parts)), "pptx") == 5
+
+    def test_xlsx_counts_worksheets(self):
+        """Test XLSX sheets are counted from worksheet parts."""
+        parts = {"xl/workbook.xml": "<w/>", "xl/worksheets/sheet1.xml": "<s/>", "xl/worksheets/sheet2.xml": "<s/>"}
+        assert count_ooxml_pages(io.BytesIO(_zip(parts)), "xlsx") == 2
+
+
+class TestCountPages:
+    """Test the cached entry point."""
+
+    def test_restores_stream_position(self):
+        """Test the stream position is unchanged after counting."""
+        stream = io.BytesIO(_reportlab_pdf(2))
+        stream.seek(5)
+        assert count_pages(stream, "doc.pdf") == 2
+        assert stream.tell() == 5
+
+    def test_cached_by_content_hash(self):
+        """Test repeated counts of the same content hit the cache."""
+        data = _reportlab_pdf(3)
+        assert count_pages(io.BytesIO(data), "a.pdf") == 3
+        with patch('app.pagecount.count_pdf_pages') as mock_count:
+            assert count_pages(io.BytesIO(data), "b.pdf") == 3
+            mock_count.assert_not_called()
+
+    def test_cache_lookup_reads_samples_only(self):
+        """Test a cached count is found without reading the whole upload."""
+        data = _reportlab_pdf(300, lines=40)
+        assert count_pages(io.BytesIO(data), "a.pdf") == 300
+        stream = io.BytesIO(data)
+        reads = []
+        original_read = stream.read
+
+        def tracking_read(n=-1):
+            chunk = original_read(n)
+            reads.append(len(chunk))
+            return chunk
+
+        stream.read = tracking_read
+        with patch('app.pagecount.count_pdf_pages') as mock_count:
+            assert count_pages(stream, "a.pdf") == 300
+            mock_count.assert_not_called()
+        assert sum(reads) < len(data) / 2
+
+    def test_cache_key_covers_size_and_tail(self):
+        """Test uploads differing in size or trailer are counted separately."""
+        data = _reportlab_pdf(2)
+        assert count_pages(io.BytesIO(data), "a.pdf") == 2
+        assert count_pages(io.BytesIO(_reportlab_pdf(3)), "a.pdf") == 3
+        assert pagecount.sample_digest(io.BytesIO(data)) != pagecount.sample_digest(io.BytesIO(data + b"\n"))
+
+    def test_text_estimated_from_size(self):
+        """Test text files are estimated from their length."""
+        data = b"x" * (pagecount.TEXT_CHARS_PER_PAGE * 2 + 1)
+        assert count_pages(io.BytesIO(data), "notes.txt") == 3
+
+    def test_unreadable_pdf_counts_as_one(self):
+        """Test garbage input falls back to a single page."""
+        assert count_pages(io.BytesIO(b"not a pdf at all"), "x.pdf") == 1
@@ -0,0 +1,116 @@
+"""
+Tests for the streaming text, Markdown, CSV and JSON converters.
+
+This module tests each converter's output, that results do not depend
+on how the input is chunked, and engine selection for text types.
+"""
+import json
+import random
+from unittest.mock import patch
+
+import pytest
+
+from app import passthrough
+from app.conversion import choose_engine
+from app.passthrough import convert, iter_markdown, mime_for_filename
+
+
+def _write(tmp_path, name, data):
+    path = tmp_path / name
+    path.write_bytes(data.encode("utf-8") if isinstance(data, str) else data)
+    return str(path)
+
+
+class TestText:
+    """Test plain text and Markdown pass through."""
+
+    def test_unchanged(self, tmp_path):
+        """Test text comes back as written, minus a UTF-8 BOM, in bounded chunks."""
+        body = "# Title\r\n\r\nSome *markdown* — ünïcode.\n" * 5000
+        path = _write(tmp_path, "a.md", "﻿" + body)
+        chunks = list(iter_markdown(path, "text/markdown"))
+        assert "".join(chunks) == body
+        assert len(chunks) > 1 and max(map(len, chunks)) <= passthrough._CHUNK
+
+    def test_invalid_utf8_replaced(self, tmp_path):
+        """Test undecodable bytes do not fail the conversion."""
+        path = _write(tmp_path, "a.txt", b"caf\xe9 ok")
+        assert convert(path, "text/plain") == "caf� ok"
+
+
+class TestCsv:
+    """Test CSV rendering as a Markdown table."""
+
+    def test_table(self, tmp_path):
+        """Test header, separator, padding from the sample and escaping."""
+        path = _write(tmp_path, "a.csv", 'name,qty,note\nwidget,2,"a|b"\ngizmo,10,"two\nlines"\n')
+        assert convert(path, "text/csv") == (
+            "| name   | qty | note         |\n"
+            "| ------ | --- | ------------ |\n"
+            "| widget | 2   | a\\|b         |\n"
+            "| gizmo  | 10  | two<br>lines |\n"
+        )
+
+    def test_delimiter_and_ragged_rows(self, tmp_path):
+        """Test semicolon files and rows shorter or longer than the header."""
+        path = _write(tmp_path, "a.csv", "a;b;c\n1;2\n1;2;3;4\n")
+        assert convert(path, "text/csv").splitlines()[2:] == ["| 1   | 2   |     |", "| 1   | 2   | 3, 4 |"]
+
+    def test_rows_after_sample_streamed(self, tmp_path):
+        """Test rows past the sample keep the sampled widths and every row is kept."""
+        rows = "".join(f"{i},{'x' * (i % 7)}\n" for i in range(5000))
+        path = _write(tmp_path, "a.csv", "id,value\n" + rows + "99999999,long value beyond the sample\n")
+        with patch.object(passthrough, '_CHUNK', 1024):
+            lines = "".join(iter_markdown(path, "text/csv")).splitlines()
+        assert len(lines) == 5003
+        assert lines[1] == "| --- | ------ |"
+        assert lines[-1] == "| 99999999 | long value beyond the sample |"
+
+    def test_empty(self, tmp_path):
+        """Test an empty file gives empty output."""
+        assert convert(_write(tmp_path, "a.csv", ""), "text/csv") == ""
+
+
+def _random_json(rng, depth=0):
+    roll = rng.random()
+    if depth > 3 or roll < 0.4:
+        return rng.choice([0, -2.5, 1e21, True, None, "", "a b", 'q"\\é', "x" * rng.randint(0, 30)])
+    if roll < 0.7:
+        return [_random_json(rng, depth + 1) for _ in range(rng.randint(0, 4))]
+    return {f"k{i}": _random_json(rng, depth + 1) for i in range(rng.randint(0, 4))}
+
+
+class TestJson:
+    """Test JSON pretty-printing."""
+
+    @pytest.mark.parametrize("seed", range(3))
+    def test_matches_json_dumps(self, tmp_path, seed):
+        """Test output matches json.dumps(indent=2) for compact and spaced input at any chunk size."""
+        rng = random.Random(seed)
+        for n in range(300):
+            value = _random_json(rng)
+            text = json.dumps(value, separators=rng.choice([(",", ":"), (", ", ": ")]), ensure_ascii=False)
+            path = _write(tmp_path, f"{n}.json", "\n" + text + "\n")
+            with patch.object(passthrough, '_CHUNK', rng.choice([1, 2, 5, 64 * 1024])):
+                out = convert(path, "application/json")
+            assert out == "```json\n" + json.dumps(value, indent=2, ensure_ascii=False) + "\n```\n", text
+
+    def test_strings_kept_verbatim(self, tmp_path):
+        """Test escapes and number spellings are not rewritten."""
+        path = _write(tmp_path, "a.json", '{"a":"\\u00e9 [, ]","b":1.50}')
+        assert convert(path, "application/json") == '```json\n{\n  "a": "\\u00e9 [, ]",\n  "b": 1.50\n}\n```\n'
+
+
+class TestRouting:
+    """Test text types are routed to the passthrough engine."""
+
+    def test_choose_engine(self):
+        """Test text MIME types pick passthrough even with Document AI configured."""
+        flags = {"PRO_CONVERSION_ENABLED": "true", "GOOGLE_CLOUD_PROJECT": "p", "DOCAI_PROCESSOR_ID": "x"}
+        assert [choose_engine(m, flags) for m in ("text/csv", "application/json", "application/pdf")] == \
+            ["passthrough", "passthrough", "docai"]
+
+    def test_mime_for_filename(self):
+        """Test extensions map to text MIME types."""
+        assert [mime_for_filename(n) for n in ("a.CSV", "b.md", "c.json", "d.pdf", None)] == \
+            ["text/csv", "text/markdown", "application/json", None, None]
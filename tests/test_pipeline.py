@@ -0,0 +1,151 @@
+"""
+Tests for the staged conversion pipeline.
+
+This module tests stage ordering, error routing, back-pressure and
+overlap between stages, plus the process-pool stage.
+"""
+import os
+import threading
+import time
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from app.pipeline import PROCESS, Pipeline, Stage, in_pool_worker, postprocess_stage, run_serial, stage_workers
+
+
+def _record(name):
+    def fn(ctx):
+        ctx.setdefault("seen", []).append(name)
+    return fn
+
+
+def _fail(ctx):
+    raise ValueError("boom")
+
+
+def _pool_marker(ctx):
+    return {"in_pool_worker": in_pool_worker()}
+
+
+def _crash(ctx):
+    """Kill the pool process for items asking for it; a flag file crashes it only once."""
+    flag = ctx.get("crash_once")
+    if ctx.get("crash") or (flag and os.path.exists(flag)):
+        if flag:
+            os.unlink(flag)
+        os._exit(1)
+    return {"converted": True}
+
+
+@pytest.fixture
+def make_pipeline():
+    """Build pipelines and shut them down after the test."""
+    pipelines = []
+
+    def factory(stages, **kwargs):
+        pipeline = Pipeline(stages, **kwargs)
+        pipelines.append(pipeline)
+        return pipeline
+
+    yield factory
+    for pipeline in pipelines:
+        pipeline.shutdown()
+
+
+class TestPipeline:
+    """Test pipeline semantics shared by staged and serial modes."""
+
+    def test_stages_run_in_order(self, make_pipeline):
+        """Test every stage sees the item in order and updates are merged."""
+        stages = [Stage("a", _record("a")), Stage("b", lambda ctx: {"out": 42}), Stage("c", _record("c"))]
+        ctx = make_pipeline(stages).run({}, timeout=5)
+        assert ctx["seen"] == ["a", "c"]
+        assert ctx["out"] == 42
+        assert set(ctx["timings"]) == {"a", "b", "c"}
+
+    def test_error_skips_to_run_on_error_stages(self, make_pipeline):
+        """Test a failure records the error and only runs cleanup stages."""
+        stages = [
+            Stage("fetch", _fail),
+            Stage("convert", _record("convert")),
+            Stage("persist", _record("persist"), run_on_error=True),
+        ]
+        for ctx in (make_pipeline(stages).run({}, timeout=5), run_serial(stages, {})):
+            assert isinstance(ctx["error"], ValueError)
+            assert ctx["failed_stage"] == "fetch"
+            assert ctx["seen"] == ["persist"]
+
+    def test_halt_skips_remaining_stages(self):
+        """Test a stage can stop the item without it being an error."""
+        stages = [Stage("fetch", lambda ctx: {"halt": True}), Stage("notify", _record("notify"), run_on_error=True)]
+        ctx = run_serial(stages, {})
+        assert "seen" not in ctx
+        assert "error" not in ctx
+
+    def test_stages_overlap(self, make_pipeline):
+        """Test I/O of one item overlaps with work on another."""
+        stages = [
+            Stage("fetch", lambda ctx: time.sleep(0.05), workers=4),
+            Stage("convert", lambda ctx: time.sleep(0.05), workers=4),
+        ]
+        pipeline = make_pipeline(stages)
+        pipeline.start()
+        started = time.perf_counter()
+        futures = [pipeline.submit({"n": n}) for n in range(8)]
+        for future in futures:
+            future.result(timeout=5)
+        # Serially this would take 8 * 0.1s
+        assert time.perf_counter() - started < 0.5
+
+    def test_bounded_queue_applies_back_pressure(self, make_pipeline):
+        """Test submit blocks while a slow stage's queue is full."""
+        release = threading.Event()
+        stages = [Stage("slow", lambda ctx: release.wait(5))]
+        pipeline = make_pipeline(stages, queue_size=1)
+        pipeline.start()
+        pipeline.submit({})  # taken by the single worker
+        pipeline.submit({})  # fills the queue
+
+        blocked = threading.Thread(target=pipeline.submit, args=({},), daemon=True)
+        blocked.start()
+        blocked.join(0.2)
+        assert blocked.is_alive()
+        release.set()
+        blocked.join(5)
+        assert not blocked.is_alive()
+
+    def test_process_stage(self, make_pipeline):
+        """Test CPU stages run on a process pool and return updates."""
+        stages = [Stage("postprocess", postprocess_stage, executor=PROCESS, workers=1)]
+        ctx = make_pipeline(stages).run({"markdown": "a  \r\n\n\n\nb"}, timeout=60)
+        assert ctx["markdown"] == "a\n\nb"
+
+    def test_process_stage_workers_are_marked(self, make_pipeline):
+        """Test pool processes know they must not start pools of their own."""
+        stages = [Stage("convert", _pool_marker, executor=PROCESS, workers=1)]
+        assert make_pipeline(stages).run({}, timeout=60)["in_pool_worker"] is True
+        assert not in_pool_worker()
+
+    def test_crashed_pool_process_fails_only_its_item(self, make_pipeline):
+        """Test a pool broken by a dying child is replaced for later items."""
+        pipeline = make_pipeline([Stage("convert", _crash, executor=PROCESS, workers=1)])
+        ctx = pipeline.run({"crash": True}, timeout=60)
+        assert isinstance(ctx["error"], BrokenProcessPool)
+        assert pipeline.run({}, timeout=60)["converted"] is True
+
+    def test_item_on_crashed_pool_is_retried(self, make_pipeline, tmp_path):
+        """Test an item whose pool broke under it is retried on the new pool."""
+        flag = tmp_path / "crash"
+        flag.touch()
+        pipeline = make_pipeline([Stage("convert", _crash, executor=PROCESS, workers=1)])
+        ctx = pipeline.run({"crash_once": str(flag)}, timeout=60)
+        assert "error" not in ctx
+        assert ctx["converted"] is True
+
+    def test_stage_workers_from_environment(self, monkeypatch):
+        """Test stage concurrency is configurable per stage."""
+        monkeypatch.setenv("PIPELINE_CONVERT_WORKERS", "6")
+        assert stage_workers("convert", 2) == 6
+        monkeypatch.setenv("PIPELINE_CONVERT_WORKERS", "nope")
+        assert stage_workers("convert", 2) == 2
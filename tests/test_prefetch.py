@@ -0,0 +1,140 @@
+"""
+Tests for worker input prefetching.
+
+This module tests spooling, claiming, the byte budget, cancellation and
+scheduling from the worker's reserved requests.
+"""
+import os
+import threading
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+
+from app.prefetch import Prefetcher, get_prefetch_multiplier, prefetch_reserved
+
+
+def _fetch_bytes(data, chunk=4):
+    def fetch(out):
+        for i in range(0, len(data), chunk):
+            out.write(data[i:i + chunk])
+    return fetch
+
+
+@pytest.fixture
+def prefetcher(tmp_path):
+    """Create a prefetcher spooling into a temporary directory."""
+    p = Prefetcher(spool_dir=str(tmp_path), budget_bytes=100, workers=2)
+    yield p
+    p.shutdown()
+
+
+class TestPrefetcher:
+    """Test the spool and budget logic."""
+
+    def test_claim_returns_spooled_file(self, prefetcher):
+        """Test a finished prefetch is handed to the claiming task."""
+        assert prefetcher.schedule("t1", "uploads/a.txt", _fetch_bytes(b"hello world"))
+        path = prefetcher.claim("t1", "uploads/a.txt", timeout=5)
+        with open(path, "rb") as fh:
+            assert fh.read() == b"hello world"
+        assert prefetcher.used_bytes == 0
+        os.unlink(path)
+
+    def test_claimed_file_keeps_source_extension(self, prefetcher):
+        """Test the spooled file ends in the input's extension, as converters need."""
+        prefetcher.schedule("t1", "gs://bucket/uploads/1/report.v2.PDF", _fetch_bytes(b"%PDF"))
+        path = prefetcher.claim("t1", "gs://bucket/uploads/1/report.v2.PDF", timeout=5)
+        assert path.endswith(".PDF")
+        os.unlink(path)
+        prefetcher.schedule("t2", "uploads/noext", _fetch_bytes(b"x"))
+        path = prefetcher.claim("t2", "uploads/noext", timeout=5)
+        assert os.path.splitext(path)[1] == ""
+        os.unlink(path)
+
+    def test_claim_requires_matching_source(self, prefetcher):
+        """Test a claim for a different object is not served."""
+        prefetcher.schedule("t1", "uploads/a.txt", _fetch_bytes(b"x"))
+        assert prefetcher.claim("t1", "uploads/b.txt", timeout=5) is None
+        assert prefetcher.claim("unknown", "uploads/a.txt", timeout=5) is None
+
+    def test_size_hint_over_budget_is_skipped(self, prefetcher):
+        """Test prefetches known to exceed the budget never start."""
+        assert not prefetcher.schedule("t1", "big", _fetch_bytes(b"x"), size_hint=500)
+        assert prefetcher.used_bytes == 0
+
+    def test_download_exceeding_budget_is_abandoned(self, prefetcher, tmp_path):
+        """Test a download growing past the budget stops and is removed."""
+        prefetcher.schedule("t1", "big", _fetch_bytes(b"x" * 200, chunk=50))
+        assert prefetcher.claim("t1", "big", timeout=5) is None
+        assert prefetcher.used_bytes == 0
+        assert os.listdir(tmp_path) == []
+
+    def test_cancel_stops_in_flight_download(self, prefetcher, tmp_path):
+        """Test revoking a task stops its download at the next chunk."""
+        first_chunk = threading.Event()
+        proceed = threading.Event()
+        chunks = []
+
+        def fetch(out):
+            out.write(b"a")
+            chunks.append(1)
+            first_chunk.set()
+            proceed.wait(5)
+            out.write(b"b")
+            chunks.append(2)
+
+        prefetcher.schedule("t1", "src", fetch)
+        assert first_chunk.wait(5)
+        prefetcher.cancel("t1")
+        proceed.set()
+        assert prefetcher.claim("t1", "src", timeout=5) is None
+        prefetcher._executor.shutdown(wait=True)
+        assert chunks == [1]
+        assert os.listdir(tmp_path) == []
+        assert prefetcher.used_bytes == 0
+
+    def test_shutdown_removes_unclaimed_files(self, prefetcher, tmp_path):
+        """Test shutdown cancels everything and cleans the spool."""
+        prefetcher.schedule("t1", "a", _fetch_bytes(b"abc"))
+        prefetcher.schedule("t2", "b", _fetch_bytes(b"def"))
+        prefetcher.shutdown()
+        assert os.listdir(tmp_path) == []
+        assert not prefetcher.schedule("t3", "c", _fetch_bytes(b"x"))
+
+
+class TestPrefetchReserved:
+    """Test scheduling from the worker's reserved requests."""
+
+    def test_only_reserved_conversion_tasks_are_prefetched(self, prefetcher):
+        """Test the running task and non-conversion tasks are skipped."""
+        reserved = [
+            SimpleNamespace(id="run", name="convert_from_gcs", args=["c0", "gs://b/0"], kwargs={}),
+            SimpleNamespace(id="next", name="convert_document", args=[1, 1, "uploads/1/a.pdf"],
+                            kwargs={"size_bytes": 10}),
+            SimpleNamespace(id="gcs", name="convert_from_gcs", args=["c2", "gs://b/2"], kwargs={}),
+            SimpleNamespace(id="ping", name="ping", args=[], kwargs={}),
+        ]
+        state = SimpleNamespace(reserved_requests=reserved, active_requests=set())
+        with patch("celery.worker.state", state), \
+             patch("app.prefetch.get_prefetcher", return_value=prefetcher), \
+             patch.object(prefetcher, "schedule", return_value=True) as mock_schedule:
+            assert prefetch_reserved(None, current_task_id="run") == 2
+            started = {call.args[0]: call for call in mock_schedule.call_args_list}
+            assert set(started) == {"next", "gcs"}
+            assert started["next"].args[1] == "uploads/1/a.pdf"
+            assert started["next"].kwargs["size_hint"] == 10
+            assert started["gcs"].args[1] == "gs://b/2"
+
+
+class TestPrefetchMultiplier:
+    """Test which workers reserve an extra task for prefetching."""
+
+    def test_only_single_lane_workers_reserve_ahead(self):
+        """Test shared workers keep a multiplier of 1 so lanes stay isolated."""
+        with patch.dict(os.environ, {'PREFETCH_ENABLED': '1'}):
+            assert get_prefetch_multiplier(["small"]) == 2
+            assert get_prefetch_multiplier(["large"]) == 2
+            assert get_prefetch_multiplier(["small", "large"]) == 1
+        with patch.dict(os.environ, {'PREFETCH_ENABLED': '0'}):
+            assert get_prefetch_multiplier(["small"]) == 1
@@ -0,0 +1,194 @@
+"""
+Tests for markdown clean-up.
+
+This module checks the streaming normalizer against the original
+whole-string clean_markdown on generated inputs, including inputs split
+into arbitrary chunks and across normalization windows, and tests the
+page-by-page PDF text fallback.
+"""
+import os
+import random
+import re
+import shutil
+import tempfile
+import time
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from unittest.mock import Mock, patch
+
+import pytest
+
+from app import quality
+from app.quality import MarkdownNormalizer, clean_markdown, clean_markdown_stream, iter_pdf_text, pdf_fallback_markdown
+
+
+def legacy_clean_markdown(md):
+    """The original implementation, which the normalizer must match exactly."""
+    if not md: return md
+    md = md.replace("\r\n", "\n").replace("\r", "\n")
+    md = "\n".join(line.rstrip() for line in md.split("\n"))
+    md = re.sub(r"\n{3,}", "\n\n", md)
+    md = re.sub(r"(```+)\s*\n", r"```\n", md)
+    lines = md.split("\n")
+    freq = {}
+    for ln in lines:
+        if 2 <= len(ln) <= 40 and ln.isupper():
+            freq[ln] = freq.get(ln, 0) + 1
+    common = {k for k, v in freq.items() if v >= 10}
+    if common:
+        lines = [ln for ln in lines if ln not in common]
+        md = "\n".join(lines)
+    return md.strip()
+
+
+# Fragments chosen to hit every rule: line endings, Unicode whitespace,
+# blank runs, fences with trailing whitespace and running headers
+ATOMS = ["\n", "\r", "\r\n", "\n\n\n\n", " ", "\t", "\x0c", "\x85", " ", "　", "`", "```",
+         "````", "``` \n", "a ```", "x", "Ab", "é", "É", "HI", "HEADER", "PAGE 1", "\ud800"]
+
+
+def _random_markdown(rng):
+    md = "".join(rng.choice(ATOMS) for _ in range(rng.randint(0, 40)))
+    if rng.random() < 0.3:
+        md += ("\nHEADER\n" + rng.choice(["a", "b\n\n", "```\n", "  c  "])) * rng.randint(8, 12)
+    return md
+
+
+def _random_chunks(rng, md):
+    cuts = sorted(rng.sample(range(len(md) + 1), min(len(md) + 1, rng.randint(0, 6))))
+    return [md[a:b] for a, b in zip([0] + cuts, cuts + [len(md)])]
+
+
+class TestEquivalence:
+    """Property tests: the streaming normalizer matches the original exactly."""
+
+    @pytest.mark.parametrize("seed", range(4))
+    def test_random_documents(self, seed):
+        """Test generated documents, whole and chunked, with tiny and normal windows."""
+        rng = random.Random(seed)
+        for _ in range(2000):
+            md = _random_markdown(rng)
+            expected = legacy_clean_markdown(md)
+            with patch.object(quality, '_WINDOW', rng.choice([1, 2, 3, 7, 64 * 1024])):
+                assert clean_markdown(md) == expected, md
+                if md:
+                    chunks = _random_chunks(rng, md)
+                    streamed = "".join(clean_markdown_stream(chunks, spool_bytes=rng.choice([0, 1 << 20])))
+                    assert streamed == expected, chunks
+
+    @pytest.mark.parametrize("md", [
+        None, "", "   ", "\n\n\n\n", "\r\n\r\n\r\n\r\nX", "a\r\n\r\n\r\n\r\nb",
+        "```python   \n\n\ncode\n````\n\n", "``` \n```", "x````", "  indented\n\n\n  fence```\n\n  y",
+        "TITLE\n" * 10 + "body", "TITLE\n" * 9 + "body", " LINE\x85 \n  \n\ttext\x1c",
+    ])
+    def test_edge_cases(self, md):
+        """Test empty input, blank-only input, fences and the header threshold."""
+        assert clean_markdown(md) == legacy_clean_markdown(md)
+
+
+class TestStreaming:
+    """Test the streaming interfaces."""
+
+    def test_normalizer_emits_complete_lines_only(self):
+        """Test lines come out as soon as they are terminated and CRLF split across chunks is one break."""
+        normalizer = MarkdownNormalizer()
+        assert list(normalizer.feed("one  \r")) == []
+        assert list(normalizer.feed("\ntw")) == ["one"]
+        assert list(normalizer.feed("o\n\n\n\nthree```\n")) == ["two", "", "three```"]
+        assert list(normalizer.close()) == [""]
+
+    def test_large_input_streams_in_batches(self):
+        """Test a large document is spooled to disk and returned in bounded pieces."""
+        md = ("HEADER\r\n" + "text   \r\n" * 5000 + "\r\n\r\n\r\n") * 40
+        pieces = list(clean_markdown_stream((md[i:i + 10000] for i in range(0, len(md), 10000)), spool_bytes=1024))
+        assert len(pieces) > 1 and max(map(len, pieces)) < 2 * quality._OUTPUT_BATCH
+        assert "".join(pieces) == legacy_clean_markdown(md)
+        assert "HEADER" not in pieces[0]
+
+
+@pytest.fixture(scope="module")
+def pdf_path():
+    """Write a 20-page PDF with numbered lines on every page."""
+    from reportlab.pdfgen import canvas
+
+    temp_dir = tempfile.mkdtemp()
+    path = os.path.join(temp_dir, "doc.pdf")
+    c = canvas.Canvas(path)
+    for n in range(1, 21):
+        c.drawString(72, 800, f"Page {n} heading")
+        c.drawString(72, 700, f"Body of page {n}.")
+        c.showPage()
+    c.save()
+    yield path
+    shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+class TestPdfTextFallback:
+    """Test page-by-page PDF text extraction."""
+
+    def test_pages_in_order(self, pdf_path):
+        """Test every page comes back in order, ending in a page break."""
+        pages = list(iter_pdf_text(pdf_path, workers=1))
+        assert len(pages) == 20
+        assert pages[4] == "Page 5 heading\n\nBody of page 5.\n\n\x0c"
+        assert "".join(pages).startswith("Page 1 heading\n\nBody of page 1.\n\n\x0cPage 2 heading")
+
+    def test_fast_layout(self, pdf_path):
+        """Test fast mode keeps the text of each page."""
+        pages = list(iter_pdf_text(pdf_path, layout="fast", workers=1))
+        assert "Body of page 20." in pages[-1] and "Page 20 heading" in pages[-1]
+
+    def test_page_and_time_budgets(self, pdf_path):
+        """Test extraction stops at max_pages and once the time budget is spent."""
+        assert len(list(iter_pdf_text(pdf_path, max_pages=3, workers=1))) == 3
+        clock = iter(range(100))
+        with patch.object(quality.time, 'monotonic', side_effect=lambda: next(clock)):
+            assert len(list(iter_pdf_text(pdf_path, time_budget=2.5, workers=1))) == 3
+        with patch.dict(os.environ, {'PDF_FALLBACK_MAX_PAGES': '4'}):
+            assert pdf_fallback_markdown(pdf_path)[0].count("Body of page") == 4
+
+    def test_process_pool(self, pdf_path):
+        """Test page ranges extracted on a process pool match in-process extraction."""
+        assert list(iter_pdf_text(pdf_path, workers=2)) == list(iter_pdf_text(pdf_path, workers=1))
+        assert len(list(iter_pdf_text(pdf_path, max_pages=12, workers=2))) == 12
+
+    def test_broken_pool_is_replaced(self, pdf_path):
+        """Test a fallback pool broken by a dying child is replaced for the next document."""
+        crash = quality._get_pdf_pool(2).submit(os._exit, 1)
+        with pytest.raises(BrokenProcessPool):
+            crash.result(timeout=60)
+        assert len(list(iter_pdf_text(pdf_path, workers=2))) == 20
+
+    def test_busy_pool_is_replaced_after_budget(self, pdf_path):
+        """Test ranges still running when extraction stops do not keep the pool for the next document."""
+        pool = Mock()
+        running, pending = Future(), Future()
+        running.set_running_or_notify_cancel()
+        pool.submit.side_effect = [running, pending]
+        with patch.object(quality, '_get_pdf_pool', return_value=pool):
+            pages = quality._parallel_pdf_pages(pdf_path, 16, 2, "fast", time.monotonic())
+            assert list(pages) == []
+        assert pending.cancelled()
+        pool.shutdown.assert_called_once_with(wait=False, cancel_futures=True)
+
+    def test_no_nested_pools(self, pdf_path):
+        """Test a pipeline pool worker extracts in-process instead of starting a pool."""
+        with patch('app.pipeline._in_pool_worker', True), \
+             patch.object(quality, '_get_pdf_pool', side_effect=AssertionError) as get_pool:
+            assert len(list(iter_pdf_text(pdf_path, workers=4))) == 20
+        get_pool.assert_not_called()
+
+    def test_unreadable_file(self, tmp_path):
+        """Test files pdfminer cannot read give no fallback text."""
+        path = tmp_path / "broken.pdf"
+        path.write_bytes(b"%PDF-1.4 not really")
+        assert pdf_fallback_markdown(str(path)) == (None, None)
+
+    def test_fallback_streams_into_postprocessing(self, pdf_path):
+        """Test fallback pages are stripped and cleaned as a stream, matching the whole-text passes."""
+        from app.boilerplate import strip_boilerplate
+
+        raw = "".join(iter_pdf_text(pdf_path, workers=1))
+        stripped, report = strip_boilerplate(raw)
+        with patch.object(quality, 'clean_markdown', side_effect=AssertionError):
+            assert pdf_fallback_markdown(pdf_path) == (clean_markdown(stripped), report)
@@ -0,0 +1,187 @@
+"""
+Tests for plan-aware queue scheduling.
+
+This module tests queue and lane selection at enqueue time and the
+weighted queue-order strategy used by workers.
+"""
+import heapq
+from collections import Counter, deque
+from unittest.mock import Mock, patch
+
+from app.scheduling import (
+    get_cached_plan, get_plan_weights, get_worker_lanes, lane_for,
+    plan_queue_names, queue_for_plan, queue_for_user, weighted_cycle
+)
+
+QUEUES = ['mdraft_team_small', 'mdraft_pro_small', 'mdraft_ff_small', 'mdraft_default']
+
+
+def _serve(cycle, backlog, pulls):
+    """Simulate a worker pulling from the first non-empty queue in order."""
+    served = []
+    for _ in range(pulls):
+        order = cycle.consume(len(cycle.items))
+        queue = next((q for q in order if backlog.get(q)), None)
+        if queue is None:
+            break
+        backlog[queue] -= 1
+        cycle.rotate(queue)
+        served.append(queue)
+    return served
+
+
+class TestQueueSelection:
+    """Test queue selection from cached plan data."""
+
+    def test_plans_map_to_queues(self):
+        """Test each plan has its own queue and unknown plans use F&F."""
+        assert queue_for_plan('Pro') == 'mdraft_pro_small'
+        assert queue_for_plan('Team', 'large') == 'mdraft_team_large'
+        assert queue_for_plan('F&F') == 'mdraft_ff_small'
+        assert queue_for_plan('Enterprise') == 'mdraft_ff_small'
+        assert queue_for_plan(None, 'large') == 'mdraft_ff_large'
+
+    def test_cached_plan_read_from_redis(self):
+        """Test the plan is read from the userplan hash."""
+        client = Mock()
+        client.hget.return_value = b'Team'
+        with patch('app.scheduling._get_redis_client', return_value=client):
+            assert get_cached_plan(5) == 'Team'
+            client.hget.assert_called_once_with('userplan:5', 'plan')
+
+    def test_cached_plan_tolerates_redis_errors(self):
+        """Test Redis failures fall back to no plan."""
+        client = Mock()
+        client.hget.side_effect = Exception('down')
+        with patch('app.scheduling._get_redis_client', return_value=client):
+            assert get_cached_plan(5) is None
+
+    def test_weights_from_environment(self):
+        """Test weights are parsed and clamped to at least 1."""
+        with patch.dict('os.environ', {'PLAN_QUEUE_WEIGHTS': 'Pro=5, F&F=0, Bogus=9, Team=x'}):
+            assert get_plan_weights() == {'F&F': 1, 'Pro': 5, 'Team': 4}
+
+
+class TestWeightedCycle:
+    """Test the weighted queue-order strategy."""
+
+    def _cycle(self):
+        cycle = weighted_cycle()
+        cycle.update(QUEUES)
+        return cycle
+
+    def test_shares_follow_weights_when_all_busy(self):
+        """Test busy queues are served in proportion to their weights."""
+        backlog = {'mdraft_team_small': 1000, 'mdraft_pro_small': 1000, 'mdraft_ff_small': 1000}
+        counts = Counter(_serve(self._cycle(), backlog, 800))
+        assert counts['mdraft_team_small'] == 400
+        assert counts['mdraft_pro_small'] == 300
+        assert counts['mdraft_ff_small'] == 100
+
+    def test_free_tier_not_starved(self):
+        """Test free-tier work is served at a steady rate under paid load."""
+        backlog = {'mdraft_pro_small': 1000, 'mdraft_ff_small': 1000}
+        served = _serve(self._cycle(), backlog, 200)
+        gaps = [i for i, q in enumerate(served) if q == 'mdraft_ff_small']
+        assert gaps
+        assert max(b - a for a, b in zip(gaps, gaps[1:])) <= 10
+
+    def test_idle_queue_cannot_bank_unbounded_credit(self):
+        """Test a queue returning from idle does not lock others out."""
+        cycle = self._cycle()
+        _serve(cycle, {'mdraft_ff_small': 500}, 500)
+        served = _serve(cycle, {'mdraft_pro_small': 100, 'mdraft_ff_small': 100}, 40)
+        first_ff = served.index('mdraft_ff_small')
+        assert first_ff <= 10
+
+    def test_pro_latency_under_mixed_load(self):
+        """Test Pro jobs arriving behind a free-tier backlog start quickly."""
+        cycle = self._cycle()
+        backlog = {'mdraft_ff_small': 500, 'mdraft_pro_small': 0}
+        _serve(cycle, backlog, 50)
+        backlog['mdraft_pro_small'] = 20
+        served = _serve(cycle, backlog, 100)
+        pro_positions = [i for i, q in enumerate(served) if q == 'mdraft_pro_small']
+        # With weights F&F=1/Pro=3 (team idle), 20 Pro jobs finish within ~27 pulls
+        assert pro_positions[-1] < 30
+
+    def test_unknown_queues_get_default_weight(self):
+        """Test queues without a configured weight are still served."""
+        cycle = weighted_cycle()
+        cycle.update(['mdraft_pro_small', 'other'])
+        served = _serve(cycle, {'mdraft_pro_small': 100, 'other': 100}, 40)
+        assert 'other' in served
+
+
+def _simulate(jobs, workers):
+    """Simulate workers pulling from lane queues.
+
+    Args:
+        jobs: List of (name, size_bytes, pages, engine, duration), all
+            enqueued at t=0 in order
+        workers: List of queue lists, one per worker thread
+
+    Returns:
+        Dictionary mapping job name to completion time
+    """
+    queues = {}
+    for name, size_bytes, pages, engine, duration in jobs:
+        queue = queue_for_user(None, plan='Pro', size_bytes=size_bytes, pages=pages, engine=engine)
+        queues.setdefault(queue, deque()).append((name, duration))
+
+    done = {}
+    idle = [(0, i) for i in range(len(workers))]
+    heapq.heapify(idle)
+    while idle:
+        now, worker = heapq.heappop(idle)
+        queue = next((q for q in workers[worker] if queues.get(q)), None)
+        if queue is None:
+            continue
+        name, duration = queues[queue].popleft()
+        done[name] = now + duration
+        heapq.heappush(idle, (now + duration, worker))
+    return done
+
+
+class TestLanes:
+    """Test size-aware lane routing."""
+
+    def test_cost_drives_lane(self):
+        """Test bytes, pages and engine all feed the lane decision."""
+        assert lane_for(20_000, 1, 'markitdown') == 'small'
+        assert lane_for(20_000, 300, 'markitdown') == 'large'
+        assert lane_for(80 * 1024 * 1024, 2, 'markitdown') == 'large'
+        assert lane_for(100_000, 20, 'markitdown') == 'small'
+        assert lane_for(100_000, 20, 'docai') == 'large'
+
+    def test_thresholds_configurable(self):
+        """Test the large-lane threshold comes from the environment."""
+        with patch.dict('os.environ', {'LANE_LARGE_COST': '500'}):
+            assert lane_for(20_000, 300, 'markitdown') == 'small'
+
+    def test_worker_lanes(self):
+        """Test workers can dedicate capacity to a single lane."""
+        with patch.dict('os.environ', {'WORKER_LANES': 'small'}):
+            assert get_worker_lanes() == ['small']
+            assert plan_queue_names(get_worker_lanes()) == [
+                'mdraft_team_small', 'mdraft_pro_small', 'mdraft_ff_small'
+            ]
+        with patch.dict('os.environ', {'WORKER_LANES': 'bogus'}):
+            assert get_worker_lanes() == ['small', 'large']
+
+    def test_small_latency_independent_of_large_backlog(self):
+        """Test small documents finish quickly behind a large backlog."""
+        large = [(f'large{i}', 5_000_000, 300, 'docai', 600) for i in range(20)]
+        small = [(f'small{i}', 20_000, 1, 'markitdown', 2) for i in range(50)]
+        shared = ['mdraft_pro_small', 'mdraft_pro_large']
+        dedicated = ['mdraft_pro_small']
+
+        with_lanes = _simulate(large + small, [shared] * 3 + [dedicated])
+        small_done = max(t for name, t in with_lanes.items() if name.startswith('small'))
+        assert small_done <= 50 * 2
+        assert all(name in with_lanes for name, *_ in large)
+
+        # Triple the large backlog: small latency does not change
+        more_large = large + [(f'xl{i}', 5_000_000, 300, 'docai', 600) for i in range(40)]
+        with_more = _simulate(more_large + small, [shared] * 3 + [dedicated])
+        assert max(t for name, t in with_more.items() if name.startswith('small')) == small_done
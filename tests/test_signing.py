@@ -0,0 +1,105 @@
+"""
+Tests for the signed URL cache.
+
+This module tests reuse while a URL has enough validity left, cache keys,
+the optional Redis tier and the storage helpers that sign through it.
+"""
+import json
+import os
+from unittest.mock import Mock, patch
+
+import pytest
+
+from app.services import gcs, signing
+
+
+@pytest.fixture
+def blob():
+    """Patch the GCS client so every blob signs a numbered URL."""
+    gcs.reset_clients()
+    signing.clear()
+    counter = {'n': 0}
+
+    def sign(**kwargs):
+        counter['n'] += 1
+        return f"https://signed/{counter['n']}"
+
+    mock_blob = Mock()
+    mock_blob.generate_signed_url.side_effect = sign
+    client = Mock()
+    client.bucket.return_value.blob.return_value = mock_blob
+    with patch('google.cloud.storage.Client', return_value=client):
+        yield mock_blob
+    gcs.reset_clients()
+    signing.clear()
+
+
+class TestSignedURLCache:
+    """Test expiry-aware reuse of signed URLs."""
+
+    def test_reuses_until_threshold(self, blob):
+        """Test a URL is reused until less than the minimum validity is left."""
+        with patch('app.services.signing.time.time', return_value=1000.0):
+            first = signing.get_signed_url('b', 'o', 300)
+        with patch('app.services.signing.time.time', return_value=1200.0):
+            assert signing.get_signed_url('b', 'o', 300) == first
+        with patch('app.services.signing.time.time', return_value=1250.0):
+            assert signing.get_signed_url('b', 'o', 300) != first
+        assert blob.generate_signed_url.call_count == 2
+        assert signing.stats() == {'signed': 2, 'hits': 1}
+
+    def test_key_includes_method_ttl_and_headers(self, blob):
+        """Test different response headers, methods or lifetimes are signed separately."""
+        signing.get_signed_url('b', 'o', 300)
+        signing.get_signed_url('b', 'o', 300, query_parameters={'response-content-type': 'text/plain'})
+        signing.get_signed_url('b', 'o', 300, method='PUT')
+        signing.get_signed_url('b', 'o', 900)
+        signing.get_signed_url('b', 'o', 300, query_parameters={})
+        assert blob.generate_signed_url.call_count == 4
+
+    def test_short_lifetimes_cap_threshold(self):
+        """Test the reuse threshold never exceeds half the URL's lifetime."""
+        assert signing.get_min_remaining(300) == 60
+        assert signing.get_min_remaining(30) == 15
+        with patch.dict(os.environ, {'SIGNED_URL_MIN_REMAINING': '0'}):
+            assert signing.get_min_remaining(300) == 0
+
+    def test_shared_through_redis(self, blob):
+        """Test a URL signed by another process is picked up from Redis."""
+        redis_client = Mock()
+        redis_client.get.return_value = None
+        with patch.dict(os.environ, {'SIGNED_URL_CACHE_REDIS': '1'}), \
+             patch('app.api_usage._get_redis_client', return_value=redis_client), \
+             patch('app.services.signing.time.time', return_value=1000.0):
+            url = signing.get_signed_url('b', 'o', 300)
+            key, value = redis_client.set.call_args.args
+            assert redis_client.set.call_args.kwargs == {'ex': 240}
+
+            signing.clear()
+            redis_client.get.return_value = value
+            assert signing.get_signed_url('b', 'o', 300) == url
+        assert json.loads(value) == [url, 1300.0]
+        assert blob.generate_signed_url.call_count == 1
+        assert signing.stats() == {'redis_hits': 1}
+
+
+class TestSigningCallers:
+    """Test the storage helpers sign through the cache."""
+
+    def test_helpers_reuse_urls(self, blob):
+        """Test repeated helper calls for the same object sign once."""
+        from app.storage import generate_signed_url, generate_v4_signed_url
+
+        assert generate_signed_url('gs://b/o.md') == generate_signed_url('gs://b/o.md')
+        disposition = 'attachment; filename=o.md'
+        assert (generate_v4_signed_url('b', 'o.md', response_content_disposition=disposition)
+                == generate_v4_signed_url('b', 'o.md', response_content_disposition=disposition))
+        assert blob.generate_signed_url.call_count == 2
+
+    def test_signing_failure_returns_none(self, blob):
+        """Test signing errors are not cached and surface as None."""
+        from app.storage import generate_signed_url
+
+        blob.generate_signed_url.side_effect = RuntimeError('no private key')
+        assert generate_signed_url('gs://b/o.md') is None
+        assert signing.stats() == {}
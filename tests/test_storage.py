@@ -10,7 +10,10 @@ from pathlib import Path
 from unittest.mock import Mock, patch, MagicMock
 from io import BytesIO
 
-from app.services.storage import Storage
+from google.api_core.exceptions import NotFound, PreconditionFailed
+
+from app.services import gcs
+from app.services.storage import BulkResult, PreconditionFailedError, Storage
 
 
 class TestStorageLocal:
@@ -170,6 +173,7 @@ class TestStorageGCS:
         self.mock_client.bucket.return_value = self.mock_bucket
         
         # Patch GCS client creation
+        gcs.reset_clients()
         self.gcs_patcher = patch('google.cloud.storage.Client', return_value=self.mock_client)
         self.gcs_patcher.start()
         
@@ -180,6 +184,7 @@ class TestStorageGCS:
         """Clean up test environment."""
         self.app_patcher.stop()
         self.gcs_patcher.stop()
+        gcs.reset_clients()
     
     def test_init_gcs_mode(self):
         """Test Storage initialization in GCS mode."""
@@ -206,7 +211,6 @@ class TestStorageGCS:
         test_path = "test/file.txt"
         
         # Set up mock blob
-        self.mock_blob.exists.return_value = True
         self.mock_blob.download_as_bytes.return_value = test_data
         
         result = self.storage.read_bytes(test_path)
@@ -214,13 +218,14 @@ class TestStorageGCS:
         assert result == test_data
         self.mock_bucket.blob.assert_called_once_with(test_path)
         self.mock_blob.download_as_bytes.assert_called_once()
+        self.mock_blob.exists.assert_not_called()
     
     def test_read_bytes_gcs_not_found(self):
         """Test reading bytes from non-existent GCS file."""
         test_path = "test/file.txt"
         
         # Set up mock blob to not exist
-        self.mock_blob.exists.return_value = False
+        self.mock_blob.download_as_bytes.side_effect = NotFound("no such object")
         
         with pytest.raises(FileNotFoundError):
             self.storage.read_bytes(test_path)
@@ -265,24 +270,24 @@ class TestStorageGCS:
     def test_delete_gcs_true(self):
         """Test deleting existing GCS file."""
         test_path = "test/file.txt"
-        self.mock_blob.exists.return_value = True
         
         result = self.storage.delete(test_path)
         
         assert result is True
+        self.mock_blob.exists.assert_not_called()
         self.mock_bucket.blob.assert_called_once_with(test_path)
         self.mock_blob.delete.assert_called_once()
     
     def test_delete_gcs_false(self):
         """Test deleting non-existent GCS file."""
         test_path = "test/file.txt"
-        self.mock_blob.exists.return_value = False
+        self.mock_blob.delete.side_effect = NotFound("no such object")
         
         result = self.storage.delete(test_path)
         
         assert result is False
         self.mock_bucket.blob.assert_called_once_with(test_path)
-        self.mock_blob.delete.assert_not_called()
+        self.mock_blob.delete.assert_called_once()
 
 
 class TestStorageErrorHandling:
@@ -345,7 +350,7 @@ class TestStorageErrorHandling:
     def test_delete_error(self):
         """Test delete() error handling."""
         # Mock pathlib error
-        with patch('pathlib.Path.exists', side_effect=OSError("Permission denied")):
+        with patch('pathlib.Path.unlink', side_effect=OSError("Permission denied")):
             result = self.storage.delete("test/file.txt")
             assert result is False
 
@@ -383,7 +388,7 @@ class TestStorageGCSInitErrors:
                     Storage()
     
     def test_init_gcs_bucket_not_found(self):
-        """Test GCS initialization with non-existent bucket."""
+        """Test a non-existent bucket fails on first use, not at construction."""
         # Mock Flask app config
         mock_app = Mock()
         mock_app.config = {
@@ -396,10 +401,453 @@ class TestStorageGCSInitErrors:
         mock_client = Mock()
         mock_bucket = Mock()
         mock_bucket.exists.return_value = False
+        gcs.reset_clients()
         
         with patch('app.services.storage.current_app', mock_app):
             with patch('google.cloud.storage.Client', return_value=mock_client):
                 mock_client.bucket.return_value = mock_bucket
                 
-                with pytest.raises(RuntimeError, match="Failed to initialize GCS storage"):
-                    Storage()
+                storage = Storage()
+                mock_bucket.exists.assert_not_called()
+                
+                with pytest.raises(RuntimeError, match="does not exist"):
+                    storage.write_bytes("test/file.txt", b"test")
+        gcs.reset_clients()
+
+
+class TestGCSClientRegistry:
+    """Test the process-wide GCS client registry."""
+    
+    def setup_method(self):
+        """Set up a mock client behind a fresh registry."""
+        gcs.reset_clients()
+        self.mock_client = Mock()
+        self.mock_bucket = Mock()
+        self.mock_bucket.exists.return_value = True
+        self.mock_client.bucket.return_value = self.mock_bucket
+        self.gcs_patcher = patch('google.cloud.storage.Client', return_value=self.mock_client)
+        self.mock_client_cls = self.gcs_patcher.start()
+        
+        self.mock_app = Mock()
+        self.mock_app.config = {
+            'USE_GCS': True,
+            'GCS_BUCKET_NAME': 'test-bucket',
+            'GOOGLE_CLOUD_PROJECT': 'test-project'
+        }
+        self.app_patcher = patch('app.services.storage.current_app', self.mock_app)
+        self.app_patcher.start()
+    
+    def teardown_method(self):
+        """Clean up test environment."""
+        self.app_patcher.stop()
+        self.gcs_patcher.stop()
+        gcs.reset_clients()
+    
+    def test_client_created_once_per_project(self):
+        """Test clients are shared and get a pooled HTTP adapter."""
+        assert gcs.get_client('test-project') is gcs.get_client('test-project')
+        self.mock_client_cls.assert_called_once_with(project='test-project')
+        adapter = self.mock_client._http.mount.call_args.args[1]
+        assert adapter._pool_maxsize == gcs.get_pool_size()
+    
+    def test_storage_instances_share_client_and_validate_once(self):
+        """Test many Storage instances check the bucket a single time."""
+        self.mock_bucket.blob.return_value.exists.return_value = True
+        for _ in range(3):
+            storage = Storage()
+            assert storage.exists("a.txt") is True
+        self.mock_client_cls.assert_called_once()
+        self.mock_bucket.exists.assert_called_once()
+    
+    def test_failed_validation_is_retried(self):
+        """Test a failed bucket check is not cached."""
+        self.mock_bucket.exists.side_effect = [False, True]
+        with pytest.raises(ValueError):
+            gcs.ensure_bucket('test-bucket')
+        assert gcs.ensure_bucket('test-bucket') is self.mock_bucket
+        gcs.ensure_bucket('test-bucket')
+        assert self.mock_bucket.exists.call_count == 2
+    
+    def test_registry_resets_in_new_process(self):
+        """Test a forked child does not reuse the parent's client."""
+        parent = gcs.get_client()
+        with patch('app.services.gcs.os.getpid', return_value=gcs._pid + 1):
+            self.mock_client_cls.return_value = Mock()
+            assert gcs.get_client() is not parent
+    
+    def test_get_blob_parses_uri(self):
+        """Test gs:// URIs resolve to a blob on the shared bucket."""
+        gcs.get_blob('gs://test-bucket/uploads/a b.pdf')
+        self.mock_client.bucket.assert_called_once_with('test-bucket')
+        self.mock_bucket.blob.assert_called_once_with('uploads/a b.pdf')
+
+
+class TestStorageStreaming:
+    """Test chunked open_read/open_write in local mode."""
+    
+    def setup_method(self):
+        """Set up local storage in a temporary directory."""
+        self.temp_dir = tempfile.mkdtemp()
+        self.mock_app = Mock()
+        self.mock_app.config = {'USE_GCS': False, 'GCS_BUCKET_NAME': None, 'GOOGLE_CLOUD_PROJECT': None}
+        self.app_patcher = patch('app.services.storage.current_app', self.mock_app)
+        self.app_patcher.start()
+        self.storage = Storage()
+        self.storage._data_dir = Path(self.temp_dir)
+    
+    def teardown_method(self):
+        """Clean up test environment."""
+        self.app_patcher.stop()
+        import shutil
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+    
+    def test_open_write_commits_on_close(self):
+        """Test written chunks only appear once the writer is closed."""
+        target = Path(self.temp_dir) / "out/file.bin"
+        with self.storage.open_write("out/file.bin") as out:
+            out.write(b"abc")
+            out.write(b"def")
+            assert not target.exists()
+        assert target.read_bytes() == b"abcdef"
+        assert out.bytes_written == 6
+    
+    def test_open_write_discards_on_error(self):
+        """Test a failed write leaves no object or temporary file behind."""
+        with pytest.raises(OSError):
+            with self.storage.open_write("out/file.bin") as out:
+                out.write(b"abc")
+                raise OSError("client disconnected")
+        assert list(Path(self.temp_dir).rglob("*.*")) == []
+    
+    def test_open_read_range_in_chunks(self):
+        """Test ranged reads are served chunk by chunk."""
+        self.storage.write_bytes("in.bin", bytes(range(100)))
+        with patch.dict(os.environ, {'STORAGE_CHUNK_SIZE': '7'}):
+            reader = self.storage.open_read("in.bin", start=10, end=40)
+            chunks = list(reader.iter_chunks())
+        assert reader.size == 100
+        assert b"".join(chunks) == bytes(range(10, 40))
+        assert max(len(c) for c in chunks) == 7
+        assert reader.closed
+    
+    def test_open_read_seek(self):
+        """Test seeking inside and past the readable range."""
+        self.storage.write_bytes("in.bin", b"0123456789")
+        with self.storage.open_read("in.bin") as reader:
+            assert reader.read(3) == b"012"
+            reader.seek(8)
+            assert reader.read() == b"89"
+            reader.seek(50)
+            assert reader.read() == b""
+    
+    def test_open_read_not_found(self):
+        """Test opening a missing object raises FileNotFoundError."""
+        with pytest.raises(FileNotFoundError):
+            self.storage.open_read("missing.bin")
+
+
+class TestStorageStreamingGCS:
+    """Test chunked open_read/open_write in GCS mode."""
+    
+    setup_method = TestStorageGCS.setup_method
+    teardown_method = TestStorageGCS.teardown_method
+    
+    def _serve(self, data):
+        self.mock_blob.size = len(data)
+        self.mock_blob.download_as_bytes.side_effect = lambda start, end, checksum: data[start:end + 1]
+    
+    def test_open_read_uses_ranged_downloads(self):
+        """Test each chunk is one ranged GET, plus one size lookup."""
+        data = bytes(range(50))
+        self._serve(data)
+        with patch.dict(os.environ, {'STORAGE_CHUNK_SIZE': '20'}):
+            reader = self.storage.open_read("a.bin", start=5)
+            assert reader.size == 50
+            assert b"".join(reader.iter_chunks()) == data[5:]
+        assert [c.kwargs['start'] for c in self.mock_blob.download_as_bytes.call_args_list] == [5, 25, 45]
+        self.mock_blob.reload.assert_called_once()
+    
+    def test_open_read_small_object_is_one_request(self):
+        """Test an object shorter than one chunk needs no metadata request."""
+        self._serve(b"hello")
+        gcs.reset_round_trips()
+        reader = self.storage.open_read("a.txt")
+        assert reader.size == 5
+        assert b"".join(reader.iter_chunks()) == b"hello"
+        self.mock_blob.reload.assert_not_called()
+        assert gcs.get_round_trips() == {"validate_bucket": 1, "open_read": 1}
+    
+    def test_open_read_not_found(self):
+        """Test a missing GCS object raises FileNotFoundError."""
+        self.mock_blob.download_as_bytes.side_effect = NotFound("no such object")
+        with pytest.raises(FileNotFoundError):
+            self.storage.open_read("missing.bin")
+    
+    def test_small_write_is_single_request(self):
+        """Test objects under one chunk skip the resumable upload."""
+        with self.storage.open_write("small.txt") as out:
+            out.write(b"hello")
+        self.mock_blob.upload_from_string.assert_called_once_with(b"hello")
+        self.mock_blob.open.assert_not_called()
+    
+    def test_large_write_uses_resumable_upload(self):
+        """Test objects over one chunk stream through a resumable upload."""
+        chunk = b"x" * (256 * 1024)
+        with patch.dict(os.environ, {'STORAGE_CHUNK_SIZE': str(len(chunk))}):
+            with self.storage.open_write("big.bin") as out:
+                out.write(chunk)
+                out.write(chunk)
+        self.mock_blob.open.assert_called_once_with("wb", chunk_size=len(chunk), ignore_flush=True)
+        writer = self.mock_blob.open.return_value
+        assert sum(len(c.args[0]) for c in writer.write.call_args_list) == 2 * len(chunk)
+        writer.close.assert_called_once()
+
+
+class TestDownloadRoute:
+    """Test the download endpoint in proxy mode."""
+    
+    mode = 'proxy'
+    
+    def setup_method(self):
+        """Create an app serving a local storage directory."""
+        from flask import Flask
+        from app.routes import download_file
+        
+        self.temp_dir = tempfile.mkdtemp()
+        self.app = Flask(__name__)
+        self.app.config.update(USE_GCS=False)
+        self.app.add_url_rule("/download/<path:storage_path>", view_func=download_file)
+        self.cwd = os.getcwd()
+        os.chdir(self.temp_dir)
+        (Path(self.temp_dir) / "data/outputs").mkdir(parents=True)
+        (Path(self.temp_dir) / "data/outputs/result.md").write_bytes(b"0123456789")
+        self.client = self.app.test_client()
+        self.env_patcher = patch.dict(os.environ, {'DOWNLOAD_MODE': self.mode})
+        self.env_patcher.start()
+    
+    def teardown_method(self):
+        """Clean up test environment."""
+        self.env_patcher.stop()
+        os.chdir(self.cwd)
+        import shutil
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+    
+    def test_full_download(self):
+        """Test a plain GET streams the whole object."""
+        resp = self.client.get("/download/outputs/result.md")
+        assert resp.status_code == 200
+        assert resp.data == b"0123456789"
+        assert resp.headers['Accept-Ranges'] == 'bytes'
+        assert 'filename=' in resp.headers['Content-Disposition']
+    
+    def test_range_download(self):
+        """Test a byte range returns 206 with only the requested bytes."""
+        resp = self.client.get("/download/outputs/result.md", headers={'Range': 'bytes=2-4'})
+        assert resp.status_code == 206
+        assert resp.data == b"234"
+        assert resp.headers['Content-Range'] == 'bytes 2-4/10'
+        resp = self.client.get("/download/outputs/result.md", headers={'Range': 'bytes=-3'})
+        assert resp.data == b"789"
+    
+    def test_unsatisfiable_range_and_missing_file(self):
+        """Test out-of-range requests get 416 and missing files 404."""
+        resp = self.client.get("/download/outputs/result.md", headers={'Range': 'bytes=50-60'})
+        assert resp.status_code == 416
+        assert self.client.get("/download/outputs/none.md").status_code == 404
+
+
+class TestDownloadRouteOffload(TestDownloadRoute):
+    """Test the download endpoint in offload mode."""
+    
+    mode = 'offload'
+    
+    def test_local_file_is_sent_by_server(self):
+        """Test local files go through send_file rather than a Python stream."""
+        import app.routes
+        with patch('app.routes.send_file', wraps=app.routes.send_file) as mock_send_file:
+            resp = self.client.get("/download/outputs/result.md")
+        assert resp.data == b"0123456789"
+        assert mock_send_file.call_args.args[0].name == "result.md"
+    
+    def test_accel_redirect(self):
+        """Test nginx offload returns only the internal redirect header."""
+        with patch.dict(os.environ, {'DOWNLOAD_ACCEL_PREFIX': '/protected/'}):
+            resp = self.client.get("/download/outputs/result.md")
+        assert resp.headers['X-Accel-Redirect'] == '/protected/outputs/result.md'
+        assert resp.data == b""
+    
+    def test_path_traversal_rejected(self):
+        """Test paths outside the data directory are not served."""
+        assert self.client.get("/download/../secret.txt").status_code == 404
+    
+    def test_gcs_redirects_to_signed_url(self):
+        """Test GCS downloads are a 302 to a signed URL."""
+        storage = Mock(use_gcs=True)
+        storage.signed_url.return_value = "https://storage.googleapis.com/b/x?sig"
+        with patch('app.routes.Storage', return_value=storage):
+            resp = self.client.get("/download/outputs/result.md")
+        assert resp.status_code == 302
+        assert resp.headers['Location'] == "https://storage.googleapis.com/b/x?sig"
+        assert storage.signed_url.call_args.kwargs['filename'] == 'result.md'
+        storage.open_read.assert_not_called()
+    
+    def test_unsigned_gcs_proxies_only_when_configured(self):
+        """Test a signing failure falls back to proxying only if enabled."""
+        storage = Mock(use_gcs=True)
+        storage.signed_url.return_value = None
+        storage.open_read.side_effect = FileNotFoundError
+        with patch('app.routes.Storage', return_value=storage):
+            assert self.client.get("/download/outputs/result.md").status_code == 503
+            with patch.dict(os.environ, {'DOWNLOAD_PROXY_FALLBACK': '1'}):
+                assert self.client.get("/download/outputs/result.md").status_code == 404
+        storage.open_read.assert_called_once()
+
+
+class TestRoundTrips:
+    """Test each GCS storage operation costs a single request."""
+    
+    setup_method = TestStorageGCS.setup_method
+    
+    def teardown_method(self):
+        """Clean up test environment."""
+        TestStorageGCS.teardown_method(self)
+        gcs.reset_round_trips()
+    
+    def test_one_request_per_operation(self):
+        """Test read, write, exists and delete each take one round trip."""
+        self.mock_blob.download_as_bytes.return_value = b"x"
+        self.storage.exists("a")
+        gcs.reset_round_trips()
+        self.storage.write_bytes("a", b"x")
+        self.storage.read_bytes("a")
+        self.storage.exists("a")
+        self.storage.delete("a")
+        self.storage.read_bytes("a")
+        assert gcs.get_round_trips() == {"write_bytes": 1, "read_bytes": 2, "exists": 1, "delete": 1}
+    
+    def test_missing_objects_do_not_cost_extra_requests(self):
+        """Test not-found reads and deletes are answered by the request itself."""
+        self.mock_blob.download_as_bytes.side_effect = NotFound("gone")
+        self.mock_blob.delete.side_effect = NotFound("gone")
+        self.storage.exists("a")
+        gcs.reset_round_trips()
+        with pytest.raises(FileNotFoundError):
+            self.storage.read_bytes("a")
+        assert self.storage.delete("a") is False
+        assert gcs.get_round_trips() == {"read_bytes": 1, "delete": 1}
+    
+    def test_generation_precondition_gcs(self):
+        """Test a stale generation surfaces as PreconditionFailedError."""
+        self.storage.write_bytes("a", b"x", if_generation_match=0)
+        self.mock_blob.upload_from_string.assert_called_with(b"x", if_generation_match=0)
+        self.mock_blob.upload_from_string.side_effect = PreconditionFailed("stale")
+        with pytest.raises(PreconditionFailedError):
+            self.storage.write_bytes("a", b"y", if_generation_match=7)
+
+
+class TestLocalPreconditions:
+    """Test generation-match preconditions on local storage."""
+    
+    setup_method = TestStorageStreaming.setup_method
+    teardown_method = TestStorageStreaming.teardown_method
+    
+    def test_create_only(self):
+        """Test generation 0 only writes objects that do not exist."""
+        self.storage.write_bytes("a.txt", b"one", if_generation_match=0)
+        with pytest.raises(PreconditionFailedError):
+            self.storage.write_bytes("a.txt", b"two", if_generation_match=0)
+        assert self.storage.read_bytes("a.txt") == b"one"
+        assert [p.name for p in Path(self.temp_dir).iterdir()] == ["a.txt"]
+    
+    def test_overwrite_requires_current_generation(self):
+        """Test an overwrite succeeds only against the generation it read."""
+        generation = self.storage.write_bytes("a.txt", b"one")
+        assert self.storage.generation("a.txt") == generation
+        self.storage.write_bytes("a.txt", b"two", if_generation_match=generation)
+        with pytest.raises(PreconditionFailedError):
+            with self.storage.open_write("a.txt", if_generation_match=generation) as out:
+                out.write(b"three")
+        assert self.storage.read_bytes("a.txt") == b"two"
+        assert self.storage.generation("missing.txt") is None
+
+
+class TestBulkOperations:
+    """Test concurrent get_many/put_many/delete_many."""
+    
+    setup_method = TestStorageStreaming.setup_method
+    teardown_method = TestStorageStreaming.teardown_method
+    
+    def test_round_trip_local(self):
+        """Test bulk put, get and delete collect per-item results in order."""
+        items = {f"bulk/{i}.txt": str(i).encode() for i in range(20)}
+        puts = self.storage.put_many(items, concurrency=4)
+        assert [r.path for r in puts] == list(items)
+        assert all(r.ok and r.value for r in puts)
+        
+        gets = self.storage.get_many(list(items) + ["bulk/missing.txt"])
+        assert [r.value for r in gets[:-1]] == list(items.values())
+        assert not gets[-1].ok and "not found" in gets[-1].error.lower()
+        
+        deletes = self.storage.delete_many(["bulk/0.txt", "bulk/missing.txt"])
+        assert deletes == [BulkResult("bulk/0.txt", True, True), BulkResult("bulk/missing.txt", True, False)]
+    
+    def test_async_api(self):
+        """Test the coroutine variants and the event-loop guard."""
+        import asyncio
+        
+        async def run():
+            await self.storage.aput_many([("a.txt", b"a")])
+            with pytest.raises(RuntimeError):
+                self.storage.get_many(["a.txt"])
+            return await self.storage.aget_many(["a.txt"])
+        
+        assert asyncio.run(run())[0].value == b"a"
+        assert self.storage.get_many([]) == []
+
+
+class TestBulkDeleteGCS:
+    """Test GCS bulk deletes use batch requests."""
+    
+    def setup_method(self):
+        """Set up a mocked GCS client that real batches can be opened on."""
+        TestStorageGCS.setup_method(self)
+        self.mock_client._connection._client_info.user_agent = ""
+    
+    def teardown_method(self):
+        """Clean up test environment."""
+        TestStorageGCS.teardown_method(self)
+        gcs.reset_round_trips()
+    
+    def test_batches_of_100(self):
+        """Test 250 deletes cost three batch requests with per-item outcomes."""
+        from google.cloud.storage.batch import Batch
+        statuses = [204] * 248 + [404, 503]
+        batches = []
+        
+        def finish(batch, raise_exception=True):
+            n = self.mock_bucket.delete_blob.call_count - sum(len(b) for b in batches)
+            batches.append([Mock(status_code=statuses.pop(0)) for _ in range(n)])
+            return batches[-1]
+        
+        paths = [f"outputs/{i}/result.md" for i in range(250)]
+        self.storage.exists("warm")
+        gcs.reset_round_trips()
+        
+        with patch.object(Batch, 'finish', autospec=True, side_effect=finish):
+            results = self.storage.delete_many(paths, concurrency=1)
+        
+        assert len(batches) == 3
+        assert [r.path for r in results] == paths
+        assert sum(1 for r in results if r.ok and r.value) == 248
+        assert results[-2] == BulkResult(paths[-2], True, False)
+        assert not results[-1].ok and "503" in results[-1].error
+        assert gcs.get_round_trips() == {"delete_many": 3}
+        self.mock_blob.delete.assert_not_called()
+    
+    def test_failed_batch_marks_every_item(self):
+        """Test a failed batch request fails its items without raising."""
+        from google.cloud.storage.batch import Batch
+        with patch.object(Batch, 'finish', side_effect=RuntimeError("batch rejected")):
+            results = self.storage.delete_many(["a", "b"])
+        assert [r.ok for r in results] == [False, False]
+        assert "batch rejected" in results[0].error
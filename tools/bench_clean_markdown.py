@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the markdown normalizer.
+
+Compares app.quality.clean_markdown and clean_markdown_stream with the
+original whole-string implementation on synthetic converter output, and
+checks all three produce identical text.
+
+Usage:
+    python tools/bench_clean_markdown.py
+    python tools/bench_clean_markdown.py --mb 50 --repeat 5
+"""
+
+import argparse
+import os
+import re
+import sys
+import time
+import tracemalloc
+
+try:
+    from app.quality import clean_markdown, clean_markdown_stream
+except ModuleNotFoundError:
+    # Add project root to sys.path when invoked directly
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    if root not in sys.path:
+        sys.path.insert(0, root)
+    from app.quality import clean_markdown, clean_markdown_stream
+
+
+def legacy_clean_markdown(md: str) -> str:
+    """The original seven-pass implementation, kept as the baseline."""
+    if not md: return md
+    md = md.replace("\r\n", "\n").replace("\r", "\n")
+    md = "\n".join(line.rstrip() for line in md.split("\n"))
+    md = re.sub(r"\n{3,}", "\n\n", md)
+    md = re.sub(r"(```+)\s*\n", r"```\n", md)
+    lines = md.split("\n")
+    freq = {}
+    for ln in lines:
+        if 2 <= len(ln) <= 40 and ln.isupper():
+            freq[ln] = freq.get(ln, 0) + 1
+    common = {k for k, v in freq.items() if v >= 10}
+    if common:
+        lines = [ln for ln in lines if ln not in common]
+        md = "\n".join(lines)
+    return md.strip()
+
+
+def make_markdown(size_mb: float) -> str:
+    """Build converter-like output: CRLF lines, trailing spaces, blank runs, fences, a running header."""
+    page = ("ANNUAL REPORT\r\n\r\n## Section  \r\n\r\n\r\n\r\n"
+            + ("Body text with trailing spaces.   " * 6 + "\r\n") * 12
+            + "```python   \r\n\r\nprint('hi')\r\n```\r\n\r\n\r\nPage footer text\r\n")
+    return page * max(1, int(size_mb * 1024 * 1024 / len(page)))
+
+
+def measure(fn, md: str, repeat: int):
+    """Return (best seconds, peak traced bytes, result)."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(md)
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    fn(md)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark clean_markdown")
+    parser.add_argument("--mb", type=float, default=20, help="Input size in MB (default: 20)")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per implementation (default: 3)")
+    args = parser.parse_args()
+
+    md = make_markdown(args.mb)
+    print(f"Input: {len(md) / 1e6:.1f} M characters")
+
+    def stream(text):
+        chunk = 1024 * 1024
+        return "".join(clean_markdown_stream(text[i:i + chunk] for i in range(0, len(text), chunk)))
+
+    results = {}
+    for name, fn in (("legacy", legacy_clean_markdown), ("clean_markdown", clean_markdown),
+                     ("clean_markdown_stream", stream)):
+        seconds, peak, results[name] = measure(fn, md, args.repeat)
+        print(f"{name:<22} {seconds:7.3f} s   peak {peak / 1e6:8.1f} MB")
+
+    if len(set(results.values())) != 1:
+        print("❌ Outputs differ")
+        sys.exit(1)
+    print("✅ Outputs identical")
+
+
+if __name__ == "__main__":
+    main()